@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Скрипт для офлайн-бэктеста логики автозакупки на исторических свечах
+Использует ту же оценку возможностей, выбор направления и стоп-лоссы, что и бот
+"""
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from services.bybit_service import BybitService
+from services.market_analysis_service import MarketAnalysisService
+from services.risk_management_service import RiskManagementService
+from services.candle_store import CandleStore
+from services.backtest_engine import BacktestEngine, fetch_candles, format_report
+from services.trading_rules import TRADE_COOLDOWN_HOURS
+import config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+BACKTEST_DIR = DATA_DIR / "backtest"
+
+
+def main():
+    """Основная функция"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Бэктест автозакупки на исторических свечах')
+    parser.add_argument('--symbols', type=str, default='',
+                        help='Символы через запятую (по умолчанию - все popular_coins)')
+    parser.add_argument('--days', type=int, default=365, help='Глубина истории в днях')
+    parser.add_argument('--interval', type=str, default='60', help='Интервал свечей Bybit (60, 15, 5...)')
+    parser.add_argument('--max-positions', type=int, default=config.AUTO_MAX_ACTIVE_POSITIONS,
+                        help='Максимум одновременных позиций')
+    parser.add_argument('--cooldown-hours', type=float, default=TRADE_COOLDOWN_HOURS,
+                        help='Карантин символа после закрытия сделки')
+    parser.add_argument('--slippage-bps', type=float, default=2.0, help='Проскальзывание рыночных ордеров, б.п.')
+    parser.add_argument('--maker', action='store_true', help='Считать вход по мейкер-комиссии')
+    args = parser.parse_args()
+
+    bybit_service = BybitService()
+    risk_service = RiskManagementService(bybit_service=bybit_service)
+    market_service = MarketAnalysisService(bybit_service=bybit_service, risk_service=risk_service)
+
+    symbols = [s.strip().upper() for s in args.symbols.split(",") if s.strip()] or market_service.popular_coins
+
+    candle_store = CandleStore(config.CANDLE_STORE_DIR or None)
+
+    # Индикаторы считаются на окне из 240 свечей - подгружаем историю с запасом
+    candles_by_symbol = {}
+    for symbol in symbols:
+        candles = fetch_candles(bybit_service, symbol, days=args.days, interval=args.interval,
+                                store=candle_store)
+        if candles is None:
+            logger.warning(f"⚠️ {symbol}: свечи не загружены, пропускаем")
+            continue
+        candles_by_symbol[symbol] = candles
+        logger.info(f"✅ {symbol}: {len(candles['close'])} свечей")
+
+    engine = BacktestEngine(
+        market_service,
+        risk_service,
+        max_positions=args.max_positions,
+        cooldown_hours=args.cooldown_hours,
+        use_maker=args.maker,
+        slippage_bps=args.slippage_bps
+    )
+    report = engine.run(candles_by_symbol)
+
+    print(format_report(report))
+
+    # Сохраняем полный отчет (сделки и кривую капитала) для дальнейшего анализа
+    BACKTEST_DIR.mkdir(parents=True, exist_ok=True)
+    report_file = BACKTEST_DIR / f"report_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
+    with report_file.open("w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    print(f"\n💾 Полный отчет: {report_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Скрипт бенчмарков цикла автозакупки (скан -> анализ -> решение -> ордер)
+Биржа - локальный симулятор, AI и БД - заглушки с задержкой; результаты сравниваются
+с базовой линией benchmark_baseline.json, регрессия - код выхода 1
+"""
+import json
+import logging
+import sys
+from pathlib import Path
+
+from services.benchmark_suite import (
+    BenchmarkContext, compare_with_baseline, format_report, load_baseline,
+    record_fixtures, run_benchmarks, save_baseline
+)
+
+logging.basicConfig(level=logging.WARNING)
+# Без БД AIService предупреждает о каждом несохраненном плане - в бенчмарке это шум
+logging.getLogger("services.ai_service").setLevel(logging.ERROR)
+logger = logging.getLogger(__name__)
+
+BASELINE_FILE = Path(__file__).resolve().parent / "benchmark_baseline.json"
+
+
+def main():
+    """Основная функция"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Бенчмарки цикла автозакупки')
+    parser.add_argument('--only', type=str, default='',
+                        help='Подстроки имен бенчмарков через запятую (indicators, scan, db, ai, cycle)')
+    parser.add_argument('--rounds', type=int, default=None, help='Число раундов (по умолчанию - свое у каждого)')
+    parser.add_argument('--seed', type=int, default=0, help='Зерно синтетических цен симулятора')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Задержка ответа биржи, мс')
+    parser.add_argument('--ai-latency-ms', type=float, default=0.0, help='Задержка ответа AI, мс')
+    parser.add_argument('--db-latency-ms', type=float, default=1.0, help='Задержка запроса к БД, мс')
+    parser.add_argument('--symbols', type=str, default='',
+                        help='Символы через запятую (по умолчанию - все popular_coins)')
+    parser.add_argument('--fixtures', type=str, default='',
+                        help='Каталог CandleStore с записанными свечами вместо синтетики')
+    parser.add_argument('--record', type=str, default='',
+                        help='Записать свечи с Bybit в каталог (для --fixtures) и выйти')
+    parser.add_argument('--baseline', type=str, default=str(BASELINE_FILE), help='Файл базовой линии')
+    parser.add_argument('--save-baseline', action='store_true', help='Записать результаты как базовую линию')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Допустимое замедление лучшего раунда относительно базовой линии (0.5 = 50%%)')
+    parser.add_argument('--json', type=str, default='', help='Сохранить результаты в JSON')
+    args = parser.parse_args()
+
+    symbols = [s.strip().upper() for s in args.symbols.split(",") if s.strip()] or None
+
+    if args.record:
+        from services.bybit_service import BybitService
+        from services.market_analysis_service import MarketAnalysisService
+
+        bybit_service = BybitService()
+        symbols = symbols or MarketAnalysisService(bybit_service=bybit_service).popular_coins
+        written = record_fixtures(bybit_service, args.record, symbols)
+        for symbol, count in written.items():
+            print(f"✅ {symbol}: {count} свечей")
+        print(f"\n💾 Свечи записаны в {args.record}, запуск: python benchmark.py --fixtures {args.record}")
+        return
+
+    ctx = BenchmarkContext(
+        seed=args.seed,
+        latency_ms=args.latency_ms,
+        ai_latency_ms=args.ai_latency_ms,
+        db_latency_ms=args.db_latency_ms,
+        fixtures_dir=args.fixtures or None,
+        symbols=symbols
+    )
+    only = [s.strip() for s in args.only.split(",") if s.strip()] or None
+    results = run_benchmarks(ctx, only=only, rounds=args.rounds)
+
+    baseline = load_baseline(args.baseline)
+    comparison = compare_with_baseline(results, baseline, tolerance=args.tolerance)
+    print(format_report(results, comparison, baseline=baseline, ctx=ctx))
+
+    if args.json:
+        with Path(args.json).open("w", encoding="utf-8") as f:
+            json.dump({"settings": ctx.settings(), "results": results, "comparison": comparison},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты: {args.json}")
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results, ctx)
+        print(f"\n💾 Базовая линия обновлена: {args.baseline}")
+        return
+
+    if any(compared["status"] == "regression" for compared in comparison.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 import logging
 import json
 import asyncio
-import math
-from typing import Optional, Dict, List, Tuple
+import time
+from typing import Optional, Dict, List, Set, Tuple
 from datetime import datetime, timedelta
 from pathlib import Path
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
@@ -16,6 +16,30 @@ from services.risk_management_service import RiskManagementService
 from services.market_analysis_service import MarketAnalysisService
 from services.news_service import NewsService
 from services.db_service import DatabaseService
+from services.async_db_service import AsyncDatabaseService
+from services.candle_store import CandleStore
+from services.correlation_engine import CorrelationEngine
+from services.retention_service import RetentionService
+from services.state_store import StateStore
+from services.instrument_catalog import InstrumentCatalog
+from services.order_manager import OrderManager
+from services.execution_engine import ExecutionEngine
+from services.exchange_simulator import ExchangeSimulator
+from services.account_stream import (
+    AccountStream,
+    POSITION_OPENED,
+    POSITION_UPDATED,
+    POSITION_CLOSED,
+    LIQUIDATION,
+)
+from services.lazy_service import LazyService, timed, format_startup_profile
+from services.metrics import StageTimer, start_http_server, track_job, watch_event_loop_lag
+from services.profiler import SamplingProfiler
+from services.trading_rules import (
+    TRADE_COOLDOWN_HOURS,
+    calculate_net_profit as _calculate_net_profit,
+    determine_trade_side as _determine_trade_side,
+)
 
 # Настройка логирования
 logging.basicConfig(
@@ -24,47 +48,122 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Состояние и свечи в режиме симулятора (BYBIT_SIMULATOR_STATE_DIR не задан)
+SIMULATOR_STATE_DIR = Path(__file__).resolve().parent / "data" / "simulator"
+
 # Инициализация сервисов
+# Сервисы с сетевыми подключениями (БД, Bybit, AI, новости) создаются при первом обращении -
+# импорт bot.py не ходит в сеть. Миграции схемы БД - отдельный шаг (_run_db_migrations в main).
+def _create_db_service():
+    if config.BYBIT_SIMULATOR:
+        logger.info("ℹ️ Режим симулятора - сделки и снимки рынка в БД не сохраняются")
+        return None
+    if not (config.DB_HOST and config.DB_NAME):
+        logger.info("ℹ️ Параметры БД не указаны - история не будет сохраняться")
+        return None
+    service = DatabaseService(candle_store=candle_store)
+    if not service.connection or not service.connection.is_connected():
+        logger.warning("⚠️ Не удалось подключиться к БД - история не будет сохраняться")
+        return None
+    return service
+
+
+def _create_correlation_engine():
+    engine = CorrelationEngine(
+        candle_store,
+        window=config.CORRELATION_WINDOW_HOURS,
+        ewma_halflife=config.CORRELATION_EWMA_HALFLIFE_HOURS
+    )
+    engine.refresh()
+    return engine
+
+
+def _storage_paths() -> Tuple[Optional[Path], Optional[Path]]:
+    """Файл состояния и каталог свечей; у симулятора свои, чтобы не смешивать синтетику с боевыми данными"""
+    if config.BYBIT_SIMULATOR:
+        root = Path(config.BYBIT_SIMULATOR_STATE_DIR or SIMULATOR_STATE_DIR)
+        return root / "bot_state.sqlite3", root / "candles"
+    return config.STATE_DB_PATH or None, config.CANDLE_STORE_DIR or None
+
+
+def _create_exchange_simulator():
+    if not config.BYBIT_SIMULATOR:
+        return None
+    options = dict(seed=config.BYBIT_SIMULATOR_SEED, balance=config.BYBIT_SIMULATOR_BALANCE,
+                   latency=config.BYBIT_SIMULATOR_LATENCY_MS / 1000, error_rate=config.BYBIT_SIMULATOR_ERROR_RATE,
+                   realtime=True)
+    if config.BYBIT_SIMULATOR_DATA:
+        simulator = ExchangeSimulator.from_candle_store(CandleStore(config.BYBIT_SIMULATOR_DATA), **options)
+    else:
+        simulator = ExchangeSimulator(**options)
+    logger.warning("⚠️ BYBIT_SIMULATOR=true - бот работает с локальным симулятором биржи, ордера не настоящие")
+    return simulator
+
+
+def _create_account_stream():
+    if not config.BYBIT_PRIVATE_STREAM:
+        logger.info("ℹ️ Приватный поток Bybit выключен - позиции опрашиваются через REST")
+        return None
+    if exchange_simulator:
+        return AccountStream(testnet=False, api_key="", api_secret="",
+                             websocket_factory=exchange_simulator.websocket)
+    return AccountStream(testnet=config.BYBIT_TESTNET, api_key=config.BYBIT_API_KEY,
+                         api_secret=config.BYBIT_API_SECRET)
+
+
+def _create_news_service():
+    if not config.PERPLEXITY_API_KEY:
+        logger.warning("PERPLEXITY_API_KEY не установлен - новостной анализ недоступен")
+        return None
+    return NewsService(api_key=config.PERPLEXITY_API_KEY)
+
+
 try:
-    logger.info("Инициализация сервисов...")
-    # Сначала инициализируем БД (если доступна), затем передаем в сервисы
-    db_service = None
-    try:
-        if config.DB_HOST and config.DB_NAME:
-            db_service = DatabaseService()
-            if db_service.connection and db_service.connection.is_connected():
-                db_service.init_tables()
-                logger.info("✅ База данных подключена и таблицы инициализированы")
-            else:
-                logger.warning("⚠️ Не удалось подключиться к БД - история не будет сохраняться")
-                db_service = None
-        else:
-            logger.info("ℹ️ Параметры БД не указаны - история не будет сохраняться")
-    except Exception as e:
-        logger.warning(f"⚠️ Ошибка при инициализации БД: {e} - история не будет сохраняться")
-        db_service = None
-    
-    bybit_service = BybitService(db_service=db_service)  # Передаем db_service для сохранения ошибок
-    logger.info("BybitService инициализирован")
-    ai_service = AIService()
-    logger.info("AIService инициализирован")
-    trading_decision_service = TradingDecisionService()
-    logger.info("TradingDecisionService инициализирован")
-    risk_management_service = RiskManagementService(db_service=db_service)
-    logger.info("RiskManagementService инициализирован")
-    # Инициализация NewsService (может быть None если API ключ не установлен)
-    news_service = None
-    try:
-        if config.PERPLEXITY_API_KEY:
-            news_service = NewsService(api_key=config.PERPLEXITY_API_KEY)
-            logger.info("NewsService инициализирован")
-        else:
-            logger.warning("PERPLEXITY_API_KEY не установлен - новостной анализ недоступен")
-    except Exception as e:
-        logger.warning(f"Не удалось инициализировать NewsService: {e}")
-    
-    market_analysis_service = MarketAnalysisService(news_service=news_service, db_service=db_service)
-    logger.info("MarketAnalysisService инициализирован")
+    state_path, candle_dir = _storage_paths()
+    with timed("state_store"):
+        # Состояние бота между перезапусками (позиции, карантин, автозакупка)
+        state_store = StateStore(state_path)
+    # Хранилище свечей на диске: наполняется при анализе рынка, используется для корреляций
+    candle_store = CandleStore(candle_dir)
+    # Матрица корреляций по свечам из хранилища (check_correlation и промпт выбора монеты)
+    correlation_engine = LazyService("CorrelationEngine", _create_correlation_engine)
+    # БД (None, если не настроена или недоступна)
+    db_service = LazyService("DatabaseService", _create_db_service)
+    # Асинхронный доступ к БД для корутин (пул создается при первом запросе, уже в цикле событий)
+    async_db_service = LazyService("AsyncDatabaseService", lambda: AsyncDatabaseService() if db_service else None)
+    # Локальный симулятор биржи (None, если BYBIT_SIMULATOR не включен)
+    exchange_simulator = LazyService("ExchangeSimulator", _create_exchange_simulator)
+    # Один клиент Bybit на все сервисы; db_service - для сохранения ошибок
+    bybit_service = LazyService(
+        "BybitService", lambda: BybitService(db_service=db_service, client=exchange_simulator._resolve())
+    )
+    # Приватный поток Bybit: книга позиций и баланса, события открытия/закрытия (запускается в main)
+    account_stream = LazyService("AccountStream", _create_account_stream)
+    # Справочник инструментов (шаги цены/объема, пределы плеча): из state_store, устаревший - в фоне
+    instrument_catalog = LazyService("InstrumentCatalog",
+                                     lambda: InstrumentCatalog(bybit_service, state_store=state_store))
+    # Исполнение входа (мейкер с догоном, рыночный добор) с телеметрией в order_executions
+    execution_engine = LazyService("ExecutionEngine", lambda: ExecutionEngine(bybit_service, db_service=db_service))
+    # Ордера на вход: TP/SL в самом ордере или фоновой задачей после исполнения
+    order_manager = LazyService("OrderManager", lambda: OrderManager(bybit_service, execution_engine=execution_engine))
+    ai_service = LazyService("AIService", lambda: AIService(correlation_engine=correlation_engine))
+    trading_decision_service = LazyService(
+        "TradingDecisionService",
+        lambda: TradingDecisionService(bybit_service=bybit_service, ai_service=ai_service)
+    )
+    risk_management_service = LazyService(
+        "RiskManagementService",
+        lambda: RiskManagementService(db_service=db_service, bybit_service=bybit_service,
+                                      correlation_engine=correlation_engine)
+    )
+    # NewsService может быть None, если API ключ не установлен
+    news_service = LazyService("NewsService", _create_news_service)
+    market_analysis_service = LazyService(
+        "MarketAnalysisService",
+        lambda: MarketAnalysisService(news_service=news_service, db_service=db_service,
+                                      bybit_service=bybit_service, risk_service=risk_management_service,
+                                      candle_store=candle_store)
+    )
     
     # Проверяем разрешенные chat_id
     allowed_chat_ids = []
@@ -79,60 +178,19 @@ except Exception as e:
 
 # Глобальная переменная для разрешенных chat_id
 ALLOWED_CHAT_IDS = allowed_chat_ids if 'allowed_chat_ids' in locals() else []
-MIN_QTY_BY_SYMBOL = {
-    # Базовые значения по умолчанию; при старте бота мы стараемся переопределить их
-    # реальными фильтрами с Bybit через get_instruments_info.
-    "BTCUSDT": 0.001,
-    "ETHUSDT": 0.01,
-    "BNBUSDT": 0.1,
-    "XRPUSDT": 10,
-    "SOLUSDT": 0.1,
-    "ADAUSDT": 10,
-    "DOGEUSDT": 100,
-    "AVAXUSDT": 0.1,
-    "MATICUSDT": 10,
-    "LINKUSDT": 0.1,
-    "TONUSDT": 1,
-    "TRXUSDT": 10,
-    "LTCUSDT": 0.01,
-    "NEARUSDT": 1,
-    "APTUSDT": 0.1,
-    "OPUSDT": 0.1,
-    "ARBUSDT": 1,
-    "POLUSDT": 10,
-    "SEIUSDT": 1,
-    "SUIUSDT": 1,
-}
-QTY_STEP_BY_SYMBOL = {
-    "BTCUSDT": 0.001,
-    "ETHUSDT": 0.001,
-    "BNBUSDT": 0.01,
-    "XRPUSDT": 1,
-    "SOLUSDT": 0.01,
-    "ADAUSDT": 1,
-    "DOGEUSDT": 1,
-    # Для AVAXUSDT шаг лота 0.1, поэтому округляем к 0.1
-    "AVAXUSDT": 0.1,
-    "MATICUSDT": 1,
-    "LINKUSDT": 0.1,
-    "TONUSDT": 0.1,
-    "TRXUSDT": 1,
-    "LTCUSDT": 0.001,
-    "NEARUSDT": 0.1,
-    "APTUSDT": 0.01,
-    "OPUSDT": 0.01,
-    "ARBUSDT": 0.1,
-    "POLUSDT": 1,
-    "SEIUSDT": 0.1,
-    "SUIUSDT": 0.1,
-}
 MAX_ACTIVE_POSITIONS = getattr(config, "AUTO_MAX_ACTIVE_POSITIONS", 3)
 AUTO_BUY_JOB_NAME = "auto_buy_job"
 AUTO_BUY_INTERVAL_SECONDS = 30
+AUTO_BUY_TIMEOUT_SECONDS = 25.0  # Бюджет одного цикла автозакупки (запас до следующего запуска)
+# Входы, чей цикл автозакупки прерван по таймауту: они доводятся до конца, результат забирает auto_buy_job
+_DETACHED_ENTRIES: Set[asyncio.Task] = set()
 DATA_COLLECTION_JOB_NAME = "data_collection_job"
 DATA_COLLECTION_INTERVAL_SECONDS = 60  # Каждую минуту
+DATA_COLLECTION_CONCURRENCY = 4  # Сколько монет собираются одновременно
 DATA_ROTATION_JOB_NAME = "data_rotation_job"
 DATA_ROTATION_INTERVAL_HOURS = 24  # Раз в день
+INSTRUMENT_REFRESH_JOB_NAME = "instrument_refresh_job"
+INSTRUMENT_REFRESH_INTERVAL_SECONDS = 3600  # Проверка раз в час, загрузка - если справочник старше суток
 SIGNAL_TRANSLATIONS = {
     "NEUTRAL": "НЕЙТРАЛЬНЫЙ",
     "N/A": "Н/Д",
@@ -166,111 +224,44 @@ def _translate_orientation(value: Optional[str]) -> str:
     return ORIENTATION_TRANSLATIONS.get(key, value or "позиция")
 
 
-def _calculate_net_profit(pnl_percent: float, use_maker: bool = True, include_additional_fee: bool = False) -> Dict[str, float]:
-    """
-    Рассчитать чистую прибыль с учетом комиссий.
-    
-    Args:
-        pnl_percent: Процент прибыли/убытка (например, 0.5 для 0.5%)
-        use_maker: Использовать мейкер-комиссию (True) или тейкер (False)
-        include_additional_fee: Включать ли дополнительную комиссию 0.05%
-    
-    Returns:
-        Dict с ключами: gross_pnl, entry_fee, exit_fee, additional_fee, total_fees, net_pnl, net_pnl_percent
-    """
-    entry_fee = MAKER_FEE if use_maker else TAKER_FEE
-    exit_fee = TAKER_FEE  # Выход всегда рыночный (стоп/тейк)
-    additional_fee = ADDITIONAL_FEE if include_additional_fee else 0.0
-    
-    total_fees = entry_fee + exit_fee + additional_fee
-    net_pnl_percent = pnl_percent - (total_fees * 100)  # Конвертируем в проценты
-    
-    return {
-        "gross_pnl": pnl_percent,
-        "entry_fee": entry_fee * 100,  # В процентах
-        "exit_fee": exit_fee * 100,
-        "additional_fee": additional_fee * 100,
-        "total_fees": total_fees * 100,
-        "net_pnl": net_pnl_percent,
-        "net_pnl_percent": net_pnl_percent
-    }
-
-
-LAST_TRADE_TIMES: Dict[str, datetime] = {}
-SYMBOL_FILTERS_REFRESHED = False
+LAST_TRADE_TIMES = state_store.namespace("last_trade_times")  # {symbol: datetime последней сделки}
 MONITOR_JOB_NAME = "active_monitor"
 MONITOR_INTERVAL_SECONDS = 300
 POSITION_POLL_JOB_NAME = "position_poll"
 POSITION_POLL_INTERVAL_SECONDS = 30
-TRADE_COOLDOWN_HOURS = 4
-# Через сколько секунд после открытия позиции принудительно пересчитать и обновить TP/SL
-TP_SL_REFRESH_DELAY_SECONDS = 30
-TP_SL_REFRESH_TASKS: Dict[str, asyncio.Task] = {}
+# При подключенном приватном потоке позиции сверяются с REST раз в столько секунд
+POSITION_RESYNC_INTERVAL_SECONDS = 300
 DATA_DIR = (Path(__file__).resolve().parent / "data")
 DATA_DIR.mkdir(parents=True, exist_ok=True)
-COOLDOWN_FILE = DATA_DIR / "last_trade_times.json"
+# Сэмплирующий профилировщик: /profile_start на N циклов автозакупки, /profile_report - отчет
+profiler = SamplingProfiler(interval=config.PROFILER_INTERVAL_MS / 1000, output_dir=config.PROFILER_DIR or None)
+PROFILER_DEFAULT_CYCLES = 3
+COOLDOWN_FILE = DATA_DIR / "last_trade_times.json"  # Старый формат карантина, переносится в state_store
 
 
-def _refresh_symbol_filters_from_exchange():
-    """
-    Попробовать подтянуть реальные min_qty и qty_step с Bybit для популярных монет.
-    Это позволяет избежать ошибок Qty invalid, даже если дефолты в коде отличаются.
-    """
-    global SYMBOL_FILTERS_REFRESHED
-    try:
-        symbols = set(MIN_QTY_BY_SYMBOL.keys())
-        # Добавляем популярные монеты из MarketAnalysisService (там уже топ-20)
-        try:
-            mas_symbols = getattr(market_analysis_service, "popular_coins", [])
-            symbols.update(mas_symbols)
-        except Exception:
-            pass
-
-        updated = []
-        for sym in sorted(symbols):
-            filters = bybit_service.get_symbol_filters(sym)
-            if not filters:
-                continue
-            MIN_QTY_BY_SYMBOL[sym] = filters["min_qty"]
-            QTY_STEP_BY_SYMBOL[sym] = filters["qty_step"]
-            updated.append(f"{sym}: min={filters['min_qty']}, step={filters['qty_step']}")
-
-        if updated:
-            logger.info(
-                "Обновлены биржевые фильтры объёма для символов:\n" + "\n".join(updated)
-            )
-            SYMBOL_FILTERS_REFRESHED = True
-    except Exception as e:
-        logger.warning(f"Не удалось обновить фильтры объёма с биржи: {e}")
-
-
-def _load_last_trade_times():
+def _migrate_last_trade_times():
+    """Перенести карантин из старого JSON-файла в state_store (один раз)"""
     if not COOLDOWN_FILE.exists():
         return
     try:
         with COOLDOWN_FILE.open("r", encoding="utf-8") as f:
             data = json.load(f)
+        migrated = {}
         for symbol, iso_time in data.items():
             try:
-                LAST_TRADE_TIMES[symbol.upper()] = datetime.fromisoformat(iso_time)
+                migrated[symbol.upper()] = datetime.fromisoformat(iso_time)
             except ValueError:
                 continue
-        logger.info(f"Загружено {len(LAST_TRADE_TIMES)} записей карантина из файла.")
-    except Exception as e:
-        logger.warning(f"Не удалось загрузить файл карантина: {e}")
-
-
-def _save_last_trade_times():
-    try:
-        serializable = {symbol: ts.isoformat() for symbol, ts in LAST_TRADE_TIMES.items()}
-        with COOLDOWN_FILE.open("w", encoding="utf-8") as f:
-            json.dump(serializable, f, ensure_ascii=False, indent=2)
+        # Записи, уже сохраненные в state_store, новее файла
+        LAST_TRADE_TIMES.update({s: ts for s, ts in migrated.items() if s not in LAST_TRADE_TIMES})
+        COOLDOWN_FILE.rename(COOLDOWN_FILE.with_suffix(".json.migrated"))
+        logger.info(f"Карантин перенесен из файла в state_store: {len(migrated)} записей.")
     except Exception as e:
-        logger.warning(f"Не удалось сохранить файл карантина: {e}")
+        logger.warning(f"Не удалось перенести файл карантина: {e}")
 
 
-_load_last_trade_times()
-_refresh_symbol_filters_from_exchange()
+_migrate_last_trade_times()
+logger.info(f"Восстановлено {len(LAST_TRADE_TIMES)} записей карантина.")
 
 
 def _record_trade_timestamp(symbol: str, timestamp: Optional[datetime] = None):
@@ -278,14 +269,13 @@ def _record_trade_timestamp(symbol: str, timestamp: Optional[datetime] = None):
     sym = symbol.upper()
     LAST_TRADE_TIMES[sym] = ts
     logger.info(f"Карантин: {sym} обновлён до {ts.isoformat()}")
-    _save_last_trade_times()
-AUTO_BUY_STATE = {
-    # После перезапуска бота автозакупка сразу включена,
-    # чтобы не приходилось каждый раз жать «Авто старт».
+AUTO_BUY_STATE = state_store.namespace("auto_buy", defaults={
+    # При первом запуске автозакупка сразу включена, чтобы не приходилось жать «Авто старт»;
+    # дальше включение/остановка переживают перезапуск бота.
     "enabled": True,
     "last_run": None,
     "last_result": "Ещё не запускалась"
-}
+})
 # Флаг для отслеживания, было ли отправлено уведомление о достижении лимита позиций
 LIMIT_NOTIFICATION_SENT = False
 def _get_command_keyboard() -> InlineKeyboardMarkup:
@@ -324,13 +314,10 @@ def _get_command_keyboard() -> InlineKeyboardMarkup:
 
 
 # Отслеживание состояния позиций для уведомлений
-POSITION_STATES: Dict[str, Dict] = {}  # {symbol: {"last_size": float, "notified_liquidation": bool, "notified_profit": bool, "target_profit": float}}
-
-# Комиссии Bybit (фьючерсы)
-MAKER_FEE = 0.0002  # 0.02% для мейкер-ордеров (лимитные)
-TAKER_FEE = 0.00055  # 0.055% для тейкер-ордеров (рыночные)
-ADDITIONAL_FEE = 0.0005  # 0.05% дополнительная комиссия (если применима)
-
+# {symbol: {"last_size": float, "notified_liquidation": bool, "notified_profit": bool, "target_profit": float}}
+# Хранится в state_store: после перезапуска уже известные позиции не уведомляются повторно.
+# После изменения вложенных полей - POSITION_STATES.save(symbol)
+POSITION_STATES = state_store.namespace("positions")
 
 def check_access(chat_id):
     """Проверка доступа по chat_id"""
@@ -350,90 +337,9 @@ def _get_cooldown_remaining(symbol: str) -> Optional[timedelta]:
     return cooldown - elapsed
 
 
-def _schedule_tp_sl_refresh(symbol: str):
-    """Запустить отложенное обновление TP/SL через 15 секунд после входа."""
-    symbol = (symbol or "").upper()
-    if not symbol:
-        return
-    if symbol in TP_SL_REFRESH_TASKS:
-        logger.debug(f"TP/SL refresh уже запланирован для {symbol}")
-        return
-
-    async def _job():
-        try:
-            await asyncio.sleep(TP_SL_REFRESH_DELAY_SECONDS)
-            await _refresh_tp_sl_for_symbol(symbol)
-        except Exception as e:
-            logger.error(f"Ошибка при отложенном обновлении TP/SL для {symbol}: {e}", exc_info=True)
-        finally:
-            TP_SL_REFRESH_TASKS.pop(symbol, None)
-
-    TP_SL_REFRESH_TASKS[symbol] = asyncio.create_task(_job())
-
-
-async def _refresh_tp_sl_for_symbol(symbol: str):
-    """Пересчитать и обновить TP/SL для конкретной позиции."""
-    try:
-        positions = bybit_service.get_positions() or []
-    except Exception as e:
-        logger.error(f"Не удалось получить позиции для обновления {symbol}: {e}")
-        return
-
-    position = next(
-        (pos for pos in positions if (pos.get("symbol") or "").upper() == symbol.upper() and _is_position_active(pos)),
-        None
-    )
-    if not position:
-        logger.info(f"Позиция {symbol} не найдена или закрыта — пропускаю обновление TP/SL.")
-        return
-
-    data = market_analysis_service.get_historical_data(symbol)
-    if not data:
-        logger.warning(f"Нет исторических данных для {symbol}, обновление TP/SL пропущено.")
-        return
-
-    raw_side = (position.get("side") or "").lower()
-    if raw_side == "buy":
-        side = "Long"
-    elif raw_side == "sell":
-        side = "Short"
-    else:
-        side = "Long" if position.get("positionIdx") in (0, 1) else "Short"
-
-    try:
-        entry_price = float(position.get("avgPrice") or position.get("entryPrice") or data.get("current_price", 0))
-    except (TypeError, ValueError):
-        entry_price = data.get("current_price", 0)
-
-    if entry_price <= 0:
-        logger.warning(f"Не удалось определить цену входа для {symbol}, TP/SL не обновлены.")
-        return
-
-    volatility_percent = max(data.get("volatility", 2) / 100, 0.01)
-    historical = data.get("historical") or {}
-    atr = historical.get("atr")
-    stop_loss = risk_management_service.get_recommended_stop_loss(entry_price, side, volatility_percent, atr)
-    target_gross_pnl = 0.5
-    take_profit = entry_price * (1 + target_gross_pnl / 100) if side == "Long" else entry_price * (1 - target_gross_pnl / 100)
-
-    result = bybit_service.update_tp_sl(symbol, stop_loss, take_profit)
-    if result.get("stop_loss") or result.get("take_profit"):
-        logger.info(f"Отложенное обновление TP/SL выполнено для {symbol}: SL={stop_loss:.4f}, TP={take_profit:.4f}")
-    else:
-        logger.warning(f"Не удалось обновить TP/SL для {symbol} при отложенном запуске: {result.get('errors')}")
-
-
 def _normalize_order_qty(symbol: str, qty: float) -> float:
-    """Привести количество к допустимому шагу и минимуму биржи."""
-    symbol = symbol.upper()
-    step = QTY_STEP_BY_SYMBOL.get(symbol, 0.0001)
-    min_qty = MIN_QTY_BY_SYMBOL.get(symbol, step)
-    if step <= 0:
-        step = 0.0001
-    normalized = math.floor(qty / step) * step
-    if normalized < min_qty:
-        normalized = min_qty
-    return round(normalized, 6)
+    """Привести количество к допустимому шагу и пределам биржи (справочник инструментов)."""
+    return instrument_catalog.normalize_qty(symbol, qty)
 
 
 async def _broadcast_message(bot, text: str):
@@ -1051,7 +957,10 @@ async def get_news(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         # Получаем новостной контекст
-        news_context = news_service.get_trading_news_context(symbol)
+        news_context = news_service.get_trading_news_context(
+            symbol,
+            batched_news=news_service.get_batched_symbol_news([symbol], max_results_per_symbol=5)
+        )
         
         await loading_msg.delete()
         
@@ -1381,15 +1290,22 @@ async def prediction_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Ошибка при тесте предсказаний: {str(e)}")
 
 
-async def _execute_auto_trade(overview: Dict, update: Update) -> Optional[str]:
+async def _execute_auto_trade(overview: Dict, update: Update, deadline: Optional[float] = None) -> Optional[str]:
     """
     Выполнить автоматическую торговую сделку в рамках /market_overview.
     Теперь заполняем столько доступных слотов, сколько разрешает MAX_ACTIVE_POSITIONS.
+    deadline - момент time.monotonic(), к которому входы должны завершиться (None - без ограничения).
     """
     try:
         global LIMIT_NOTIFICATION_SENT, db_service
+        # Время этапов - в pipeline_stage_seconds (services/metrics.py)
+        stages = StageTimer("auto_trade")
+        
+        # Свечи из обзора рынка уже в хранилище - досчитываем матрицу корреляций
+        correlation_engine.refresh()
         
         existing_positions = bybit_service.get_positions() or []
+        stages.lap("positions")
         active_positions = [pos for pos in existing_positions if _is_position_active(pos)]
         active_count = len(active_positions)
         
@@ -1450,6 +1366,14 @@ async def _execute_auto_trade(overview: Dict, update: Update) -> Optional[str]:
         ai_trade_plans: Dict[str, Dict] = {}
         market_payloads: Dict[str, Dict] = {}
         if analysis_pool:
+            # Новости по всем монетам пула - одним пакетным запросом вместо N отдельных
+            batched_news: Dict[str, Dict] = {}
+            if news_service:
+                batched_news = news_service.get_batched_symbol_news(
+                    [asset["symbol"] for asset in analysis_pool],
+                    max_results_per_symbol=5
+                )
+            
             for asset in analysis_pool:
                 symbol = asset["symbol"]
                 market_data = bybit_service.get_market_data_comprehensive(symbol)
@@ -1465,7 +1389,7 @@ async def _execute_auto_trade(overview: Dict, update: Update) -> Optional[str]:
                     market_data["order_book"] = order_book
                 
                 if news_service:
-                    symbol_news = news_service.get_symbol_specific_news(symbol, max_results=5)
+                    symbol_news = batched_news.get(symbol)
                     if symbol_news:
                         news_summary = []
                         for news_item in symbol_news.get("news", [])[:5]:
@@ -1498,6 +1422,7 @@ async def _execute_auto_trade(overview: Dict, update: Update) -> Optional[str]:
                 }
                 ai_market_data.append(payload)
                 market_payloads[symbol] = payload
+            stages.lap("market_data")
             
             if ai_market_data:
                 try:
@@ -1512,6 +1437,7 @@ async def _execute_auto_trade(overview: Dict, update: Update) -> Optional[str]:
                         logger.info(f"AI рекомендует: {ai_recommended_symbol}")
                 except Exception as e:
                     logger.warning(f"Ошибка при AI-анализе для выбора монеты: {e}")
+                stages.lap("ai_selection")
                 
                 for payload in ai_market_data:
                     symbol = payload["symbol"]
@@ -1523,6 +1449,7 @@ async def _execute_auto_trade(overview: Dict, update: Update) -> Optional[str]:
                             logger.info(f"AI-план подготовлен для {symbol}")
                     except Exception as plan_error:
                         logger.warning(f"AI не смог построить план для {symbol}: {plan_error}")
+                stages.lap("ai_plans")
 
         opened_messages: List[str] = []
         used_symbols: set[str] = set()
@@ -1546,9 +1473,11 @@ async def _execute_auto_trade(overview: Dict, update: Update) -> Optional[str]:
                 break
             used_symbols.add(asset["symbol"])
             recommend_context = ai_analysis if asset.get("symbol") == ai_recommended_symbol else None
-            trade_msg = await _open_trade_for_asset(asset, overview, update, asset_ai_plan, recommend_context)
+            trade_msg = await _open_trade_for_asset(asset, overview, update, asset_ai_plan, recommend_context,
+                                                    deadline=deadline)
             if trade_msg:
                 opened_messages.append(trade_msg)
+        stages.lap("orders")
         
         if opened_messages:
             return "\n".join(opened_messages)
@@ -1559,11 +1488,19 @@ async def _execute_auto_trade(overview: Dict, update: Update) -> Optional[str]:
         return f"⚠️ Тестовая сделка не выполнена: {str(e)}"
 
 
-async def _open_trade_for_asset(asset: Dict, overview: Dict, update: Update, ai_plan: Optional[Dict], ai_recommendation: Optional[Dict]) -> Optional[str]:
-    """Разместить сделку по конкретному asset из best_assets."""
+async def _open_trade_for_asset(asset: Dict, overview: Dict, update: Update, ai_plan: Optional[Dict], ai_recommendation: Optional[Dict],
+                                deadline: Optional[float] = None) -> Optional[str]:
+    """
+    Разместить сделку по конкретному asset из best_assets.
+
+    deadline - момент time.monotonic(), к которому вход должен завершиться (бюджет цикла автозакупки).
+    Размещение и запись сделки идут отдельной задачей: отмена вызывающего (таймаут цикла)
+    ее не прерывает, результат забирает auto_buy_job через _DETACHED_ENTRIES.
+    """
+    decision_time = datetime.utcnow()
     symbol = asset["symbol"]
     data = asset["data"]
-    leverage = asset["leverage_info"]["recommended_leverage"]
+    leverage = instrument_catalog.clamp_leverage(symbol, asset["leverage_info"]["recommended_leverage"])
     order_flow = overview.get("order_flow", {}) or {}
     # Получаем текущие позиции один раз, чтобы использовать их во всех проверках
     existing_positions = bybit_service.get_positions() or []
@@ -1583,8 +1520,6 @@ async def _open_trade_for_asset(asset: Dict, overview: Dict, update: Update, ai_
         return f"⚠️ Дневной лимит убытков достигнут ({daily_loss_check.get('daily_loss_percent', 0):.2f}%). Торговля приостановлена."
     
     entry_price = data["current_price"]
-    ai_note = ""
-    missing_data_note = ""
     
     # Получаем ATR из исторических данных
     historical = data.get("historical") or {}
@@ -1641,119 +1576,97 @@ async def _open_trade_for_asset(asset: Dict, overview: Dict, update: Update, ai_
     qty = _normalize_order_qty(symbol, qty)
     if qty <= 0:
         return None
+    stop_loss = instrument_catalog.round_price(symbol, stop_loss)
+    take_profit = instrument_catalog.round_price(symbol, take_profit)
 
     order_side = "Buy" if side == "Long" else "Sell"
     logger.info(f"Попытка разместить ордер: {symbol}, side={order_side}, qty={qty}, entry={entry_price}, SL={stop_loss}, TP={take_profit}")
-    order_result = bybit_service.place_order(
-        symbol=symbol,
-        side=order_side,
-        qty=qty,
-        stop_loss=stop_loss,
-        take_profit=take_profit,
-        prefer_maker=False
-    )
 
-    if not order_result or order_result.get("error"):
-        error_text = order_result.get("error") if isinstance(order_result, dict) else "Bybit вернул ошибку."
-        return f"⚠️ Не удалось разместить сделку ({error_text})."
+    async def place_and_record() -> Optional[str]:
+        order_result = await order_manager.place_entry(
+            symbol=symbol,
+            side=order_side,
+            qty=qty,
+            stop_loss=stop_loss,
+            take_profit=take_profit,
+            expected_price=entry_price,
+            decision_time=decision_time,
+            deadline=deadline
+        )
 
-    logger.info(f"✅ Ордер успешно размещен для {symbol}: {order_result}")
-    # Карантин устанавливается при ЗАКРЫТИИ позиции, а не при открытии
-    
-    # Сохраняем сделку в БД
-    if db_service:
-        try:
-            bot_name = getattr(config, "BOT_NAME", "main")
-            db_service.save_trade(
-                symbol=symbol,
-                side=side,
-                entry_price=entry_price,
-                quantity=qty,
-                leverage=leverage,
-                stop_loss=stop_loss,
-                take_profit=take_profit,
-                bot_name=bot_name,
-                status="open"
-            )
-            logger.info(f"💾 Сделка сохранена в БД: {symbol} {side}")
-        except Exception as e:
-            logger.warning(f"Не удалось сохранить сделку в БД: {e}")
-    
-    # Всегда планируем отложенное обновление TP/SL через TP_SL_REFRESH_DELAY_SECONDS,
-    # даже если биржа сообщила, что уровни уже установлены. Так мы гарантируем,
-    # что через ~30 секунд стоп/тейк будут пересчитаны и установлены повторно.
-    logger.info(f"Планирую отложенное обновление TP/SL для {symbol} через {TP_SL_REFRESH_DELAY_SECONDS} сек.")
-    _schedule_tp_sl_refresh(symbol)
+        if not order_result or order_result.get("error"):
+            error_text = order_result.get("error") if isinstance(order_result, dict) else "Bybit вернул ошибку."
+            return f"⚠️ Не удалось разместить сделку ({error_text})."
 
-    if side == "Long":
-        pnl_percent = ((take_profit - entry_price) / entry_price) * 100 if entry_price > 0 else 0
-    else:
-        pnl_percent = ((entry_price - take_profit) / entry_price) * 100 if entry_price > 0 else 0
-    profit_calc = _calculate_net_profit(pnl_percent, use_maker=True, include_additional_fee=False)
-    net_profit_percent = profit_calc['net_pnl']
-
-    explanation_source = ai_plan or ai_recommendation
-    if explanation_source:
-        confidence = explanation_source.get("confidence", 0)
-        reasoning = explanation_source.get("reasoning", "")
-        missing_data = explanation_source.get("missing_data", [])
-        ai_note = f"\n🤖 AI-решение: уверенность {confidence*100:.0f}%\n💡 {reasoning}\n"
-        if missing_data:
-            missing_list = "\n".join([f"  • {item}" for item in missing_data])
-            missing_data_note = f"\n⚠️ AI сообщает, что для 100% уверенности не хватает:\n{missing_list}\n"
+        logger.info(f"✅ Ордер успешно размещен для {symbol}: {order_result}")
+        # Карантин устанавливается при ЗАКРЫТИИ позиции, а не при открытии
 
-    return (
-        f"✅ Автоматическая сделка выполнена:\n\n"
-        f"Монета: {symbol}\n"
-        f"Тип: {'ЛОНГ' if side == 'Long' else 'ШОРТ'}\n"
-        f"Вход: ${entry_price:.2f}\n"
-        f"Размер: {qty:.6f}\n"
-        f"Плечо: {leverage}x\n"
-        f"Стоп-лосс: ${stop_loss:.2f}\n"
-        f"Тейк-профит: ${take_profit:.2f}\n"
-        f"Риск: ${risk_amount:.2f}\n"
-        f"💰 Чистая прибыль: {net_profit_percent:.2f}% (с учетом комиссий: вход мейкер 0.02% + выход тейкер 0.055%)\n"
-        f"{ai_note}"
-        f"{missing_data_note}"
-        f"ID ордера: {order_result.get('orderId', 'N/A')}\n\n"
-        f"🔔 Мониторинг: /monitor start"
-    )
+        # Цена входа - фактическая средняя цена исполнения, если она известна
+        fill_price = (order_result.get("execution") or {}).get("avg_price") or entry_price
 
+        # Сохраняем сделку в БД
+        if db_service:
+            try:
+                bot_name = getattr(config, "BOT_NAME", "main")
+                await async_db_service.save_trade(
+                    symbol=symbol,
+                    side=side,
+                    entry_price=fill_price,
+                    quantity=qty,
+                    leverage=leverage,
+                    stop_loss=stop_loss,
+                    take_profit=take_profit,
+                    bot_name=bot_name,
+                    status="open"
+                )
+                logger.info(f"💾 Сделка сохранена в БД: {symbol} {side}")
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить сделку в БД: {e}")
 
-def _determine_trade_side(status: Optional[str], trend: Optional[str]) -> str:
-    """
-    Логика выбора направления сделки с учетом перекупленности/перепроданности:
-      - OVERBOUGHT → Short (но если тренд сильный бычий, может быть Long)
-      - OVERSOLD → Long (но если тренд сильный медвежий, может быть Short)
-      - BALANCED/NEUTRAL → Long по умолчанию (бычий рынок в целом)
-      - Медвежий тренд → Short
-      - Бычий тренд → Long
-    """
-    status = (status or "BALANCED").upper()
-    trend = (trend or "сбалансирован").lower()
-
-    # Явная перепроданность - хорошая возможность для Long
-    if status == "OVERSOLD":
-        # Если тренд очень медвежий, может быть опасно открывать Long
-        if "сильный медвеж" in trend or "критическ" in trend:
-            return "Short"  # Следуем тренду
-        return "Long"  # Перепроданность = возможность для отскока
-    
-    # Явная перекупленность - возможность для Short
-    if status == "OVERBOUGHT":
-        # Если тренд очень бычий, может быть опасно открывать Short
-        if "сильный быч" in trend or "критическ" in trend:
-            return "Long"  # Следуем тренду
-        return "Short"  # Перекупленность = возможность для коррекции
-    
-    # Если статус BALANCED или NEUTRAL, смотрим на тренд
-    if "медвеж" in trend:
-        return "Short"
-    if "быч" in trend:
-        return "Long"
-    
-    # По умолчанию Long (бычий рынок в целом)
-    return "Long"
+        if side == "Long":
+            pnl_percent = ((take_profit - fill_price) / fill_price) * 100 if fill_price > 0 else 0
+        else:
+            pnl_percent = ((fill_price - take_profit) / fill_price) * 100 if fill_price > 0 else 0
+        profit_calc = _calculate_net_profit(pnl_percent, use_maker=True, include_additional_fee=False)
+        net_profit_percent = profit_calc['net_pnl']
+
+        ai_note = ""
+        missing_data_note = ""
+        explanation_source = ai_plan or ai_recommendation
+        if explanation_source:
+            confidence = explanation_source.get("confidence", 0)
+            reasoning = explanation_source.get("reasoning", "")
+            missing_data = explanation_source.get("missing_data", [])
+            ai_note = f"\n🤖 AI-решение: уверенность {confidence*100:.0f}%\n💡 {reasoning}\n"
+            if missing_data:
+                missing_list = "\n".join([f"  • {item}" for item in missing_data])
+                missing_data_note = f"\n⚠️ AI сообщает, что для 100% уверенности не хватает:\n{missing_list}\n"
+
+        return (
+            f"✅ Автоматическая сделка выполнена:\n\n"
+            f"Монета: {symbol}\n"
+            f"Тип: {'ЛОНГ' if side == 'Long' else 'ШОРТ'}\n"
+            f"Вход: ${fill_price:.2f}\n"
+            f"Размер: {qty:.6f}\n"
+            f"Плечо: {leverage}x\n"
+            f"Стоп-лосс: ${stop_loss:.2f}\n"
+            f"Тейк-профит: ${take_profit:.2f}\n"
+            f"Риск: ${risk_amount:.2f}\n"
+            f"💰 Чистая прибыль: {net_profit_percent:.2f}% (с учетом комиссий: вход мейкер 0.02% + выход тейкер 0.055%)\n"
+            f"{ai_note}"
+            f"{missing_data_note}"
+            f"ID ордера: {order_result.get('orderId', 'N/A')}\n\n"
+            f"🔔 Мониторинг: /monitor start"
+        )
+
+    # Ордер уходит в потоке и не отменяется вместе с корутиной: без shield таймаут цикла
+    # потерял бы запись сделки, уведомление и установку TP/SL уже размещенного входа
+    entry_task = asyncio.create_task(place_and_record())
+    try:
+        return await asyncio.shield(entry_task)
+    except asyncio.CancelledError:
+        _DETACHED_ENTRIES.add(entry_task)
+        raise
 
 
 async def _send_long_message(update: Update, message: str):
@@ -1798,41 +1711,17 @@ async def monitor_active_positions(context: ContextTypes.DEFAULT_TYPE):
 
     timestamp = datetime.now().strftime("%d.%m %H:%M")
 
+    # Данные по каждой монете запрашиваются один раз, все монеты параллельно;
+    # результат общий для проверки TP/SL, состояния позиции и отчета
+    inputs = await asyncio.gather(*(_fetch_monitoring_inputs(symbol) for symbol in positions_by_symbol))
+    inputs_by_symbol = dict(zip(positions_by_symbol, inputs))
+
     # ВАЖНО: Проверяем и переустанавливаем условные ордера, если их нет
     # Это гарантирует, что тейк-профит и стоп-лосс всегда работают автоматически
-    for symbol, position_meta in positions_by_symbol.items():
-        try:
-            size = float(position_meta.get("size", 0) or 0)
-            if abs(size) < 0.001:
-                continue
-            
-            # Получаем данные для расчета стопов и тейков
-            data = market_analysis_service.get_historical_data(symbol)
-            if not data:
-                continue
-            
-            exit_plan = _build_exit_plan(symbol, data, position_meta)
-            stop_loss = exit_plan.get("stop_loss")
-            take_profit = exit_plan.get("take_profit")
-            
-            # Проверяем, установлены ли стоп-лосс и тейк-профит в позиции
-            current_stop = position_meta.get("stopLoss")
-            current_tp = position_meta.get("takeProfit")
-            
-            # Если стоп-лосс или тейк-профит не установлены, устанавливаем их
-            if stop_loss and not current_stop:
-                logger.info(f"🔄 Устанавливаю стоп-лосс для {symbol}: ${stop_loss}")
-                bybit_service.update_stop_loss(symbol, stop_loss)
-            
-            if take_profit and not current_tp:
-                logger.info(f"🔄 Устанавливаю тейк-профит для {symbol}: ${take_profit}")
-                # Устанавливаем тейк-профит через set_trading_stop
-                bybit_service.set_trading_stop(
-                    symbol=symbol,
-                    take_profit=take_profit
-                )
-        except Exception as e:
-            logger.warning(f"Мониторинг: ошибка при проверке условных ордеров для {symbol}: {e}")
+    await asyncio.gather(*(
+        asyncio.to_thread(_repair_tp_sl, symbol, position_meta, inputs_by_symbol[symbol]["data"])
+        for symbol, position_meta in positions_by_symbol.items()
+    ))
 
     # Проверка ликвидаций и профитов
     await _check_position_events(bot, positions_by_symbol)
@@ -1853,9 +1742,10 @@ async def monitor_active_positions(context: ContextTypes.DEFAULT_TYPE):
     ]
 
     for symbol, position_meta in positions_by_symbol.items():
-        message_parts.append(_build_monitoring_report(symbol, position_meta))
+        symbol_inputs = inputs_by_symbol[symbol]
+        message_parts.append(_build_monitoring_report(symbol, position_meta, **symbol_inputs))
         # Обновляем состояние позиции
-        _update_position_state(symbol, position_meta)
+        _update_position_state(symbol, position_meta, data=symbol_inputs["data"])
 
     full_message = "\n".join(message_parts)
 
@@ -1863,12 +1753,95 @@ async def monitor_active_positions(context: ContextTypes.DEFAULT_TYPE):
         await _send_text_chunks(bot, chat_id, full_message)
 
 
+async def _fetch_monitoring_inputs(symbol: str) -> Dict:
+    """Данные для мониторинга монеты: история (вместе со стаканом) и новости - параллельно, по одному запросу"""
+    async def fetch_news():
+        if not news_service:
+            return None
+        try:
+            return await asyncio.to_thread(news_service.get_symbol_specific_news,
+                                           symbol.replace("USDT", ""), max_results=3)
+        except Exception as e:
+            logger.warning(f"Мониторинг: не удалось получить новости для {symbol}: {e}")
+            return None
+
+    # Снимок в market_history пишет data_collection_job, мониторингу он не нужен
+    data, news_ctx = await asyncio.gather(
+        asyncio.to_thread(market_analysis_service.get_historical_data, symbol, save_snapshot=False),
+        fetch_news(),
+        return_exceptions=True
+    )
+    if isinstance(data, Exception):
+        logger.warning(f"Мониторинг: не удалось получить данные для {symbol}: {data}")
+        data = None
+    if isinstance(news_ctx, Exception):
+        news_ctx = None
+    # Стакан уже получен внутри get_historical_data - повторно не запрашиваем
+    order_book = data.get("order_book") if data else None
+    return {"data": data, "order_book": order_book, "news_ctx": news_ctx}
+
+
+def _repair_tp_sl(symbol: str, position_meta: Dict, data: Optional[Dict]):
+    """Поставить стоп-лосс и тейк-профит, если их нет у позиции (план выхода - по общим данным)"""
+    try:
+        size = float(position_meta.get("size", 0) or 0)
+        if abs(size) < 0.001 or not data:
+            return
+        
+        exit_plan = _build_exit_plan(symbol, data, position_meta)
+        stop_loss = exit_plan.get("stop_loss")
+        take_profit = exit_plan.get("take_profit")
+        
+        # Проверяем, установлены ли стоп-лосс и тейк-профит в позиции
+        current_stop = position_meta.get("stopLoss")
+        current_tp = position_meta.get("takeProfit")
+        
+        # Если стоп-лосс или тейк-профит не установлены, устанавливаем их
+        if stop_loss and not current_stop:
+            logger.info(f"🔄 Устанавливаю стоп-лосс для {symbol}: ${stop_loss}")
+            bybit_service.update_stop_loss(symbol, stop_loss)
+        
+        if take_profit and not current_tp:
+            logger.info(f"🔄 Устанавливаю тейк-профит для {symbol}: ${take_profit}")
+            # Устанавливаем тейк-профит через set_trading_stop
+            bybit_service.set_trading_stop(
+                symbol=symbol,
+                take_profit=take_profit
+            )
+    except Exception as e:
+        logger.warning(f"Мониторинг: ошибка при проверке условных ордеров для {symbol}: {e}")
+
+
+@track_job(POSITION_POLL_JOB_NAME, budget=POSITION_POLL_INTERVAL_SECONDS)
 async def position_poll_job(context: ContextTypes.DEFAULT_TYPE):
-    """Проверка состояния позиций каждые 30 секунд."""
+    """
+    Проверка состояния позиций каждые 30 секунд.
+    
+    При подключенном приватном потоке открытие/закрытие приходят событиями (_on_account_event),
+    здесь только обновляются цены для проверки профита/ликвидации и раз в
+    POSITION_RESYNC_INTERVAL_SECONDS книга сверяется с REST.
+    """
     if not ALLOWED_CHAT_IDS:
         return
     
     bot = context.bot
+    if account_stream and account_stream.is_live():
+        last_reconcile = account_stream.last_reconcile_at or 0
+        if time.time() - last_reconcile >= POSITION_RESYNC_INTERVAL_SECONDS:
+            # Расхождения книги и REST придут событиями в _on_account_event
+            await asyncio.to_thread(_reconcile_account_stream)
+            return
+        active_positions = {pos.get("symbol"): pos for pos in account_stream.positions()}
+        tickers = await asyncio.gather(
+            *(asyncio.to_thread(bybit_service.get_ticker, symbol) for symbol in active_positions)
+        )
+        for symbol, ticker in zip(list(active_positions), tickers):
+            if ticker and ticker.get("last_price"):
+                account_stream.update_mark_price(symbol, ticker["last_price"])
+                active_positions[symbol]["markPrice"] = ticker["last_price"]
+        await _check_position_events(bot, active_positions)
+        return
+    
     try:
         positions = bybit_service.get_positions() or []
     except Exception as e:
@@ -1895,77 +1868,172 @@ async def position_poll_job(context: ContextTypes.DEFAULT_TYPE):
         if abs(prev_size) > 0.0001 and symbol not in active_positions:
             await _notify_position_closed(bot, symbol, state)
             POSITION_STATES[symbol]["last_size"] = 0.0
+            POSITION_STATES.save(symbol)
     
     # Проверяем события (ликвидации, профиты)
     await _check_position_events(bot, active_positions)
 
 
+def _reconcile_account_stream() -> bool:
+    """Сверить книгу приватного потока со снимком позиций и баланса из REST"""
+    taken_at = time.time()
+    positions = bybit_service.get_positions_snapshot()
+    if positions is None:
+        return False
+    account_stream.reconcile(positions, balance=bybit_service.get_balance(fresh=True), taken_at=taken_at)
+    return True
+
+
+async def _on_account_event(bot, event: str, symbol: str, position_meta: Dict):
+    """Событие приватного потока: открытие, изменение, закрытие позиции или ликвидация"""
+    if not ALLOWED_CHAT_IDS:
+        return
+    try:
+        if event == POSITION_OPENED:
+            was_active = abs(POSITION_STATES.get(symbol, {}).get("last_size", 0.0)) > 0.0001
+            if not was_active:
+                await _notify_position_opened(bot, symbol, position_meta)
+            await asyncio.to_thread(_update_position_state, symbol, position_meta)
+        elif event == POSITION_UPDATED:
+            state = POSITION_STATES.get(symbol)
+            size = float(position_meta.get("size") or 0)
+            # Цель профита пересчитывается только при изменении размера (запрос истории свечей)
+            if not state or abs(state.get("last_size", 0.0) - size) > 1e-12:
+                await asyncio.to_thread(_update_position_state, symbol, position_meta)
+            await _check_position_events(bot, {symbol: position_meta})
+        elif event == POSITION_CLOSED:
+            state = POSITION_STATES.get(symbol)
+            if state and abs(state.get("last_size", 0.0)) > 0.0001:
+                await _notify_position_closed(bot, symbol, state)
+                POSITION_STATES[symbol]["last_size"] = 0.0
+                POSITION_STATES.save(symbol)
+        elif event == LIQUIDATION:
+            state = POSITION_STATES.get(symbol) or {}
+            if not state.get("notified_liquidation", False):
+                pnl = float(position_meta.get("unrealisedPnl") or 0)
+                await _notify_liquidation(bot, symbol, position_meta, pnl)
+                if symbol in POSITION_STATES:
+                    POSITION_STATES[symbol]["notified_liquidation"] = True
+                    POSITION_STATES.save(symbol)
+    except Exception as e:
+        logger.error(f"Ошибка обработки события {event} {symbol}: {e}", exc_info=True)
+
+
+def _start_account_stream(bot, loop: asyncio.AbstractEventLoop):
+    """Подключить приватный поток, заполнить книгу из REST и переключить на нее BybitService"""
+    if not account_stream:
+        return
+    stream = account_stream._resolve()
+    
+    def forward(event, symbol, data):
+        # Сообщения приходят в потоке WebSocket - обработка в цикле событий бота
+        if event in (POSITION_OPENED, POSITION_UPDATED, POSITION_CLOSED, LIQUIDATION):
+            asyncio.run_coroutine_threadsafe(_on_account_event(bot, event, symbol, data), loop)
+    
+    stream.add_listener(forward)
+    order_manager.bind_stream(stream, loop)
+    if not stream.start() or not _reconcile_account_stream():
+        return
+    bybit_service.attach_account_stream(stream)
+    
+    # Позиции, закрытые, пока бот был остановлен: в книге их нет, событий не будет
+    active = {pos.get("symbol") for pos in stream.positions()}
+    for symbol, state in list(POSITION_STATES.items()):
+        if abs(state.get("last_size", 0.0)) > 0.0001 and symbol not in active:
+            asyncio.run_coroutine_threadsafe(
+                _on_account_event(bot, POSITION_CLOSED, symbol, {"symbol": symbol, "size": "0"}), loop
+            )
+
+
+async def _collect_symbol_data(symbol: str, semaphore: asyncio.Semaphore) -> bool:
+    """Собрать данные по одной монете: запросы к бирже - в потоках, запись в БД - через пул"""
+    async with semaphore:
+        try:
+            # Получаем данные
+            ticker, funding, oi = await asyncio.gather(
+                asyncio.to_thread(bybit_service.get_ticker, symbol),
+                asyncio.to_thread(bybit_service.get_funding_rate, symbol),
+                asyncio.to_thread(bybit_service.get_open_interest, symbol)
+            )
+            if not ticker:
+                logger.warning(f"⚠️ Не удалось получить ticker для {symbol}")
+                return False
+            
+            # Сохраняем в кэш для быстрого доступа - параллельно с загрузкой исторических данных
+            cache_data = {
+                "ticker": ticker,
+                "funding": funding,
+                "open_interest": oi,
+                "timestamp": datetime.utcnow().isoformat()
+            }
+            cache_task = asyncio.create_task(
+                async_db_service.save_to_cache(symbol, "market_data", cache_data, ttl_minutes=2)
+            )
+            
+            # Получаем исторические данные, снимок в market_history сохраняем сами
+            historical = await asyncio.to_thread(
+                market_analysis_service.get_historical_data, symbol, save_snapshot=False
+            )
+            if historical and historical.get("db_snapshot"):
+                await async_db_service.save_market_snapshot(symbol, historical["db_snapshot"], historical)
+            await cache_task
+            
+            return bool(historical)
+        except Exception as e:
+            logger.error(f"Ошибка при сборе данных для {symbol}: {e}")
+            # Сохраняем ошибку в БД
+            await async_db_service.save_api_error("data_collection", symbol, "EXCEPTION", str(e))
+            return False
+
+
+@track_job(DATA_COLLECTION_JOB_NAME, budget=DATA_COLLECTION_INTERVAL_SECONDS)
 async def data_collection_job(context: ContextTypes.DEFAULT_TYPE):
     """
     Фоновый job для наполнения БД данными каждую минуту.
-    Собирает данные по всем популярным монетам и сохраняет в БД.
+    Собирает данные по всем популярным монетам (до DATA_COLLECTION_CONCURRENCY одновременно)
+    и сохраняет в БД через асинхронный пул, не блокируя цикл событий.
     """
-    if not db_service or not db_service.connection or not db_service.connection.is_connected():
+    if not async_db_service or not db_service.connection or not db_service.connection.is_connected():
         return
     
     try:
         logger.info("🔄 Начало сбора данных для БД...")
         
         # Очищаем истекший кэш
-        db_service.cleanup_expired_cache()
+        await async_db_service.cleanup_expired_cache()
         
         # Собираем данные по всем популярным монетам
         symbols = market_analysis_service.popular_coins
-        collected = 0
-        errors = 0
-        
-        for symbol in symbols:
-            try:
-                # Получаем данные
-                ticker = bybit_service.get_ticker(symbol)
-                if not ticker:
-                    logger.warning(f"⚠️ Не удалось получить ticker для {symbol}")
-                    errors += 1
-                    continue
-                
-                funding = bybit_service.get_funding_rate(symbol)
-                oi = bybit_service.get_open_interest(symbol)
-                
-                # Сохраняем в кэш для быстрого доступа
-                cache_data = {
-                    "ticker": ticker,
-                    "funding": funding,
-                    "open_interest": oi,
-                    "timestamp": datetime.utcnow().isoformat()
-                }
-                if db_service:
-                    db_service.save_to_cache(symbol, "market_data", cache_data, ttl_minutes=2)
-                
-                # Получаем исторические данные (они автоматически сохраняются в market_history)
-                historical = market_analysis_service.get_historical_data(symbol)
-                
-                if historical:
-                    collected += 1
-                else:
-                    errors += 1
-                    
-            except Exception as e:
-                logger.error(f"Ошибка при сборе данных для {symbol}: {e}")
-                errors += 1
-                # Сохраняем ошибку в БД
-                if db_service:
-                    db_service.save_api_error("data_collection", symbol, "EXCEPTION", str(e))
+        semaphore = asyncio.Semaphore(DATA_COLLECTION_CONCURRENCY)
+        results = await asyncio.gather(*(_collect_symbol_data(symbol, semaphore) for symbol in symbols))
+        collected = sum(1 for result in results if result)
+        errors = len(results) - collected
         
         logger.info(f"✅ Сбор данных завершен: собрано {collected}/{len(symbols)}, ошибок: {errors}")
         
+        # Досчитываем агрегаты 5m/1h/1d по новым снимкам
+        rollup_results = await asyncio.to_thread(db_service.rollup_service.run)
+        logger.info(f"✅ Агрегаты market_history обновлены: {rollup_results}")
+        
     except Exception as e:
         logger.error(f"Критическая ошибка в data_collection_job: {e}", exc_info=True)
 
 
+def _run_data_rotation() -> list:
+    """Ротация в фоновом потоке на отдельном подключении - не блокирует event loop и основное подключение"""
+    rotation_db = DatabaseService()
+    try:
+        retention_service = RetentionService(rotation_db, archive_dir=config.RETENTION_ARCHIVE_DIR or None)
+        return retention_service.run()
+    finally:
+        rotation_db.close()
+
+
 async def data_rotation_job(context: ContextTypes.DEFAULT_TYPE):
     """
     Фоновый job для ротации старых данных в БД.
-    Удаляет данные старше 90 дней и старые AI ответы (оставляет последние 1000).
+    Политики хранения - services/retention_service.DEFAULT_POLICIES: дневные партиции удаляются
+    целиком, остальные таблицы чистятся порциями.
     """
     if not db_service or not db_service.connection or not db_service.connection.is_connected():
         return
@@ -1973,43 +2041,49 @@ async def data_rotation_job(context: ContextTypes.DEFAULT_TYPE):
     try:
         logger.info("🔄 Начало ротации данных в БД...")
         
-        # Ротация market_history (храним 90 дней)
-        deleted_history = db_service.rotate_old_data("market_history", keep_days=90)
-        
-        # Ротация api_errors (храним 30 дней)
-        deleted_errors = db_service.rotate_old_data("api_errors", keep_days=30)
-        
-        # Ротация trades_history (храним 90 дней)
-        deleted_trades = db_service.rotate_old_data("trades_history", keep_days=90)
+        results = await asyncio.to_thread(_run_data_rotation)
         
-        # Ротация AI ответов (оставляем последние 1000)
-        deleted_ai = db_service.cleanup_old_ai_responses(keep_count=1000)
+        for result in results:
+            if result.get("error"):
+                logger.warning(f"⚠️ Ротация {result['table']}: {result['error']}")
+            else:
+                logger.info(
+                    f"   {result['table']}: удалено партиций {result['partitions_dropped']}, "
+                    f"создано партиций {result['partitions_created']}, удалено строк {result['rows_deleted']}"
+                )
         
-        logger.info(f"✅ Ротация данных завершена: удалено {deleted_history + deleted_errors + deleted_trades + deleted_ai} записей")
+        logger.info("✅ Ротация данных завершена")
         
     except Exception as e:
         logger.error(f"Критическая ошибка в data_rotation_job: {e}", exc_info=True)
 
 
+async def instrument_refresh_job(context: ContextTypes.DEFAULT_TYPE):
+    """Фоновое обновление справочника инструментов, если он устарел."""
+    try:
+        if await asyncio.to_thread(instrument_catalog.refresh_if_stale):
+            logger.info(f"✅ Справочник инструментов обновлен: {len(instrument_catalog.instruments)} шт.")
+    except Exception as e:
+        logger.error(f"Ошибка в instrument_refresh_job: {e}", exc_info=True)
+
+
+@track_job(AUTO_BUY_JOB_NAME, budget=AUTO_BUY_TIMEOUT_SECONDS)
 async def auto_buy_job(context: ContextTypes.DEFAULT_TYPE):
     """Периодически анализируем рынок и, если автозакупка активна, пробуем открыть сделку."""
     if not AUTO_BUY_STATE["enabled"]:
         return
     
-    # При первом запуске авто-бота пытаемся обновить реальные биржевые фильтры объёма,
-    # чтобы избежать ошибок Qty invalid из-за неверных локальных настроек.
-    if not SYMBOL_FILTERS_REFRESHED:
-        _refresh_symbol_filters_from_exchange()
-    
     bot = context.bot
     AUTO_BUY_STATE["last_run"] = datetime.utcnow()
     
     try:
         # Ограничиваем время выполнения автозакупки (максимум 25 секунд из 30)
         try:
+            # Мейкер-вход укорачивается так, чтобы уложиться в бюджет цикла
+            deadline = time.monotonic() + AUTO_BUY_TIMEOUT_SECONDS
             trade_msg = await asyncio.wait_for(
-                _execute_auto_trade_with_analysis(),
-                timeout=25.0
+                _execute_auto_trade_with_analysis(deadline=deadline),
+                timeout=AUTO_BUY_TIMEOUT_SECONDS
             )
             
             if trade_msg:
@@ -2020,8 +2094,19 @@ async def auto_buy_job(context: ContextTypes.DEFAULT_TYPE):
         except asyncio.TimeoutError:
             AUTO_BUY_STATE["last_result"] = "таймаут при выполнении"
             error_msg = "Timed out"
-            logger.warning(f"Таймаут в auto_buy_job (превышено 25 секунд)")
+            logger.warning(f"Таймаут в auto_buy_job (превышено {AUTO_BUY_TIMEOUT_SECONDS:.0f} секунд)")
             await _broadcast_message(bot, f"⚠️ Автозакупка: ошибка\n{error_msg}")
+            # Вход, размещавшийся в момент таймаута, доводится до конца - сообщаем его результат
+            pending_entries = list(_DETACHED_ENTRIES)
+            _DETACHED_ENTRIES.clear()
+            if pending_entries:
+                logger.info(f"Автозакупка: жду завершения {len(pending_entries)} входов после таймаута")
+                for entry_result in await asyncio.gather(*pending_entries, return_exceptions=True):
+                    if isinstance(entry_result, Exception):
+                        logger.error(f"Ошибка входа после таймаута автозакупки: {entry_result}")
+                    elif entry_result:
+                        AUTO_BUY_STATE["last_result"] = "открыта новая сделка"
+                        await _broadcast_message(bot, f"🤖 Автозакупка:\n{entry_result}")
     except Exception as e:
         AUTO_BUY_STATE["last_result"] = f"ошибка: {e}"
         logger.error(f"Ошибка в auto_buy_job: {e}", exc_info=True)
@@ -2029,17 +2114,25 @@ async def auto_buy_job(context: ContextTypes.DEFAULT_TYPE):
         if "Timed out" in error_msg or "timeout" in error_msg.lower():
             error_msg = "Timed out"
         await _broadcast_message(bot, f"⚠️ Автозакупка: ошибка\n{error_msg}")
+    
+    # Профиль за заказанное число циклов готов - отправляем отчет
+    if profiler.cycle_finished():
+        await _send_profile_report(bot, ALLOWED_CHAT_IDS)
 
 
-async def _execute_auto_trade_with_analysis():
-    """Вспомогательная функция для выполнения автозакупки с анализом рынка."""
+async def _execute_auto_trade_with_analysis(deadline: Optional[float] = None):
+    """Вспомогательная функция для выполнения автозакупки с анализом рынка (deadline - см. _execute_auto_trade)."""
+    stages = StageTimer("auto_trade")
     analysis_results = market_analysis_service.analyze_all_coins()
+    stages.lap("scan")
     if not analysis_results:
         AUTO_BUY_STATE["last_result"] = "нет данных для анализа"
         return None
     
     market_sentiment = news_service.get_market_sentiment() if news_service else None
+    stages.lap("sentiment")
     overview = market_analysis_service.get_market_overview(analysis_results, market_sentiment)
+    stages.lap("overview")
     if not overview:
         AUTO_BUY_STATE["last_result"] = "нет подходящих активов"
         return None
@@ -2049,13 +2142,23 @@ async def _execute_auto_trade_with_analysis():
         pass
     fake_bot = FakeBot()
     proxy_update = SimpleNamespace(message=_BroadcastReplyProxy(fake_bot))
-    return await _execute_auto_trade(overview, proxy_update)
+    return await _execute_auto_trade(overview, proxy_update, deadline=deadline)
+
+
+_NOT_FETCHED = object()
 
 
-def _build_monitoring_report(symbol: str, position_meta: Optional[Dict]) -> str:
-    """Собрать отчет по активной монете с историей, стаканом и новостями."""
+def _build_monitoring_report(symbol: str, position_meta: Optional[Dict], data: Optional[Dict] = _NOT_FETCHED,
+                             order_book: Optional[Dict] = _NOT_FETCHED, news_ctx: Optional[Dict] = _NOT_FETCHED) -> str:
+    """
+    Собрать отчет по активной монете с историей, стаканом и новостями.
+    
+    Данные, уже полученные вызывающим (_fetch_monitoring_inputs), передаются аргументами;
+    не переданные запрашиваются здесь.
+    """
     try:
-        data = market_analysis_service.get_historical_data(symbol)
+        if data is _NOT_FETCHED:
+            data = market_analysis_service.get_historical_data(symbol)
         if not data:
             return f"\n{symbol}: не удалось получить рыночные данные."
 
@@ -2072,23 +2175,28 @@ def _build_monitoring_report(symbol: str, position_meta: Optional[Dict]) -> str:
         oi = data.get("open_interest", "N/A")
         volume = market_analysis_service._format_volume_value(data.get("volume_24h", 0)) if hasattr(market_analysis_service, "_format_volume_value") else f"{data.get('volume_24h', 0):,.0f}"
 
-        order_book = bybit_service.get_order_book(symbol) if hasattr(bybit_service, "get_order_book") else None
+        if order_book is _NOT_FETCHED:
+            order_book = bybit_service.get_order_book(symbol)
         buy_qty = order_book.get("total_buy_qty") if order_book else "N/A"
         sell_qty = order_book.get("total_sell_qty") if order_book else "N/A"
 
         news_summary = ""
         sentiment_line = "• Новости: сервис отключен"
         if news_service:
-            try:
-                symbol_base = symbol.replace("USDT", "")
-                news_ctx = news_service.get_symbol_specific_news(symbol_base, max_results=3)
+            if news_ctx is _NOT_FETCHED:
+                try:
+                    news_ctx = news_service.get_symbol_specific_news(symbol.replace("USDT", ""), max_results=3)
+                except Exception as news_error:
+                    logger.warning(f"Мониторинг: не удалось получить новости для {symbol}: {news_error}")
+                    news_ctx = None
+            if news_ctx is None:
+                # Ошибка уже залогирована при получении (здесь или в _fetch_monitoring_inputs)
+                sentiment_line = "• Новости: недоступны"
+            else:
                 sentiment_line = f"• Новости: {news_ctx.get('sentiment', 'NEUTRAL')}"
                 first_news = news_ctx.get("news", [])
                 if first_news:
                     news_summary = f"{first_news[0].get('title', '')} ({first_news[0].get('source', '')})"
-            except Exception as news_error:
-                logger.warning(f"Мониторинг: не удалось получить новости для {symbol}: {news_error}")
-                sentiment_line = "• Новости: недоступны"
 
         exit_plan = _build_exit_plan(symbol, data, position_meta)
         orientation_ru = _translate_orientation(exit_plan['orientation'])
@@ -2197,8 +2305,12 @@ def _format_position_side_value(side_value: str) -> str:
     return "позиция"
 
 
-def _update_position_state(symbol: str, position_meta: Dict):
-    """Обновить состояние позиции для отслеживания событий."""
+def _update_position_state(symbol: str, position_meta: Dict, data: Optional[Dict] = None):
+    """
+    Обновить состояние позиции для отслеживания событий.
+    
+    data - уже полученные исторические данные монеты (иначе запрашиваются для расчета цели профита).
+    """
     if symbol not in POSITION_STATES:
         POSITION_STATES[symbol] = {
             "last_size": 0.0,
@@ -2218,7 +2330,7 @@ def _update_position_state(symbol: str, position_meta: Dict):
     
     # Получаем целевой профит из exit plan
     try:
-        data = market_analysis_service.get_historical_data(symbol)
+        data = data or market_analysis_service.get_historical_data(symbol)
         if data:
             exit_plan = _build_exit_plan(symbol, data, position_meta)
             take_profit_price = exit_plan.get("take_profit", 0)
@@ -2232,6 +2344,8 @@ def _update_position_state(symbol: str, position_meta: Dict):
                     POSITION_STATES[symbol]["target_profit"] = target_pct
     except Exception as e:
         logger.warning(f"Не удалось обновить target_profit для {symbol}: {e}")
+    finally:
+        POSITION_STATES.save(symbol)
 
 
 async def _check_position_events(bot, current_positions: Dict[str, Dict]):
@@ -2295,6 +2409,8 @@ async def _check_position_events(bot, current_positions: Dict[str, Dict]):
                 elif target_profit > 0 and pnl_pct >= target_profit * 0.8 and not state.get("notified_profit", False):
                     await _notify_profit_target(bot, symbol, pnl_pct, target_profit, unrealized_pnl)
                     state["notified_profit"] = True
+            
+            POSITION_STATES.save(symbol)
                     
         except Exception as e:
             logger.error(f"Ошибка при проверке событий позиции {symbol}: {e}")
@@ -2415,7 +2531,7 @@ async def _notify_position_closed(bot, symbol: str, state: Dict):
     if db_service:
         try:
             bot_name = getattr(config, "BOT_NAME", "main")
-            db_service.update_trade_exit(
+            await async_db_service.update_trade_exit(
                 symbol=symbol,
                 exit_price=exit_price,
                 pnl=pnl,
@@ -2512,6 +2628,66 @@ async def auto_buy_status_command(update: Update, context: ContextTypes.DEFAULT_
     await _handle_auto_buy(update, "status")
 
 
+async def _send_profile_report(bot, chat_ids: List[int], top_n: int = None):
+    """Записать collapsed stacks (для flamegraph) и отправить сводку профиля с файлом в чаты"""
+    path = await asyncio.to_thread(profiler.write_collapsed)
+    summary = profiler.summary(top_n or config.PROFILER_TOP_N)
+    logger.info(f"{summary}\nФайл профиля: {path}")
+    if len(summary) > 4000:
+        summary = summary[:4000] + "\n…"
+    for chat_id in chat_ids:
+        try:
+            await bot.send_message(chat_id=chat_id, text=summary)
+            with path.open("rb") as f:
+                await bot.send_document(chat_id=chat_id, document=f, filename=path.name,
+                                        caption="🔥 flamegraph.pl / speedscope.app")
+        except Exception as e:
+            logger.error(f"Не удалось отправить профиль в чат {chat_id}: {e}")
+
+
+async def profile_start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Запустить сэмплирующий профилировщик на N циклов автозакупки: /profile_start [N]"""
+    chat_id = update.effective_chat.id
+    if not check_access(chat_id):
+        return
+    
+    try:
+        cycles = int(context.args[0]) if context.args else PROFILER_DEFAULT_CYCLES
+    except ValueError:
+        await update.message.reply_text("❌ Формат: /profile_start [число циклов]")
+        return
+    cycles = max(1, cycles)
+    
+    if not profiler.start(cycles=cycles):
+        await update.message.reply_text(
+            f"🔬 Профилировщик уже запущен, осталось циклов: {profiler.cycles_left}. Отчет сейчас: /profile_report"
+        )
+        return
+    note = "" if AUTO_BUY_STATE["enabled"] else "\n⚠️ Автозакупка выключена - циклы не идут, отчет: /profile_report"
+    await update.message.reply_text(
+        f"🔬 Профилировщик запущен на {cycles} цикл(а) автозакупки "
+        f"(сэмпл каждые {profiler.interval * 1000:.0f} мс). Отчет придет автоматически.{note}"
+    )
+
+
+async def profile_report_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Остановить профилировщик и прислать отчет: /profile_report [N строк топа]"""
+    chat_id = update.effective_chat.id
+    if not check_access(chat_id):
+        return
+    
+    try:
+        top_n = int(context.args[0]) if context.args else config.PROFILER_TOP_N
+    except ValueError:
+        await update.message.reply_text("❌ Формат: /profile_report [число строк топа]")
+        return
+    
+    if not profiler.stop() and not profiler.sample_count():
+        await update.message.reply_text("🔬 Профиль пуст. Запуск: /profile_start [число циклов]")
+        return
+    await _send_profile_report(context.bot, ALLOWED_CHAT_IDS or [chat_id], top_n=top_n)
+
+
 async def _initiate_manual_order(action: str, update_or_message, context: ContextTypes.DEFAULT_TYPE, symbol: str, qty: float) -> bool:
     """Общая логика подготовки ручной покупки/продажи."""
     if hasattr(update_or_message, "effective_chat"):
@@ -2730,7 +2906,7 @@ async def confirm_buy(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Размещаем ордер с защитными уровнями если они указаны
-    result = bybit_service.place_order(
+    result = await order_manager.place_entry(
         symbol=order_data['symbol'],
         side="Buy",
         qty=order_data['qty'],
@@ -2746,8 +2922,6 @@ async def confirm_buy(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"Количество: {order_data['qty']}"
         )
         # Карантин устанавливается при ЗАКРЫТИИ позиции, а не при открытии
-        if not result.get("tp_sl_attached"):
-            _schedule_tp_sl_refresh(order_data['symbol'])
     else:
         error_text = result.get("error") if isinstance(result, dict) else "Bybit вернул ошибку."
         await update.message.reply_text(f"❌ Не удалось разместить ордер: {error_text}")
@@ -2765,15 +2939,15 @@ async def close_all_positions(update: Update, context: ContextTypes.DEFAULT_TYPE
     await update.message.reply_text("🔄 Закрываю все открытые позиции...")
     
     try:
-        result = bybit_service.close_all_positions()
+        result = await asyncio.to_thread(bybit_service.close_all_positions)
         
         if result["total_closed"] > 0:
             closed_list = "\n".join([
-                f"• {p['symbol']}: {p['size']:.6f} ({p['side']})"
-                for p in result["closed"]
+                f"• {p['symbol']}: {p['size']:.6f} ({p['side']}) — {p['status']}, {p['latency_ms']:.0f} мс"
+                for p in result["orders"] if not p["error"]
             ])
             message = (
-                f"✅ Закрыто позиций: {result['total_closed']}\n\n"
+                f"✅ Закрыто позиций: {result['total_closed']} за {result['elapsed_ms']:.0f} мс\n\n"
                 f"{closed_list}"
             )
             
@@ -2813,7 +2987,7 @@ async def confirm_sell(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Размещаем ордер с защитными уровнями если они указаны
-    result = bybit_service.place_order(
+    result = await order_manager.place_entry(
         symbol=order_data['symbol'],
         side="Sell",
         qty=order_data['qty'],
@@ -2829,8 +3003,6 @@ async def confirm_sell(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"Количество: {order_data['qty']}"
         )
         _record_trade_timestamp(order_data['symbol'])
-        if not result.get("tp_sl_attached"):
-            _schedule_tp_sl_refresh(order_data['symbol'])
     else:
         error_text = result.get("error") if isinstance(result, dict) else "Bybit вернул ошибку."
         await update.message.reply_text(f"❌ Не удалось разместить ордер: {error_text}")
@@ -3051,10 +3223,47 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Ошибка при отправке сообщения об ошибке: {e}")
 
 
+def _run_db_migrations():
+    """Привести схему БД к актуальной (отдельный шаг запуска, см. migrate_db.py)"""
+    if not config.DB_AUTO_MIGRATE:
+        logger.info("ℹ️ DB_AUTO_MIGRATE выключен - миграции БД выполняются через migrate_db.py")
+        return
+    with timed("db migrations"):
+        if db_service:
+            if db_service.init_tables():
+                logger.info("✅ База данных подключена, схема актуальна")
+            else:
+                logger.warning("⚠️ Миграции схемы БД не применены - см. migrate_db.py --status")
+
+
 def main():
     """Запуск бота"""
+    _run_db_migrations()
+    # Устаревший справочник инструментов обновляется в фоне, старт его не ждет
+    instrument_catalog.refresh_in_background()
+    
+    async def start_streams(application):
+        """Подключить приватный поток Bybit (в потоке - подключение и снимок REST блокирующие)"""
+        if config.METRICS_ENABLED:
+            # Задержка цикла событий: насколько блокирующий код задерживает job'ы и команды
+            application.create_task(watch_event_loop_lag())
+        await asyncio.to_thread(_start_account_stream, application.bot, asyncio.get_running_loop())
+    
+    async def close_db_pool(application):
+        """Закрыть пул асинхронных подключений к БД и приватный поток при остановке"""
+        if account_stream._is_initialized and account_stream:
+            await asyncio.to_thread(account_stream.stop)
+        if async_db_service:
+            await async_db_service.close()
+    
     # Создаем приложение
-    application = Application.builder().token(config.TELEGRAM_BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(config.TELEGRAM_BOT_TOKEN)
+        .post_init(start_streams)
+        .post_shutdown(close_db_pool)
+        .build()
+    )
     
     # Добавляем обработчик для логирования всех обновлений
     async def log_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -3100,6 +3309,8 @@ def main():
     application.add_handler(CommandHandler("confirm_sell", confirm_sell))
     application.add_handler(CommandHandler("close_all", close_all_positions))
     application.add_handler(CommandHandler("update_tp_sl", update_tp_sl_command))
+    application.add_handler(CommandHandler("profile_start", profile_start_command))
+    application.add_handler(CommandHandler("profile_report", profile_report_command))
     application.add_handler(CallbackQueryHandler(command_button_handler, pattern="^(cmd|input):"))
     application.add_handler(CallbackQueryHandler(trade_button_handler, pattern="^trade:"))
     logger.info("Все обработчики команд зарегистрированы")
@@ -3123,6 +3334,13 @@ def main():
                 first=5,
                 name=POSITION_POLL_JOB_NAME
             )
+        if not job_queue.get_jobs_by_name(INSTRUMENT_REFRESH_JOB_NAME):
+            job_queue.run_repeating(
+                instrument_refresh_job,
+                interval=INSTRUMENT_REFRESH_INTERVAL_SECONDS,
+                first=INSTRUMENT_REFRESH_INTERVAL_SECONDS,
+                name=INSTRUMENT_REFRESH_JOB_NAME
+            )
         existing_auto_jobs = job_queue.get_jobs_by_name(AUTO_BUY_JOB_NAME)
         if not existing_auto_jobs:
             job_queue.run_repeating(
@@ -3132,8 +3350,8 @@ def main():
                 name=AUTO_BUY_JOB_NAME
             )
         
-        # Регистрируем job для сбора данных в БД
-        if db_service and db_service.connection and db_service.connection.is_connected():
+        # Регистрируем job для сбора данных в БД (подключение проверяют сами job'ы)
+        if config.DB_HOST and config.DB_NAME:
             existing_data_jobs = job_queue.get_jobs_by_name(DATA_COLLECTION_JOB_NAME)
             if not existing_data_jobs:
                 job_queue.run_repeating(
@@ -3155,6 +3373,14 @@ def main():
                 )
                 logger.info(f"✅ Зарегистрирован job для ротации данных в БД (каждые {DATA_ROTATION_INTERVAL_HOURS} часов)")
     
+    logger.info(format_startup_profile())
+    
+    if config.METRICS_ENABLED:
+        start_http_server(config.METRICS_HOST, config.METRICS_PORT)
+    if config.PROFILER_START_CYCLES > 0:
+        # Отчет уйдет в ALLOWED_CHAT_IDS после PROFILER_START_CYCLES циклов автозакупки
+        profiler.start(cycles=config.PROFILER_START_CYCLES)
+    
     # Запускаем бота
     logger.info("Бот запущен...")
     logger.info("Ожидание обновлений от Telegram...")
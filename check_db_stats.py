@@ -7,10 +7,10 @@ if db.connection:
     query = """
     SELECT 
         symbol, 
-        COUNT(*) as count, 
-        MIN(timestamp) as first_date, 
-        MAX(timestamp) as last_date 
-    FROM market_history 
+        SUM(sample_count) as count, 
+        MIN(bucket_start) as first_date, 
+        MAX(bucket_start) as last_date 
+    FROM market_history_1h 
     GROUP BY symbol 
     ORDER BY symbol
     """
@@ -20,12 +20,12 @@ if db.connection:
         print("=" * 70)
         total = 0
         for row in result:
-            count = row['count']
+            count = int(row['count'])
             total += count
             symbol = row['symbol']
             first = row['first_date']
             last = row['last_date']
-            print(f"{symbol:12} | {count:6} свечей | {first} - {last}")
+            print(f"{symbol:12} | {count:6} снимков | {first} - {last}")
         print("=" * 70)
         print(f"Всего: {total} снимков в БД")
         print(f"Монет: {len(result)}")
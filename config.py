@@ -11,6 +11,32 @@ TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 BYBIT_API_KEY = os.getenv("BYBIT_API_KEY")
 BYBIT_API_SECRET = os.getenv("BYBIT_API_SECRET")
 BYBIT_TESTNET = os.getenv("BYBIT_TESTNET", "False").lower() == "true"
+# Приватный WebSocket (позиции, ордера, исполнения, баланс) вместо опроса позиций через REST
+BYBIT_PRIVATE_STREAM = os.getenv("BYBIT_PRIVATE_STREAM", "True").lower() == "true"
+# Локальный симулятор биржи вместо Bybit (services/exchange_simulator.py): ордера и позиции не настоящие
+BYBIT_SIMULATOR = os.getenv("BYBIT_SIMULATOR", "False").lower() == "true"
+# Каталог хранилища свечей для проигрывания (пусто - синтетические цены)
+BYBIT_SIMULATOR_DATA = os.getenv("BYBIT_SIMULATOR_DATA", "")
+# Состояние и свечи бота в режиме симулятора - отдельно от боевых, MySQL не используется
+# (пусто - data/simulator в каталоге бота)
+BYBIT_SIMULATOR_STATE_DIR = os.getenv("BYBIT_SIMULATOR_STATE_DIR", "")
+try:
+    BYBIT_SIMULATOR_SEED = int(os.getenv("BYBIT_SIMULATOR_SEED", "0"))
+except ValueError:
+    BYBIT_SIMULATOR_SEED = 0
+try:
+    BYBIT_SIMULATOR_BALANCE = float(os.getenv("BYBIT_SIMULATOR_BALANCE", "10000"))
+except ValueError:
+    BYBIT_SIMULATOR_BALANCE = 10000
+# Задержка ответа (мс) и доля ответов с ошибкой лимита запросов
+try:
+    BYBIT_SIMULATOR_LATENCY_MS = float(os.getenv("BYBIT_SIMULATOR_LATENCY_MS", "0"))
+except ValueError:
+    BYBIT_SIMULATOR_LATENCY_MS = 0
+try:
+    BYBIT_SIMULATOR_ERROR_RATE = float(os.getenv("BYBIT_SIMULATOR_ERROR_RATE", "0"))
+except ValueError:
+    BYBIT_SIMULATOR_ERROR_RATE = 0
 
 # AI (Hugging Face)
 HF_TOKEN = os.getenv("HF_TOKEN")
@@ -36,12 +62,83 @@ try:
 except ValueError:
     AUTO_MAX_ACTIVE_POSITIONS = 3
 
+# Матрица корреляций: скользящее окно и период полураспада EWMA в часах, метод для проверки позиций
+try:
+    CORRELATION_WINDOW_HOURS = int(os.getenv("CORRELATION_WINDOW_HOURS", "720"))
+except ValueError:
+    CORRELATION_WINDOW_HOURS = 720
+try:
+    CORRELATION_EWMA_HALFLIFE_HOURS = float(os.getenv("CORRELATION_EWMA_HALFLIFE_HOURS", "168"))
+except ValueError:
+    CORRELATION_EWMA_HALFLIFE_HOURS = 168
+CORRELATION_METHOD = os.getenv("CORRELATION_METHOD", "rolling").lower()
+
+# Исполнение ордеров на вход (services/execution_engine.py): лимитный PostOnly с догоном цены,
+# через EXECUTION_MAKER_DEADLINE_SECONDS секунд остаток добирается рыночным ордером
+EXECUTION_PREFER_MAKER = os.getenv("EXECUTION_PREFER_MAKER", "True").lower() == "true"
+try:
+    EXECUTION_MAKER_DEADLINE_SECONDS = float(os.getenv("EXECUTION_MAKER_DEADLINE_SECONDS", "20"))
+except ValueError:
+    EXECUTION_MAKER_DEADLINE_SECONDS = 20
+try:
+    EXECUTION_CHASE_INTERVAL_SECONDS = float(os.getenv("EXECUTION_CHASE_INTERVAL_SECONDS", "2"))
+except ValueError:
+    EXECUTION_CHASE_INTERVAL_SECONDS = 2
+
 # Database
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT", "3306")
 DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
+# Размер пула асинхронных подключений (services/async_db_service.py)
+try:
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+except ValueError:
+    DB_POOL_SIZE = 5
+
+# Применять миграции схемы БД при запуске бота (false - только через migrate_db.py)
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "True").lower() == "true"
+
+# Колоночное хранилище свечей (пусто - data/candles в каталоге бота)
+CANDLE_STORE_DIR = os.getenv("CANDLE_STORE_DIR", "")
+
+# Файл состояния бота между перезапусками, SQLite (пусто - data/bot_state.sqlite3 в каталоге бота)
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "")
+
+# Архив строк, удаляемых при ротации БД (пусто - удалять без архивации)
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "")
+
+# Сколько дней хранятся сырые минутные снимки market_history (дальше - только агрегаты 5m/1h/1d)
+try:
+    RAW_HISTORY_KEEP_DAYS = int(os.getenv("RAW_HISTORY_KEEP_DAYS", "3"))
+except ValueError:
+    RAW_HISTORY_KEEP_DAYS = 3
+
+# Метрики Prometheus: GET /metrics на локальном порту (services/metrics.py)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "False").lower() == "true"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+try:
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+except ValueError:
+    METRICS_PORT = 9108
+
+# Сэмплирующий профилировщик (services/profiler.py), управление - /profile_start и /profile_report
+# PROFILER_START_CYCLES > 0 - профилировать столько циклов автозакупки сразу после запуска
+try:
+    PROFILER_START_CYCLES = int(os.getenv("PROFILER_START_CYCLES", "0"))
+except ValueError:
+    PROFILER_START_CYCLES = 0
+try:
+    PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "10"))
+except ValueError:
+    PROFILER_INTERVAL_MS = 10
+try:
+    PROFILER_TOP_N = int(os.getenv("PROFILER_TOP_N", "15"))
+except ValueError:
+    PROFILER_TOP_N = 15
+# Каталог файлов профиля (пусто - data/profiles в каталоге бота)
+PROFILER_DIR = os.getenv("PROFILER_DIR", "")
 
 # Bot name (для различения ботов в БД)
 BOT_NAME = os.getenv("BOT_NAME", "main")
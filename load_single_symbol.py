@@ -7,6 +7,7 @@ from datetime import datetime, timedelta
 from services.bybit_service import BybitService
 from services.market_analysis_service import MarketAnalysisService
 from services.db_service import DatabaseService
+from services.candle_store import CandleStore
 import config
 import logging
 import time
@@ -105,6 +106,10 @@ def load_year_of_data(symbol: str, db_service: DatabaseService,
         return False
     
     all_candles.sort(key=lambda x: x["timestamp"])
+
+    # Свечи целиком - в колоночное хранилище (корреляции, бэктест)
+    if db_service.candle_store:
+        db_service.candle_store.append(symbol, "60", all_candles)
     
     logger.info(f"   📊 Всего загружено уникальных свечей: {len(all_candles)}")
     
@@ -144,7 +149,7 @@ def load_year_of_data(symbol: str, db_service: DatabaseService,
                 except Exception as e:
                     logger.debug(f"   ⚠️ Не удалось рассчитать индикаторы для свечи {i}: {e}")
             
-            if db_service.save_market_snapshot(symbol, market_data, candle_stats):
+            if db_service.save_market_snapshot(symbol, market_data, candle_stats, timestamp=candle_timestamp):
                 saved_count += 1
                 
                 if saved_count % 500 == 0:
@@ -158,6 +163,11 @@ def load_year_of_data(symbol: str, db_service: DatabaseService,
             continue
     
     logger.info(f"✅ Для {symbol} сохранено {saved_count} снимков в БД")
+    
+    # История загружена задним числом - пересобираем агрегаты 5m/1h/1d по символу
+    if saved_count:
+        rollup_results = db_service.rollup_service.rebuild(symbol=symbol)
+        logger.info(f"   📦 Агрегаты пересобраны: {rollup_results}")
     return saved_count > 0
 
 
@@ -170,7 +180,7 @@ def main():
     print()
     
     try:
-        db_service = DatabaseService()
+        db_service = DatabaseService(candle_store=CandleStore(config.CANDLE_STORE_DIR or None))
         if not db_service.connection or not db_service.connection.is_connected():
             print("❌ Не удалось подключиться к БД")
             sys.exit(1)
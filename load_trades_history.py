@@ -77,8 +77,9 @@ def load_trades_history_24h(bybit_service: BybitService, db_service: DatabaseSer
                         created_time = int(pnl_data.get("createdTime", 0))
                         updated_time = int(pnl_data.get("updatedTime", 0))
                         
-                        entry_time = datetime.fromtimestamp(created_time / 1000) if created_time else start_time
-                        exit_time = datetime.fromtimestamp(updated_time / 1000) if updated_time else end_time
+                        # В trades_history время хранится в UTC, как у сделок бота
+                        entry_time = datetime.utcfromtimestamp(created_time / 1000) if created_time else start_time
+                        exit_time = datetime.utcfromtimestamp(updated_time / 1000) if updated_time else end_time
                         
                         # Проверяем наличие колонки bot_name
                         check_column = db_service.execute_query(
@@ -119,7 +120,8 @@ def load_trades_history_24h(bybit_service: BybitService, db_service: DatabaseSer
                                 quantity=qty,
                                 leverage=leverage,
                                 bot_name=bot_name,
-                                status="open"
+                                status="open",
+                                entry_time=entry_time
                             )
                             
                             # Сразу обновляем как закрытую с выходом
@@ -129,10 +131,15 @@ def load_trades_history_24h(bybit_service: BybitService, db_service: DatabaseSer
                                     exit_price=exit_price,
                                     pnl=closed_pnl,
                                     pnl_percent=pnl_percent,
-                                    bot_name=bot_name
+                                    bot_name=bot_name,
+                                    exit_time=exit_time,
+                                    entry_time=entry_time
                                 )
+                                loaded += 1
+                            else:
+                                logger.warning(f"   ⚠️ Сделка {symbol} {entry_time} не сохранена")
+                                continue
                             
-                            loaded += 1
                             logger.info(f"   ✅ Загружена сделка: {symbol} {side} PnL: {closed_pnl:.2f} USDT")
                         else:
                             logger.debug(f"   ⏭ Пропущена дубликат: {symbol} {side}")
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Скрипт для применения миграций схемы БД (services/schema_migrations.py)
+
+Бот выполняет этот шаг сам при запуске, если DB_AUTO_MIGRATE=true; при DB_AUTO_MIGRATE=false
+скрипт нужно запускать вручную после обновления кода.
+"""
+import sys
+import argparse
+from services.db_service import DatabaseService
+from services.schema_migrations import LATEST_VERSION, pending_migrations, run_migrations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Применение миграций схемы БД')
+    parser.add_argument('--status', action='store_true', help='Только показать версию схемы и ожидающие миграции')
+    parser.add_argument('--target', type=int, default=None,
+                        help=f'До какой версии применять (по умолчанию - до последней, {LATEST_VERSION})')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("МИГРАЦИИ СХЕМЫ БД")
+    print("=" * 60)
+    print()
+
+    try:
+        db_service = DatabaseService()
+        if not db_service.connection or not db_service.connection.is_connected():
+            print("❌ Не удалось подключиться к БД")
+            sys.exit(1)
+    except Exception as e:
+        print(f"❌ Ошибка при инициализации: {e}")
+        sys.exit(1)
+
+    current = db_service.get_schema_version()
+    if current is None:
+        print("❌ Не удалось прочитать версию схемы")
+        sys.exit(1)
+    print(f"📊 Версия схемы: {current} (последняя: {LATEST_VERSION})")
+    pending = pending_migrations(current)
+    for version, description, _ in pending:
+        print(f"   ⏳ {version}: {description}")
+
+    if args.status or not pending:
+        db_service.close()
+        return
+
+    print()
+    ok = run_migrations(db_service, target_version=args.target)
+    print(f"📊 Версия схемы: {db_service.get_schema_version()}")
+    db_service.close()
+    if not ok:
+        print("❌ Миграции применены не полностью, подробности в логе")
+        sys.exit(1)
+    print("✅ Схема БД актуальна")
+
+
+if __name__ == "__main__":
+    main()
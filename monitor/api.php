@@ -406,7 +406,7 @@ function getStats() {
     
     // Статистика по ошибкам
     $query = "
-        SELECT COUNT(*) as error_count
+        SELECT COALESCE(SUM(occurrences), 0) as error_count
         FROM api_errors
         WHERE timestamp >= DATE_SUB(NOW(), INTERVAL 24 HOUR)
     ";
@@ -420,9 +420,9 @@ function getStats() {
     $query = "
         SELECT 
             COUNT(DISTINCT symbol) as symbols_count,
-            COUNT(*) as total_records
-        FROM market_history
-        WHERE timestamp >= DATE_SUB(NOW(), INTERVAL 7 DAY)
+            COALESCE(SUM(sample_count), 0) as total_records
+        FROM market_history_5m
+        WHERE bucket_start >= DATE_SUB(NOW(), INTERVAL 7 DAY)
     ";
     
     $stmt = $conn->query($query);
@@ -695,6 +695,7 @@ function getRecentErrors() {
             symbol,
             error_code,
             error_message,
+            occurrences,
             timestamp
         FROM api_errors
         ORDER BY timestamp DESC
@@ -713,6 +714,7 @@ function getRecentErrors() {
             'symbol' => $row['symbol'],
             'error_code' => $row['error_code'],
             'error_message' => $row['error_message'],
+            'occurrences' => intval($row['occurrences'] ?? 1),
             'timestamp' => $row['timestamp']
         ];
     }
@@ -724,6 +726,35 @@ function getRecentErrors() {
     }
 }
 
+/**
+ * Выбор таблицы истории для периода (см. services/rollup_service.py):
+ * самая грубая из агрегатов, дающая не меньше 1000 точек и покрывающая период по сроку хранения
+ */
+function chooseMarketHistoryTable($hours) {
+    $step = $hours * 3600 / 1000;
+    // От грубой к мелкой: таблица, интервал в секундах, срок хранения в днях (null - бессрочно)
+    $levels = [
+        ['table' => 'market_history_1d', 'seconds' => 86400, 'keep_days' => null, 'raw' => false],
+        ['table' => 'market_history_1h', 'seconds' => 3600, 'keep_days' => 730, 'raw' => false],
+        ['table' => 'market_history_5m', 'seconds' => 300, 'keep_days' => 30, 'raw' => false],
+        ['table' => 'market_history', 'seconds' => 60, 'keep_days' => 3, 'raw' => true],
+    ];
+    $covers = function ($level) use ($hours) {
+        return $level['keep_days'] === null || $level['keep_days'] * 24 >= $hours;
+    };
+    foreach ($levels as $level) {
+        if ($level['seconds'] <= $step && $covers($level)) {
+            return $level;
+        }
+    }
+    foreach (array_reverse($levels) as $level) {
+        if ($covers($level)) {
+            return $level;
+        }
+    }
+    return $levels[0];
+}
+
 function getMarketData() {
     try {
         $conn = getDBConnection();
@@ -734,21 +765,40 @@ function getMarketData() {
     $symbol = $_GET['symbol'] ?? 'BTCUSDT';
     $hours = intval($_GET['hours'] ?? 24);
     
-    $query = "
-        SELECT 
-            timestamp,
-            price,
-            volume_24h,
-            volatility,
-            rsi,
-            atr,
-            macd
-        FROM market_history
-        WHERE symbol = :symbol 
-        AND timestamp >= DATE_SUB(NOW(), INTERVAL :hours HOUR)
-        ORDER BY timestamp DESC
-        LIMIT 1000
-    ";
+    $source = chooseMarketHistoryTable($hours);
+    if ($source['raw']) {
+        $query = "
+            SELECT 
+                timestamp,
+                price,
+                volume_24h,
+                volatility,
+                rsi,
+                atr,
+                macd
+            FROM market_history
+            WHERE symbol = :symbol 
+            AND timestamp >= DATE_SUB(NOW(), INTERVAL :hours HOUR)
+            ORDER BY timestamp DESC
+            LIMIT 1000
+        ";
+    } else {
+        $query = "
+            SELECT 
+                bucket_start AS timestamp,
+                close AS price,
+                avg_volume_24h AS volume_24h,
+                avg_volatility AS volatility,
+                avg_rsi AS rsi,
+                avg_atr AS atr,
+                avg_macd AS macd
+            FROM {$source['table']}
+            WHERE symbol = :symbol 
+            AND bucket_start >= DATE_SUB(NOW(), INTERVAL :hours HOUR)
+            ORDER BY bucket_start DESC
+            LIMIT 1000
+        ";
+    }
     
     $stmt = $conn->prepare($query);
     $stmt->bindValue(':symbol', $symbol, PDO::PARAM_STR);
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Скрипт для подбора порогов стратегии: перебор параметров с walk-forward валидацией
+Прогоны идут в пуле процессов поверх бэктестера (см. backtest.py)
+"""
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from services.bybit_service import BybitService
+from services.candle_store import CandleStore
+from services.backtest_engine import fetch_candles
+from services.parameter_optimizer import DEFAULT_PARAM_GRID, ParameterOptimizer, build_param_sets
+import config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+OPTIMIZER_DIR = DATA_DIR / "optimizer"
+
+
+def main():
+    """Основная функция"""
+    import argparse
+    from services.market_analysis_service import MarketAnalysisService
+
+    parser = argparse.ArgumentParser(description='Перебор параметров стратегии с walk-forward валидацией')
+    parser.add_argument('--symbols', type=str, default='',
+                        help='Символы через запятую (по умолчанию - все popular_coins)')
+    parser.add_argument('--days', type=int, default=365, help='Глубина истории в днях')
+    parser.add_argument('--interval', type=str, default='60', help='Интервал свечей Bybit')
+    parser.add_argument('--grid', type=str, default='',
+                        help='JSON-файл с сеткой {"market.rsi_overbought": [65, 70], ...}')
+    parser.add_argument('--samples', type=int, default=0,
+                        help='Случайный поиск: сколько наборов взять из сетки (0 - вся сетка)')
+    parser.add_argument('--train-days', type=int, default=90, help='Окно обучения walk-forward')
+    parser.add_argument('--test-days', type=int, default=30, help='Тестовое окно walk-forward')
+    parser.add_argument('--workers', type=int, default=0, help='Размер пула процессов (0 - все ядра)')
+    parser.add_argument('--min-trades', type=int, default=10, help='Минимум сделок для учета результата')
+    args = parser.parse_args()
+
+    grid = DEFAULT_PARAM_GRID
+    if args.grid:
+        with open(args.grid, "r", encoding="utf-8") as f:
+            grid = json.load(f)
+
+    bybit_service = BybitService()
+    market_service = MarketAnalysisService(bybit_service=bybit_service)
+    symbols = [s.strip().upper() for s in args.symbols.split(",") if s.strip()] or market_service.popular_coins
+
+    candle_store = CandleStore(config.CANDLE_STORE_DIR or None)
+    candles_by_symbol = {}
+    for symbol in symbols:
+        candles = fetch_candles(bybit_service, symbol, days=args.days, interval=args.interval,
+                                store=candle_store)
+        if candles is not None:
+            candles_by_symbol[symbol] = candles
+
+    param_sets = build_param_sets(grid, samples=args.samples or None)
+    output_dir = OPTIMIZER_DIR / f"run_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
+
+    optimizer = ParameterOptimizer(
+        candles_by_symbol,
+        engine_defaults={"max_positions": config.AUTO_MAX_ACTIVE_POSITIONS},
+        max_workers=args.workers or None,
+        min_trades=args.min_trades
+    )
+    summary = optimizer.run(param_sets, train_days=args.train_days, test_days=args.test_days, output_dir=output_dir)
+
+    print("=" * 60)
+    print(f"Наборов: {summary['param_sets']}, окон walk-forward: {summary['folds']}, "
+          f"время: {summary['elapsed_seconds']} с")
+    print(f"Out-of-sample: {summary['out_of_sample']}")
+    print("Топ-5 по обучению:")
+    for row in summary["ranked"][:5]:
+        print(f"  #{row['param_id']}: train={row['train_objective']} test={row['test_objective']} {row['params']}")
+    print(f"\n💾 Результаты: {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Скрипт для пересборки колоночного хранилища свечей из истории в БД (агрегаты market_history_*)
+"""
+import sys
+import argparse
+from services.db_service import DatabaseService
+from services.candle_store import CandleStore
+import config
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Пересборка хранилища свечей из истории в БД')
+    parser.add_argument('--symbols', type=str, default='',
+                        help='Символы через запятую (по умолчанию - все символы из market_history_1h)')
+    parser.add_argument('--interval', type=str, default='60', help='Интервал свечей в минутах')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("ПЕРЕСБОРКА ХРАНИЛИЩА СВЕЧЕЙ ИЗ БД")
+    print("=" * 60)
+    print()
+
+    try:
+        candle_store = CandleStore(config.CANDLE_STORE_DIR or None)
+        db_service = DatabaseService(candle_store=candle_store)
+        if not db_service.connection or not db_service.connection.is_connected():
+            print("❌ Не удалось подключиться к БД")
+            sys.exit(1)
+    except Exception as e:
+        print(f"❌ Ошибка при инициализации: {e}")
+        sys.exit(1)
+
+    symbols = [s.strip().upper() for s in args.symbols.split(",") if s.strip()]
+    if not symbols:
+        rows = db_service.execute_query("SELECT DISTINCT symbol FROM market_history_1h") or []
+        symbols = [row["symbol"] for row in rows]
+
+    for symbol in symbols:
+        count = candle_store.rebuild_from_db(db_service, symbol, interval=args.interval)
+        print(f"✅ {symbol}: {count} свечей")
+
+    print(f"\n💾 Хранилище: {candle_store.root}")
+
+
+if __name__ == "__main__":
+    main()
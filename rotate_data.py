@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Скрипт для ротации данных в БД вручную и разовой миграции таблиц на дневные партиции
+"""
+import sys
+import argparse
+import logging
+from services.db_service import DatabaseService
+from services.retention_service import RetentionService, DEFAULT_POLICIES
+import config
+
+logging.basicConfig(level=logging.INFO)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ротация данных в БД')
+    parser.add_argument('--partition', action='store_true',
+                        help='Перевести market_history, api_errors, ai_responses на дневные партиции (перестраивает таблицы)')
+    parser.add_argument('--archive-dir', type=str, default=config.RETENTION_ARCHIVE_DIR,
+                        help='Каталог архива удаляемых строк (пусто - без архивации)')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("РОТАЦИЯ ДАННЫХ В БД")
+    print("=" * 60)
+    print()
+
+    db_service = DatabaseService()
+    if not db_service.connection or not db_service.connection.is_connected():
+        print("❌ Не удалось подключиться к БД")
+        sys.exit(1)
+
+    retention_service = RetentionService(db_service, archive_dir=args.archive_dir or None)
+
+    if args.partition:
+        print("⚠️ Партиционирование перестраивает таблицы - остановите бота на время миграции")
+        for table_name, policy in DEFAULT_POLICIES.items():
+            if policy.get("partitioned"):
+                ok = retention_service.partition_table(table_name)
+                print(f"{'✅' if ok else '❌'} {table_name}")
+        print()
+
+    for result in retention_service.run():
+        if result.get("error"):
+            print(f"❌ {result['table']}: {result['error']}")
+        else:
+            print(f"✅ {result['table']}: удалено партиций {result['partitions_dropped']}, "
+                  f"создано партиций {result['partitions_created']}, удалено строк {result['rows_deleted']}")
+
+    db_service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Приватный WebSocket Bybit: книга позиций, ордеров и баланса в памяти
+
+Подписка на топики position, order, execution и wallet. Книга заполняется снимком
+REST (reconcile) и дальше обновляется сообщениями потока - открытие, закрытие
+и ликвидация позиции видны через миллисекунды, а не на следующем опросе.
+
+Пока поток подключен и книга заполнена (is_live), BybitService.get_positions
+и get_balance отвечают из книги без запросов к бирже. Пропуски на время
+переподключения закрываются периодическим reconcile со снимком REST.
+
+Подписчики (add_listener) получают события (event, symbol, data) из потока
+WebSocket или из потока, вызвавшего reconcile.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    from pybit.unified_trading import WebSocket
+    WEBSOCKET_AVAILABLE = True
+except ImportError:
+    WEBSOCKET_AVAILABLE = False
+    logger.warning("WebSocket pybit недоступен, позиции будут опрашиваться через REST")
+
+# События для подписчиков
+POSITION_OPENED = "position_opened"
+POSITION_UPDATED = "position_updated"
+POSITION_CLOSED = "position_closed"
+LIQUIDATION = "liquidation"
+ORDER_UPDATED = "order_updated"
+EXECUTION = "execution"
+WALLET_UPDATED = "wallet_updated"
+
+LIQUIDATION_EXEC_TYPES = ("BustTrade", "AdlTrade")
+CLOSED_ORDER_STATUSES = ("Filled", "Cancelled", "Rejected", "Deactivated", "PartiallyFilledCanceled")
+MIN_POSITION_SIZE = 0.0001
+
+
+def _size(position: Dict) -> float:
+    try:
+        return abs(float(position.get("size") or 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _updated_ms(item: Dict) -> int:
+    try:
+        return int(item.get("updatedTime") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class AccountStream:
+    def __init__(self, testnet: bool, api_key: str, api_secret: str, category: str = "linear",
+                 account_type: str = "UNIFIED", websocket_factory: Callable = None):
+        """
+        Args:
+            testnet: Тестовая сеть
+            api_key: API ключ Bybit
+            api_secret: API секрет Bybit
+            category: Категория позиций в книге
+            account_type: Тип кошелька для баланса
+            websocket_factory: Создание клиента WebSocket (по умолчанию pybit; для локальной заглушки)
+        """
+        self.testnet = testnet
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.category = category
+        self.account_type = account_type
+        self.websocket_factory = websocket_factory
+
+        self._lock = threading.Lock()
+        self._positions: Dict[str, Dict] = {}  # Только активные позиции
+        self._orders: Dict[str, Dict] = {}  # Только открытые ордера
+        self._wallet: Optional[Dict] = None
+        self._listeners: List[Callable[[str, str, Dict], None]] = []
+        self._ws = None
+        self._seeded = False
+        self.last_message_at: Optional[float] = None
+        self.last_reconcile_at: Optional[float] = None
+
+    # ---------- подключение ----------
+
+    def start(self) -> bool:
+        """Подключиться и подписаться на приватные топики"""
+        if self._ws is not None:
+            return True
+        factory = self.websocket_factory
+        if factory is None:
+            if not WEBSOCKET_AVAILABLE:
+                return False
+            factory = WebSocket
+        try:
+            ws = factory(
+                testnet=self.testnet,
+                channel_type="private",
+                api_key=self.api_key,
+                api_secret=self.api_secret,
+                restart_on_error=True,
+            )
+            ws.position_stream(callback=self._on_position)
+            ws.order_stream(callback=self._on_order)
+            ws.execution_stream(callback=self._on_execution)
+            ws.wallet_stream(callback=self._on_wallet)
+            self._ws = ws
+            logger.info("✅ Приватный поток Bybit подключен (position, order, execution, wallet)")
+            return True
+        except Exception as e:
+            logger.error(f"Не удалось подключить приватный поток Bybit: {e}")
+            return False
+
+    def stop(self):
+        if self._ws is not None:
+            try:
+                self._ws.exit()
+            except Exception as e:
+                logger.warning(f"Ошибка при закрытии приватного потока: {e}")
+            self._ws = None
+        self._seeded = False
+
+    def is_live(self) -> bool:
+        """Книга актуальна: поток подключен и заполнен снимком REST"""
+        if self._ws is None or not self._seeded:
+            return False
+        try:
+            return bool(self._ws.is_connected())
+        except Exception:
+            return False
+
+    def add_listener(self, listener: Callable[[str, str, Dict], None]):
+        """Подписаться на события: listener(event, symbol, data)"""
+        self._listeners.append(listener)
+
+    def _emit(self, events: List[tuple]):
+        for event, symbol, data in events:
+            for listener in self._listeners:
+                try:
+                    listener(event, symbol, data)
+                except Exception as e:
+                    logger.error(f"Ошибка обработчика события {event} {symbol}: {e}")
+
+    # ---------- позиции ----------
+
+    def _apply_position(self, position: Dict, events: List[tuple]):
+        """Применить позицию к книге (под блокировкой), события - в events"""
+        symbol = position.get("symbol")
+        if not symbol or position.get("category", self.category) != self.category:
+            return
+        previous = self._positions.get(symbol)
+        if _size(position) >= MIN_POSITION_SIZE:
+            merged = dict(previous or {}, **position)
+            self._positions[symbol] = merged
+            events.append((POSITION_UPDATED if previous else POSITION_OPENED, symbol, dict(merged)))
+        elif previous is not None:
+            del self._positions[symbol]
+            events.append((POSITION_CLOSED, symbol, dict(previous, **position)))
+
+    def reconcile(self, positions: List[Dict], balance: Optional[str] = None, taken_at: float = None):
+        """
+        Сверить книгу со снимком REST: недостающие позиции открываются, лишние закрываются
+
+        Позиции, обновленные потоком позже снимка, не трогаются.
+
+        Args:
+            positions: Ответ BybitService.get_positions(fresh=True)
+            balance: totalWalletBalance из REST (если известен)
+            taken_at: Время запроса снимка (time.time()), по умолчанию - сейчас
+        """
+        taken_ms = int((taken_at or time.time()) * 1000)
+        events: List[tuple] = []
+        with self._lock:
+            snapshot = {pos.get("symbol"): pos for pos in positions if pos.get("symbol")}
+            for symbol, position in snapshot.items():
+                current = self._positions.get(symbol)
+                if current is None or _updated_ms(position) >= _updated_ms(current):
+                    self._apply_position(position, events)
+            for symbol, current in list(self._positions.items()):
+                if symbol not in snapshot and _updated_ms(current) <= taken_ms:
+                    self._apply_position({"symbol": symbol, "size": "0"}, events)
+            if balance is not None and self._wallet is None:
+                self._wallet = {"accountType": self.account_type, "totalWalletBalance": balance}
+            self._seeded = True
+            self.last_reconcile_at = time.time()
+        self._emit(events)
+
+    def positions(self) -> List[Dict]:
+        """Активные позиции (копии, формат как у REST get_positions)"""
+        with self._lock:
+            return [dict(position) for position in self._positions.values()]
+
+    def get_position(self, symbol: str) -> Optional[Dict]:
+        with self._lock:
+            position = self._positions.get(symbol.upper())
+            return dict(position) if position else None
+
+    def update_mark_price(self, symbol: str, price: float):
+        """Обновить цену маркировки (поток позиций присылает ее только при изменении позиции)"""
+        with self._lock:
+            position = self._positions.get(symbol)
+            if position is not None:
+                position["markPrice"] = str(price)
+
+    # ---------- ордера и баланс ----------
+
+    def open_orders(self, symbol: str = None) -> List[Dict]:
+        """Открытые ордера (все или по символу)"""
+        with self._lock:
+            return [dict(order) for order in self._orders.values()
+                    if symbol is None or order.get("symbol") == symbol.upper()]
+
+    @property
+    def balance(self) -> Optional[str]:
+        """totalWalletBalance кошелька (строка, как в REST get_wallet_balance)"""
+        with self._lock:
+            return self._wallet.get("totalWalletBalance") if self._wallet else None
+
+    # ---------- сообщения потока ----------
+
+    def _on_position(self, message: Dict):
+        self.last_message_at = time.time()
+        events: List[tuple] = []
+        with self._lock:
+            for position in message.get("data", []):
+                self._apply_position(position, events)
+        self._emit(events)
+
+    def _on_order(self, message: Dict):
+        self.last_message_at = time.time()
+        events: List[tuple] = []
+        with self._lock:
+            for order in message.get("data", []):
+                order_id = order.get("orderId")
+                if not order_id or order.get("category", self.category) != self.category:
+                    continue
+                if order.get("orderStatus") in CLOSED_ORDER_STATUSES:
+                    self._orders.pop(order_id, None)
+                else:
+                    self._orders[order_id] = order
+                events.append((ORDER_UPDATED, order.get("symbol"), order))
+        self._emit(events)
+
+    def _on_execution(self, message: Dict):
+        self.last_message_at = time.time()
+        events: List[tuple] = []
+        with self._lock:
+            for execution in message.get("data", []):
+                if execution.get("category", self.category) != self.category:
+                    continue
+                symbol = execution.get("symbol")
+                events.append((EXECUTION, symbol, execution))
+                if execution.get("execType") in LIQUIDATION_EXEC_TYPES:
+                    position = self._positions.get(symbol) or {}
+                    events.append((LIQUIDATION, symbol, dict(position, execution=execution)))
+        self._emit(events)
+
+    def _on_wallet(self, message: Dict):
+        self.last_message_at = time.time()
+        events: List[tuple] = []
+        with self._lock:
+            for wallet in message.get("data", []):
+                if wallet.get("accountType") == self.account_type:
+                    self._wallet = wallet
+                    events.append((WALLET_UPDATED, "", wallet))
+        self._emit(events)
@@ -1,8 +1,10 @@
 import os
 import json
+import time
 from typing import List, Dict, Optional
 from openai import OpenAI, APITimeoutError
 import config
+from services.metrics import observe_ai_request
 
 
 # Температуры для разных задач
@@ -13,14 +15,21 @@ TEMPERATURE_TRADE_PLAN = 0.0    # Строгие JSON-планы сделок и
 
 
 class AIService:
-    def __init__(self):
+    def __init__(self, correlation_engine=None, client=None, model=None):
         """
         Инициализация AI клиента.
         Приоритет:
-        1) Если задан DEEPSEEK_API_KEY → работаем напрямую с DeepSeek (deepseek-reasoner).
-        2) Иначе используем старый режим через Hugging Face router.
+        1) Если передан client (интерфейс OpenAI chat.completions) → используем его (бенчмарки, заглушки).
+        2) Если задан DEEPSEEK_API_KEY → работаем напрямую с DeepSeek (deepseek-reasoner).
+        3) Иначе используем старый режим через Hugging Face router.
+        
+        correlation_engine - опционально, CorrelationEngine для реальных корреляций в промпте выбора монеты.
         """
-        if getattr(config, "DEEPSEEK_API_KEY", None):
+        self.correlation_engine = correlation_engine
+        if client is not None:
+            self.client = client
+            self.model = model or config.AI_MODEL
+        elif getattr(config, "DEEPSEEK_API_KEY", None):
             self.client = OpenAI(
                 api_key=config.DEEPSEEK_API_KEY,
                 base_url=getattr(config, "DEEPSEEK_BASE_URL", "https://api.deepseek.com"),
@@ -36,6 +45,18 @@ class AIService:
             )
             self.model = config.AI_MODEL
     
+    def _complete(self, operation: str, **kwargs):
+        """Запрос chat.completions с записью времени и токенов в метрики (operation - метка запроса)"""
+        started = time.perf_counter()
+        try:
+            completion = self.client.chat.completions.create(model=self.model, **kwargs)
+        except Exception as e:
+            outcome = "timeout" if isinstance(e, (APITimeoutError, TimeoutError)) else "error"
+            observe_ai_request(operation, self.model, time.perf_counter() - started, outcome)
+            raise
+        observe_ai_request(operation, self.model, time.perf_counter() - started, completion=completion)
+        return completion
+    
     def analyze_market(self, market_data, db_service = None):
         """Детальный анализ фьючерсного рынка с помощью AI (аналогично профессиональному трейдинговому анализу)"""
         
@@ -186,8 +207,8 @@ Give clear recommendation for crypto futures:
 Response format: structured, professional, with specific numbers and levels, adapted for crypto markets."""
         
         try:
-            completion = self.client.chat.completions.create(
-                model=self.model,
+            completion = self._complete(
+                "analyze_market",
                 messages=[
                     {
                         "role": "system",
@@ -241,8 +262,8 @@ Response format: structured, professional, with specific numbers and levels, ada
         """
         
         try:
-            completion = self.client.chat.completions.create(
-                model=self.model,
+            completion = self._complete(
+                "trading_advice",
                 messages=[
                     {
                         "role": "user",
@@ -257,6 +278,25 @@ Response format: structured, professional, with specific numbers and levels, ada
             print(f"Ошибка при получении совета от AI: {e}")
             return "Не удалось получить совет от AI"
     
+    def _format_correlation_info(self, candidate_symbols: List[str], position_symbols: List[str]) -> str:
+        """Блок промпта с корреляциями кандидатов и открытых позиций (часовые доходности, скользящее окно)"""
+        if not self.correlation_engine:
+            return ""
+        lines = []
+        for candidate in candidate_symbols:
+            pairs = []
+            for position_symbol in position_symbols:
+                if not position_symbol or position_symbol.upper() == candidate.upper():
+                    continue
+                correlation = self.correlation_engine.get(candidate, position_symbol)
+                if correlation is not None:
+                    pairs.append(f"{position_symbol} {correlation:+.2f}")
+            if pairs:
+                lines.append(f"  • {candidate}: {', '.join(pairs)}")
+        if not lines:
+            return ""
+        return f"\nCORRELATION WITH OPEN POSITIONS (hourly returns, rolling window):\n{chr(10).join(lines)}\n"
+    
     def analyze_market_for_trade_selection(self, market_data_list: List[Dict], existing_positions: Optional[List[Dict]] = None, balance: Optional[float] = None, db_service = None) -> Optional[Dict]:
         """
         AI-анализ для выбора лучшей монеты для торговли из списка кандидатов.
@@ -305,10 +345,15 @@ Response format: structured, professional, with specific numbers and levels, ada
                         liq_list = [f"  • {z['symbol']}: ${z['price']:.2f} ({z['side'].upper()})" for z in liquidation_zones]
                         liq_info = f"\nLIQUIDATION ZONES (existing positions):\n{chr(10).join(liq_list)}\n"
                     
+                    correlation_info = self._format_correlation_info(
+                        [item["symbol"] for item in market_data_list],
+                        [pos.get("symbol") for pos in active_positions]
+                    )
+                    
                     positions_info = f"""
 CURRENT OPEN POSITIONS:
 {chr(10).join(positions_list)}
-{liq_info}
+{liq_info}{correlation_info}
 IMPORTANT: Consider correlation with existing positions. Avoid opening highly correlated positions (e.g., BTCUSDT and ETHUSDT have ~0.85 correlation). Prefer diversification across different sectors and directions. Be aware of liquidation zones - avoid opening positions too close to existing liquidation prices.
 """
             
@@ -337,8 +382,8 @@ Current time: {hour_utc} UTC
 """
             
             balance_info = ""
-            if balance is not None:
-                balance_info = f"\nACCOUNT BALANCE: ${balance:.2f} USDT\n"
+            if balance is not None:  # get_balance отдает строку из ответа API
+                balance_info = f"\nACCOUNT BALANCE: ${float(balance):.2f} USDT\n"
             
             # Form prompt for AI
             prompt_parts = [
@@ -568,8 +613,8 @@ Respond in JSON format:
             prompt = "\n".join(prompt_parts)
             
             try:
-                completion = self.client.chat.completions.create(
-                    model=self.model,
+                completion = self._complete(
+                    "trade_selection",
                     messages=[
                         {
                             "role": "system",
@@ -691,8 +736,8 @@ Requirements:
 - If data insufficient, return null
 """
             try:
-                completion = self.client.chat.completions.create(
-                    model=self.model,
+                completion = self._complete(
+                    "trade_plan",
                     messages=[
                         {"role": "system", "content": "You are an experienced crypto trader. Respond with valid JSON containing trading plan."},
                         {"role": "user", "content": prompt}
@@ -746,8 +791,8 @@ Requirements:
     def analyze_trading_decision(self, prompt):
         """Анализ для принятия торгового решения (возвращает JSON)"""
         try:
-            completion = self.client.chat.completions.create(
-                model=self.model,
+            completion = self._complete(
+                "trading_decision",
                 messages=[
                     {
                         "role": "system",
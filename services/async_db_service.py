@@ -0,0 +1,274 @@
+"""
+Асинхронный доступ к MySQL для корутин бота (пул подключений aiomysql)
+
+Повторяет основные методы DatabaseService (save_market_snapshot, save_trade, update_trade_exit,
+save_ai_response, save_api_error, get_latest_market_data, кэш), но не блокирует цикл событий:
+запросы идут через пул, поэтому несколько корутин пишут в БД параллельно друг с другом
+и с запросами к бирже. SQL и подготовка параметров общие с DatabaseService.
+
+Если aiomysql не установлен, запросы выполняются синхронным DatabaseService
+в отдельном потоке (asyncio.to_thread) - по одному за раз.
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from services.db_service import (
+    DatabaseService,
+    MARKET_SNAPSHOT_QUERY,
+    TIME_OF_DAY_QUERY,
+    AI_RESPONSE_QUERY,
+    API_ERROR_QUERY,
+    CACHE_UPSERT_QUERY,
+    LATEST_MARKET_DATA_QUERY,
+    validate_market_data,
+    market_snapshot_params,
+    time_of_day_params,
+    ai_response_params,
+    api_error_params,
+    trade_insert,
+    market_row_to_dict,
+)
+from services.metrics import observe_db_query
+import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import aiomysql
+    AIOMYSQL_AVAILABLE = True
+except ImportError:
+    AIOMYSQL_AVAILABLE = False
+    logger.warning("aiomysql не установлен, запросы к БД пойдут через поток. Установите: pip install aiomysql")
+
+
+class AsyncDatabaseService:
+    def __init__(self, min_size: int = 1, max_size: int = None):
+        """
+        Args:
+            min_size: Минимум подключений в пуле
+            max_size: Максимум подключений в пуле (по умолчанию config.DB_POOL_SIZE)
+        """
+        self.min_size = min_size
+        self.max_size = max_size or config.DB_POOL_SIZE
+        self._pool = None
+        self._sync_db: Optional[DatabaseService] = None
+        # Блокировки создаются в цикле событий при первом запросе
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._sync_lock: Optional[asyncio.Lock] = None
+        self._trade_columns: Optional[List[str]] = None
+
+    # ---------- подключение ----------
+
+    async def connect(self) -> bool:
+        """Создать пул подключений (вызывается автоматически при первом запросе)"""
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._pool is not None or self._sync_db is not None:
+                return True
+            try:
+                if AIOMYSQL_AVAILABLE:
+                    self._pool = await aiomysql.create_pool(
+                        host=config.DB_HOST,
+                        port=int(config.DB_PORT),
+                        db=config.DB_NAME,
+                        user=config.DB_USER,
+                        password=config.DB_PASSWORD,
+                        minsize=self.min_size,
+                        maxsize=self.max_size,
+                        autocommit=True,
+                        connect_timeout=10,
+                        charset="utf8mb4"
+                    )
+                    logger.info(f"✅ Пул подключений MySQL создан (до {self.max_size} подключений)")
+                else:
+                    # Отдельное подключение: основное используется синхронным кодом в других потоках
+                    self._sync_db = await asyncio.to_thread(DatabaseService)
+                    self._sync_lock = asyncio.Lock()
+                return True
+            except Exception as e:
+                logger.error(f"Ошибка при создании пула подключений MySQL: {e}")
+                self._pool = None
+                self._sync_db = None
+                return False
+
+    async def close(self):
+        """Закрыть пул подключений"""
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+        if self._sync_db is not None:
+            await asyncio.to_thread(self._sync_db.close)
+            self._sync_db = None
+
+    async def execute_query(self, query, params=None):
+        """
+        Выполнить SQL запрос
+
+        Returns:
+            Для SELECT/SHOW - список строк-словарей, для остальных - количество строк, при ошибке None
+        """
+        if self._pool is None and self._sync_db is None and not await self.connect():
+            return None
+
+        if self._sync_db is not None:
+            # Время запроса записывает сам DatabaseService (backend="sync")
+            async with self._sync_lock:
+                return await asyncio.to_thread(self._sync_db.execute_query, query, params)
+
+        started = time.perf_counter()
+        try:
+            async with self._pool.acquire() as connection:
+                async with connection.cursor(aiomysql.DictCursor) as cursor:
+                    await cursor.execute(query, params or ())
+                    if query.strip().upper().startswith('SELECT') or query.strip().upper().startswith('SHOW'):
+                        result = await cursor.fetchall()
+                    else:
+                        result = cursor.rowcount
+            observe_db_query("async", query, time.perf_counter() - started)
+            return result
+        except Exception as e:
+            observe_db_query("async", query, time.perf_counter() - started, outcome="error")
+            logger.error(f"Ошибка при выполнении запроса: {e}")
+            return None
+
+    # ---------- запись ----------
+
+    async def save_market_snapshot(self, symbol: str, market_data: Dict, historical_data: Dict, timestamp=None):
+        """Сохранить снимок рыночных данных с валидацией (timestamp - время снимка UTC, по умолчанию сейчас)"""
+        try:
+            if not validate_market_data(market_data):
+                logger.warning(f"⚠️ Данные для {symbol} не прошли валидацию, пропускаем сохранение")
+                return False
+
+            timestamp = timestamp or datetime.utcnow()
+            # Снимок и агрегаты времени суток - независимые вставки, выполняются параллельно
+            results = await asyncio.gather(
+                self.execute_query(MARKET_SNAPSHOT_QUERY,
+                                   market_snapshot_params(symbol, market_data, historical_data, timestamp)),
+                self.execute_query(TIME_OF_DAY_QUERY, time_of_day_params(
+                    symbol, timestamp,
+                    volatility=market_data.get('volatility', 0),
+                    volume=market_data.get('volume_24h', 0),
+                    funding_rate=market_data.get('funding_rate', 0),
+                    spread=market_data.get('spread')
+                ))
+            )
+            if results[0] is None:
+                await self.save_api_error("save_market_snapshot", symbol, "DB_ERROR", "Не удалось сохранить снимок")
+                return False
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении снимка рынка: {e}")
+            return False
+
+    async def save_trade(self, symbol: str, side: str, entry_price: float, quantity: float,
+                         leverage: int, stop_loss: float = None, take_profit: float = None,
+                         bot_name: str = "main", status: str = "open", entry_time=None):
+        """
+        Сохранить сделку в БД (аргументы - как у DatabaseService.save_trade)
+
+        Returns:
+            Количество вставленных строк или None
+        """
+        try:
+            # Набор колонок trades_history за время работы не меняется - запрашиваем один раз
+            if self._trade_columns is None:
+                columns = await self.execute_query("SHOW COLUMNS FROM trades_history")
+                if columns:
+                    self._trade_columns = [col['Field'] for col in columns]
+            query, params = trade_insert(
+                self._trade_columns or [], symbol, side, entry_price, quantity, leverage,
+                stop_loss=stop_loss, take_profit=take_profit, bot_name=bot_name, status=status,
+                entry_time=entry_time
+            )
+            return await self.execute_query(query, params)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении сделки: {e}")
+            return None
+
+    async def update_trade_exit(self, symbol: str, exit_price: float, pnl: float,
+                                pnl_percent: float, bot_name: str = "main", exit_time=None):
+        """Обновить сделку при выходе (аргументы - как у DatabaseService.update_trade_exit)"""
+        try:
+            if self._trade_columns is None:
+                columns = await self.execute_query("SHOW COLUMNS FROM trades_history")
+                if columns:
+                    self._trade_columns = [col['Field'] for col in columns]
+
+            if 'bot_name' in (self._trade_columns or []):
+                where_clause = "symbol = %s AND bot_name = %s AND (status = 'open' OR exit_time IS NULL)"
+                where_params = (symbol.upper(), bot_name)
+            else:
+                where_clause = "symbol = %s AND status = 'open'"
+                where_params = (symbol.upper(),)
+
+            open_trade = await self.execute_query(
+                f"SELECT id, entry_time FROM trades_history WHERE {where_clause} ORDER BY entry_time DESC LIMIT 1",
+                where_params
+            )
+            if not open_trade:
+                return True
+
+            query = """
+            UPDATE trades_history
+            SET exit_time = %s, exit_price = %s, pnl = %s, pnl_percent = %s, status = 'closed'
+            WHERE id = %s
+            """
+            params = (exit_time or datetime.utcnow(), exit_price, pnl, pnl_percent, open_trade[0]['id'])
+            if await self.execute_query(query, params):
+                await self.execute_query(TIME_OF_DAY_QUERY, time_of_day_params(
+                    symbol, open_trade[0]['entry_time'],
+                    trade_won=(pnl or 0) > 0,
+                    pnl_percent=pnl_percent
+                ))
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении сделки: {e}")
+            return False
+
+    async def save_ai_response(self, request_type: str, symbols: List[str], response_data: Dict,
+                               prompt_text: str = None, tokens_used: int = None, response_time_ms: int = None):
+        """Сохранить ответ AI для анализа"""
+        params = ai_response_params(
+            datetime.utcnow(), request_type, symbols, response_data,
+            prompt_text=prompt_text, tokens_used=tokens_used, response_time_ms=response_time_ms
+        )
+        return await self.execute_query(AI_RESPONSE_QUERY, params) is not None
+
+    async def save_api_error(self, api_method: str, symbol: str, error_code: str,
+                             error_message: str, response_data: Dict = None):
+        """Сохранить ошибку API для анализа"""
+        params = api_error_params(datetime.utcnow(), api_method, symbol, error_code, error_message, response_data)
+        return await self.execute_query(API_ERROR_QUERY, params) is not None
+
+    async def save_to_cache(self, symbol: str, data_type: str, data: Dict, ttl_minutes: int = 5):
+        """Сохранить данные в кэш"""
+        timestamp = datetime.utcnow()
+        params = (symbol, timestamp, data_type, json.dumps(data), timestamp + timedelta(minutes=ttl_minutes))
+        return await self.execute_query(CACHE_UPSERT_QUERY, params) is not None
+
+    async def cleanup_expired_cache(self):
+        """Очистить истекший кэш"""
+        return await self.execute_query(
+            "DELETE FROM market_cache WHERE expires_at < %s", (datetime.utcnow(),)
+        ) is not None
+
+    # ---------- чтение ----------
+
+    async def get_latest_market_data(self, symbol: str, minutes_back: int = 5) -> Optional[Dict]:
+        """Получить последние данные из БД (вместо запроса к API)"""
+        try:
+            cutoff_time = datetime.utcnow() - timedelta(minutes=minutes_back)
+            result = await self.execute_query(LATEST_MARKET_DATA_QUERY, (symbol, cutoff_time))
+            if result:
+                return market_row_to_dict(result[0])
+            return None
+        except Exception as e:
+            logger.error(f"Ошибка при получении данных из БД: {e}")
+            return None
@@ -0,0 +1,632 @@
+"""
+Событийный бэктестер стратегии автозакупки на исторических свечах
+
+Прогоняет сохраненные свечи (1h или мельче) через ту же оценку возможностей
+MarketAnalysisService, тот же выбор направления и стоп-лосс RiskManagementService,
+симулирует исполнение, TP/SL, комиссии (calculate_net_profit) и карантин после сделки.
+Индикаторы считаются векторно по всему ряду сразу, поэтому год по 20 монетам
+прогоняется за секунды.
+"""
+import heapq
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from services.candle_store import CandleStore
+from services.trading_rules import TRADE_COOLDOWN_HOURS, calculate_net_profit, determine_trade_side
+
+logger = logging.getLogger(__name__)
+
+CANDLE_FIELDS = ("timestamp", "open", "high", "low", "close", "volume")
+
+TREND_LABELS = [
+    "сильный бычий тренд",
+    "умеренный бычий тренд",
+    "нейтральное боковое движение",
+    "умеренный медвежий тренд",
+    "сильный медвежий тренд",
+]
+
+
+def candles_to_arrays(candles: List[Dict]) -> Dict[str, np.ndarray]:
+    """Преобразовать список свечей (формат BybitService.get_kline) в колонки NumPy"""
+    candles = sorted(candles, key=lambda c: c["timestamp"])
+    arrays = {"timestamp": np.array([int(c["timestamp"]) for c in candles], dtype=np.int64)}
+    for field in CANDLE_FIELDS[1:]:
+        arrays[field] = np.array([float(c.get(field, 0) or 0) for c in candles], dtype=np.float64)
+    return arrays
+
+
+def _download_candles(bybit_service, symbol: str, interval: str, start_ms: int, end_ms: int) -> List[Dict]:
+    """Скачать свечи за период постранично (по 1000 штук), от новых к старым"""
+    interval_ms = int(interval) * 60 * 1000
+    by_timestamp: Dict[int, Dict] = {}
+    current_end = end_ms
+    while current_end > start_ms:
+        request_start = max(start_ms, current_end - 1000 * interval_ms)
+        candles = bybit_service.get_kline(
+            symbol=symbol,
+            interval=interval,
+            limit=1000,
+            start_time=request_start,
+            end_time=current_end
+        )
+        if not candles:
+            break
+        for candle in candles:
+            by_timestamp[candle["timestamp"]] = candle
+        earliest = min(c["timestamp"] for c in candles)
+        if earliest >= current_end:
+            break
+        current_end = earliest - interval_ms
+        time.sleep(0.2)  # Не превышаем rate limit
+    return list(by_timestamp.values())
+
+
+def fetch_candles(bybit_service, symbol: str, days: int = 365, interval: str = "60",
+                  store: Optional[CandleStore] = None) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Загрузить свечи за период: из хранилища свечей, с биржи докачивается только недостающее
+
+    Args:
+        bybit_service: BybitService
+        symbol: Символ
+        days: Глубина истории в днях
+        interval: Интервал свечей Bybit ("1", "5", "60", ...)
+        store: Хранилище свечей (None - всегда качать с биржи целиком)
+
+    Returns:
+        Колонки свечей или None
+    """
+    interval_ms = int(interval) * 60 * 1000
+    end_ms = int(datetime.utcnow().timestamp() * 1000)
+    start_ms = end_ms - days * 24 * 3600 * 1000
+
+    if store is None:
+        candles = _download_candles(bybit_service, symbol, interval, start_ms, end_ms)
+        if not candles:
+            logger.warning(f"Бэктест: нет свечей для {symbol}")
+            return None
+        return candles_to_arrays(candles)
+
+    stored = store.read(symbol, interval, fields=["timestamp"])
+    if stored is not None and int(stored["timestamp"][0]) <= start_ms + interval_ms:
+        # История есть - докачиваем хвост, начиная с последней (возможно незакрытой) свечи
+        candles = _download_candles(bybit_service, symbol, interval, int(stored["timestamp"][-1]), end_ms)
+        store.append(symbol, interval, candles)
+    else:
+        # Истории нет или она короче запрошенной - качаем период целиком и пересобираем ряд
+        candles = _download_candles(bybit_service, symbol, interval, start_ms, end_ms)
+        if candles:
+            store.delete(symbol, interval)
+            store.append(symbol, interval, candles)
+
+    arrays = store.read(symbol, interval, start_ms=start_ms, fields=list(CANDLE_FIELDS))
+    if arrays is None:
+        logger.warning(f"Бэктест: нет свечей для {symbol}")
+    return arrays
+
+
+def _rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Скользящее среднее (NaN, пока окно не заполнено)"""
+    result = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        cumsum = np.cumsum(np.insert(values, 0, 0.0))
+        result[window - 1:] = (cumsum[window:] - cumsum[:-window]) / window
+    return result
+
+
+def _rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    return _rolling_mean(values, window) * window
+
+
+def _rolling_reduce(values: np.ndarray, window: int, func) -> np.ndarray:
+    result = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        result[window - 1:] = func(sliding_window_view(values, window), axis=1)
+    return result
+
+
+def _window_ema(values: np.ndarray, length: int, window: int) -> np.ndarray:
+    """
+    EMA так же, как MarketAnalysisService._calculate_ema на окне из window свечей:
+    затравка - первая свеча окна. Это свертка с фиксированным ядром.
+    """
+    result = np.full(values.shape, np.nan)
+    if len(values) < window:
+        return result
+    length = min(length, window)
+    k = 2 / (length + 1)
+    powers = (1 - k) ** np.arange(window - 1, -1, -1)
+    weights = k * powers
+    weights[0] = powers[0]
+    result[window - 1:] = sliding_window_view(values, window) @ weights
+    return np.round(result, 4)
+
+
+def compute_features(candles: Dict[str, np.ndarray], window: int = 240) -> Dict[str, np.ndarray]:
+    """
+    Векторно рассчитать признаки, которые MarketAnalysisService.get_historical_data
+    получает из тикера и _analyze_candles, для каждой свечи ряда
+
+    Args:
+        candles: Колонки свечей (timestamp, open, high, low, close, volume[, funding_rate])
+        window: Размер окна свечей, как в живом анализе (limit=240)
+
+    Returns:
+        Словарь массивов признаков той же длины, что и ряд
+    """
+    close = candles["close"]
+    high = candles["high"]
+    low = candles["low"]
+    volume = candles["volume"]
+    n = len(close)
+
+    ma_24 = _rolling_mean(close, 24)
+    ma_96 = _rolling_mean(close, 96)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ma_diff_pct = (ma_24 - ma_96) / ma_96 * 100
+    trend_code = np.full(n, 2, dtype=np.int8)
+    trend_code[ma_diff_pct > 0.3] = 1
+    trend_code[ma_diff_pct > 1.5] = 0
+    trend_code[ma_diff_pct < -0.3] = 3
+    trend_code[ma_diff_pct < -1.5] = 4
+
+    ema_50 = _window_ema(close, 50, window)
+    ema_200 = _window_ema(close, 200, window)
+    ema_signal = np.zeros(n, dtype=np.int8)  # 1 - BULLISH, -1 - BEARISH, 0 - NEUTRAL
+    ema_signal[ema_50 > ema_200 * 1.002] = 1
+    ema_signal[ema_50 < ema_200 * 0.998] = -1
+
+    # RSI - простые средние приростов/падений за 14 свечей (как _calculate_rsi)
+    diff = np.diff(close, prepend=np.nan)
+    gains = np.where(diff > 0, diff, 0.0)
+    losses = np.where(diff > 0, 0.0, np.abs(np.nan_to_num(diff)))
+    avg_gain = _rolling_mean(gains, 14)
+    avg_loss = _rolling_mean(losses, 14)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.where(avg_loss == 0, 100.0, 100 - 100 / (1 + avg_gain / avg_loss))
+    rsi[:15] = np.nan
+    rsi = np.round(rsi, 2)
+
+    # ATR - простое среднее True Range за 14 свечей (как _calculate_atr)
+    prev_close = np.roll(close, 1)
+    true_range = np.maximum.reduce([high - low, np.abs(high - prev_close), np.abs(low - prev_close)])
+    true_range[0] = 0.0
+    atr = _rolling_mean(true_range, 14)
+    atr[:15] = np.nan
+    atr = np.round(atr, 4)
+
+    # Тикерные поля за 24 свечи
+    change_24h = np.full(n, np.nan)
+    change_24h[24:] = (close[24:] - close[:-24]) / close[:-24] * 100
+    high_24h = _rolling_reduce(high, 24, np.max)
+    low_24h = _rolling_reduce(low, 24, np.min)
+    volatility = np.round((high_24h - low_24h) / close * 100, 2)
+    volume_24h = _rolling_sum(volume, 24)
+    liquidity_score = np.round(np.minimum(volume_24h / 1_000_000_000, 1.0) * 5, 2)
+
+    funding_rate = candles.get("funding_rate")
+    if funding_rate is None:
+        funding_rate = np.zeros(n)
+
+    valid = np.zeros(n, dtype=bool)
+    valid[max(window, 25) - 1:] = True
+    valid &= ~np.isnan(volatility) & ~np.isnan(change_24h)
+
+    return {
+        "trend_code": trend_code,
+        "ema_50": ema_50,
+        "ema_200": ema_200,
+        "ema_signal": ema_signal,
+        "rsi": rsi,
+        "atr": atr,
+        "change_24h": change_24h,
+        "volatility": volatility,
+        "volume_24h": volume_24h,
+        "liquidity_score": liquidity_score,
+        "funding_rate": funding_rate,
+        "valid": valid,
+    }
+
+
+class BacktestEngine:
+    """
+    Событийный бэктестер автозакупки
+
+    На каждой свече (решение по закрытию) оцениваются все монеты тем же
+    _calculate_opportunity_score, свободные слоты заполняются лучшими монетами,
+    вход - по открытию следующей свечи, выход - по первому касанию SL/TP.
+    Момент выхода ищется векторно сразу при входе и попадает в очередь событий.
+    """
+
+    EMA_SIGNALS = {1: "BULLISH", -1: "BEARISH", 0: "NEUTRAL"}
+
+    def __init__(self, market_service, risk_service=None, max_positions: int = 3,
+                 cooldown_hours: float = TRADE_COOLDOWN_HOURS, window: int = 240,
+                 take_profit_percent: float = 0.5, use_maker: bool = False,
+                 slippage_bps: float = 2.0):
+        """
+        Args:
+            market_service: MarketAnalysisService (оценка, плечо, размер)
+            risk_service: RiskManagementService (по умолчанию - market_service.risk_service)
+            max_positions: Максимум одновременных позиций (как MAX_ACTIVE_POSITIONS)
+            cooldown_hours: Карантин символа после закрытия сделки
+            window: Окно свечей для индикаторов (как limit=240 в живом анализе)
+            take_profit_percent: Цель по цене для TP без AI-плана (как в _open_trade_for_asset)
+            use_maker: Считать вход по мейкер-комиссии
+            slippage_bps: Проскальзывание рыночных исполнений в базисных пунктах
+        """
+        self.market_service = market_service
+        self.risk_service = risk_service or market_service.risk_service
+        self.max_positions = max_positions
+        self.cooldown_ms = int(cooldown_hours * 3600 * 1000)
+        self.window = window
+        self.take_profit_percent = take_profit_percent
+        self.use_maker = use_maker
+        self.slippage = slippage_bps / 10000
+
+    def run(self, candles_by_symbol: Dict[str, Dict[str, np.ndarray]],
+            features_by_symbol: Optional[Dict[str, Dict[str, np.ndarray]]] = None) -> Dict:
+        """
+        Прогнать стратегию по свечам
+
+        Args:
+            candles_by_symbol: {символ: колонки свечей}
+            features_by_symbol: Заранее рассчитанные признаки (для перебора параметров)
+
+        Returns:
+            Отчет: сделки, кривая капитала, PnL, просадка, win rate
+        """
+        started = time.perf_counter()
+        # С готовыми признаками (срез длинного ряда) прогрев индикаторов уже пройден
+        min_length = 1 if features_by_symbol else self.window
+        symbols = [s for s, c in candles_by_symbol.items() if c is not None and len(c["close"]) > min_length]
+        if not symbols:
+            return self._empty_report()
+
+        features = {}
+        statuses = {}
+        for symbol in symbols:
+            feats = (features_by_symbol or {}).get(symbol) or compute_features(candles_by_symbol[symbol], self.window)
+            features[symbol] = feats
+            statuses[symbol] = self._overbought_statuses(feats)
+
+        # Общая шкала времени и индекс свечи каждого символа на ней
+        timeline = np.unique(np.concatenate([candles_by_symbol[s]["timestamp"] for s in symbols]))
+        row_at = {}
+        for symbol in symbols:
+            ts = candles_by_symbol[symbol]["timestamp"]
+            idx = np.searchsorted(ts, timeline)
+            idx_clipped = np.minimum(idx, len(ts) - 1)
+            row_at[symbol] = np.where(ts[idx_clipped] == timeline, idx_clipped, -1)
+
+        capital = float(self.market_service.capital)
+        risk_amount = capital * self.market_service.max_daily_risk
+        daily_loss_limit = capital * self.risk_service.max_daily_loss_percent
+
+        equity = capital
+        equity_curve = []
+        trades: List[Dict] = []
+        open_positions: Dict[str, Dict] = {}
+        exit_events: List = []  # (время выхода, символ)
+        cooldown_until: Dict[str, int] = {}
+        daily_losses: Dict[str, float] = {}
+
+        for ti, ts in enumerate(timeline):
+            ts = int(ts)
+
+            # 1. Закрываем позиции, выход которых наступил к этой свече
+            while exit_events and exit_events[0][0] <= ts:
+                _, symbol = heapq.heappop(exit_events)
+                trade = open_positions.pop(symbol)
+                equity += trade["pnl_usdt"]
+                trades.append(trade)
+                if equity <= 0:
+                    break
+                cooldown_until[symbol] = trade["exit_ts"] + self.cooldown_ms
+                day = datetime.utcfromtimestamp(trade["exit_ts"] / 1000).date().isoformat()
+                if trade["pnl_usdt"] < 0:
+                    daily_losses[day] = daily_losses.get(day, 0.0) - trade["pnl_usdt"]
+
+            if equity <= 0:
+                # Капитал исчерпан: убыток не больше капитала, остальные позиции ликвидируются, торговля прекращается
+                equity = self._liquidate(trades, open_positions, candles_by_symbol, ts, equity)
+                exit_events = []
+                equity_curve.append((ts, equity))
+                break
+
+            equity_curve.append((ts, equity))
+
+            # 2. Заполняем свободные слоты
+            if len(open_positions) >= self.max_positions:
+                continue
+            day = datetime.utcfromtimestamp(ts / 1000).date().isoformat()
+            if daily_losses.get(day, 0.0) >= daily_loss_limit:
+                continue
+
+            analysis = []
+            for symbol in symbols:
+                row = row_at[symbol][ti]
+                if row < 0 or not features[symbol]["valid"][row]:
+                    continue
+                analysis.append(self._score_asset(symbol, row, candles_by_symbol[symbol], features[symbol], statuses[symbol]))
+            if not analysis:
+                continue
+            analysis.sort(key=lambda item: item["score"], reverse=True)
+            order_flow = self.market_service._calculate_order_flow(analysis)
+
+            for asset in analysis:
+                if len(open_positions) >= self.max_positions:
+                    break
+                symbol = asset["symbol"]
+                if symbol in open_positions or cooldown_until.get(symbol, 0) > ts:
+                    continue
+                trade = self._open_trade(asset, order_flow, open_positions, candles_by_symbol[symbol], risk_amount)
+                if not trade:
+                    continue
+                open_positions[symbol] = trade
+                heapq.heappush(exit_events, (trade["exit_ts"], symbol))
+
+        # Закрываем оставшиеся позиции по последним событиям
+        while exit_events:
+            exit_ts, symbol = heapq.heappop(exit_events)
+            trade = open_positions.pop(symbol)
+            equity += trade["pnl_usdt"]
+            trades.append(trade)
+            if equity <= 0:
+                equity = self._liquidate(trades, open_positions, candles_by_symbol, exit_ts, equity)
+                break
+        if equity_curve:
+            equity_curve.append((equity_curve[-1][0], equity))
+
+        report = self._build_report(trades, equity_curve, capital)
+        report["symbols"] = symbols
+        report["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+        return report
+
+    def _overbought_statuses(self, feats: Dict[str, np.ndarray]) -> List[Optional[str]]:
+        """Статус перекупленности по каждой свече через MarketAnalysisService._detect_overbought_status"""
+        statuses: List[Optional[str]] = [None] * len(feats["valid"])
+        detect = self.market_service._detect_overbought_status
+        for row in np.flatnonzero(feats["valid"]):
+            rsi = feats["rsi"][row]
+            rsi = None if np.isnan(rsi) else float(rsi)
+            rsi_signal = "NEUTRAL"
+            if rsi:
+                if rsi > self.market_service.rsi_overbought:
+                    rsi_signal = "OVERBOUGHT"
+                elif rsi < self.market_service.rsi_oversold:
+                    rsi_signal = "OVERSOLD"
+            statuses[row] = detect(
+                change_percent=float(feats["change_24h"][row]),
+                funding_rate=float(feats["funding_rate"][row]),
+                rsi=rsi,
+                rsi_signal=rsi_signal,
+                ema_signal=self.EMA_SIGNALS[int(feats["ema_signal"][row])]
+            )
+        return statuses
+
+    def _score_asset(self, symbol: str, row: int, candles: Dict[str, np.ndarray],
+                     feats: Dict[str, np.ndarray], statuses: List[Optional[str]]) -> Dict:
+        """Оценить монету на свече так же, как analyze_all_coins"""
+        service = self.market_service
+        atr = feats["atr"][row]
+        data = {
+            "symbol": symbol,
+            "current_price": float(candles["close"][row]),
+            "change_24h": float(feats["change_24h"][row]),
+            "volume_24h": float(feats["volume_24h"][row]),
+            "funding_rate": float(feats["funding_rate"][row]),
+            "volatility": float(feats["volatility"][row]),
+            "liquidity_score": float(feats["liquidity_score"][row]),
+            "overbought_status": statuses[row],
+            "historical_trend": TREND_LABELS[int(feats["trend_code"][row])],
+            "ema_signal": self.EMA_SIGNALS[int(feats["ema_signal"][row])],
+            "smart_money_flow": 0.0,
+            "atr": None if np.isnan(atr) else float(atr),
+        }
+        leverage_info = service.calculate_adaptive_leverage(data["volatility"], service.daily_target, service.capital)
+        recommended_stop = self.risk_service.get_recommended_stop_loss(
+            data["current_price"], "Long", data["volatility"] / 100
+        )
+        position_info = service.calculate_safe_position_size(
+            symbol,
+            data["current_price"],
+            recommended_stop,
+            leverage_info["recommended_leverage"],
+            risk_multiplier=service._adjust_risk_multiplier(data)
+        )
+        return {
+            "symbol": symbol,
+            "row": row,
+            "data": data,
+            "leverage_info": leverage_info,
+            "position_info": position_info,
+            "score": service._calculate_opportunity_score(data, leverage_info, position_info)
+        }
+
+    def _open_trade(self, asset: Dict, order_flow: Dict, open_positions: Dict[str, Dict],
+                    candles: Dict[str, np.ndarray], risk_amount: float) -> Optional[Dict]:
+        """Открыть сделку как _open_trade_for_asset (без AI-плана) и сразу найти момент выхода"""
+        symbol = asset["symbol"]
+        data = asset["data"]
+        row = asset["row"]
+        if row + 1 >= len(candles["close"]):
+            return None
+
+        side = determine_trade_side(data.get("overbought_status"), order_flow.get("trend"))
+        existing = [{"symbol": s, "side": p["side"]} for s, p in open_positions.items()]
+        if not self.risk_service.check_correlation(symbol, existing, new_side=side).get("is_safe"):
+            return None
+
+        decision_price = data["current_price"]
+        volatility_percent = max(data.get("volatility", 2) / 100, 0.01)
+        stop_loss = self.risk_service.get_recommended_stop_loss(decision_price, side, volatility_percent, data.get("atr"))
+        take_profit = decision_price * (1 + self.take_profit_percent / 100) if side == "Long" \
+            else decision_price * (1 - self.take_profit_percent / 100)
+
+        leverage = asset["leverage_info"]["recommended_leverage"]
+        qty = self.risk_service.calculate_position_size(decision_price, stop_loss, risk_amount, leverage)
+        if qty <= 0:
+            return None
+
+        # Рыночный вход по открытию следующей свечи
+        entry_row = row + 1
+        direction = 1 if side == "Long" else -1
+        entry_price = float(candles["open"][entry_row]) * (1 + direction * self.slippage)
+
+        exit_row, exit_price, exit_reason = self._find_exit(candles, entry_row, side, stop_loss, take_profit)
+
+        gross_pnl_percent = direction * (exit_price - entry_price) / entry_price * 100
+        profit = calculate_net_profit(gross_pnl_percent, use_maker=self.use_maker)
+        pnl_usdt = qty * entry_price * profit["net_pnl_percent"] / 100
+
+        return {
+            "symbol": symbol,
+            "side": side,
+            "score": round(asset["score"], 2),
+            "leverage": leverage,
+            "quantity": qty,
+            "entry_ts": int(candles["timestamp"][entry_row]),
+            "exit_ts": int(candles["timestamp"][exit_row]),
+            "entry_price": entry_price,
+            "exit_price": exit_price,
+            "stop_loss": stop_loss,
+            "take_profit": take_profit,
+            "exit_reason": exit_reason,
+            "gross_pnl_percent": round(gross_pnl_percent, 4),
+            "net_pnl_percent": round(profit["net_pnl_percent"], 4),
+            "pnl_usdt": pnl_usdt,
+        }
+
+    def _find_exit(self, candles: Dict[str, np.ndarray], entry_row: int, side: str,
+                   stop_loss: float, take_profit: float):
+        """
+        Векторно найти первую свечу, на которой задет SL или TP.
+        Если на одной свече задеты оба уровня, считаем что первым сработал SL.
+        """
+        opens = candles["open"][entry_row:]
+        highs = candles["high"][entry_row:]
+        lows = candles["low"][entry_row:]
+        if side == "Long":
+            sl_hit = lows <= stop_loss
+            tp_hit = highs >= take_profit
+        else:
+            sl_hit = highs >= stop_loss
+            tp_hit = lows <= take_profit
+
+        hit = sl_hit | tp_hit
+        if not hit.any():
+            last = len(candles["close"]) - 1
+            return last, float(candles["close"][last]), "END_OF_DATA"
+
+        offset = int(np.argmax(hit))
+        exit_row = entry_row + offset
+        open_price = float(opens[offset])
+        if sl_hit[offset]:
+            # Гэп через стоп исполняется по открытию, плюс проскальзывание рыночного стопа
+            if side == "Long":
+                price = min(stop_loss, open_price) * (1 - self.slippage)
+            else:
+                price = max(stop_loss, open_price) * (1 + self.slippage)
+            return exit_row, price, "STOP_LOSS"
+        if side == "Long":
+            price = max(take_profit, open_price)
+        else:
+            price = min(take_profit, open_price)
+        return exit_row, price, "TAKE_PROFIT"
+
+    def _liquidate(self, trades: List[Dict], open_positions: Dict[str, Dict],
+                   candles_by_symbol: Dict[str, Dict[str, np.ndarray]], ts: int, equity: float) -> float:
+        """
+        Капитал исчерпан последней закрытой сделкой: ее убыток урезается до остатка капитала,
+        остальные позиции закрываются по цене закрытия на момент ts без PnL (обеспечения у них уже нет)
+
+        Returns:
+            Капитал после ликвидации (0)
+        """
+        last = trades[-1]
+        last["pnl_usdt"] -= equity
+        last["exit_reason"] = "LIQUIDATION"
+        for symbol, trade in sorted(open_positions.items()):
+            candles = candles_by_symbol[symbol]
+            row = max(int(np.searchsorted(candles["timestamp"], ts, side="right")) - 1, 0)
+            trade.update({
+                "exit_ts": int(ts),
+                "exit_price": float(candles["close"][row]),
+                "exit_reason": "LIQUIDATION",
+                "net_pnl_percent": 0.0,
+                "pnl_usdt": 0.0,
+            })
+            trades.append(trade)
+        open_positions.clear()
+        logger.warning(f"Бэктест: капитал исчерпан на {datetime.utcfromtimestamp(ts / 1000)}, торговля остановлена")
+        return 0.0
+
+    def _build_report(self, trades: List[Dict], equity_curve: List, capital: float) -> Dict:
+        equity = np.array([value for _, value in equity_curve]) if equity_curve else np.array([capital])
+        peaks = np.maximum.accumulate(equity)
+        # Капитал не уходит ниже нуля, поэтому просадка не больше 100%
+        drawdowns = np.clip((peaks - equity) / np.where(peaks > 0, peaks, 1.0), 0.0, 1.0)
+        pnls = np.array([t["pnl_usdt"] for t in trades]) if trades else np.array([])
+        wins = pnls[pnls > 0]
+        losses = pnls[pnls < 0]
+
+        by_symbol: Dict[str, Dict] = {}
+        for trade in trades:
+            stats = by_symbol.setdefault(trade["symbol"], {"trades": 0, "pnl_usdt": 0.0, "wins": 0})
+            stats["trades"] += 1
+            stats["pnl_usdt"] += trade["pnl_usdt"]
+            stats["wins"] += 1 if trade["pnl_usdt"] > 0 else 0
+        for stats in by_symbol.values():
+            stats["pnl_usdt"] = round(stats["pnl_usdt"], 4)
+            stats["win_rate"] = round(stats["wins"] / stats["trades"] * 100, 2)
+
+        return {
+            "start_capital": capital,
+            "final_equity": round(float(equity[-1]), 4),
+            "total_pnl_usdt": round(float(pnls.sum()) if len(pnls) else 0.0, 4),
+            "total_return_percent": round((float(equity[-1]) - capital) / capital * 100, 4) if capital else 0.0,
+            "max_drawdown_percent": round(float(drawdowns.max()) * 100, 4) if len(drawdowns) else 0.0,
+            "trades_count": len(trades),
+            "win_rate": round(len(wins) / len(trades) * 100, 2) if trades else 0.0,
+            "avg_win_usdt": round(float(wins.mean()), 4) if len(wins) else 0.0,
+            "avg_loss_usdt": round(float(losses.mean()), 4) if len(losses) else 0.0,
+            "profit_factor": round(float(wins.sum() / -losses.sum()), 4) if len(losses) and losses.sum() else None,
+            "exit_reasons": {
+                reason: sum(1 for t in trades if t["exit_reason"] == reason)
+                for reason in ("TAKE_PROFIT", "STOP_LOSS", "END_OF_DATA", "LIQUIDATION")
+            },
+            "by_symbol": by_symbol,
+            "trades": trades,
+            "equity_curve": equity_curve,
+        }
+
+    def _empty_report(self) -> Dict:
+        capital = float(self.market_service.capital)
+        report = self._build_report([], [], capital)
+        report["symbols"] = []
+        report["elapsed_seconds"] = 0.0
+        return report
+
+
+def format_report(report: Dict) -> str:
+    """Краткий текстовый отчет бэктеста"""
+    lines = [
+        "📊 РЕЗУЛЬТАТ БЭКТЕСТА",
+        f"Монет: {len(report.get('symbols', []))} | Сделок: {report['trades_count']}",
+        f"Капитал: ${report['start_capital']:.2f} → ${report['final_equity']:.2f} "
+        f"({report['total_return_percent']:+.2f}%)",
+        f"PnL: ${report['total_pnl_usdt']:+.4f} | Max просадка: {report['max_drawdown_percent']:.2f}%",
+        f"Win rate: {report['win_rate']:.2f}% | Profit factor: {report['profit_factor']}",
+        f"Выходы: {report['exit_reasons']}",
+        f"Время прогона: {report.get('elapsed_seconds', 0)} с",
+    ]
+    for symbol, stats in sorted(report.get("by_symbol", {}).items(), key=lambda x: x[1]["pnl_usdt"], reverse=True):
+        lines.append(f"  {symbol}: {stats['trades']} сделок, PnL ${stats['pnl_usdt']:+.4f}, win {stats['win_rate']}%")
+    return "\n".join(lines)
@@ -0,0 +1,620 @@
+"""
+Бенчмарки цикла автозакупки: скан рынка -> анализ -> решение AI -> ордер
+
+Сеть заменена: Bybit - ExchangeSimulator с задержкой ответов, AI - клиент с готовыми
+ответами и задержкой, БД - подключение-заглушка с задержкой запроса. Рыночные данные -
+синтетика симулятора (seed) или записанные свечи (CandleStore, см. record_fixtures).
+
+Бенчмарк - функция (ctx) -> run или (run, setup), зарегистрированная @benchmark.
+run замеряется rounds раз, setup выполняется перед каждым раундом и не замеряется;
+run может вернуть число обработанных элементов - тогда считается пропускная способность.
+С базовой линией (benchmark_baseline.json) сравнивается лучший раунд - он меньше всего
+зависит от соседних процессов: дольше базового больше чем на tolerance - регрессия.
+"""
+import asyncio
+import json
+import logging
+import platform
+import re
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+import config
+from services.ai_service import AIService
+from services.async_db_service import AsyncDatabaseService
+from services.bybit_service import BybitService
+from services.candle_store import CandleStore
+from services.db_service import DatabaseService
+from services.exchange_simulator import ExchangeSimulator
+from services.lazy_service import LazyService
+from services.market_analysis_service import MarketAnalysisService
+from services.risk_management_service import RiskManagementService
+
+logger = logging.getLogger(__name__)
+
+CYCLE_BUDGET_SECONDS = 25.0  # Таймаут автозакупки в auto_buy_job
+BOT_SIMULATOR_SPEED = 30.0  # Ускорение часов симулятора в цикле бота (секунда - полминуты рынка)
+AI_POOL_SIZE = 5  # Сколько монет бот отдает AI за цикл (analysis_pool в _execute_auto_trade)
+TRADE_COLUMNS = ["id", "bot_name", "symbol", "side", "entry_time", "entry_price", "quantity", "leverage",
+                 "hour_utc", "status", "stop_loss", "take_profit"]
+
+BENCHMARKS: List[Dict] = []
+
+
+class BenchmarkSkipped(Exception):
+    """Бенчмарк не может выполниться в этом окружении"""
+
+
+def benchmark(name: str, group: str, rounds: int = 10, warmup: int = 1):
+    """Зарегистрировать бенчмарк (имя вида группа.название)"""
+    def decorator(func: Callable) -> Callable:
+        BENCHMARKS.append({
+            "name": name,
+            "group": group,
+            "rounds": rounds,
+            "warmup": warmup,
+            "func": func,
+            "description": (func.__doc__ or "").strip().split("\n")[0],
+        })
+        return func
+    return decorator
+
+
+# ---------- заглушки AI и БД ----------
+
+class _FakeCompletions:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.prompt_chars = 0
+
+    def create(self, model: str = None, messages: List[Dict] = None, **_):
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = messages[-1]["content"] if messages else ""
+        self.prompt_chars += len(prompt)
+        symbols = re.findall(r"\b[A-Z0-9]{2,}USDT\b", prompt)
+        symbol = symbols[0] if symbols else "BTCUSDT"
+        content = json.dumps({
+            "recommended_symbol": symbol,
+            "symbol": symbol,
+            "recommended_side": "Long",
+            "confidence": 0.7,
+            "reasoning": "benchmark",
+            "missing_data": [],
+        })
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeAIClient:
+    """Клиент с интерфейсом OpenAI chat.completions: фиксированная задержка и ответ по первой монете промпта"""
+
+    def __init__(self, latency: float = 0.0):
+        self.chat = SimpleNamespace(completions=_FakeCompletions(latency))
+
+
+class _LatencyCursor:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.rowcount = 0
+        self._rows: List[Dict] = []
+
+    def execute(self, query: str, params=None):
+        if self.latency:
+            time.sleep(self.latency)
+        if query.strip().upper().startswith("SHOW COLUMNS"):
+            self._rows = [{"Field": name} for name in TRADE_COLUMNS]
+        else:
+            self._rows = []
+        self.rowcount = 1
+
+    def fetchall(self) -> List[Dict]:
+        return self._rows
+
+    def fetchone(self) -> Optional[Dict]:
+        return self._rows[0] if self._rows else None
+
+    def close(self):
+        pass
+
+
+class _LatencyConnection:
+    """Подключение MySQL-заглушка: каждый запрос занимает latency секунд"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def is_connected(self) -> bool:
+        return True
+
+    def cursor(self, **_) -> _LatencyCursor:
+        return _LatencyCursor(self.latency)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class BenchmarkDatabase(DatabaseService):
+    """DatabaseService поверх подключения-заглушки (замеряется путь записи без MySQL)"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        super().__init__()
+
+    def connect(self):
+        self.connection = _LatencyConnection(self.latency)
+        return True
+
+
+class BenchmarkAsyncDatabase(AsyncDatabaseService):
+    """AsyncDatabaseService поверх BenchmarkDatabase (путь без aiomysql: запросы в потоке)"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+
+    async def connect(self) -> bool:
+        if self._sync_db is None:
+            self._sync_db = BenchmarkDatabase(self.latency)
+            self._sync_lock = asyncio.Lock()
+        return True
+
+
+# ---------- общие данные бенчмарков ----------
+
+class BenchmarkContext:
+    def __init__(self, seed: int = 0, latency_ms: float = 20.0, ai_latency_ms: float = 0.0,
+                 db_latency_ms: float = 1.0, fixtures_dir: str = None, symbols: List[str] = None):
+        """
+        Args:
+            seed: Зерно симулятора (синтетические цены)
+            latency_ms: Задержка каждого ответа биржи в сценариях с задержкой
+            ai_latency_ms: Задержка ответа AI
+            db_latency_ms: Задержка запроса к БД
+            fixtures_dir: Каталог CandleStore с записанными свечами (пусто - синтетика)
+            symbols: Вселенная монет (по умолчанию popular_coins, с fixtures_dir - записанные символы)
+        """
+        self.seed = seed
+        self.latency_ms = latency_ms
+        self.ai_latency_ms = ai_latency_ms
+        self.db_latency_ms = db_latency_ms
+        self.fixtures_dir = fixtures_dir
+        if fixtures_dir and not symbols:
+            symbols = CandleStore(fixtures_dir).symbols("60")
+        self._symbols = symbols
+        self._cache: Dict[str, object] = {}
+        self._workdir: Optional[Path] = None
+
+    def settings(self) -> Dict:
+        """Параметры прогона: сравнивать с базовой линией имеет смысл только при совпадении"""
+        return {
+            "seed": self.seed,
+            "latency_ms": self.latency_ms,
+            "ai_latency_ms": self.ai_latency_ms,
+            "db_latency_ms": self.db_latency_ms,
+            "fixtures": bool(self.fixtures_dir),
+        }
+
+    @property
+    def workdir(self) -> Path:
+        if self._workdir is None:
+            self._workdir = Path(tempfile.mkdtemp(prefix="trade_bot_bench_"))
+        return self._workdir
+
+    def simulator(self, latency: bool = True) -> ExchangeSimulator:
+        options = dict(seed=self.seed, latency=self.latency_ms / 1000 if latency else 0.0)
+        if self.fixtures_dir:
+            return ExchangeSimulator.from_candle_store(CandleStore(self.fixtures_dir), symbols=self._symbols, **options)
+        return ExchangeSimulator(**options)
+
+    def market_service(self, latency: bool = True) -> MarketAnalysisService:
+        bybit_service = BybitService(client=self.simulator(latency))
+        service = MarketAnalysisService(
+            bybit_service=bybit_service,
+            risk_service=RiskManagementService(bybit_service=bybit_service)
+        )
+        if self._symbols:
+            service.popular_coins = list(self._symbols)
+        return service
+
+    def ai_service(self, latency: bool = True) -> AIService:
+        return AIService(client=FakeAIClient(self.ai_latency_ms / 1000 if latency else 0.0))
+
+    def database(self) -> BenchmarkDatabase:
+        return BenchmarkDatabase(self.db_latency_ms / 1000)
+
+    def async_database(self) -> BenchmarkAsyncDatabase:
+        return BenchmarkAsyncDatabase(self.db_latency_ms / 1000)
+
+    @property
+    def symbols(self) -> List[str]:
+        return list(self._symbols or self._cached("symbols", lambda: self.offline_market.popular_coins))
+
+    def _cached(self, key: str, factory: Callable):
+        if key not in self._cache:
+            self._cache[key] = factory()
+        return self._cache[key]
+
+    @property
+    def offline_market(self) -> MarketAnalysisService:
+        """Анализ рынка без задержек (подготовка данных, не замеряется)"""
+        return self._cached("offline_market", lambda: self.market_service(latency=False))
+
+    @property
+    def candles(self) -> Dict[str, List[Dict]]:
+        """Часовые свечи анализа (240 штук, как в get_historical_data) по символам"""
+        def load():
+            bybit_service = self.offline_market.bybit_service
+            loaded = {symbol: bybit_service.get_kline(symbol=symbol, interval="60", limit=240) for symbol in self.symbols}
+            return {symbol: candles for symbol, candles in loaded.items() if candles}
+        return self._cached("candles", load)
+
+    @property
+    def analysis_results(self) -> List[Dict]:
+        return self._cached("analysis_results", self.offline_market.analyze_all_coins)
+
+    @property
+    def ai_payloads(self) -> List[Dict]:
+        """Данные AI по лучшим монетам в формате _execute_auto_trade"""
+        def build():
+            market = self.offline_market
+            payloads = []
+            for asset in self.analysis_results[:AI_POOL_SIZE]:
+                symbol = asset["symbol"]
+                market_data = market.bybit_service.get_market_data_comprehensive(symbol)
+                if not market_data:
+                    continue
+                market_data["historical"] = market.get_historical_data(symbol)
+                market_data["order_book"] = market.bybit_service.get_order_book(symbol, limit=50)
+                payloads.append({"symbol": symbol, "market_data": market_data, "score": asset["score"],
+                                 "data": asset["data"]})
+            return payloads
+        return self._cached("ai_payloads", build)
+
+    @property
+    def snapshots(self) -> List[tuple]:
+        """(символ, снимок рынка, статистика свечей) для save_market_snapshot"""
+        def build():
+            market = self.offline_market
+            rows = []
+            for symbol, candles in self.candles.items():
+                data = market.get_historical_data(symbol, save_snapshot=False)
+                if data and data.get("db_snapshot"):
+                    rows.append((symbol, data["db_snapshot"], market._analyze_candles(candles)))
+            return rows
+        return self._cached("snapshots", build)
+
+
+# ---------- бенчмарки ----------
+
+@benchmark("indicators.analyze_candles", "indicators", rounds=50)
+def bench_analyze_candles(ctx: BenchmarkContext):
+    """Индикаторы и уровни по 240 свечам одной монеты (_analyze_candles)"""
+    market = ctx.offline_market
+    candles = next(iter(ctx.candles.values()))
+    return lambda: market._analyze_candles(candles) and 1
+
+
+@benchmark("indicators.analyze_candles_batch", "indicators", rounds=10)
+def bench_analyze_candles_batch(ctx: BenchmarkContext):
+    """Индикаторы по всей вселенной монет"""
+    market = ctx.offline_market
+    candles = ctx.candles
+
+    def run():
+        for series in candles.values():
+            market._analyze_candles(series)
+        return len(candles)
+    return run
+
+
+@benchmark("scan.analyze_all_coins", "scan", rounds=3, warmup=0)
+def bench_analyze_all_coins(ctx: BenchmarkContext):
+    """Скан вселенной (analyze_all_coins) с задержкой ответов биржи"""
+    market = ctx.market_service(latency=True)
+    return lambda: len(market.analyze_all_coins())
+
+
+@benchmark("scan.market_overview", "scan", rounds=50)
+def bench_market_overview(ctx: BenchmarkContext):
+    """Сводка рынка по готовым результатам анализа (get_market_overview)"""
+    market = ctx.offline_market
+    results = ctx.analysis_results
+    return lambda: market.get_market_overview(results) and len(results)
+
+
+@benchmark("db.market_snapshots", "db", rounds=5)
+def bench_db_snapshots(ctx: BenchmarkContext):
+    """Запись снимков рынка (save_market_snapshot), 5 на монету"""
+    database = ctx.database()
+    rows = ctx.snapshots * 5
+
+    def run():
+        for symbol, snapshot, candle_stats in rows:
+            database.save_market_snapshot(symbol, snapshot, candle_stats)
+        return len(rows)
+    return run
+
+
+@benchmark("db.async_market_snapshots", "db", rounds=5)
+def bench_db_async_snapshots(ctx: BenchmarkContext):
+    """Запись снимков рынка из корутин (AsyncDatabaseService, как в data_collection_job)"""
+    rows = ctx.snapshots * 5
+    loop = asyncio.new_event_loop()
+    database = ctx.async_database()
+
+    async def save_all():
+        await asyncio.gather(*(database.save_market_snapshot(symbol, snapshot, candle_stats)
+                               for symbol, snapshot, candle_stats in rows))
+
+    def run():
+        loop.run_until_complete(save_all())
+        return len(rows)
+    return run
+
+
+@benchmark("db.trades", "db", rounds=5)
+def bench_db_trades(ctx: BenchmarkContext):
+    """Запись сделок (save_trade)"""
+    database = ctx.database()
+    assets = ctx.analysis_results
+
+    def run():
+        for asset in assets * 3:
+            price = asset["data"]["current_price"]
+            database.save_trade(asset["symbol"], "Long", price, 1.0, 5,
+                                stop_loss=price * 0.98, take_profit=price * 1.005)
+        return len(assets) * 3
+    return run
+
+
+@benchmark("ai.trade_selection_prompt", "ai", rounds=50)
+def bench_trade_selection_prompt(ctx: BenchmarkContext):
+    """Промпт выбора монеты и разбор ответа (analyze_market_for_trade_selection, AI без задержки)"""
+    ai_service = ctx.ai_service(latency=False)
+    payloads = ctx.ai_payloads
+    return lambda: ai_service.analyze_market_for_trade_selection(payloads, [], 1000.0) and len(payloads)
+
+
+@benchmark("ai.trade_plan_prompt", "ai", rounds=50)
+def bench_trade_plan_prompt(ctx: BenchmarkContext):
+    """Промпты торговых планов по пулу монет (analyze_asset_trade_plan, AI без задержки)"""
+    ai_service = ctx.ai_service(latency=False)
+    payloads = ctx.ai_payloads
+
+    def run():
+        for payload in payloads:
+            ai_service.analyze_asset_trade_plan(payload)
+        return len(payloads)
+    return run
+
+
+def _load_bot(ctx: BenchmarkContext):
+    """bot.py на симуляторе, AI- и БД-заглушках; состояние и свечи - во временном каталоге"""
+    config.STATE_DB_PATH = str(ctx.workdir / "bot_state.sqlite3")
+    config.CANDLE_STORE_DIR = str(ctx.workdir / "candles")
+    config.BYBIT_PRIVATE_STREAM = False
+    try:
+        import bot
+    except ImportError as e:
+        raise BenchmarkSkipped(f"bot.py не импортируется: {e}")
+    simulator = ctx.simulator()
+    # Мейкер-вход ждет исполнения по реальным часам: часы симулятора идут за ними (ускоренно),
+    # чтобы лимитные ордера на лучшей цене исполнялись встречным потоком
+    simulator.realtime = True
+    simulator.speed = BOT_SIMULATOR_SPEED
+    bot.exchange_simulator = LazyService("ExchangeSimulator", lambda: simulator)
+    bot.ai_service = LazyService("AIService", ctx.ai_service)
+    bot.db_service = LazyService("DatabaseService", ctx.database)
+    bot.async_db_service = LazyService("AsyncDatabaseService", ctx.async_database)
+    bot.news_service = LazyService("NewsService", lambda: None)
+    bot.ALLOWED_CHAT_IDS = []
+    bot.market_analysis_service.popular_coins = ctx.symbols
+    return bot
+
+
+@benchmark("cycle.auto_trade", "cycle", rounds=3, warmup=0)
+def bench_auto_trade_cycle(ctx: BenchmarkContext):
+    """Полный цикл автозакупки (_execute_auto_trade_with_analysis) с задержками биржи, AI и БД, вход - по настройкам бота"""
+    bot = _load_bot(ctx)
+    loop = asyncio.new_event_loop()
+
+    def setup():
+        # Каждый раунд начинается без позиций, иначе лимит позиций обрывает цикл
+        if bot.bybit_service.get_positions():
+            bot.bybit_service.close_all_positions()
+        bot.bybit_service.invalidate_positions()
+
+    def run():
+        # Срок входа - как в auto_buy_job: мейкер-фаза укорачивается под бюджет цикла
+        deadline = time.monotonic() + CYCLE_BUDGET_SECONDS
+        loop.run_until_complete(bot._execute_auto_trade_with_analysis(deadline=deadline))
+    return run, setup
+
+
+# ---------- прогон и базовая линия ----------
+
+def _stats(times: List[float], items: Optional[int], group: str) -> Dict:
+    median = statistics.median(times)
+    return {
+        "group": group,
+        "rounds": len(times),
+        "min": min(times),
+        "max": max(times),
+        "mean": statistics.fmean(times),
+        "median": median,
+        "stddev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "items": items,
+        "items_per_sec": items / median if items and median > 0 else None,
+    }
+
+
+def run_benchmarks(ctx: BenchmarkContext, only: List[str] = None, rounds: int = None) -> Dict[str, Dict]:
+    """
+    Выполнить бенчмарки
+
+    Args:
+        ctx: Данные и заглушки
+        only: Подстроки имен (None - все)
+        rounds: Переопределить число раундов
+
+    Returns:
+        {имя: статистика} (для пропущенных - {"skipped": причина})
+    """
+    results = {}
+    for case in BENCHMARKS:
+        name = case["name"]
+        if only and not any(pattern in name for pattern in only):
+            continue
+        try:
+            prepared = case["func"](ctx)
+        except BenchmarkSkipped as e:
+            logger.warning(f"Бенчмарк {name} пропущен: {e}")
+            results[name] = {"group": case["group"], "skipped": str(e)}
+            continue
+        run, setup = prepared if isinstance(prepared, tuple) else (prepared, None)
+
+        for _ in range(case["warmup"]):
+            if setup:
+                setup()
+            run()
+        times, items = [], None
+        for _ in range(rounds or case["rounds"]):
+            if setup:
+                setup()
+            started = time.perf_counter()
+            count = run()
+            times.append(time.perf_counter() - started)
+            items = count if isinstance(count, int) and not isinstance(count, bool) else None
+        results[name] = _stats(times, items, case["group"])
+        logger.info(f"{name}: медиана {results[name]['median'] * 1000:.2f} мс ({len(times)} раундов)")
+    return results
+
+
+def load_baseline(path: Path) -> Optional[Dict]:
+    try:
+        with Path(path).open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Не удалось прочитать базовую линию {path}: {e}")
+        return None
+
+
+def save_baseline(path: Path, results: Dict[str, Dict], ctx: BenchmarkContext):
+    """Записать результаты как новую базовую линию"""
+    baseline = {
+        "created_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+        "settings": ctx.settings(),
+        "benchmarks": {
+            name: {key: stats[key] for key in ("median", "min", "mean", "items_per_sec")}
+            for name, stats in sorted(results.items()) if "skipped" not in stats
+        },
+    }
+    with Path(path).open("w", encoding="utf-8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+
+def compare_with_baseline(results: Dict[str, Dict], baseline: Optional[Dict], tolerance: float = 0.5) -> Dict[str, Dict]:
+    """
+    Сравнить лучшие раунды с базовой линией
+
+    Returns:
+        {имя: {"status": ok|regression|faster|new|skipped, "ratio": min / базовый min}}
+    """
+    reference = (baseline or {}).get("benchmarks", {})
+    comparison = {}
+    for name, stats in results.items():
+        if "skipped" in stats:
+            comparison[name] = {"status": "skipped", "ratio": None}
+            continue
+        base = reference.get(name)
+        if not base or not base.get("min"):
+            comparison[name] = {"status": "new", "ratio": None}
+            continue
+        ratio = stats["min"] / base["min"]
+        if ratio > 1 + tolerance:
+            status = "regression"
+        elif ratio < 1 / (1 + tolerance):
+            status = "faster"
+        else:
+            status = "ok"
+        comparison[name] = {"status": status, "ratio": ratio}
+    return comparison
+
+
+def _format_seconds(value: float) -> str:
+    if value >= 1:
+        return f"{value:.2f} s"
+    if value >= 0.001:
+        return f"{value * 1000:.2f} ms"
+    return f"{value * 1e6:.1f} µs"
+
+
+def format_report(results: Dict[str, Dict], comparison: Dict[str, Dict], baseline: Optional[Dict] = None,
+                  ctx: BenchmarkContext = None) -> str:
+    """Текстовый отчет: таблица медиан, сравнение с базовой линией и бюджет цикла"""
+    status_labels = {"ok": "✅", "regression": "❌ регрессия", "faster": "🚀 быстрее", "new": "🆕 нет в базе",
+                     "skipped": "⏭ пропущен"}
+    lines = ["=" * 100, "БЕНЧМАРКИ ЦИКЛА АВТОЗАКУПКИ", "=" * 100]
+    if ctx is not None:
+        lines.append(f"Параметры: {ctx.settings()}")
+    if baseline:
+        lines.append(f"Базовая линия: {baseline.get('created_at')} ({baseline.get('machine')}, Python {baseline.get('python')})")
+        if ctx is not None and baseline.get("settings") != ctx.settings():
+            lines.append(f"⚠️ Параметры базовой линии другие: {baseline.get('settings')} - сравнение неточно")
+    lines.append("")
+    lines.append(f"{'Бенчмарк':<34} {'медиана':>11} {'min':>11} {'±σ':>10} {'элем/с':>10}  {'к базе':>7}  статус")
+    lines.append("-" * 100)
+    for name, stats in results.items():
+        compared = comparison.get(name, {})
+        label = status_labels.get(compared.get("status"), "")
+        if "skipped" in stats:
+            lines.append(f"{name:<34} {'-':>11} {'-':>11} {'-':>10} {'-':>10}  {'-':>7}  {label}: {stats['skipped']}")
+            continue
+        ratio = f"{compared['ratio']:.2f}x" if compared.get("ratio") else "-"
+        throughput = f"{stats['items_per_sec']:.0f}" if stats.get("items_per_sec") else "-"
+        lines.append(
+            f"{name:<34} {_format_seconds(stats['median']):>11} {_format_seconds(stats['min']):>11} "
+            f"{_format_seconds(stats['stddev']):>10} {throughput:>10}  {ratio:>7}  {label}"
+        )
+    cycle = results.get("cycle.auto_trade")
+    if cycle and "skipped" not in cycle:
+        share = cycle["median"] / CYCLE_BUDGET_SECONDS * 100
+        mark = "✅" if cycle["median"] <= CYCLE_BUDGET_SECONDS else "❌"
+        lines.append("")
+        lines.append(f"{mark} Цикл автозакупки: {_format_seconds(cycle['median'])} из {CYCLE_BUDGET_SECONDS:.0f} s бюджета ({share:.0f}%)")
+    regressions = [name for name, compared in comparison.items() if compared["status"] == "regression"]
+    if regressions:
+        lines.append("")
+        lines.append(f"❌ Регрессии: {', '.join(regressions)}")
+    return "\n".join(lines)
+
+
+def record_fixtures(bybit_service, path: str, symbols: List[str], interval: str = "60", limit: int = 1000) -> Dict[str, int]:
+    """
+    Записать свечи с биржи в CandleStore для прогона бенчмарков на реальных данных
+
+    Returns:
+        {символ: записано свечей}
+    """
+    store = CandleStore(path)
+    written = {}
+    for symbol in symbols:
+        candles = bybit_service.get_kline(symbol=symbol, interval=interval, limit=limit)
+        if not candles:
+            logger.warning(f"Свечи {symbol} не получены, пропускаю")
+            continue
+        written[symbol] = store.append(symbol, interval, candles)
+    return written
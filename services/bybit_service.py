@@ -1,23 +1,78 @@
 from pybit.unified_trading import HTTP
 import config
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
 
+from services.error_sink import ApiErrorSink
+from services.metrics import instrument_client
+
 logger = logging.getLogger(__name__)
 
+POSITIONS_EMPTY_CACHE_SECONDS = 10  # Сколько отдавать пустой список позиций без запроса к бирже
+CLOSE_BATCH_SIZE = 10  # Ордеров в одном place_batch_order (предел Bybit для linear)
+
+
+def _is_tp_sl_rejection(response: Dict) -> bool:
+    """Ордер отклонен из-за уровней стоп-лосса/тейк-профита"""
+    message = (response.get("retMsg") or "").lower().replace(" ", "")
+    return any(marker in message for marker in ("takeprofit", "stoploss", "tpsl", "tp/sl"))
+
 
 class BybitService:
-    def __init__(self, db_service=None):
-        logger.info(f"Инициализация BybitService: testnet={config.BYBIT_TESTNET}")
-        self.client = HTTP(
-            testnet=config.BYBIT_TESTNET,
-            api_key=config.BYBIT_API_KEY,
-            api_secret=config.BYBIT_API_SECRET,
-        )
+    def __init__(self, db_service=None, client=None):
+        """
+        Args:
+            db_service: DatabaseService для сохранения ошибок API
+            client: Клиент с интерфейсом pybit HTTP (по умолчанию - Bybit; ExchangeSimulator - локально)
+        """
+        if client:
+            logger.info(f"Инициализация BybitService: клиент {type(client).__name__}")
+            self.client = client
+        else:
+            logger.info(f"Инициализация BybitService: testnet={config.BYBIT_TESTNET}")
+            self.client = HTTP(
+                testnet=config.BYBIT_TESTNET,
+                api_key=config.BYBIT_API_KEY,
+                api_secret=config.BYBIT_API_SECRET,
+            )
+        # Время и ошибки каждого запроса - в метриках (services/metrics.py)
+        self.client = instrument_client(self.client)
         self.db_service = db_service  # Для сохранения ошибок
+        # Ошибки пишутся в БД фоновым потоком пачками, запрос их не ждет
+        self.error_sink = ApiErrorSink.for_db(db_service) if db_service else None
+        # Книга позиций и баланса из приватного потока (services/account_stream.py)
+        self.account_stream = None
+        # Последний успешный снимок позиций (пустой отдается из кэша POSITIONS_EMPTY_CACHE_SECONDS)
+        self._positions_cache: Optional[List[Dict]] = None
+        self._positions_cached_at = 0.0
+    
+    def attach_account_stream(self, account_stream):
+        """Отвечать на get_positions/get_balance из книги потока, пока он подключен"""
+        self.account_stream = account_stream
     
-    def get_balance(self):
-        """Получить баланс кошелька (фьючерсный счет)"""
+    def _stream_live(self) -> bool:
+        return self.account_stream is not None and self.account_stream.is_live()
+    
+    def _record_error(self, api_method: str, symbol: str, error_code: str, error_message: str,
+                      response_data: Dict = None):
+        """Поставить ошибку API в очередь на запись в БД"""
+        if self.error_sink:
+            try:
+                self.error_sink.record(api_method, symbol, error_code, error_message, response_data)
+            except Exception:
+                pass
+    
+    def get_balance(self, fresh: bool = False):
+        """
+        Получить баланс кошелька (фьючерсный счет)
+        
+        Args:
+            fresh: Запросить у биржи, даже если подключен приватный поток
+        """
+        if not fresh and self._stream_live() and self.account_stream.balance is not None:
+            return self.account_stream.balance
         try:
             response = self.client.get_wallet_balance(
                 accountType="UNIFIED"  # UNIFIED включает фьючерсы
@@ -35,11 +90,7 @@ class BybitService:
                 print(f"Ошибка Bybit API: {error_msg} (код: {error_code})")
                 
                 # Сохраняем ошибку в БД
-                if self.db_service:
-                    try:
-                        self.db_service.save_api_error("get_balance", "N/A", str(error_code), error_msg, response)
-                    except Exception:
-                        pass
+                self._record_error("get_balance", "N/A", str(error_code), error_msg, response)
                 
                 # Детальная информация об ошибках
                 if error_code == 401:
@@ -114,11 +165,7 @@ class BybitService:
                 return None
             
             # Сохраняем только реальные ошибки (не успешные запросы)
-            if self.db_service:
-                try:
-                    self.db_service.save_api_error("get_ticker", symbol, str(error_code), error_msg, response)
-                except Exception:
-                    pass
+            self._record_error("get_ticker", symbol, str(error_code), error_msg, response)
             return None
         except Exception as e:
             error_msg = str(e)
@@ -129,11 +176,8 @@ class BybitService:
             
             logger.error(f"Ошибка при получении тикера {symbol}: {e}")
             # Сохраняем только серьезные ошибки (не таймауты и не несуществующие символы)
-            if self.db_service and "timeout" not in error_msg.lower() and "symbol invalid" not in error_msg.lower():
-                try:
-                    self.db_service.save_api_error("get_ticker", symbol, "EXCEPTION", error_msg)
-                except Exception:
-                    pass
+            if "timeout" not in error_msg.lower() and "symbol invalid" not in error_msg.lower():
+                self._record_error("get_ticker", symbol, "EXCEPTION", error_msg)
             return None
     
     def get_funding_rate(self, symbol="BTCUSDT"):
@@ -264,12 +308,23 @@ class BybitService:
             return []
     
     def place_order(self, symbol, side, qty, order_type="Market", 
-                   stop_loss=None, take_profit=None, reduce_only=False, prefer_maker=False):
+                   stop_loss=None, take_profit=None, reduce_only=False, prefer_maker=False, price=None):
         """
         Разместить ордер на фьючерсном рынке с защитными ордерами.
+        
+        Стоп-лосс и тейк-профит передаются в самом ордере (tpslMode=Full) - позиция
+        открывается уже с ними. Если биржа отклоняет ордер из-за уровней, ордер
+        размещается без них и в результате tp_sl_attached=False - уровни ставит
+        вызывающий (OrderManager) после исполнения.
+        
+        Args:
+            order_type: "Market" или "Limit" (для Limit нужна price)
+            prefer_maker: Лимитный ордер только мейкером (PostOnly); пересечет стакан - биржа его отменит
+            price: Цена лимитного ордера
         """
         try:
-            order_type = "Market"
+            if order_type == "Limit" and not price:
+                return {"error": "Для лимитного ордера не указана цена"}
             order_params = {
                 "category": "linear",
                 "symbol": symbol,
@@ -278,12 +333,30 @@ class BybitService:
                 "qty": str(qty),
                 "reduceOnly": reduce_only
             }
+            if order_type == "Limit":
+                order_params["price"] = str(price)
+                order_params["timeInForce"] = "PostOnly" if prefer_maker else "GTC"
+            with_tp_sl = bool((stop_loss or take_profit) and not reduce_only)
+            if with_tp_sl:
+                order_params["tpslMode"] = "Full"
+                if stop_loss:
+                    order_params["stopLoss"] = str(stop_loss)
+                if take_profit:
+                    order_params["takeProfit"] = str(take_profit)
             
             logger.info(f"Размещаю ордер: {symbol}, side={side}, qty={qty}, params={order_params}")
             response = self.client.place_order(**order_params)
             logger.info(f"Ответ API place_order: retCode={response.get('retCode')}, retMsg={response.get('retMsg')}")
             logger.debug(f"Полный ответ API: {response}")
             
+            if response.get("retCode") != 0 and with_tp_sl and _is_tp_sl_rejection(response):
+                # Отклонен - значит, не исполнен; повторяем без уровней, их поставят после исполнения
+                logger.warning(f"⚠️ Ордер {symbol} с TP/SL отклонен ({response.get('retMsg')}), размещаю без TP/SL")
+                for key in ("tpslMode", "stopLoss", "takeProfit"):
+                    order_params.pop(key, None)
+                with_tp_sl = False
+                response = self.client.place_order(**order_params)
+            
             if response.get("retCode") != 0:
                 error_msg = response.get("retMsg", "Неизвестная ошибка")
                 error_code = response.get("retCode", "N/A")
@@ -305,47 +378,57 @@ class BybitService:
                 }
             
             logger.info(f"✅ Ордер размещен: {symbol}, side={side}, qty={qty}, orderId={order_id}, status={order_status}")
+            self.invalidate_positions()
             
             if stop_loss or take_profit:
-                tp_sl_ok = self._attach_tp_sl_with_retry(symbol, stop_loss, take_profit, order_type)
-                order_result["tp_sl_attached"] = bool(tp_sl_ok)
+                order_result["tp_sl_attached"] = with_tp_sl
             
             return order_result
         except Exception as e:
             logger.error(f"Ошибка при размещении ордера: {e}")
             return {"error": str(e)}
 
-    def _attach_tp_sl_with_retry(self, symbol, stop_loss, take_profit, order_type):
-        import time
-        
-        max_attempts = 5
-        initial_wait = 1.0 if order_type == "Market" else 2.0
-        time.sleep(initial_wait)
-        
-        for attempt in range(max_attempts):
-            try:
-                tp_sl_result = self.set_trading_stop(
-                    symbol=symbol,
-                    stop_loss=stop_loss,
-                    take_profit=take_profit
-                )
-                if tp_sl_result:
-                    logger.info(f"✅ TP/SL установлены для {symbol}: SL={stop_loss}, TP={take_profit}")
-                    return True
-                
-                if attempt < max_attempts - 1:
-                    logger.info(f"⏳ TP/SL не установлены, повтор через 1 сек (попытка {attempt + 1}/{max_attempts})")
-                    time.sleep(1.0)
-                else:
-                    logger.warning(f"⚠️ Не удалось установить TP/SL для {symbol} после {max_attempts} попыток.")
-            except Exception as e:
-                if attempt < max_attempts - 1:
-                    logger.warning(f"⚠️ Ошибка при установке TP/SL (попытка {attempt + 1}/{max_attempts}): {e}, повторяю")
-                    time.sleep(1.0)
-                else:
-                    logger.error(f"❌ Ошибка при установке TP/SL для {symbol} после {max_attempts} попыток: {e}")
-        return False
-
+    def amend_order(self, symbol: str, order_id: str, price=None, qty=None) -> bool:
+        """Изменить цену/количество активного ордера"""
+        try:
+            params = {"category": "linear", "symbol": symbol, "orderId": order_id}
+            if price is not None:
+                params["price"] = str(price)
+            if qty is not None:
+                params["qty"] = str(qty)
+            response = self.client.amend_order(**params)
+            if response.get("retCode") != 0:
+                logger.debug(f"amend_order {symbol} {order_id}: {response.get('retMsg')} (код: {response.get('retCode')})")
+                return False
+            return True
+        except Exception as e:
+            logger.warning(f"Ошибка при изменении ордера {symbol} {order_id}: {e}")
+            return False
+    
+    def cancel_order(self, symbol: str, order_id: str) -> bool:
+        """Отменить ордер (False - не отменен, например уже исполнен)"""
+        try:
+            response = self.client.cancel_order(category="linear", symbol=symbol, orderId=order_id)
+            if response.get("retCode") != 0:
+                logger.debug(f"cancel_order {symbol} {order_id}: {response.get('retMsg')} (код: {response.get('retCode')})")
+                return False
+            return True
+        except Exception as e:
+            logger.warning(f"Ошибка при отмене ордера {symbol} {order_id}: {e}")
+            return False
+    
+    def get_order(self, symbol: str, order_id: str) -> Optional[Dict]:
+        """Состояние ордера (активного или недавно закрытого): orderStatus, cumExecQty, avgPrice, price"""
+        try:
+            response = self.client.get_open_orders(category="linear", symbol=symbol, orderId=order_id)
+            if response.get("retCode") != 0:
+                return None
+            orders = (response.get("result") or {}).get("list") or []
+            return orders[0] if orders else None
+        except Exception as e:
+            logger.warning(f"Ошибка при получении ордера {symbol} {order_id}: {e}")
+            return None
+    
     def get_order_book(self, symbol="BTCUSDT", limit=50):
         """Получить стакан цен по символу и оценить суммарные объёмы bid/ask."""
         try:
@@ -409,46 +492,37 @@ class BybitService:
             logger.error(f"Ошибка при получении стакана {symbol}: {e}")
             return None
 
-    def get_symbol_filters(self, symbol: str) -> Optional[Dict[str, float]]:
+    def get_instruments(self, category: str = "linear", limit: int = 1000) -> Optional[List[Dict]]:
         """
-        Получить параметры лота для символа (minOrderQty и qtyStep) с Bybit.
-        Используется для того, чтобы не ловить ошибки Qty invalid.
+        Получить все инструменты категории (get_instruments_info с пагинацией по cursor)
+        
+        Returns:
+            Список инструментов в формате Bybit или None при ошибке
         """
         try:
-            response = self.client.get_instruments_info(
-                category="linear",
-                symbol=symbol
-            )
-            if response.get("retCode") != 0:
-                logger.error(
-                    f"Ошибка get_instruments_info для {symbol}: "
-                    f"{response.get('retMsg')} (код: {response.get('retCode')})"
-                )
-                return None
-
-            instruments = (response.get("result") or {}).get("list") or []
-            if not instruments:
-                logger.warning(f"get_instruments_info: пустой список для {symbol}")
-                return None
-
-            lot_filter = instruments[0].get("lotSizeFilter") or {}
-            try:
-                min_qty = float(lot_filter.get("minOrderQty") or 0)
-                qty_step = float(lot_filter.get("qtyStep") or 0)
-            except (TypeError, ValueError):
-                logger.warning(f"Не удалось распарсить lotSizeFilter для {symbol}: {lot_filter}")
-                return None
-
-            if min_qty <= 0 or qty_step <= 0:
-                logger.warning(f"lotSizeFilter вернул некорректные значения для {symbol}: {lot_filter}")
-                return None
-
-            logger.info(
-                f"Фильтры лота для {symbol}: min_qty={min_qty}, qty_step={qty_step}"
-            )
-            return {"min_qty": min_qty, "qty_step": qty_step}
+            instruments = []
+            cursor = None
+            while True:
+                params = {"category": category, "limit": limit}
+                if cursor:
+                    params["cursor"] = cursor
+                response = self.client.get_instruments_info(**params)
+                if response.get("retCode") != 0:
+                    logger.error(
+                        f"Ошибка get_instruments_info ({category}): "
+                        f"{response.get('retMsg')} (код: {response.get('retCode')})"
+                    )
+                    self._record_error("get_instruments_info", None, str(response.get("retCode")),
+                                       response.get("retMsg", "Unknown error"))
+                    return None
+                result = response.get("result") or {}
+                instruments.extend(result.get("list") or [])
+                cursor = result.get("nextPageCursor")
+                if not cursor:
+                    break
+            return instruments
         except Exception as e:
-            logger.error(f"Ошибка при получении фильтров лота для {symbol}: {e}", exc_info=True)
+            logger.error(f"Ошибка при получении списка инструментов {category}: {e}")
             return None
     
     def _analyze_order_book_depth(self, bids: List[Dict], asks: List[Dict], current_price: float) -> Dict:
@@ -764,179 +838,244 @@ class BybitService:
             logger.error(f"Ошибка при частичном закрытии позиции: {e}")
             return None
     
-    def close_all_positions(self):
-        """Закрыть все открытые позиции"""
+    @staticmethod
+    def _close_order_params(pos: Dict) -> Optional[Dict]:
+        """Рыночный reduce-only ордер, закрывающий позицию (None - позиция пустая)"""
+        symbol = pos.get("symbol")
+        size = float(pos.get("size", 0) or 0)
+        if not symbol or abs(size) < 0.001:  # Пропускаем пустые позиции
+            return None
+        
+        # ВАЖНО: Bybit возвращает size всегда положительным!
+        # Тип позиции определяется полем "side":
+        # - side="Buy" → Long позиция → закрываем продажей (Sell)
+        # - side="Sell" → Short позиция → закрываем покупкой (Buy)
+        position_side = (pos.get("side") or "").capitalize()
+        if position_side == "Buy":
+            close_side, pos_type = "Sell", "Long"
+        elif position_side == "Sell":
+            close_side, pos_type = "Buy", "Short"
+        else:
+            # Если side не указан, определяем по знаку размера (fallback)
+            logger.warning(f"Позиция {symbol}: side не указан ({pos.get('side')}), используем fallback")
+            close_side, pos_type = ("Sell", "Long") if size > 0 else ("Buy", "Short")
+        
+        return {
+            "symbol": symbol,
+            "side": close_side,
+            "orderType": "Market",
+            "qty": str(abs(size)),
+            "reduceOnly": True,
+            "position_type": pos_type
+        }
+    
+    def _send_close_batch(self, orders: List[Dict]) -> List[Dict]:
+        """
+        Отправить пачку закрывающих ордеров одним запросом place_batch_order
+        
+        Returns:
+            Отчет по каждому ордеру; если пакетный запрос не прошел - ордера отправляются
+            отдельными запросами параллельно
+        """
+        started = time.perf_counter()
+        request = [{key: value for key, value in order.items() if key != "position_type"} for order in orders]
+        try:
+            response = self.client.place_batch_order(category="linear", request=request)
+        except Exception as e:
+            logger.warning(f"Пакетное закрытие не выполнено ({e}), отправляю ордера по одному")
+            return self._send_close_orders(orders)
+        latency_ms = (time.perf_counter() - started) * 1000
+        if response.get("retCode") != 0:
+            logger.warning(f"Пакетное закрытие отклонено: {response.get('retMsg')}, отправляю ордера по одному")
+            return self._send_close_orders(orders)
+        
+        results = (response.get("result") or {}).get("list") or []
+        statuses = (response.get("retExtInfo") or {}).get("list") or []
+        reports = []
+        for index, order in enumerate(orders):
+            result = results[index] if index < len(results) else {}
+            status = statuses[index] if index < len(statuses) else {}
+            accepted = status.get("code", 0) == 0 and bool(result.get("orderId"))
+            reports.append({
+                "symbol": order["symbol"],
+                "side": order["position_type"],
+                "size": float(order["qty"]),
+                "order_id": result.get("orderId"),
+                "status": "Accepted" if accepted else "Rejected",
+                "error": None if accepted else status.get("msg", "Неизвестная ошибка"),
+                "latency_ms": latency_ms,
+                "batch": True
+            })
+        return reports
+    
+    def _send_close_orders(self, orders: List[Dict]) -> List[Dict]:
+        """Отправить закрывающие ордера отдельными запросами, параллельно (запасной путь пачки)"""
+        with ThreadPoolExecutor(max_workers=len(orders)) as executor:
+            return list(executor.map(self._send_close_order, orders))
+    
+    def _send_close_order(self, order: Dict) -> Dict:
+        """Отправить один закрывающий ордер"""
+        started = time.perf_counter()
+        report = {"symbol": order["symbol"], "side": order["position_type"], "size": float(order["qty"]),
+                  "order_id": None, "status": "Rejected", "error": None, "batch": False}
         try:
-            positions = self.get_positions()
-            closed = []
-            errors = []
+            params = {key: value for key, value in order.items() if key != "position_type"}
+            response = self.client.place_order(category="linear", **params)
+            if response.get("retCode") == 0:
+                report["order_id"] = (response.get("result") or {}).get("orderId")
+                report["status"] = "Accepted"
+            else:
+                report["error"] = response.get("retMsg", "Неизвестная ошибка")
+        except Exception as e:
+            report["error"] = str(e)
+        report["latency_ms"] = (time.perf_counter() - started) * 1000
+        return report
+    
+    def close_all_positions(self, confirm: bool = True):
+        """
+        Закрыть все открытые позиции
+        
+        Закрывающие ордера уходят пачками place_batch_order (по CLOSE_BATCH_SIZE), пачки - параллельно,
+        так что все позиции закрываются за один сетевой круг. Если пакетный запрос не прошел,
+        ордера пачки отправляются отдельными запросами параллельно (и параллельно с остальными пачками).
+        
+        Args:
+            confirm: Проверить исполнение снимком позиций после отправки
+        
+        Returns:
+            Dict: closed, errors, total_closed, orders (по символу: статус, задержка, ошибка), elapsed_ms
+        """
+        started = time.perf_counter()
+        try:
+            # Свежий снимок с биржи: кэш get_positions (или книга позиций потока) может отставать
+            positions = self.get_positions_snapshot()
+            if positions is None:
+                return {"closed": [], "errors": ["Не удалось получить открытые позиции"], "total_closed": 0,
+                        "orders": [], "elapsed_ms": (time.perf_counter() - started) * 1000}
+            orders = [order for order in map(self._close_order_params, positions) if order]
+            if not orders:
+                return {"closed": [], "errors": [], "total_closed": 0, "orders": [], "elapsed_ms": 0.0}
             
-            for pos in positions:
-                symbol = pos.get("symbol")
-                size = float(pos.get("size", 0) or 0)
-                
-                if abs(size) < 0.001:  # Пропускаем пустые позиции
-                    continue
-                
-                try:
-                    # Логируем все данные позиции для диагностики
-                    position_side = pos.get("side", "N/A")
-                    position_size = pos.get("size", "N/A")
-                    logger.info(f"Позиция {symbol}: size={size}, side={position_side}, raw_size={position_size}")
-                    
-                    # ВАЖНО: Bybit возвращает size всегда положительным!
-                    # Тип позиции определяется полем "side":
-                    # - side="Buy" → Long позиция → закрываем продажей (Sell)
-                    # - side="Sell" → Short позиция → закрываем покупкой (Buy)
-                    
-                    # Определяем тип позиции по полю side из API
-                    position_side_normalized = (position_side or "").capitalize()
-                    
-                    if position_side_normalized == "Buy":
-                        # Long позиция - закрываем продажей
-                        close_side = "Sell"
-                        pos_type = "Long"
-                    elif position_side_normalized == "Sell":
-                        # Short позиция - закрываем покупкой
-                        close_side = "Buy"
-                        pos_type = "Short"
-                    else:
-                        # Если side не указан, определяем по размеру (fallback)
-                        # Но это не должно происходить в нормальных условиях
-                        logger.warning(f"Позиция {symbol}: side не указан ({position_side}), используем fallback")
-                        if size > 0:
-                            close_side = "Sell"
-                            pos_type = "Long"
-                        elif size < 0:
-                            close_side = "Buy"
-                            pos_type = "Short"
-                        else:
-                            continue  # size = 0, пропускаем
-                    
-                    qty = abs(size)
-                    
-                    logger.info(f"Закрытие {symbol}: позиция={pos_type}, qty={qty}, close_side={close_side}")
-                    
-                    # Закрываем позицию рыночным ордером
-                    order_params = {
-                        "category": "linear",
-                        "symbol": symbol,
-                        "side": close_side,
-                        "orderType": "Market",
-                        "qty": str(qty),
-                        "reduceOnly": True
-                    }
-                    
-                    logger.info(f"Отправка запроса на закрытие: {order_params}")
-                    response = self.client.place_order(**order_params)
-                    
-                    if response.get("retCode") == 0:
-                        closed.append({
-                            "symbol": symbol,
-                            "size": qty,
-                            "side": pos_type
-                        })
-                        logger.info(f"Позиция {symbol} закрыта: {qty} ({pos_type})")
-                    else:
-                        error_msg = response.get("retMsg", "Неизвестная ошибка")
-                        errors.append(f"{symbol}: {error_msg}")
-                        logger.error(f"Ошибка при закрытии {symbol}: {error_msg}")
-                        
-                except Exception as e:
-                    error_str = str(e)
-                    errors.append(f"{symbol}: {error_str}")
-                    logger.error(f"Ошибка при закрытии позиции {symbol}: {e}", exc_info=True)
+            batches = [orders[i:i + CLOSE_BATCH_SIZE] for i in range(0, len(orders), CLOSE_BATCH_SIZE)]
+            logger.info(f"Закрываю {len(orders)} позиций: {len(batches)} пакетных запросов")
+            with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+                reports = [report for batch in executor.map(self._send_close_batch, batches) for report in batch]
             
+            if confirm:
+                # Исполнение рыночного reduce-only проверяем по позициям: закрытой позиции в снимке нет
+                remaining = self.get_positions_snapshot()
+                if remaining is not None:
+                    remaining_size = {pos.get("symbol"): float(pos.get("size") or 0) for pos in remaining}
+                    for report in reports:
+                        if report["status"] != "Accepted":
+                            continue
+                        left = remaining_size.get(report["symbol"], 0.0)
+                        if left < 0.001:
+                            report["status"] = "Filled"
+                        elif left < report["size"]:
+                            report["status"] = "PartiallyFilled"
+            
+            closed, errors = [], []
+            for report in reports:
+                if report["error"]:
+                    errors.append(f"{report['symbol']}: {report['error']}")
+                    logger.error(f"Ошибка при закрытии {report['symbol']}: {report['error']}")
+                else:
+                    closed.append({"symbol": report["symbol"], "size": report["size"], "side": report["side"]})
+                    logger.info(f"Позиция {report['symbol']} закрывается: {report['size']} ({report['side']}), "
+                                f"{report['status']}, {report['latency_ms']:.0f} мс")
+            
+            self.invalidate_positions()
             return {
                 "closed": closed,
                 "errors": errors,
-                "total_closed": len(closed)
+                "total_closed": len(closed),
+                "orders": reports,
+                "elapsed_ms": (time.perf_counter() - started) * 1000
             }
         except Exception as e:
             logger.error(f"Ошибка при закрытии всех позиций: {e}", exc_info=True)
-            return {"closed": [], "errors": [str(e)], "total_closed": 0}
+            return {"closed": [], "errors": [str(e)], "total_closed": 0, "orders": [],
+                    "elapsed_ms": (time.perf_counter() - started) * 1000}
     
-    def get_positions(self):
-        """Получить открытые позиции на фьючерсном рынке"""
+    def get_positions_snapshot(self) -> Optional[List[Dict]]:
+        """
+        Снимок открытых позиций (get_positions по settleCoin с пагинацией по cursor)
+        
+        Returns:
+            Список позиций или None при ошибке (пустой список - позиций действительно нет)
+        """
         try:
-            # Пробуем разные варианты запроса
-            # Вариант 1: с settleCoin
-            response = self.client.get_positions(
-                category="linear",
-                settleCoin="USDT"
-            )
-            
-            logger.info(f"Ответ API get_positions: retCode={response.get('retCode')}, retMsg={response.get('retMsg')}")
-            logger.info(f"Полный ответ API (первые 500 символов): {str(response)[:500]}")
-            
-            if response.get("retCode") == 0:
-                positions = response.get("result", {}).get("list", [])
-                logger.info(f"Получено позиций от Bybit API (вариант 1): {len(positions)}")
-                
-                # Если позиций нет, пробуем без settleCoin
-                if len(positions) == 0:
-                    logger.info("Пробую получить позиции без settleCoin...")
-                    try:
-                        response2 = self.client.get_positions(category="linear")
-                        logger.info(f"Ответ API (вариант 2): retCode={response2.get('retCode')}, retMsg={response2.get('retMsg')}")
-                        if response2.get("retCode") == 0:
-                            positions = response2.get("result", {}).get("list", [])
-                            logger.info(f"Получено позиций от Bybit API (вариант 2): {len(positions)}")
-                            if positions:
-                                logger.info(f"Полный ответ API (вариант 2): {str(response2)[:500]}")
-                    except Exception as e2:
-                        logger.warning(f"Ошибка при варианте 2: {e2}")
-                
-                # Если позиций нет, пробуем получить по конкретным символам
-                if len(positions) == 0:
-                    logger.info("Пробую получить позиции по популярным символам...")
-                    popular_symbols = ["BTCUSDT", "ETHUSDT", "XRPUSDT", "SOLUSDT", "BNBUSDT", "ADAUSDT", "DOGEUSDT",
-                                     "AVAXUSDT", "DOTUSDT", "MATICUSDT", "LINKUSDT", "UNIUSDT", "ATOMUSDT", "LTCUSDT"]
-                    for symbol in popular_symbols:
-                        try:
-                            response3 = self.client.get_positions(
-                                category="linear",
-                                symbol=symbol,
-                                settleCoin="USDT"
-                            )
-                            if response3.get("retCode") == 0:
-                                positions3 = response3.get("result", {}).get("list", [])
-                                if positions3:
-                                    for pos in positions3:
-                                        size_val = pos.get("size", "0")
-                                        try:
-                                            size_float = float(size_val) if size_val and str(size_val) != "N/A" else 0
-                                        except (ValueError, TypeError):
-                                            size_float = 0
-                                        if abs(size_float) > 0.0001:
-                                            # Проверяем, нет ли уже такой позиции
-                                            if not any(p.get("symbol") == pos.get("symbol") for p in positions):
-                                                positions.append(pos)
-                                                logger.info(f"✅ Найдена позиция {symbol}: size={size_float}, side={pos.get('side')}")
-                        except Exception as e3:
-                            pass  # Игнорируем ошибки для отдельных символов
-                
-                # Логируем все позиции для диагностики
-                if positions:
-                    logger.info(f"✅ ИТОГО найдено позиций: {len(positions)}")
-                    for pos in positions:
-                        symbol = pos.get("symbol", "N/A")
-                        size = pos.get("size", "N/A")
-                        side = pos.get("side", "N/A")
-                        avg_price = pos.get("avgPrice", "N/A")
-                        logger.info(f"Позиция: {symbol}, size={size}, side={side}, avgPrice={avg_price}")
-                else:
-                    logger.warning("⚠️ API вернул пустой список позиций после всех попыток")
-                    logger.info(f"Структура ответа result: {response.get('result', {})}")
-                    logger.info("💡 Проверьте: 1) Тип аккаунта (UNIFIED/DERIVATIVES), 2) Тестовая/основная сеть, 3) Права API ключа")
-                
-                return positions
-            else:
-                error_msg = response.get("retMsg", "Неизвестная ошибка")
-                logger.warning(f"Bybit API вернул ошибку при получении позиций: {error_msg}, код: {response.get('retCode')}")
-                logger.info(f"Полный ответ API при ошибке: {response}")
-                return []
+            positions = []
+            cursor = None
+            while True:
+                params = {"category": "linear", "settleCoin": "USDT", "limit": 200}
+                if cursor:
+                    params["cursor"] = cursor
+                response = self.client.get_positions(**params)
+                if response.get("retCode") != 0:
+                    logger.warning(
+                        f"Ошибка get_positions: {response.get('retMsg')} (код: {response.get('retCode')})"
+                    )
+                    self._record_error("get_positions", "N/A", str(response.get("retCode")),
+                                       response.get("retMsg", "Unknown error"), response)
+                    return None
+                result = response.get("result") or {}
+                positions.extend(result.get("list") or [])
+                cursor = result.get("nextPageCursor")
+                if not cursor:
+                    break
+            logger.debug(f"get_positions: {len(positions)} позиций")
+            return positions
         except Exception as e:
-            logger.error(f"Ошибка при получении позиций: {e}", exc_info=True)
+            logger.error(f"Ошибка при получении снимка позиций: {e}")
+            return None
+    
+    def _reconcile_known_positions(self) -> List[Dict]:
+        """
+        Запасной путь при ошибке снимка: опросить по символу только позиции, известные
+        по последнему успешному снимку или книге потока
+        """
+        known = {pos.get("symbol") for pos in self._positions_cache or []}
+        if self.account_stream is not None:
+            known.update(pos.get("symbol") for pos in self.account_stream.positions())
+        positions = []
+        for symbol in sorted(filter(None, known)):
+            try:
+                response = self.client.get_positions(category="linear", symbol=symbol)
+                if response.get("retCode") == 0:
+                    positions.extend(pos for pos in response.get("result", {}).get("list", [])
+                                     if float(pos.get("size") or 0) > 0)
+            except Exception as e:
+                logger.warning(f"Не удалось получить позицию {symbol}: {e}")
+        return positions
+    
+    def invalidate_positions(self):
+        """Сбросить кэш позиций (после ордеров, меняющих позиции)"""
+        self._positions_cache = None
+        self._positions_cached_at = 0.0
+    
+    def get_positions(self):
+        """
+        Получить открытые позиции на фьючерсном рынке
+        
+        Порядок: книга приватного потока (если подключен) -> снимок REST одним запросом.
+        Пустой результат кэшируется на POSITIONS_EMPTY_CACHE_SECONDS; при ошибке снимка
+        опрашиваются только известные позиции.
+        """
+        if self._stream_live():
+            return self.account_stream.positions()
+        
+        if (self._positions_cache == []
+                and time.monotonic() - self._positions_cached_at < POSITIONS_EMPTY_CACHE_SECONDS):
             return []
+        
+        positions = self.get_positions_snapshot()
+        if positions is None:
+            logger.warning("Снимок позиций не получен, опрашиваю известные позиции по символам")
+            return self._reconcile_known_positions()
+        
+        self._positions_cache = positions
+        self._positions_cached_at = time.monotonic()
+        return positions
 
@@ -0,0 +1,329 @@
+"""
+Колоночное хранилище свечей на диске (memory-mapped NumPy)
+
+Для каждого символа и интервала - отдельный каталог, в нем по файлу на колонку
+(timestamp, open, high, low, close, volume, turnover) в сыром бинарном виде и meta.json
+с количеством записанных строк. Чтение возвращает срезы np.memmap без копирования,
+запись - дозапись в конец файлов. Хранилище можно пересобрать из MySQL (market_history)
+или дозагрузить свечами с биржи.
+"""
+import json
+import logging
+import os
+import threading
+from datetime import timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_DIR = Path(__file__).resolve().parent.parent / "data" / "candles"
+
+# Колонки и их типы
+CANDLE_COLUMNS = {
+    "timestamp": np.dtype("<i8"),  # Время открытия свечи, мс UTC
+    "open": np.dtype("<f8"),
+    "high": np.dtype("<f8"),
+    "low": np.dtype("<f8"),
+    "close": np.dtype("<f8"),
+    "volume": np.dtype("<f8"),
+    "turnover": np.dtype("<f8"),
+}
+
+
+class CandleStore:
+    """Хранилище свечей: одна колонка - один memory-mapped файл"""
+
+    def __init__(self, root: Optional[Union[str, Path]] = None):
+        self.root = Path(root) if root else DEFAULT_STORE_DIR
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    # ---------- служебное ----------
+
+    def _series_dir(self, symbol: str, interval: str) -> Path:
+        return self.root / symbol.upper() / str(interval)
+
+    def _read_count(self, series_dir: Path) -> int:
+        meta_file = series_dir / "meta.json"
+        if not meta_file.exists():
+            return 0
+        try:
+            with meta_file.open("r", encoding="utf-8") as f:
+                return int(json.load(f).get("count", 0))
+        except (ValueError, OSError):
+            return 0
+
+    def _write_count(self, series_dir: Path, count: int):
+        # meta.json пишется атомарно и всегда после данных: читатель не увидит недописанных строк
+        tmp_file = series_dir / "meta.json.tmp"
+        with tmp_file.open("w", encoding="utf-8") as f:
+            json.dump({"count": count, "columns": list(CANDLE_COLUMNS)}, f)
+        os.replace(tmp_file, series_dir / "meta.json")
+
+    @staticmethod
+    def _to_columns(candles: Union[List[Dict], Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+        """Привести свечи (список словарей get_kline или колонки) к колонкам, отсортированным по времени"""
+        if isinstance(candles, dict):
+            columns = {
+                name: np.asarray(candles.get(name, np.zeros(len(candles["timestamp"]))), dtype=dtype)
+                for name, dtype in CANDLE_COLUMNS.items()
+            }
+        else:
+            columns = {
+                name: np.array([c.get(name, 0) or 0 for c in candles], dtype=dtype)
+                for name, dtype in CANDLE_COLUMNS.items()
+            }
+        order = np.argsort(columns["timestamp"], kind="stable")
+        if not np.all(order[:-1] < order[1:]):
+            columns = {name: values[order] for name, values in columns.items()}
+        # Дубликаты времени внутри пачки - берем последнюю версию свечи
+        timestamps = columns["timestamp"]
+        if len(timestamps) > 1:
+            keep = np.append(timestamps[1:] != timestamps[:-1], True)
+            if not keep.all():
+                columns = {name: values[keep] for name, values in columns.items()}
+        return columns
+
+    # ---------- чтение ----------
+
+    def count(self, symbol: str, interval: str) -> int:
+        """Количество свечей в ряду"""
+        return self._read_count(self._series_dir(symbol, interval))
+
+    def last_timestamp(self, symbol: str, interval: str) -> Optional[int]:
+        """Время открытия последней свечи (мс) или None"""
+        columns = self.read(symbol, interval, fields=["timestamp"])
+        if columns is None:
+            return None
+        return int(columns["timestamp"][-1])
+
+    def read(self, symbol: str, interval: str, start_ms: Optional[int] = None,
+             end_ms: Optional[int] = None, fields: Optional[List[str]] = None) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Прочитать свечи за период без копирования
+
+        Args:
+            symbol: Символ
+            interval: Интервал ("1", "5", "60", "D"...)
+            start_ms: Начало периода включительно (мс), None - с начала
+            end_ms: Конец периода не включительно (мс), None - до конца
+            fields: Какие колонки вернуть (по умолчанию все)
+
+        Returns:
+            Колонки (срезы np.memmap только для чтения) или None, если данных нет
+        """
+        series_dir = self._series_dir(symbol, interval)
+        count = self._read_count(series_dir)
+        if count <= 0:
+            return None
+
+        timestamps = np.memmap(series_dir / "timestamp.bin", dtype=CANDLE_COLUMNS["timestamp"], mode="r", shape=(count,))
+        lo = int(np.searchsorted(timestamps, start_ms, side="left")) if start_ms is not None else 0
+        hi = int(np.searchsorted(timestamps, end_ms, side="left")) if end_ms is not None else count
+        if hi <= lo:
+            return None
+
+        result = {}
+        for name in fields or CANDLE_COLUMNS:
+            if name == "timestamp":
+                column = timestamps
+            else:
+                column = np.memmap(series_dir / f"{name}.bin", dtype=CANDLE_COLUMNS[name], mode="r", shape=(count,))
+            result[name] = column[lo:hi]
+        return result
+
+    def read_candles(self, symbol: str, interval: str, start_ms: Optional[int] = None,
+                     end_ms: Optional[int] = None) -> List[Dict]:
+        """Прочитать свечи в формате BybitService.get_kline (список словарей) - для старого кода"""
+        columns = self.read(symbol, interval, start_ms, end_ms)
+        if columns is None:
+            return []
+        names = list(columns)
+        rows = zip(*(columns[name].tolist() for name in names))
+        return [dict(zip(names, row)) for row in rows]
+
+    def symbols(self, interval: Optional[str] = None) -> List[str]:
+        """Символы, для которых есть данные"""
+        result = []
+        for symbol_dir in sorted(p for p in self.root.iterdir() if p.is_dir()):
+            intervals = [interval] if interval else [p.name for p in symbol_dir.iterdir() if p.is_dir()]
+            if any(self._read_count(symbol_dir / i) > 0 for i in intervals):
+                result.append(symbol_dir.name)
+        return result
+
+    # ---------- запись ----------
+
+    def append(self, symbol: str, interval: str, candles: Union[List[Dict], Dict[str, np.ndarray]]) -> int:
+        """
+        Дописать свечи в конец ряда
+
+        Свечи старше последней сохраненной пропускаются, свеча с тем же временем,
+        что и последняя, перезаписывает ее (незакрытая свеча из get_kline обновляется).
+
+        Returns:
+            Количество новых строк
+        """
+        if candles is None or len(candles) == 0:
+            return 0
+        columns = self._to_columns(candles)
+
+        with self._lock:
+            series_dir = self._series_dir(symbol, interval)
+            series_dir.mkdir(parents=True, exist_ok=True)
+            count = self._read_count(series_dir)
+
+            last_ts = None
+            if count > 0:
+                last_ts = int(np.memmap(series_dir / "timestamp.bin", dtype=CANDLE_COLUMNS["timestamp"],
+                                        mode="r", shape=(count,))[-1])
+
+            timestamps = columns["timestamp"]
+            replace_last = last_ts is not None and bool(np.any(timestamps == last_ts))
+            new_mask = timestamps > last_ts if last_ts is not None else np.ones(len(timestamps), dtype=bool)
+            new_rows = int(new_mask.sum())
+            if not new_rows and not replace_last:
+                return 0
+
+            for name, dtype in CANDLE_COLUMNS.items():
+                path = series_dir / f"{name}.bin"
+                with open(path, "ab") as f:
+                    # Хвост от прерванной записи (после count) отбрасываем
+                    if f.tell() != count * dtype.itemsize:
+                        f.truncate(count * dtype.itemsize)
+                if replace_last:
+                    with open(path, "r+b") as f:
+                        f.seek((count - 1) * dtype.itemsize)
+                        f.write(columns[name][timestamps == last_ts][-1:].astype(dtype).tobytes())
+                if new_rows:
+                    with open(path, "ab") as f:
+                        f.write(columns[name][new_mask].astype(dtype).tobytes())
+
+            self._write_count(series_dir, count + new_rows)
+        return new_rows
+
+    def delete(self, symbol: str, interval: str):
+        """Удалить ряд целиком"""
+        with self._lock:
+            series_dir = self._series_dir(symbol, interval)
+            if not series_dir.exists():
+                return
+            for path in series_dir.iterdir():
+                path.unlink()
+            series_dir.rmdir()
+
+    def _rebuild_from_rollup(self, db_service, table: str, symbol: str, interval: str,
+                             interval_minutes: int, batch_size: int) -> int:
+        """Пересобрать ряд из таблицы агрегатов с тем же интервалом"""
+        rows_by_field = {name: [] for name in CANDLE_COLUMNS}
+        last_id = 0
+        while True:
+            rows = db_service.execute_query(
+                f"""
+                SELECT id, bucket_start, open, high, low, close, avg_volume_24h
+                FROM {table}
+                WHERE symbol = %s AND id > %s
+                ORDER BY id ASC
+                LIMIT %s
+                """,
+                (symbol, last_id, batch_size)
+            )
+            if not rows:
+                break
+            for row in rows:
+                rows_by_field["timestamp"].append(int(row["bucket_start"].replace(tzinfo=timezone.utc).timestamp() * 1000))
+                for name in ("open", "high", "low", "close"):
+                    rows_by_field[name].append(float(row[name]))
+                rows_by_field["volume"].append(float(row["avg_volume_24h"] or 0) * interval_minutes / 1440)
+                rows_by_field["turnover"].append(0.0)
+            last_id = rows[-1]["id"]
+            if len(rows) < batch_size:
+                break
+
+        self.delete(symbol, interval)
+        if not rows_by_field["timestamp"]:
+            return 0
+        written = self.append(symbol, interval, {name: np.array(values) for name, values in rows_by_field.items()})
+        logger.info(f"Хранилище свечей: {symbol}/{interval} пересобрано из {table}, {written} свечей")
+        return written
+
+    def rebuild_from_db(self, db_service, symbol: str, interval: str = "60", batch_size: int = 50000) -> int:
+        """
+        Пересобрать ряд из БД: из агрегата того же интервала, если он есть, иначе из market_history
+
+        В market_history хранятся снимки цены, поэтому свечи строятся агрегацией снимков
+        в интервал: open/close - первая/последняя цена, high/low - максимум/минимум.
+        Объем за интервал оценивается как средний volume_24h, пересчитанный на длину интервала.
+
+        Returns:
+            Количество записанных свечей
+        """
+        interval_minutes = 1440 if interval == "D" else int(interval)
+        interval_ms = interval_minutes * 60 * 1000
+
+        # Если есть агрегат ровно такого интервала (market_history_1h и т.п.) - берем OHLC из него:
+        # сырые снимки хранятся всего несколько дней
+        rollup_service = getattr(db_service, "rollup_service", None)
+        rollup_table = rollup_service.table_for_seconds(interval_minutes * 60) if rollup_service else None
+        if rollup_table:
+            return self._rebuild_from_rollup(db_service, rollup_table, symbol, interval, interval_minutes, batch_size)
+
+        timestamps: List[int] = []
+        prices: List[float] = []
+        volumes: List[float] = []
+        last_id = 0
+        while True:
+            rows = db_service.execute_query(
+                """
+                SELECT id, timestamp, price, volume_24h
+                FROM market_history
+                WHERE symbol = %s AND id > %s
+                ORDER BY id ASC
+                LIMIT %s
+                """,
+                (symbol, last_id, batch_size)
+            )
+            if not rows:
+                break
+            for row in rows:
+                # В market_history время хранится как naive UTC
+                timestamps.append(int(row["timestamp"].replace(tzinfo=timezone.utc).timestamp() * 1000))
+                prices.append(float(row["price"] or 0))
+                volumes.append(float(row["volume_24h"] or 0))
+            last_id = rows[-1]["id"]
+            if len(rows) < batch_size:
+                break
+
+        self.delete(symbol, interval)
+        if not timestamps:
+            return 0
+
+        ts = np.array(timestamps, dtype=np.int64)
+        price = np.array(prices)
+        volume_24h = np.array(volumes)
+        order = np.argsort(ts, kind="stable")
+        ts, price, volume_24h = ts[order], price[order], volume_24h[order]
+        valid = price > 0
+        ts, price, volume_24h = ts[valid], price[valid], volume_24h[valid]
+        if not len(ts):
+            return 0
+
+        buckets = ts // interval_ms * interval_ms
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(ts)] - 1
+        counts = np.diff(np.r_[starts, len(ts)])
+
+        columns = {
+            "timestamp": buckets[starts],
+            "open": price[starts],
+            "high": np.maximum.reduceat(price, starts),
+            "low": np.minimum.reduceat(price, starts),
+            "close": price[ends],
+            "volume": np.add.reduceat(volume_24h, starts) / counts * interval_minutes / 1440,
+            "turnover": np.zeros(len(starts)),
+        }
+        written = self.append(symbol, interval, columns)
+        logger.info(f"Хранилище свечей: {symbol}/{interval} пересобрано из БД, {written} свечей")
+        return written
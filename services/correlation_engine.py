@@ -0,0 +1,276 @@
+"""
+Движок корреляций доходностей для всех отслеживаемых символов
+
+Держит полную матрицу N×N корреляций часовых доходностей в двух вариантах:
+скользящее окно (rolling) и экспоненциальное сглаживание (EWMA, RiskMetrics).
+Новые закрытые свечи добавляются инкрементально за O(N²) на бар, поиск
+корреляции пары - O(1). Данные берутся из хранилища свечей (CandleStore).
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("rolling", "ewma")
+
+
+def align_closes(columns_by_symbol: Dict[str, Dict[str, np.ndarray]], symbols: List[str]):
+    """
+    Выровнять закрытия нескольких символов по общей временной шкале
+
+    Returns:
+        (timestamps, closes) - объединенная шкала и матрица T×N (NaN, где свечи нет)
+    """
+    present = [columns_by_symbol[s]["timestamp"] for s in symbols if columns_by_symbol.get(s) is not None]
+    if not present:
+        return np.empty(0, dtype=np.int64), np.empty((0, len(symbols)))
+    timestamps = np.unique(np.concatenate(present))
+    closes = np.full((len(timestamps), len(symbols)), np.nan)
+    for j, symbol in enumerate(symbols):
+        columns = columns_by_symbol.get(symbol)
+        if columns is None:
+            continue
+        idx = np.searchsorted(timestamps, columns["timestamp"])
+        closes[idx, j] = columns["close"]
+    return timestamps, closes
+
+
+def closes_to_returns(timestamps: np.ndarray, closes: np.ndarray, interval_ms: int) -> np.ndarray:
+    """Доходности между соседними свечами; через пропуски в истории - NaN"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = closes[1:] / closes[:-1] - 1.0
+    returns[np.diff(timestamps) != interval_ms] = np.nan
+    returns[~np.isfinite(returns)] = np.nan
+    return returns
+
+
+class CorrelationEngine:
+    """Инкрементальная матрица корреляций (rolling + EWMA) поверх хранилища свечей"""
+
+    def __init__(self, candle_store=None, interval: str = "60", window: int = 720,
+                 ewma_halflife: float = 168, min_periods: int = 48):
+        """
+        Args:
+            candle_store: CandleStore с часовыми свечами (None - только ручные update())
+            interval: Интервал свечей
+            window: Длина скользящего окна в барах (720 часов = 30 дней)
+            ewma_halflife: Период полураспада весов EWMA в барах
+            min_periods: Минимум общих доходностей пары для rolling-корреляции
+        """
+        self.candle_store = candle_store
+        self.interval = interval
+        self.interval_ms = (1440 if interval == "D" else int(interval)) * 60 * 1000
+        self.window = window
+        self.min_periods = min_periods
+        self.ewma_lambda = 0.5 ** (1.0 / ewma_halflife)
+        # История для прогрева EWMA: веса старше ~8 полураспадов пренебрежимо малы
+        self.ewma_warmup = int(ewma_halflife * 8)
+        self._lock = threading.Lock()
+        self._reset([])
+
+    # ---------- состояние ----------
+
+    def _reset(self, symbols: List[str]):
+        n = len(symbols)
+        self.symbols = list(symbols)
+        self._index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._buffer = np.full((self.window, n), np.nan)  # Кольцевой буфер доходностей окна
+        self._pos = 0
+        self._filled = 0
+        self._since_resync = 0
+        # Парные суммы окна: n_ij, Σx_i, Σx_i², Σx_i·x_j (по барам, где есть оба символа)
+        self._n = np.zeros((n, n))
+        self._sx = np.zeros((n, n))
+        self._sxx = np.zeros((n, n))
+        self._sxy = np.zeros((n, n))
+        self._ewma_cov = np.zeros((n, n))
+        self._last_ts: Optional[int] = None
+        self._last_close = np.full(n, np.nan)
+        self._corr = {method: np.full((n, n), np.nan) for method in METHODS}
+
+    def _add_row(self, row: np.ndarray, sign: float):
+        valid = ~np.isnan(row)
+        values = np.where(valid, row, 0.0)
+        valid_f = valid.astype(np.float64)
+        self._n += sign * np.outer(valid_f, valid_f)
+        self._sx += sign * np.outer(values, valid_f)
+        self._sxx += sign * np.outer(values * values, valid_f)
+        self._sxy += sign * np.outer(values, values)
+
+    def _resync(self):
+        """Пересчитать суммы окна из буфера (убирает накопленную ошибку округления)"""
+        rows = self._buffer[~np.all(np.isnan(self._buffer), axis=1)]
+        valid = (~np.isnan(rows)).astype(np.float64)
+        values = np.nan_to_num(rows)
+        self._n = valid.T @ valid
+        self._sx = values.T @ valid
+        self._sxx = (values * values).T @ valid
+        self._sxy = values.T @ values
+        self._since_resync = 0
+
+    def _recompute(self):
+        """Обновить матрицы корреляций из накопленных сумм"""
+        n = self._n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = n * self._sxy - self._sx * self._sx.T
+            var_i = n * self._sxx - self._sx * self._sx
+            rolling = cov / np.sqrt(var_i * var_i.T)
+            rolling[n < self.min_periods] = np.nan
+            std = np.sqrt(np.diag(self._ewma_cov))
+            ewma = self._ewma_cov / np.outer(std, std)
+        rolling = np.clip(rolling, -1.0, 1.0)
+        ewma = np.clip(ewma, -1.0, 1.0)
+        np.fill_diagonal(rolling, 1.0)
+        np.fill_diagonal(ewma, 1.0)
+        # Ссылки подменяются целиком - читатели без блокировки видят согласованную матрицу
+        self._corr = {"rolling": rolling, "ewma": ewma}
+
+    def _push(self, row: np.ndarray):
+        if self._filled == self.window:
+            self._add_row(self._buffer[self._pos], -1.0)
+        else:
+            self._filled += 1
+        self._buffer[self._pos] = row
+        self._add_row(row, 1.0)
+        self._pos = (self._pos + 1) % self.window
+
+        # EWMA ковариации с нулевым средним; отсутствующая доходность - нулевой вклад
+        values = np.nan_to_num(row)
+        self._ewma_cov = self.ewma_lambda * self._ewma_cov + (1 - self.ewma_lambda) * np.outer(values, values)
+
+        self._since_resync += 1
+        if self._since_resync >= self.window:
+            self._resync()
+
+    # ---------- загрузка и обновление ----------
+
+    def load(self, timestamps: np.ndarray, closes: np.ndarray, symbols: List[str]):
+        """
+        Пересобрать состояние по выровненным закрытиям (T×N) целиком, векторно
+
+        Args:
+            timestamps: Время открытия баров (мс), по возрастанию
+            closes: Закрытия, NaN - свечи нет
+            symbols: Символы по столбцам
+        """
+        with self._lock:
+            self._reset(symbols)
+            if len(timestamps) == 0:
+                return
+            self._last_ts = int(timestamps[-1])
+            self._last_close = np.array(closes[-1], dtype=np.float64)
+            if len(timestamps) < 2:
+                self._recompute()
+                return
+
+            returns = closes_to_returns(timestamps, closes, self.interval_ms)
+            tail = returns[-self.window:]
+            self._buffer[:len(tail)] = tail
+            self._filled = len(tail)
+            self._pos = len(tail) % self.window
+            self._resync()
+
+            history = np.nan_to_num(returns[-self.ewma_warmup:])
+            weights = (1 - self.ewma_lambda) * self.ewma_lambda ** np.arange(len(history) - 1, -1, -1)
+            self._ewma_cov = (history * weights[:, None]).T @ history
+            self._recompute()
+
+    def update(self, timestamp_ms: int, closes: Dict[str, float]) -> bool:
+        """
+        Добавить закрытый бар
+
+        Args:
+            timestamp_ms: Время открытия бара (мс)
+            closes: Закрытия по символам (символы, которых нет в матрице, игнорируются)
+
+        Returns:
+            True, если бар учтен
+        """
+        with self._lock:
+            if self._last_ts is not None and timestamp_ms <= self._last_ts:
+                return False
+            row_close = np.full(len(self.symbols), np.nan)
+            for symbol, close in closes.items():
+                i = self._index.get(symbol.upper())
+                if i is not None and close:
+                    row_close[i] = float(close)
+            if self._last_ts is not None and timestamp_ms - self._last_ts == self.interval_ms:
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    row = row_close / self._last_close - 1.0
+                row[~np.isfinite(row)] = np.nan
+                self._push(row)
+                self._recompute()
+            self._last_ts = int(timestamp_ms)
+            self._last_close = row_close
+            return True
+
+    def refresh(self) -> int:
+        """
+        Подтянуть новые закрытые свечи из хранилища
+
+        При появлении новых символов матрица пересобирается целиком.
+
+        Returns:
+            Количество учтенных баров
+        """
+        if not self.candle_store:
+            return 0
+        try:
+            symbols = self.candle_store.symbols(self.interval)
+            # Последняя свеча в хранилище может быть незакрытой - не учитываем ее
+            end_ms = int(time.time() * 1000) // self.interval_ms * self.interval_ms
+            if not symbols:
+                return 0
+
+            if set(symbols) != set(self.symbols) or self._last_ts is None:
+                start_ms = end_ms - (max(self.window, self.ewma_warmup) + 1) * self.interval_ms
+                columns = {
+                    symbol: self.candle_store.read(symbol, self.interval, start_ms=start_ms, end_ms=end_ms,
+                                                   fields=["timestamp", "close"])
+                    for symbol in symbols
+                }
+                timestamps, closes = align_closes(columns, symbols)
+                self.load(timestamps, closes, symbols)
+                logger.info(f"Матрица корреляций пересобрана: {len(symbols)} символов, {len(timestamps)} баров")
+                return len(timestamps)
+
+            columns = {
+                symbol: self.candle_store.read(symbol, self.interval, start_ms=self._last_ts + 1, end_ms=end_ms,
+                                               fields=["timestamp", "close"])
+                for symbol in self.symbols
+            }
+            timestamps, closes = align_closes(columns, self.symbols)
+            added = 0
+            for ts, row in zip(timestamps.tolist(), closes):
+                if self.update(ts, {s: c for s, c in zip(self.symbols, row.tolist()) if c == c}):
+                    added += 1
+            return added
+        except Exception as e:
+            logger.warning(f"Не удалось обновить матрицу корреляций: {e}")
+            return 0
+
+    # ---------- чтение ----------
+
+    def get(self, symbol1: str, symbol2: str, method: str = "rolling") -> Optional[float]:
+        """
+        Корреляция пары символов, O(1)
+
+        Returns:
+            Коэффициент от -1 до 1 или None, если данных по паре нет
+        """
+        i = self._index.get(symbol1.upper())
+        j = self._index.get(symbol2.upper())
+        if i is None or j is None:
+            return None
+        value = self._corr[method][i, j]
+        if np.isnan(value):
+            return None
+        return float(value)
+
+    def matrix(self, method: str = "rolling") -> Dict:
+        """Копия полной матрицы: {"symbols": [...], "matrix": np.ndarray N×N}"""
+        return {"symbols": list(self.symbols), "matrix": self._corr[method].copy()}
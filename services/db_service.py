@@ -1,13 +1,258 @@
+import threading
+import time
 import mysql.connector
 from mysql.connector import Error
 from typing import Dict, List, Optional
+from datetime import timedelta
+from services.metrics import observe_db_query
+from services.rollup_service import RollupService
+from services.schema_migrations import run_migrations
 import config
 import numpy as np
 
 
+# Запросы и подготовка параметров общие для DatabaseService и AsyncDatabaseService
+MARKET_SNAPSHOT_QUERY = """
+            INSERT INTO market_history (
+                symbol, timestamp, hour_utc, price, volume_24h, volatility,
+                funding_rate, open_interest, rsi, atr, macd, macd_signal,
+                bb_upper, bb_middle, bb_lower, ema_50, ema_200, vwap, liquidity_score
+            ) VALUES (
+                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+            )
+            """
+
+TIME_OF_DAY_QUERY = """
+            INSERT INTO time_of_day_buckets (
+                symbol, day, hour_utc, snapshot_count, sum_volatility, sum_volume, sum_funding_rate,
+                spread_count, sum_spread, trade_count, win_count, sum_pnl_percent
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s), (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                snapshot_count = snapshot_count + VALUES(snapshot_count),
+                sum_volatility = sum_volatility + VALUES(sum_volatility),
+                sum_volume = sum_volume + VALUES(sum_volume),
+                sum_funding_rate = sum_funding_rate + VALUES(sum_funding_rate),
+                spread_count = spread_count + VALUES(spread_count),
+                sum_spread = sum_spread + VALUES(sum_spread),
+                trade_count = trade_count + VALUES(trade_count),
+                win_count = win_count + VALUES(win_count),
+                sum_pnl_percent = sum_pnl_percent + VALUES(sum_pnl_percent)
+            """
+
+AI_RESPONSE_QUERY = """
+            INSERT INTO ai_responses (
+                timestamp, request_type, symbols, prompt, recommended_symbol, recommended_side,
+                entry_price, stop_loss, take_profit, confidence, reasoning, full_response,
+                tokens_used, response_time_ms
+            ) VALUES (
+                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+            )
+            """
+
+API_ERROR_QUERY = """
+            INSERT INTO api_errors (
+                timestamp, api_method, symbol, error_code, error_message, response_data
+            ) VALUES (
+                %s, %s, %s, %s, %s, %s
+            )
+            """
+
+CACHE_UPSERT_QUERY = """
+            INSERT INTO market_cache (symbol, timestamp, data_type, data_json, expires_at)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                timestamp = VALUES(timestamp),
+                data_json = VALUES(data_json),
+                expires_at = VALUES(expires_at)
+            """
+
+LATEST_MARKET_DATA_QUERY = """
+            SELECT * FROM market_history
+            WHERE symbol = %s AND timestamp >= %s
+            ORDER BY timestamp DESC
+            LIMIT 1
+            """
+
+
+def validate_market_data(market_data: Dict) -> bool:
+    """Валидация данных снимка перед сохранением"""
+    try:
+        # Проверяем обязательные поля
+        if not market_data.get('current_price') or market_data.get('current_price', 0) <= 0:
+            return False
+        
+        # Проверяем разумность значений
+        price = market_data.get('current_price', 0)
+        if price < 0.0001 or price > 100000000:  # Разумные границы для крипто
+            return False
+        
+        volatility = market_data.get('volatility', 0)
+        if volatility < 0 or volatility > 100:  # Волатильность не может быть > 100%
+            return False
+        
+        return True
+    except Exception:
+        return False
+
+
+def market_snapshot_params(symbol: str, market_data: Dict, historical_data: Dict, timestamp) -> tuple:
+    """Параметры MARKET_SNAPSHOT_QUERY"""
+    historical = historical_data or {}
+    macd_data = historical.get('macd', {})
+    bb_data = historical.get('bollinger_bands', {})
+    return (
+        symbol,
+        timestamp,
+        timestamp.hour,
+        market_data.get('current_price', 0),
+        market_data.get('volume_24h', 0),
+        market_data.get('volatility', 0),
+        market_data.get('funding_rate', 0),
+        market_data.get('open_interest', 0),
+        historical.get('rsi'),
+        historical.get('atr'),
+        macd_data.get('macd') if macd_data else None,
+        macd_data.get('signal') if macd_data else None,
+        bb_data.get('upper_band') if bb_data else None,
+        bb_data.get('middle_band') if bb_data else None,
+        bb_data.get('lower_band') if bb_data else None,
+        historical.get('ema_50'),
+        historical.get('ema_200'),
+        historical.get('vwap'),
+        market_data.get('liquidity_score', 0)
+    )
+
+
+def time_of_day_params(symbol: str, timestamp, volatility: float = 0, volume: float = 0,
+                       funding_rate: float = 0, spread: float = None, trade_won: bool = None,
+                       pnl_percent: float = 0) -> tuple:
+    """Параметры TIME_OF_DAY_QUERY: строка по символу и строка по всем символам"""
+    is_trade = trade_won is not None
+    row = (
+        timestamp.date(), timestamp.hour,
+        0 if is_trade else 1,
+        float(volatility or 0), float(volume or 0), abs(float(funding_rate or 0)),
+        1 if spread is not None else 0, float(spread or 0),
+        1 if is_trade else 0, 1 if trade_won else 0, float(pnl_percent or 0) if is_trade else 0.0
+    )
+    return (symbol.upper(),) + row + (DatabaseService.ALL_SYMBOLS,) + row
+
+
+def ai_response_params(timestamp, request_type: str, symbols: List[str], response_data: Dict,
+                       prompt_text: str = None, tokens_used: int = None, response_time_ms: int = None) -> tuple:
+    """Параметры AI_RESPONSE_QUERY"""
+    import json
+    
+    return (
+        timestamp,
+        request_type,
+        ','.join(symbols) if symbols else None,
+        prompt_text,
+        response_data.get('recommended_symbol'),
+        response_data.get('recommended_side'),
+        response_data.get('entry_price'),
+        response_data.get('stop_loss'),
+        response_data.get('take_profit'),
+        response_data.get('confidence'),
+        response_data.get('reasoning'),
+        json.dumps(response_data) if response_data else None,
+        tokens_used,
+        response_time_ms
+    )
+
+
+def api_error_params(timestamp, api_method: str, symbol: str, error_code: str,
+                     error_message: str, response_data: Dict = None) -> tuple:
+    """Параметры API_ERROR_QUERY"""
+    import json
+    
+    return (
+        timestamp,
+        api_method,
+        symbol,
+        error_code,
+        error_message,
+        json.dumps(response_data) if response_data else None
+    )
+
+
+def trade_insert(column_names: List[str], symbol: str, side: str, entry_price: float, quantity: float,
+                 leverage: int, stop_loss: float = None, take_profit: float = None,
+                 bot_name: str = "main", status: str = "open", entry_time=None):
+    """
+    Запрос и параметры вставки сделки с учетом имеющихся колонок trades_history
+    
+    Returns:
+        (query, params)
+    """
+    from datetime import datetime
+    
+    entry_time = entry_time or datetime.utcnow()
+    
+    # Формируем запрос в зависимости от наличия колонок
+    fields = ['symbol', 'side', 'entry_time', 'entry_price', 'quantity', 'leverage', 'hour_utc', 'status']
+    values = [symbol.upper(), side, entry_time, entry_price, quantity, leverage, entry_time.hour, status]
+    
+    if 'bot_name' in column_names:
+        fields.insert(0, 'bot_name')
+        values.insert(0, bot_name)
+    
+    if 'stop_loss' in column_names:
+        fields.append('stop_loss')
+        values.append(stop_loss)
+    
+    if 'take_profit' in column_names:
+        fields.append('take_profit')
+        values.append(take_profit)
+    
+    placeholders = ', '.join(['%s'] * len(fields))
+    fields_str = ', '.join(fields)
+    
+    query = f"""
+            INSERT INTO trades_history ({fields_str})
+            VALUES ({placeholders})
+            """
+    return query, tuple(values)
+
+
+def market_row_to_dict(row: Dict) -> Dict:
+    """Строка market_history в формат get_latest_market_data"""
+    return {
+        "symbol": row["symbol"],
+        "price": float(row["price"]),
+        "volume_24h": float(row["volume_24h"] or 0),
+        "volatility": float(row["volatility"] or 0),
+        "funding_rate": float(row["funding_rate"] or 0),
+        "open_interest": float(row["open_interest"] or 0),
+        "rsi": float(row["rsi"]) if row["rsi"] else None,
+        "atr": float(row["atr"]) if row["atr"] else None,
+        "macd": float(row["macd"]) if row["macd"] else None,
+        "macd_signal": float(row["macd_signal"]) if row["macd_signal"] else None,
+        "bb_upper": float(row["bb_upper"]) if row["bb_upper"] else None,
+        "bb_middle": float(row["bb_middle"]) if row["bb_middle"] else None,
+        "bb_lower": float(row["bb_lower"]) if row["bb_lower"] else None,
+        "ema_50": float(row["ema_50"]) if row["ema_50"] else None,
+        "ema_200": float(row["ema_200"]) if row["ema_200"] else None,
+        "vwap": float(row["vwap"]) if row["vwap"] else None,
+        "liquidity_score": float(row["liquidity_score"] or 0),
+        "timestamp": row["timestamp"]
+    }
+
+
 class DatabaseService:
-    def __init__(self):
+    ALL_SYMBOLS = "ALL"  # Символ строк агрегатов по всем монетам
+    
+    def __init__(self, candle_store=None):
         self.connection = None
+        # Одно подключение на сервис: запросы из разных потоков выполняются по очереди
+        self._query_lock = threading.RLock()
+        self.candle_store = candle_store  # Опционально, CandleStore для аналитики по свечам
+        # Агрегаты времени суток: сводка пересчитывается из корзин не чаще раза в интервал
+        self.stats_refresh_interval = timedelta(minutes=15)
+        self.stats_keep_days = 90
+        self._time_stats_refreshed_at = None
+        # Агрегаты market_history 5m/1h/1d и выбор таблицы под запрос
+        self.rollup_service = RollupService(self, raw_keep_days=config.RAW_HISTORY_KEEP_DAYS)
         self.connect()
     
     def connect(self):
@@ -77,27 +322,31 @@ class DatabaseService:
     
     def execute_query(self, query, params=None):
         """Выполнить SQL запрос"""
-        cursor = None
-        try:
-            if not self.connection or not self.connection.is_connected():
-                self.connect()
-            
-            cursor = self.connection.cursor(dictionary=True, buffered=True)
-            cursor.execute(query, params or ())
-            
-            if query.strip().upper().startswith('SELECT') or query.strip().upper().startswith('SHOW'):
-                result = cursor.fetchall()
-            else:
-                self.connection.commit()
-                result = cursor.rowcount
-            
-            cursor.close()
-            return result
-        except Error as e:
-            if cursor:
+        with self._query_lock:
+            cursor = None
+            started = time.perf_counter()
+            try:
+                if not self.connection or not self.connection.is_connected():
+                    self.connect()
+                
+                cursor = self.connection.cursor(dictionary=True, buffered=True)
+                cursor.execute(query, params or ())
+                
+                if query.strip().upper().startswith('SELECT') or query.strip().upper().startswith('SHOW'):
+                    result = cursor.fetchall()
+                else:
+                    self.connection.commit()
+                    result = cursor.rowcount
+                
                 cursor.close()
-            print(f"Ошибка при выполнении запроса: {e}")
-            return None
+                observe_db_query("sync", query, time.perf_counter() - started)
+                return result
+            except Error as e:
+                if cursor:
+                    cursor.close()
+                observe_db_query("sync", query, time.perf_counter() - started, outcome="error")
+                print(f"Ошибка при выполнении запроса: {e}")
+                return None
     
     def get_tables(self):
         """Получить список таблиц в базе данных"""
@@ -116,217 +365,42 @@ class DatabaseService:
             print("✅ Подключение к MySQL закрыто")
     
     def init_tables(self):
-        """Инициализировать таблицы для хранения исторических данных"""
-        try:
-            # Таблица для хранения исторических данных по монетам
-            create_market_history_table = """
-            CREATE TABLE IF NOT EXISTS market_history (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                symbol VARCHAR(20) NOT NULL,
-                timestamp DATETIME NOT NULL,
-                hour_utc INT NOT NULL,
-                price DECIMAL(20, 8) NOT NULL,
-                volume_24h DECIMAL(20, 2),
-                volatility DECIMAL(10, 4),
-                funding_rate DECIMAL(10, 8),
-                open_interest DECIMAL(20, 2),
-                rsi DECIMAL(6, 2),
-                atr DECIMAL(20, 8),
-                macd DECIMAL(20, 8),
-                macd_signal DECIMAL(20, 8),
-                bb_upper DECIMAL(20, 8),
-                bb_middle DECIMAL(20, 8),
-                bb_lower DECIMAL(20, 8),
-                ema_50 DECIMAL(20, 8),
-                ema_200 DECIMAL(20, 8),
-                vwap DECIMAL(20, 8),
-                liquidity_score DECIMAL(6, 2),
-                INDEX idx_symbol_timestamp (symbol, timestamp),
-                INDEX idx_hour_utc (hour_utc),
-                INDEX idx_timestamp (timestamp)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-            """
-            
-            # Таблица для статистики по времени суток
-            create_time_stats_table = """
-            CREATE TABLE IF NOT EXISTS time_of_day_stats (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                symbol VARCHAR(20) NOT NULL,
-                hour_utc INT NOT NULL,
-                avg_volatility DECIMAL(10, 4),
-                avg_volume DECIMAL(20, 2),
-                avg_spread DECIMAL(10, 8),
-                trade_count INT DEFAULT 0,
-                win_rate DECIMAL(5, 2),
-                avg_pnl DECIMAL(10, 4),
-                last_updated DATETIME NOT NULL,
-                UNIQUE KEY unique_symbol_hour (symbol, hour_utc),
-                INDEX idx_hour_utc (hour_utc)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-            """
-            
-            # Таблица для хранения результатов сделок
-            create_trades_table = """
-            CREATE TABLE IF NOT EXISTS trades_history (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                bot_name VARCHAR(50) DEFAULT 'main',
-                symbol VARCHAR(20) NOT NULL,
-                side VARCHAR(10) NOT NULL,
-                entry_time DATETIME NOT NULL,
-                exit_time DATETIME,
-                entry_price DECIMAL(20, 8) NOT NULL,
-                exit_price DECIMAL(20, 8),
-                quantity DECIMAL(20, 8) NOT NULL,
-                pnl DECIMAL(20, 8),
-                pnl_percent DECIMAL(10, 4),
-                hour_utc INT NOT NULL,
-                leverage INT,
-                status VARCHAR(20) DEFAULT 'open',
-                stop_loss DECIMAL(20, 8),
-                take_profit DECIMAL(20, 8),
-                INDEX idx_symbol (symbol),
-                INDEX idx_entry_time (entry_time),
-                INDEX idx_hour_utc (hour_utc),
-                INDEX idx_status (status),
-                INDEX idx_bot_name (bot_name)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-            """
-            
-            # Миграция: добавляем поля bot_name, stop_loss, take_profit если их нет
-            try:
-                import logging
-                logger = logging.getLogger(__name__)
-                cursor = self.connection.cursor()
-                cursor.execute("SHOW COLUMNS FROM trades_history LIKE 'bot_name'")
-                if not cursor.fetchone():
-                    cursor.execute("ALTER TABLE trades_history ADD COLUMN bot_name VARCHAR(50) DEFAULT 'main' AFTER id")
-                    cursor.execute("ALTER TABLE trades_history ADD INDEX idx_bot_name (bot_name)")
-                    logger.info("✅ Добавлено поле bot_name в trades_history")
-                
-                cursor.execute("SHOW COLUMNS FROM trades_history LIKE 'stop_loss'")
-                if not cursor.fetchone():
-                    cursor.execute("ALTER TABLE trades_history ADD COLUMN stop_loss DECIMAL(20, 8) AFTER status")
-                    logger.info("✅ Добавлено поле stop_loss в trades_history")
-                
-                cursor.execute("SHOW COLUMNS FROM trades_history LIKE 'take_profit'")
-                if not cursor.fetchone():
-                    cursor.execute("ALTER TABLE trades_history ADD COLUMN take_profit DECIMAL(20, 8) AFTER stop_loss")
-                    logger.info("✅ Добавлено поле take_profit в trades_history")
-                
-                self.connection.commit()
-                cursor.close()
-            except Exception as e:
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Миграция trades_history: {e}")
-                if self.connection:
-                    self.connection.rollback()
-            
-            # Обновляем таблицу ai_responses (добавляем недостающие колонки)
+        """Привести схему БД к актуальной версии (см. services/schema_migrations.py)"""
+        return run_migrations(self)
+    
+    def get_schema_version(self) -> Optional[int]:
+        """
+        Текущая версия схемы БД
+        
+        Returns:
+            Номер последней примененной миграции, 0 - если таблицы schema_version еще нет, None при ошибке
+        """
+        from mysql.connector import errorcode
+        
+        with self._query_lock:
+            cursor = None
             try:
-                import logging
+                if not self.connection or not self.connection.is_connected():
+                    self.connect()
                 cursor = self.connection.cursor()
-                cursor.execute("SHOW COLUMNS FROM ai_responses LIKE 'prompt'")
-                if not cursor.fetchone():
-                    cursor.execute("ALTER TABLE ai_responses ADD COLUMN prompt LONGTEXT AFTER symbols")
-                    logger = logging.getLogger(__name__)
-                    logger.info("✅ Добавлено поле prompt в ai_responses")
-                cursor.close()
-            except Exception as e:
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Миграция ai_responses: {e}")
-                if self.connection:
-                    self.connection.rollback()
-            
-            # Таблица для хранения AI ответов и рекомендаций
-            create_ai_responses_table = """
-            CREATE TABLE IF NOT EXISTS ai_responses (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                timestamp DATETIME NOT NULL,
-                request_type VARCHAR(50) NOT NULL,
-                symbols TEXT,
-                prompt LONGTEXT,
-                recommended_symbol VARCHAR(20),
-                recommended_side VARCHAR(10),
-                entry_price DECIMAL(20, 8),
-                stop_loss DECIMAL(20, 8),
-                take_profit DECIMAL(20, 8),
-                confidence DECIMAL(5, 2),
-                reasoning TEXT,
-                full_response TEXT,
-                tokens_used INT,
-                response_time_ms INT,
-                INDEX idx_timestamp (timestamp),
-                INDEX idx_recommended_symbol (recommended_symbol),
-                INDEX idx_request_type (request_type)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-            """
-            
-            # Таблица для хранения ошибок API
-            create_api_errors_table = """
-            CREATE TABLE IF NOT EXISTS api_errors (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                timestamp DATETIME NOT NULL,
-                api_method VARCHAR(50) NOT NULL,
-                symbol VARCHAR(20),
-                error_code VARCHAR(20),
-                error_message TEXT,
-                response_data TEXT,
-                INDEX idx_timestamp (timestamp),
-                INDEX idx_api_method (api_method),
-                INDEX idx_symbol (symbol)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-            """
-            
-            # Таблица для кэширования данных по монетам (быстрый доступ)
-            create_market_cache_table = """
-            CREATE TABLE IF NOT EXISTS market_cache (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                symbol VARCHAR(20) NOT NULL,
-                timestamp DATETIME NOT NULL,
-                data_type VARCHAR(50) NOT NULL,
-                data_json TEXT NOT NULL,
-                expires_at DATETIME NOT NULL,
-                UNIQUE KEY unique_symbol_type (symbol, data_type),
-                INDEX idx_expires_at (expires_at),
-                INDEX idx_symbol_timestamp (symbol, timestamp)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-            """
-            
-            self.execute_query(create_market_history_table)
-            self.execute_query(create_time_stats_table)
-            self.execute_query(create_trades_table)
-            self.execute_query(create_ai_responses_table)
-            self.execute_query(create_api_errors_table)
-            self.execute_query(create_market_cache_table)
-            
-            return True
-        except Error as e:
-            print(f"Ошибка при инициализации таблиц: {e}")
-            return False
+                cursor.execute("SELECT MAX(version) FROM schema_version")
+                row = cursor.fetchone()
+                return (row[0] or 0) if row else 0
+            except Error as e:
+                if e.errno == errorcode.ER_NO_SUCH_TABLE:
+                    return 0
+                print(f"Ошибка при чтении версии схемы: {e}")
+                return None
+            finally:
+                if cursor:
+                    cursor.close()
     
     def _validate_market_data(self, market_data: Dict, historical_data: Dict) -> bool:
         """Валидация данных перед сохранением"""
-        try:
-            # Проверяем обязательные поля
-            if not market_data.get('current_price') or market_data.get('current_price', 0) <= 0:
-                return False
-            
-            # Проверяем разумность значений
-            price = market_data.get('current_price', 0)
-            if price < 0.0001 or price > 100000000:  # Разумные границы для крипто
-                return False
-            
-            volatility = market_data.get('volatility', 0)
-            if volatility < 0 or volatility > 100:  # Волатильность не может быть > 100%
-                return False
-            
-            return True
-        except Exception:
-            return False
+        return validate_market_data(market_data)
     
-    def save_market_snapshot(self, symbol: str, market_data: Dict, historical_data: Dict):
-        """Сохранить снимок рыночных данных с валидацией"""
+    def save_market_snapshot(self, symbol: str, market_data: Dict, historical_data: Dict, timestamp=None):
+        """Сохранить снимок рыночных данных с валидацией (timestamp - время снимка UTC, по умолчанию сейчас)"""
         try:
             # Валидация данных перед сохранением
             if not self._validate_market_data(market_data, historical_data):
@@ -335,46 +409,16 @@ class DatabaseService:
             
             from datetime import datetime
             
-            timestamp = datetime.utcnow()
-            hour_utc = timestamp.hour
-            
-            historical = historical_data or {}
-            macd_data = historical.get('macd', {})
-            bb_data = historical.get('bollinger_bands', {})
-            
-            query = """
-            INSERT INTO market_history (
-                symbol, timestamp, hour_utc, price, volume_24h, volatility,
-                funding_rate, open_interest, rsi, atr, macd, macd_signal,
-                bb_upper, bb_middle, bb_lower, ema_50, ema_200, vwap, liquidity_score
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-            )
-            """
+            timestamp = timestamp or datetime.utcnow()
             
-            params = (
-                symbol,
-                timestamp,
-                hour_utc,
-                market_data.get('current_price', 0),
-                market_data.get('volume_24h', 0),
-                market_data.get('volatility', 0),
-                market_data.get('funding_rate', 0),
-                market_data.get('open_interest', 0),
-                historical.get('rsi'),
-                historical.get('atr'),
-                macd_data.get('macd') if macd_data else None,
-                macd_data.get('signal') if macd_data else None,
-                bb_data.get('upper_band') if bb_data else None,
-                bb_data.get('middle_band') if bb_data else None,
-                bb_data.get('lower_band') if bb_data else None,
-                historical.get('ema_50'),
-                historical.get('ema_200'),
-                historical.get('vwap'),
-                market_data.get('liquidity_score', 0)
+            self.execute_query(MARKET_SNAPSHOT_QUERY, market_snapshot_params(symbol, market_data, historical_data, timestamp))
+            self._accumulate_time_of_day(
+                symbol, timestamp,
+                volatility=market_data.get('volatility', 0),
+                volume=market_data.get('volume_24h', 0),
+                funding_rate=market_data.get('funding_rate', 0),
+                spread=market_data.get('spread')
             )
-            
-            self.execute_query(query, params)
             return True
         except Error as e:
             print(f"Ошибка при сохранении снимка рынка: {e}")
@@ -385,20 +429,150 @@ class DatabaseService:
                 pass
             return False
     
-    def get_time_of_day_stats(self, symbol: str = None, hours: List[int] = None) -> Dict:
-        """Получить статистику по времени суток"""
+    def _accumulate_time_of_day(self, symbol: str, timestamp, volatility: float = 0, volume: float = 0,
+                                funding_rate: float = 0, spread: float = None, trade_won: bool = None,
+                                pnl_percent: float = 0):
+        """
+        Добавить снимок или закрытую сделку в корзину (символ, день, час UTC)
+        
+        Обновляются две строки: по символу и по всем символам (ALL_SYMBOLS) - одним запросом.
+        """
+        try:
+            self.execute_query(TIME_OF_DAY_QUERY, time_of_day_params(
+                symbol, timestamp, volatility=volatility, volume=volume, funding_rate=funding_rate,
+                spread=spread, trade_won=trade_won, pnl_percent=pnl_percent
+            ))
+        except Exception as e:
+            print(f"Ошибка при обновлении агрегатов времени суток для {symbol}: {e}")
+    
+    def rebuild_time_of_day_buckets(self, days: int = None):
+        """
+        Пересобрать корзины времени суток из market_history и trades_history
+        
+        Args:
+            days: Глубина в днях (по умолчанию - stats_keep_days)
+        """
+        try:
+            from datetime import datetime, timedelta
+            
+            cutoff_date = (datetime.utcnow() - timedelta(days=days or self.stats_keep_days)).date()
+            self.execute_query("DELETE FROM time_of_day_buckets WHERE day >= %s", (cutoff_date,))
+            
+            # Снимки берем из часовых агрегатов: сырые данные хранятся всего несколько дней.
+            # Часовой агрегат хранит среднее funding, поэтому модуль берется от среднего
+            snapshots_select = """
+            SELECT {symbol}, DATE(bucket_start), HOUR(bucket_start), SUM(sample_count),
+                   COALESCE(SUM(avg_volatility * sample_count), 0), COALESCE(SUM(avg_volume_24h * sample_count), 0),
+                   COALESCE(SUM(ABS(avg_funding_rate) * sample_count), 0),
+                   0, 0, 0, 0, 0
+            FROM market_history_1h
+            WHERE bucket_start >= %s
+            GROUP BY {group_by}
+            """
+            trades_select = """
+            SELECT {symbol}, DATE(entry_time), hour_utc, 0, 0, 0, 0, 0, 0,
+                   COUNT(*), SUM(CASE WHEN pnl > 0 THEN 1 ELSE 0 END), COALESCE(SUM(pnl_percent), 0)
+            FROM trades_history
+            WHERE entry_time >= %s AND status = 'closed'
+            GROUP BY {group_by}
+            """
+            insert = """
+            INSERT INTO time_of_day_buckets (
+                symbol, day, hour_utc, snapshot_count, sum_volatility, sum_volume, sum_funding_rate,
+                spread_count, sum_spread, trade_count, win_count, sum_pnl_percent
+            )
+            {select}
+            ON DUPLICATE KEY UPDATE
+                snapshot_count = snapshot_count + VALUES(snapshot_count),
+                sum_volatility = sum_volatility + VALUES(sum_volatility),
+                sum_volume = sum_volume + VALUES(sum_volume),
+                sum_funding_rate = sum_funding_rate + VALUES(sum_funding_rate),
+                trade_count = trade_count + VALUES(trade_count),
+                win_count = win_count + VALUES(win_count),
+                sum_pnl_percent = sum_pnl_percent + VALUES(sum_pnl_percent)
+            """
+            for select, day_hour in ((snapshots_select, "DATE(bucket_start), HOUR(bucket_start)"),
+                                     (trades_select, "DATE(entry_time), hour_utc")):
+                for symbol_expr, group_by in (("symbol", f"symbol, {day_hour}"),
+                                              (f"'{self.ALL_SYMBOLS}'", day_hour)):
+                    query = insert.format(select=select.format(symbol=symbol_expr, group_by=group_by))
+                    self.execute_query(query, (cutoff_date,))
+            
+            self._time_stats_refreshed_at = None
+            return True
+        except Exception as e:
+            print(f"Ошибка при пересборке агрегатов времени суток: {e}")
+            return False
+    
+    def refresh_time_of_day_stats(self, days: int = 30):
+        """
+        Пересчитать time_of_day_stats из корзин за последние N дней
+        
+        Читает не больше days×24 строк на символ, вместо GROUP BY по market_history.
+        """
         try:
             from datetime import datetime, timedelta
             
-            # Берем данные за последние 30 дней
-            cutoff_date = datetime.utcnow() - timedelta(days=30)
+            now = datetime.utcnow().replace(microsecond=0)
+            cutoff_date = (now - timedelta(days=days)).date()
+            
+            query = """
+            INSERT INTO time_of_day_stats (
+                symbol, hour_utc, avg_volatility, avg_volume, avg_spread, avg_funding_rate,
+                data_points, trade_count, win_rate, avg_pnl, last_updated
+            )
+            SELECT
+                symbol,
+                hour_utc,
+                SUM(sum_volatility) / NULLIF(SUM(snapshot_count), 0),
+                SUM(sum_volume) / NULLIF(SUM(snapshot_count), 0),
+                SUM(sum_spread) / NULLIF(SUM(spread_count), 0),
+                SUM(sum_funding_rate) / NULLIF(SUM(snapshot_count), 0),
+                SUM(snapshot_count),
+                SUM(trade_count),
+                SUM(win_count) * 100 / NULLIF(SUM(trade_count), 0),
+                SUM(sum_pnl_percent) / NULLIF(SUM(trade_count), 0),
+                %s
+            FROM time_of_day_buckets
+            WHERE day >= %s
+            GROUP BY symbol, hour_utc
+            ON DUPLICATE KEY UPDATE
+                avg_volatility = VALUES(avg_volatility),
+                avg_volume = VALUES(avg_volume),
+                avg_spread = VALUES(avg_spread),
+                avg_funding_rate = VALUES(avg_funding_rate),
+                data_points = VALUES(data_points),
+                trade_count = VALUES(trade_count),
+                win_rate = VALUES(win_rate),
+                avg_pnl = VALUES(avg_pnl),
+                last_updated = VALUES(last_updated)
+            """
+            if self.execute_query(query, (now, cutoff_date)) is None:
+                return False
+            
+            # Часы, по которым за окно данных не осталось, убираем; старые корзины больше не нужны
+            self.execute_query("DELETE FROM time_of_day_stats WHERE last_updated < %s", (now,))
+            keep_date = (now - timedelta(days=self.stats_keep_days)).date()
+            self.execute_query("DELETE FROM time_of_day_buckets WHERE day < %s", (keep_date,))
+            
+            self._time_stats_refreshed_at = now
+            return True
+        except Exception as e:
+            print(f"Ошибка при обновлении статистики по времени суток: {e}")
+            return False
+    
+    def get_time_of_day_stats(self, symbol: str = None, hours: List[int] = None) -> Dict:
+        """Получить статистику по времени суток (за последние 30 дней, из time_of_day_stats)"""
+        try:
+            from datetime import datetime
             
-            conditions = ["timestamp >= %s"]
-            params = [cutoff_date]
+            # Сводная таблица пересчитывается из корзин не чаще раза в stats_refresh_interval
+            if (self._time_stats_refreshed_at is None or
+                    datetime.utcnow() - self._time_stats_refreshed_at >= self.stats_refresh_interval):
+                self.refresh_time_of_day_stats()
             
-            if symbol:
-                conditions.append("symbol = %s")
-                params.append(symbol)
+            conditions = ["symbol = %s"]
+            params = [symbol.upper() if symbol else self.ALL_SYMBOLS]
             
             if hours:
                 placeholders = ','.join(['%s'] * len(hours))
@@ -408,15 +582,10 @@ class DatabaseService:
             where_clause = " AND ".join(conditions)
             
             query = f"""
-            SELECT 
-                hour_utc,
-                AVG(volatility) as avg_volatility,
-                AVG(volume_24h) as avg_volume,
-                AVG(ABS(funding_rate)) as avg_funding_rate,
-                COUNT(*) as data_points
-            FROM market_history
+            SELECT hour_utc, avg_volatility, avg_volume, avg_spread, avg_funding_rate,
+                   data_points, trade_count, win_rate, avg_pnl
+            FROM time_of_day_stats
             WHERE {where_clause}
-            GROUP BY hour_utc
             ORDER BY hour_utc
             """
             
@@ -431,8 +600,12 @@ class DatabaseService:
                 stats[hour] = {
                     'avg_volatility': float(row['avg_volatility'] or 0),
                     'avg_volume': float(row['avg_volume'] or 0),
+                    'avg_spread': float(row['avg_spread']) if row['avg_spread'] is not None else None,
                     'avg_funding_rate': float(row['avg_funding_rate'] or 0),
-                    'data_points': row['data_points']
+                    'data_points': row['data_points'] or 0,
+                    'trade_count': row['trade_count'] or 0,
+                    'win_rate': float(row['win_rate']) if row['win_rate'] is not None else None,
+                    'avg_pnl': float(row['avg_pnl']) if row['avg_pnl'] is not None else None
                 }
             
             return stats
@@ -490,38 +663,12 @@ class DatabaseService:
         """Сохранить ответ AI для анализа"""
         try:
             from datetime import datetime
-            import json
-            
-            timestamp = datetime.utcnow()
             
-            query = """
-            INSERT INTO ai_responses (
-                timestamp, request_type, symbols, prompt, recommended_symbol, recommended_side,
-                entry_price, stop_loss, take_profit, confidence, reasoning, full_response,
-                tokens_used, response_time_ms
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+            params = ai_response_params(
+                datetime.utcnow(), request_type, symbols, response_data,
+                prompt_text=prompt_text, tokens_used=tokens_used, response_time_ms=response_time_ms
             )
-            """
-            
-            params = (
-                timestamp,
-                request_type,
-                ','.join(symbols) if symbols else None,
-                prompt_text,
-                response_data.get('recommended_symbol'),
-                response_data.get('recommended_side'),
-                response_data.get('entry_price'),
-                response_data.get('stop_loss'),
-                response_data.get('take_profit'),
-                response_data.get('confidence'),
-                response_data.get('reasoning'),
-                json.dumps(response_data) if response_data else None,
-                tokens_used,
-                response_time_ms
-            )
-            
-            self.execute_query(query, params)
+            self.execute_query(AI_RESPONSE_QUERY, params)
             return True
         except Error as e:
             print(f"Ошибка при сохранении ответа AI: {e}")
@@ -532,28 +679,9 @@ class DatabaseService:
         """Сохранить ошибку API для анализа"""
         try:
             from datetime import datetime
-            import json
-            
-            timestamp = datetime.utcnow()
             
-            query = """
-            INSERT INTO api_errors (
-                timestamp, api_method, symbol, error_code, error_message, response_data
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s
-            )
-            """
-            
-            params = (
-                timestamp,
-                api_method,
-                symbol,
-                error_code,
-                error_message,
-                json.dumps(response_data) if response_data else None
-            )
-            
-            self.execute_query(query, params)
+            params = api_error_params(datetime.utcnow(), api_method, symbol, error_code, error_message, response_data)
+            self.execute_query(API_ERROR_QUERY, params)
             return True
         except Error as e:
             print(f"Ошибка при сохранении ошибки API: {e}")
@@ -568,15 +696,6 @@ class DatabaseService:
             timestamp = datetime.utcnow()
             expires_at = timestamp + timedelta(minutes=ttl_minutes)
             
-            query = """
-            INSERT INTO market_cache (symbol, timestamp, data_type, data_json, expires_at)
-            VALUES (%s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-                timestamp = VALUES(timestamp),
-                data_json = VALUES(data_json),
-                expires_at = VALUES(expires_at)
-            """
-            
             params = (
                 symbol,
                 timestamp,
@@ -585,7 +704,7 @@ class DatabaseService:
                 expires_at
             )
             
-            self.execute_query(query, params)
+            self.execute_query(CACHE_UPSERT_QUERY, params)
             return True
         except Error as e:
             print(f"Ошибка при сохранении в кэш: {e}")
@@ -647,23 +766,22 @@ class DatabaseService:
             
             cutoff_time = datetime.utcnow() - timedelta(days=days)
             
-            # Получаем исторические цены для обоих символов
-            query = """
-            SELECT timestamp, price 
-            FROM market_history
-            WHERE symbol = %s AND timestamp >= %s
-            ORDER BY timestamp ASC
-            """
+            # Сначала пробуем хранилище свечей - без запросов к БД
+            if self.candle_store:
+                correlation = self._calculate_store_correlation(symbol1, symbol2, cutoff_time)
+                if correlation is not None:
+                    return correlation
             
-            prices1 = self.execute_query(query, (symbol1, cutoff_time))
-            prices2 = self.execute_query(query, (symbol2, cutoff_time))
+            # Получаем исторические цены для обоих символов (часовые агрегаты или грубее - не сырые снимки)
+            prices1 = self.rollup_service.get_history(symbol1, cutoff_time, min_step_seconds=3600)
+            prices2 = self.rollup_service.get_history(symbol2, cutoff_time, min_step_seconds=3600)
             
             if not prices1 or not prices2 or len(prices1) < 10 or len(prices2) < 10:
                 return 0.0
             
             # Создаем словари для синхронизации по времени
-            prices1_dict = {row['timestamp']: float(row['price']) for row in prices1}
-            prices2_dict = {row['timestamp']: float(row['price']) for row in prices2}
+            prices1_dict = {row['timestamp']: float(row['close']) for row in prices1}
+            prices2_dict = {row['timestamp']: float(row['close']) for row in prices2}
             
             # Находим общие временные точки
             common_timestamps = set(prices1_dict.keys()) & set(prices2_dict.keys())
@@ -705,6 +823,84 @@ class DatabaseService:
             print(f"Ошибка при расчете корреляции между {symbol1} и {symbol2}: {e}")
             return 0.0
     
+    def _calculate_store_correlation(self, symbol1: str, symbol2: str, cutoff_time,
+                                     interval: str = "60") -> Optional[float]:
+        """
+        Корреляция доходностей по часовым закрытиям из хранилища свечей
+        
+        Returns:
+            Коэффициент корреляции или None, если в хранилище недостаточно данных
+        """
+        from datetime import timezone
+        
+        start_ms = int(cutoff_time.replace(tzinfo=timezone.utc).timestamp() * 1000)
+        candles1 = self.candle_store.read(symbol1, interval, start_ms=start_ms, fields=["timestamp", "close"])
+        candles2 = self.candle_store.read(symbol2, interval, start_ms=start_ms, fields=["timestamp", "close"])
+        if candles1 is None or candles2 is None:
+            return None
+        
+        # Выравниваем ряды по времени
+        common, idx1, idx2 = np.intersect1d(candles1["timestamp"], candles2["timestamp"],
+                                            assume_unique=True, return_indices=True)
+        if len(common) < 11:
+            return None
+        close1 = np.asarray(candles1["close"])[idx1]
+        close2 = np.asarray(candles2["close"])[idx2]
+        
+        # Доходности только между соседними свечами (пропуски в истории не склеиваем)
+        interval_ms = (1440 if interval == "D" else int(interval)) * 60 * 1000
+        mask = (np.diff(common) == interval_ms) & (close1[:-1] > 0) & (close2[:-1] > 0)
+        if mask.sum() < 10:
+            return None
+        returns1 = (close1[1:] - close1[:-1])[mask] / close1[:-1][mask]
+        returns2 = (close2[1:] - close2[:-1])[mask] / close2[:-1][mask]
+        
+        correlation = np.corrcoef(returns1, returns2)[0, 1]
+        if np.isnan(correlation):
+            return 0.0
+        return float(correlation)
+    
+    # Колонка времени и доп. условие ротации по таблицам (в trades_history нет timestamp, открытые сделки не трогаем)
+    ROTATION_COLUMNS = {
+        'market_history': ('timestamp', None),
+        'ai_responses': ('timestamp', None),
+        'api_errors': ('timestamp', None),
+        'trades_history': ('entry_time', "status = 'closed'"),
+    }
+    
+    def delete_in_batches(self, table_name: str, where_clause: str, params: tuple = (),
+                          order_column: str = "id", batch_size: int = 5000, pause_seconds: float = 0.1,
+                          max_batches: int = None) -> int:
+        """
+        Удалить строки порциями: каждая порция - отдельная короткая транзакция,
+        поэтому блокировки строк не копятся, а вставки бота между порциями проходят
+        
+        Args:
+            table_name: Имя таблицы
+            where_clause: Условие удаления (без WHERE)
+            params: Параметры условия
+            order_column: Колонка сортировки порций (желательно с индексом)
+            batch_size: Размер порции
+            pause_seconds: Пауза между порциями
+            max_batches: Максимум порций за вызов (None - до конца)
+        
+        Returns:
+            Количество удаленных записей
+        """
+        query = f"DELETE FROM {table_name} WHERE {where_clause} ORDER BY {order_column} LIMIT %s"
+        deleted = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            result = self.execute_query(query, tuple(params) + (batch_size,))
+            if not result:
+                break
+            deleted += result
+            batches += 1
+            if result < batch_size:
+                break
+            time.sleep(pause_seconds)
+        return deleted
+    
     def rotate_old_data(self, table_name: str, keep_days: int = 90):
         """
         Удалить старые данные из таблицы, оставив только последние N дней
@@ -722,21 +918,20 @@ class DatabaseService:
             cutoff_time = datetime.utcnow() - timedelta(days=keep_days)
             
             # Проверяем, что таблица существует
-            valid_tables = ['market_history', 'ai_responses', 'api_errors', 'trades_history']
-            if table_name not in valid_tables:
+            if table_name not in self.ROTATION_COLUMNS:
                 print(f"⚠️ Таблица {table_name} не в списке разрешенных для ротации")
                 return 0
             
-            query = f"DELETE FROM {table_name} WHERE timestamp < %s"
-            params = (cutoff_time,)
+            column, extra_condition = self.ROTATION_COLUMNS[table_name]
+            where_clause = f"{column} < %s"
+            if extra_condition:
+                where_clause += f" AND {extra_condition}"
             
-            result = self.execute_query(query, params)
+            result = self.delete_in_batches(table_name, where_clause, (cutoff_time,), order_column=column)
             
             if result:
                 print(f"✅ Удалено {result} записей из {table_name} старше {keep_days} дней")
-                return result
-            else:
-                return 0
+            return result
                 
         except Exception as e:
             print(f"Ошибка при ротации данных в {table_name}: {e}")
@@ -753,30 +948,23 @@ class DatabaseService:
             Количество удаленных записей
         """
         try:
-            # Получаем ID последних N записей
+            # Граница - id N-й с конца записи; все, что старше, удаляем порциями по первичному ключу
             query = """
             SELECT id FROM ai_responses
-            ORDER BY timestamp DESC
-            LIMIT %s
+            ORDER BY id DESC
+            LIMIT 1 OFFSET %s
             """
             
-            keep_ids = self.execute_query(query, (keep_count,))
+            boundary = self.execute_query(query, (keep_count - 1,))
             
-            if not keep_ids or len(keep_ids) == 0:
+            if not boundary:
                 return 0
             
-            keep_ids_list = [row['id'] for row in keep_ids]
-            placeholders = ','.join(['%s'] * len(keep_ids_list))
-            
-            # Удаляем все остальные
-            delete_query = f"DELETE FROM ai_responses WHERE id NOT IN ({placeholders})"
-            result = self.execute_query(delete_query, tuple(keep_ids_list))
+            result = self.delete_in_batches("ai_responses", "id < %s", (boundary[0]['id'],))
             
             if result:
-                print(f"✅ Удалено {result} старых AI ответов, оставлено {len(keep_ids_list)}")
-                return result
-            else:
-                return 0
+                print(f"✅ Удалено {result} старых AI ответов, оставлено {keep_count}")
+            return result
                 
         except Exception as e:
             print(f"Ошибка при очистке старых AI ответов: {e}")
@@ -784,7 +972,7 @@ class DatabaseService:
     
     def save_trade(self, symbol: str, side: str, entry_price: float, quantity: float,
                    leverage: int, stop_loss: float = None, take_profit: float = None,
-                   bot_name: str = "main", status: str = "open"):
+                   bot_name: str = "main", status: str = "open", entry_time=None):
         """
         Сохранить сделку в БД
         
@@ -798,48 +986,21 @@ class DatabaseService:
             take_profit: Тейк-профит
             bot_name: Имя бота (main/iliya)
             status: Статус (open/closed)
+            entry_time: Время входа UTC (по умолчанию сейчас; при импорте истории - время сделки)
         
         Returns:
             ID сохраненной сделки или None
         """
         try:
-            from datetime import datetime
-            
-            entry_time = datetime.utcnow()
-            hour_utc = entry_time.hour
-            
             # Проверяем наличие колонок
             columns = self.execute_query("SHOW COLUMNS FROM trades_history")
             column_names = [col['Field'] for col in columns] if columns else []
-            has_bot_name = 'bot_name' in column_names
-            has_stop_loss = 'stop_loss' in column_names
-            has_take_profit = 'take_profit' in column_names
-            
-            # Формируем запрос в зависимости от наличия колонок
-            fields = ['symbol', 'side', 'entry_time', 'entry_price', 'quantity', 'leverage', 'hour_utc', 'status']
-            values = [symbol.upper(), side, entry_time, entry_price, quantity, leverage, hour_utc, status]
-            
-            if has_bot_name:
-                fields.insert(0, 'bot_name')
-                values.insert(0, bot_name)
-            
-            if has_stop_loss:
-                fields.append('stop_loss')
-                values.append(stop_loss)
-            
-            if has_take_profit:
-                fields.append('take_profit')
-                values.append(take_profit)
-            
-            placeholders = ', '.join(['%s'] * len(fields))
-            fields_str = ', '.join(fields)
-            
-            query = f"""
-            INSERT INTO trades_history ({fields_str})
-            VALUES ({placeholders})
-            """
             
-            params = tuple(values)
+            query, params = trade_insert(
+                column_names, symbol, side, entry_price, quantity, leverage,
+                stop_loss=stop_loss, take_profit=take_profit, bot_name=bot_name, status=status,
+                entry_time=entry_time
+            )
             
             result = self.execute_query(query, params)
             return result
@@ -848,7 +1009,7 @@ class DatabaseService:
             return None
     
     def update_trade_exit(self, symbol: str, exit_price: float, pnl: float,
-                          pnl_percent: float, bot_name: str = "main"):
+                          pnl_percent: float, bot_name: str = "main", exit_time=None, entry_time=None):
         """
         Обновить сделку при выходе
         
@@ -858,6 +1019,8 @@ class DatabaseService:
             pnl: P&L в USDT
             pnl_percent: P&L в процентах
             bot_name: Имя бота
+            exit_time: Время выхода UTC (по умолчанию сейчас)
+            entry_time: Закрыть сделку с этим временем входа (по умолчанию - последнюю открытую)
         
         Returns:
             True если успешно
@@ -865,7 +1028,7 @@ class DatabaseService:
         try:
             from datetime import datetime
             
-            exit_time = datetime.utcnow()
+            exit_time = exit_time or datetime.utcnow()
             
             # Проверяем наличие колонки bot_name
             check_column = self.execute_query("SHOW COLUMNS FROM trades_history LIKE 'bot_name'")
@@ -873,25 +1036,36 @@ class DatabaseService:
             
             if has_bot_name:
                 # Обновляем самую последнюю открытую сделку или последнюю сделку без exit_time
-                query = """
-                UPDATE trades_history
-                SET exit_time = %s, exit_price = %s, pnl = %s, pnl_percent = %s, status = 'closed'
-                WHERE symbol = %s AND bot_name = %s AND (status = 'open' OR exit_time IS NULL)
-                ORDER BY entry_time DESC
-                LIMIT 1
-                """
-                params = (exit_time, exit_price, pnl, pnl_percent, symbol.upper(), bot_name)
+                where_clause = "symbol = %s AND bot_name = %s AND (status = 'open' OR exit_time IS NULL)"
+                where_params = (symbol.upper(), bot_name)
             else:
-                query = """
-                UPDATE trades_history
-                SET exit_time = %s, exit_price = %s, pnl = %s, pnl_percent = %s, status = 'closed'
-                WHERE symbol = %s AND status = 'open'
-                ORDER BY entry_time DESC
-                LIMIT 1
-                """
-                params = (exit_time, exit_price, pnl, pnl_percent, symbol.upper())
+                where_clause = "symbol = %s AND status = 'open'"
+                where_params = (symbol.upper(),)
+            if entry_time is not None:
+                where_clause += " AND entry_time = %s"
+                where_params += (entry_time,)
+            
+            # Находим сделку заранее: ее время входа нужно для агрегатов времени суток
+            open_trade = self.execute_query(
+                f"SELECT id, entry_time FROM trades_history WHERE {where_clause} ORDER BY entry_time DESC LIMIT 1",
+                where_params
+            )
+            if not open_trade:
+                return True
             
-            self.execute_query(query, params)
+            query = """
+            UPDATE trades_history
+            SET exit_time = %s, exit_price = %s, pnl = %s, pnl_percent = %s, status = 'closed'
+            WHERE id = %s
+            """
+            params = (exit_time, exit_price, pnl, pnl_percent, open_trade[0]['id'])
+            
+            if self.execute_query(query, params):
+                self._accumulate_time_of_day(
+                    symbol, open_trade[0]['entry_time'],
+                    trade_won=(pnl or 0) > 0,
+                    pnl_percent=pnl_percent
+                )
             return True
         except Error as e:
             print(f"Ошибка при обновлении сделки: {e}")
@@ -904,38 +1078,10 @@ class DatabaseService:
             
             cutoff_time = datetime.utcnow() - timedelta(minutes=minutes_back)
             
-            query = """
-            SELECT * FROM market_history
-            WHERE symbol = %s AND timestamp >= %s
-            ORDER BY timestamp DESC
-            LIMIT 1
-            """
-            
-            params = (symbol, cutoff_time)
-            result = self.execute_query(query, params)
+            result = self.execute_query(LATEST_MARKET_DATA_QUERY, (symbol, cutoff_time))
             
             if result and len(result) > 0:
-                row = result[0]
-                return {
-                    "symbol": row["symbol"],
-                    "price": float(row["price"]),
-                    "volume_24h": float(row["volume_24h"] or 0),
-                    "volatility": float(row["volatility"] or 0),
-                    "funding_rate": float(row["funding_rate"] or 0),
-                    "open_interest": float(row["open_interest"] or 0),
-                    "rsi": float(row["rsi"]) if row["rsi"] else None,
-                    "atr": float(row["atr"]) if row["atr"] else None,
-                    "macd": float(row["macd"]) if row["macd"] else None,
-                    "macd_signal": float(row["macd_signal"]) if row["macd_signal"] else None,
-                    "bb_upper": float(row["bb_upper"]) if row["bb_upper"] else None,
-                    "bb_middle": float(row["bb_middle"]) if row["bb_middle"] else None,
-                    "bb_lower": float(row["bb_lower"]) if row["bb_lower"] else None,
-                    "ema_50": float(row["ema_50"]) if row["ema_50"] else None,
-                    "ema_200": float(row["ema_200"]) if row["ema_200"] else None,
-                    "vwap": float(row["vwap"]) if row["vwap"] else None,
-                    "liquidity_score": float(row["liquidity_score"] or 0),
-                    "timestamp": row["timestamp"]
-                }
+                return market_row_to_dict(result[0])
             
             return None
         except Error as e:
@@ -0,0 +1,160 @@
+"""
+Неблокирующая запись ошибок API в таблицу api_errors
+
+Ошибка кладется в очередь в памяти за O(1) и сразу возвращает управление - запрос,
+который и так завершился ошибкой, не ждет INSERT. Фоновый поток раз в flush_interval
+записывает накопленное одним многострочным INSERT:
+- первые sample_limit ошибок по ключу (метод, символ, код) за окно пишутся отдельными строками
+  (с сообщением и ответом API) - это образцы;
+- остальные повторы за окно только считаются и по закрытии окна пишутся одной строкой
+  с количеством в колонке occurrences;
+- при переполнении очереди (массовый сбой биржи) новые ключи отбрасываются с подсчетом.
+"""
+import atexit
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BATCH_INSERT_QUERY = """
+            INSERT INTO api_errors (
+                timestamp, api_method, symbol, error_code, error_message, response_data, occurrences
+            ) VALUES {values}
+            """
+MAX_RESPONSE_LENGTH = 4000  # Ответ API в образце обрезается до этой длины
+
+
+class ApiErrorSink:
+    _sinks: Dict[int, "ApiErrorSink"] = {}
+    _sinks_lock = threading.Lock()
+
+    def __init__(self, db_service, window_seconds: float = 60, sample_limit: int = 3,
+                 flush_interval: float = 5, max_keys: int = 1000, batch_size: int = 200):
+        """
+        Args:
+            db_service: DatabaseService для записи
+            window_seconds: Окно схлопывания повторов по ключу (метод, символ, код)
+            sample_limit: Сколько ошибок по ключу за окно записывать целиком
+            flush_interval: Период фоновой записи (секунды)
+            max_keys: Максимум ключей в памяти, дальше новые ключи отбрасываются
+            batch_size: Строк в одном INSERT
+        """
+        self.db_service = db_service
+        self.window_seconds = window_seconds
+        self.sample_limit = sample_limit
+        self.flush_interval = flush_interval
+        self.max_keys = max_keys
+        self.batch_size = batch_size
+
+        self._lock = threading.Lock()
+        self._windows: Dict[tuple, Dict] = {}  # Ключ -> {"started", "seen", "suppressed", "last_message"}
+        self._samples: List[tuple] = []  # Готовые строки образцов, ждут записи
+        self.dropped = 0  # Отброшено из-за переполнения
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def for_db(cls, db_service) -> "ApiErrorSink":
+        """Общий запущенный приемник для подключения (сервисы создают свои BybitService)"""
+        with cls._sinks_lock:
+            sink = cls._sinks.get(id(db_service))
+            if sink is None:
+                sink = cls(db_service)
+                sink.start()
+                cls._sinks[id(db_service)] = sink
+            return sink
+
+    # ---------- запись в очередь ----------
+
+    def record(self, api_method: str, symbol: Optional[str], error_code: str,
+               error_message: str, response_data: Dict = None):
+        """Поставить ошибку в очередь (не блокирует и не обращается к БД)"""
+        key = (api_method, symbol, str(error_code))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                if len(self._windows) >= self.max_keys:
+                    self.dropped += 1
+                    return
+                window = {"started": now, "seen": 0, "suppressed": 0, "last_message": None}
+                self._windows[key] = window
+            window["seen"] += 1
+            if window["seen"] <= self.sample_limit:
+                # Ответ API сериализуется при записи; здесь - только ссылка
+                self._samples.append((datetime.utcnow(), key, error_message, response_data))
+            else:
+                window["suppressed"] += 1
+                window["last_message"] = error_message
+
+    # ---------- фоновая запись ----------
+
+    def _collect(self, force: bool = False) -> List[tuple]:
+        """Забрать строки к записи: образцы и итоги закрытых окон"""
+        now = time.monotonic()
+        rows = []
+        with self._lock:
+            samples, self._samples = self._samples, []
+            for key, window in list(self._windows.items()):
+                if force or now - window["started"] >= self.window_seconds:
+                    del self._windows[key]
+                    if window["suppressed"]:
+                        rows.append((datetime.utcnow(), key, window["last_message"], None, window["suppressed"]))
+            dropped, self.dropped = self.dropped, 0
+        rows = [(ts, key, message, response, 1) for ts, key, message, response in samples] + rows
+        if dropped:
+            rows.append((datetime.utcnow(), ("error_sink", None, "DROPPED"),
+                         "Очередь ошибок переполнена, ошибки отброшены", None, dropped))
+        return rows
+
+    def flush(self, force: bool = False) -> int:
+        """
+        Записать накопленные ошибки порциями по batch_size
+
+        Returns:
+            Количество записанных строк
+        """
+        rows = self._collect(force)
+        written = 0
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            params = []
+            for timestamp, (api_method, symbol, error_code), message, response, occurrences in batch:
+                response_json = json.dumps(response, default=str)[:MAX_RESPONSE_LENGTH] if response else None
+                params.extend([timestamp, api_method, symbol, error_code, message, response_json, occurrences])
+            query = BATCH_INSERT_QUERY.format(values=", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(batch)))
+            try:
+                if self.db_service.execute_query(query, tuple(params)) is not None:
+                    written += len(batch)
+            except Exception as e:
+                logger.warning(f"Не удалось записать ошибки API в БД: {e}")
+        return written
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Ошибка фоновой записи ошибок API: {e}")
+
+    def start(self):
+        """Запустить фоновый поток записи"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="api-error-sink", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Остановить поток и дописать все, что накоплено"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        self.flush(force=True)
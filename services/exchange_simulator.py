@@ -0,0 +1,992 @@
+"""
+Локальный симулятор Bybit v5 (linear) для запуска бота и бенчмарков без биржи
+
+ExchangeSimulator повторяет интерфейс клиента pybit HTTP в той части, которую использует
+BybitService: get_tickers, get_kline, get_orderbook, get_public_trade, get_positions,
+get_wallet_balance, get_instruments_info, get_funding_rate_history, get_open_interest,
+place_order, place_batch_order, amend_order, cancel_order, cancel_all_orders,
+get_open_orders, set_trading_stop. Ответы - в формате v5 (retCode/retMsg/result).
+Передается в BybitService(client=...), приватный поток - через
+AccountStream(websocket_factory=simulator.websocket).
+
+Цены:
+- синтетические: детерминированное случайное блуждание минутных свечей от seed и символа;
+- записанные: свечи из CandleStore (from_candle_store) или load_candles.
+
+Время симулятора идет только через advance() (детерминированный прогон) или
+следует за часами (realtime=True, для запуска бота). Внутри свечи цена идет линейно
+от open к close. При движении цены исполняются
+лимитные ордера, срабатывают стоп-лосс/тейк-профит позиций и ликвидация.
+
+Задержка (latency, jitter) и ошибки (error_rate, inject_error) добавляются к запросам;
+все случайности - от seed, прогон с тем же seed повторяется.
+"""
+import functools
+import logging
+import math
+import threading
+import time
+import zlib
+from collections import Counter
+from decimal import Decimal, ROUND_DOWN, ROUND_UP
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from services.trading_rules import MAKER_FEE, TAKER_FEE
+
+logger = logging.getLogger(__name__)
+
+MINUTE_MS = 60_000
+SYNTHETIC_CHUNK_BARS = 1440  # Синтетические свечи достраиваются сутками
+DEFAULT_START_MS = 1704067200000  # 2024-01-01 00:00 UTC
+INTERVAL_MINUTES = {"1": 1, "3": 3, "5": 5, "15": 15, "30": 30, "60": 60, "120": 120, "240": 240,
+                    "360": 360, "720": 720, "D": 1440, "W": 10080, "M": 43200}
+OPEN_ORDER_STATUSES = ("New", "PartiallyFilled")
+MAINTENANCE_MARGIN_RATE = 0.005
+# Примерные стартовые цены синтетики, остальные символы - от хеша имени
+DEFAULT_PRICES = {
+    "BTCUSDT": 60000.0, "ETHUSDT": 3000.0, "SOLUSDT": 150.0, "BNBUSDT": 550.0, "XRPUSDT": 0.55,
+    "ADAUSDT": 0.45, "DOGEUSDT": 0.12, "AVAXUSDT": 30.0, "LINKUSDT": 14.0, "TONUSDT": 6.0,
+    "TRXUSDT": 0.12, "LTCUSDT": 75.0, "NEARUSDT": 5.0, "APTUSDT": 8.0, "OPUSDT": 2.0,
+    "ARBUSDT": 0.9, "POLUSDT": 0.5, "MATICUSDT": 0.5, "SEIUSDT": 0.4, "SUIUSDT": 1.2,
+}
+
+
+def _crc(value: str) -> int:
+    return zlib.crc32(value.encode())
+
+
+def _decimals(step: float) -> int:
+    return max(0, -int(math.floor(math.log10(step) + 1e-9)))
+
+
+def _fmt(value: float, step: float) -> str:
+    return f"{value:.{_decimals(step)}f}"
+
+
+def _round_step(value: float, step: float, rounding=ROUND_DOWN) -> float:
+    step_dec = Decimal(str(step))
+    return float((Decimal(str(value)) / step_dec).quantize(Decimal(1), rounding=rounding) * step_dec)
+
+
+def _float(value, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _ok(result=None, ret_ext_info=None, now_ms: int = 0) -> Dict:
+    return {"retCode": 0, "retMsg": "OK", "result": result if result is not None else {},
+            "retExtInfo": ret_ext_info or {}, "time": now_ms}
+
+
+def _error(code: int, message: str, now_ms: int = 0) -> Dict:
+    return {"retCode": code, "retMsg": message, "result": {}, "retExtInfo": {}, "time": now_ms}
+
+
+def _page(items: List, limit, cursor) -> Tuple[List, str]:
+    """Страница списка и nextPageCursor (смещение строкой, как непрозрачный cursor Bybit)"""
+    offset = int(cursor or 0)
+    limit = max(int(limit or 20), 1)
+    page = items[offset:offset + limit]
+    next_cursor = str(offset + limit) if offset + limit < len(items) else ""
+    return page, next_cursor
+
+
+def _endpoint(method: Callable) -> Callable:
+    """Запрос к симулятору: счетчик, задержка, внедренные ошибки, блокировка и рассылка событий"""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, **kwargs):
+        failure = self._before_request(name)
+        if failure is not None:
+            return failure
+        with self._lock:
+            if self.realtime:
+                self._sync_clock()
+            response = method(self, **kwargs)
+            messages, self._outbox = self._outbox, []
+        self._dispatch(messages)
+        return response
+
+    return wrapper
+
+
+class _Tape:
+    """Свечи одного символа на равномерной сетке bar_ms (синтетика достраивается вперед)"""
+
+    def __init__(self, bar_ms: int, columns: Dict[str, np.ndarray], rng: np.random.Generator = None,
+                 volatility: float = 0.0):
+        self.bar_ms = bar_ms
+        self.ts = np.asarray(columns["timestamp"], dtype=np.int64)
+        self.open = np.asarray(columns["open"], dtype=np.float64)
+        self.high = np.asarray(columns["high"], dtype=np.float64)
+        self.low = np.asarray(columns["low"], dtype=np.float64)
+        self.close = np.asarray(columns["close"], dtype=np.float64)
+        self.volume = np.asarray(columns["volume"], dtype=np.float64)
+        self.rng = rng
+        self.volatility = volatility
+
+    def extend_to(self, now_ms: int):
+        if self.rng is None:
+            return
+        while self.ts[-1] < now_ms:
+            start = int(self.ts[-1]) + self.bar_ms
+            chunk = _synthetic_bars(self.rng, float(self.close[-1]), SYNTHETIC_CHUNK_BARS, self.volatility)
+            chunk["timestamp"] = start + np.arange(SYNTHETIC_CHUNK_BARS, dtype=np.int64) * self.bar_ms
+            for name in ("ts", "open", "high", "low", "close", "volume"):
+                column = "timestamp" if name == "ts" else name
+                setattr(self, name, np.concatenate((getattr(self, name), chunk[column])))
+
+    def index_at(self, now_ms: int) -> int:
+        """Свеча, в которую попадает момент now_ms (после конца записи - последняя)"""
+        return max(int(np.searchsorted(self.ts, now_ms, side="right")) - 1, 0)
+
+    def price_at(self, now_ms: int) -> float:
+        """Цена внутри свечи - линейно от open к close (после конца записи - последний close)"""
+        index = self.index_at(now_ms)
+        fraction = min(max((now_ms - int(self.ts[index])) / self.bar_ms, 0.0), 1.0)
+        return float(self.open[index] + (self.close[index] - self.open[index]) * fraction)
+
+
+def _synthetic_bars(rng: np.random.Generator, start_price: float, count: int, volatility: float) -> Dict[str, np.ndarray]:
+    """Минутные свечи геометрического случайного блуждания от start_price"""
+    returns = rng.normal(0.0, volatility, count)
+    close = start_price * np.exp(np.cumsum(returns))
+    open_ = np.concatenate(([start_price], close[:-1]))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0.0, volatility / 2, count)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0.0, volatility / 2, count)))
+    volume = rng.lognormal(0.0, 1.0, count) * 200000 / close
+    return {"open": open_, "high": high, "low": low, "close": close, "volume": volume}
+
+
+class SimulatedWebSocket:
+    """Приватный WebSocket симулятора с интерфейсом pybit WebSocket (для AccountStream)"""
+
+    def __init__(self, simulator: "ExchangeSimulator"):
+        self.simulator = simulator
+        self.callbacks: Dict[str, Callable] = {}
+        self.connected = True
+
+    def position_stream(self, callback):
+        self.callbacks["position"] = callback
+
+    def order_stream(self, callback):
+        self.callbacks["order"] = callback
+
+    def execution_stream(self, callback):
+        self.callbacks["execution"] = callback
+
+    def wallet_stream(self, callback):
+        self.callbacks["wallet"] = callback
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def exit(self):
+        self.connected = False
+        self.simulator.detach_websocket(self)
+
+    def deliver(self, topic: str, message: Dict):
+        callback = self.callbacks.get(topic)
+        if callback is not None and self.connected:
+            callback(message)
+
+
+class ExchangeSimulator:
+    def __init__(self, seed: int = 0, balance: float = 10000.0, leverage: float = 10.0,
+                 latency: Union[float, Dict[str, float]] = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 spread_bps: float = 2.0, volatility: float = 0.0008, history_bars: int = 20000,
+                 touch_fill_rate: float = 0.05, start_ms: int = DEFAULT_START_MS, synthetic: bool = True,
+                 realtime: bool = False, speed: float = 1.0):
+        """
+        Args:
+            seed: Зерно всех случайностей (цены, стакан, сделки, ошибки)
+            balance: Стартовый баланс USDT
+            leverage: Плечо новых позиций
+            latency: Задержка запроса в секундах: общая или {метод: секунды}
+            jitter: Случайная добавка к задержке, до jitter секунд
+            error_rate: Доля запросов, отвечающих retCode 10006 (превышение лимита)
+            spread_bps: Спред между лучшими bid и ask, б.п.
+            volatility: Стандартное отклонение минутной лог-доходности синтетики
+            history_bars: Сколько минутных свечей синтетики до стартового момента
+            touch_fill_rate: Вероятность за секунду, что лимитный ордер на лучшей цене
+                исполнят встречные рыночные ордера (без прохода цены через него)
+            start_ms: Стартовый момент часов симулятора
+            synthetic: Генерировать цены для символов без записанных свечей
+            realtime: Часы симулятора следуют за реальным временем (speed - ускорение)
+        """
+        self.seed = seed
+        self.leverage = leverage
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.spread_bps = spread_bps
+        self.volatility = volatility
+        self.history_bars = history_bars
+        self.touch_fill_rate = touch_fill_rate
+        self.synthetic = synthetic
+        self.realtime = realtime
+        self.speed = speed
+        self.start_ms = start_ms
+        self.now_ms = start_ms
+        self._wall_start = time.time()
+
+        self._lock = threading.RLock()
+        self._tapes: Dict[str, _Tape] = {}
+        self._steps: Dict[str, Dict[str, float]] = {}
+        self._positions: Dict[str, Dict] = {}
+        self._orders: Dict[str, Dict] = {}
+        self._order_seq = 0
+        self._exec_seq = 0
+        self._wallet = balance
+        self._sockets: List[SimulatedWebSocket] = []
+        self._outbox: List[Tuple[str, Dict]] = []
+        self._failures: Dict[str, List[Dict]] = {}
+        self._fault_rng = np.random.default_rng([seed, 7])
+        self._flow_rng = np.random.default_rng([seed, 11])
+        self.calls: Counter = Counter()
+
+    # ---------- данные ----------
+
+    @classmethod
+    def from_candle_store(cls, candle_store, interval: str = "60", symbols: List[str] = None,
+                          warmup_bars: int = 240, **kwargs) -> "ExchangeSimulator":
+        """
+        Симулятор, проигрывающий свечи из CandleStore
+
+        Часы стартуют после warmup_bars свечей (история для индикаторов) самого позднего символа.
+        """
+        kwargs.setdefault("synthetic", False)
+        simulator = cls(**kwargs)
+        starts = []
+        for symbol in symbols or candle_store.symbols(interval):
+            columns = candle_store.read(symbol, interval)
+            if columns is None:
+                logger.warning(f"Симулятор: нет свечей {symbol} ({interval}) в хранилище")
+                continue
+            simulator.load_candles(symbol, columns, interval)
+            timestamps = columns["timestamp"]
+            starts.append(int(timestamps[min(warmup_bars, len(timestamps) - 1)]))
+        if starts and "start_ms" not in kwargs:
+            simulator.start_ms = simulator.now_ms = max(starts)
+        return simulator
+
+    def load_candles(self, symbol: str, candles: Union[List[Dict], Dict[str, np.ndarray]], interval: str = "60"):
+        """
+        Загрузить записанные свечи символа (формат BybitService.get_kline или колонки CandleStore)
+        """
+        if isinstance(candles, dict):
+            columns = {name: np.asarray(candles[name]) for name in ("timestamp", "open", "high", "low", "close", "volume")}
+        else:
+            columns = {name: np.array([candle[name] for candle in candles])
+                       for name in ("timestamp", "open", "high", "low", "close", "volume")}
+        with self._lock:
+            self._tapes[symbol.upper()] = _Tape(INTERVAL_MINUTES[str(interval)] * MINUTE_MS, columns)
+
+    def _tape(self, symbol: str) -> Optional[_Tape]:
+        tape = self._tapes.get(symbol)
+        if tape is None:
+            if not self.synthetic or not symbol or not symbol.endswith("USDT"):
+                return None
+            base = DEFAULT_PRICES.get(symbol) or 0.5 + (_crc(symbol) % 20000) / 100
+            history = _synthetic_bars(np.random.default_rng([self.seed, _crc(symbol), 0]),
+                                      1.0, self.history_bars, self.volatility)
+            scale = base / history["close"][-1]
+            for name in ("open", "high", "low", "close"):
+                history[name] = history[name] * scale
+            history["volume"] = history["volume"] / scale
+            history["timestamp"] = self.start_ms - (self.history_bars - np.arange(self.history_bars, dtype=np.int64)) * MINUTE_MS
+            tape = _Tape(MINUTE_MS, history, rng=np.random.default_rng([self.seed, _crc(symbol), 1]),
+                         volatility=self.volatility)
+            self._tapes[symbol] = tape
+        tape.extend_to(self.now_ms)
+        return tape
+
+    def _symbols(self) -> List[str]:
+        symbols = set(self._tapes)
+        if self.synthetic:
+            symbols.update(DEFAULT_PRICES)
+        return sorted(symbols)
+
+    def _instrument(self, symbol: str, price: float) -> Dict[str, float]:
+        """Шаг цены и объема по порядку первой цены символа (как у инструментов Bybit)"""
+        steps = self._steps.get(symbol)
+        if steps is None:
+            exponent = int(math.floor(math.log10(price)))
+            tick = 10.0 ** (exponent - 4)
+            qty_step = min(10.0 ** (1 - exponent), 1.0) if exponent >= 1 else 1.0
+            steps = self._steps[symbol] = {"tick": tick, "qty_step": qty_step}
+        return steps
+
+    def price(self, symbol: str) -> Optional[float]:
+        """Текущая цена символа по часам симулятора"""
+        with self._lock:
+            tape = self._tape(symbol.upper())
+            return tape.price_at(self.now_ms) if tape else None
+
+    def _quote(self, symbol: str) -> Optional[Dict[str, float]]:
+        tape = self._tape(symbol)
+        if tape is None:
+            return None
+        price = tape.price_at(self.now_ms)
+        steps = self._instrument(symbol, price)
+        tick = steps["tick"]
+        half_spread = price * self.spread_bps / 20000
+        bid = _round_step(price - half_spread, tick, ROUND_DOWN)
+        ask = max(_round_step(price + half_spread, tick, ROUND_UP), bid + tick)
+        return {"price": price, "bid": bid, "ask": ask, "tick": tick, "qty_step": steps["qty_step"]}
+
+    # ---------- часы и сопоставление ----------
+
+    def advance(self, seconds: float):
+        """Сдвинуть часы симулятора: исполнить лимитные ордера, TP/SL и ликвидации по пути цены"""
+        with self._lock:
+            self._advance_to(self.now_ms + int(seconds * 1000))
+            messages, self._outbox = self._outbox, []
+        self._dispatch(messages)
+
+    def _sync_clock(self):
+        target = self.start_ms + int((time.time() - self._wall_start) * 1000 * self.speed)
+        if target > self.now_ms:
+            self._advance_to(target)
+
+    def _advance_to(self, target_ms: int):
+        previous_ms, self.now_ms = self.now_ms, target_ms
+        symbols = {order["symbol"] for order in self._orders.values() if order["orderStatus"] in OPEN_ORDER_STATUSES}
+        symbols.update(self._positions)
+        for symbol in sorted(symbols):
+            tape = self._tape(symbol)
+            if tape is None:
+                continue
+            # Путь цены: от прежней цены до новой, между ними - полные экстремумы пройденных свечей
+            prices = [tape.price_at(previous_ms), tape.price_at(target_ms)]
+            first, last = tape.index_at(previous_ms), tape.index_at(target_ms)
+            if last > first:
+                prices += [float(tape.close[first]), float(tape.open[last])]
+            low, high = min(prices), max(prices)
+            if last > first + 1:
+                low = min(low, float(tape.low[first + 1:last].min()))
+                high = max(high, float(tape.high[first + 1:last].max()))
+            self._match(symbol, low, high, (target_ms - previous_ms) / 1000)
+
+    def _match(self, symbol: str, low: float, high: float, elapsed: float):
+        quote = self._quote(symbol)
+        touch_probability = 1 - (1 - self.touch_fill_rate) ** elapsed if self.touch_fill_rate > 0 else 0.0
+        for order in sorted(self._orders.values(), key=lambda item: item["seq"]):
+            if order["symbol"] != symbol or order["orderStatus"] not in OPEN_ORDER_STATUSES:
+                continue
+            price = float(order["price"])
+            buy = order["side"] == "Buy"
+            traded_through = low <= price if buy else high >= price
+            at_touch = price >= quote["bid"] if buy else price <= quote["ask"]
+            if traded_through or (at_touch and self._flow_rng.random() < touch_probability):
+                self._fill(order, _float(order["leavesQty"]), price, maker=True)
+
+        position = self._positions.get(symbol)
+        if not position:
+            return
+        long = position["side"] == "Buy"
+        stop_loss, take_profit = _float(position["stopLoss"]), _float(position["takeProfit"])
+        liq_price = self._liq_price(position)
+        if stop_loss and ((long and low <= stop_loss) or (not long and high >= stop_loss)):
+            self._close_position(symbol, stop_loss, "StopLoss")
+        elif (long and low <= liq_price) or (not long and high >= liq_price):
+            self._close_position(symbol, liq_price, "", exec_type="BustTrade")
+        elif take_profit and ((long and high >= take_profit) or (not long and low <= take_profit)):
+            self._close_position(symbol, take_profit, "TakeProfit")
+
+    def _liq_price(self, position: Dict) -> float:
+        avg_price, leverage = position["avg_price"], position["leverage"]
+        if position["side"] == "Buy":
+            return avg_price * (1 - 1 / leverage + MAINTENANCE_MARGIN_RATE)
+        return avg_price * (1 + 1 / leverage - MAINTENANCE_MARGIN_RATE)
+
+    def _close_position(self, symbol: str, price: float, stop_order_type: str, exec_type: str = "Trade"):
+        position = self._positions[symbol]
+        order = self._new_order(symbol, "Sell" if position["side"] == "Buy" else "Buy", position["size"],
+                                "Market", price, "IOC", reduce_only=True)
+        order["stopOrderType"] = stop_order_type
+        self._fill(order, position["size"], price, maker=False, exec_type=exec_type)
+
+    # ---------- ордера и позиции ----------
+
+    def _new_order(self, symbol: str, side: str, qty: float, order_type: str, price: float,
+                   time_in_force: str, reduce_only: bool = False, stop_loss: str = "", take_profit: str = "",
+                   order_link_id: str = "") -> Dict:
+        self._order_seq += 1
+        quote = self._quote(symbol)
+        order = {
+            "seq": self._order_seq,
+            "orderId": f"sim-{self._order_seq:08d}",
+            "orderLinkId": order_link_id,
+            "category": "linear",
+            "symbol": symbol,
+            "side": side,
+            "orderType": order_type,
+            "price": _fmt(price, quote["tick"]),
+            "qty": _fmt(qty, quote["qty_step"]),
+            "leavesQty": _fmt(qty, quote["qty_step"]),
+            "cumExecQty": "0",
+            "cumExecValue": "0",
+            "cumExecFee": "0",
+            "avgPrice": "",
+            "orderStatus": "New",
+            "timeInForce": time_in_force,
+            "reduceOnly": reduce_only,
+            "stopLoss": stop_loss,
+            "takeProfit": take_profit,
+            "tpslMode": "Full" if stop_loss or take_profit else "",
+            "stopOrderType": "",
+            "positionIdx": 0,
+            "createdTime": str(self.now_ms),
+            "updatedTime": str(self.now_ms),
+        }
+        self._orders[order["orderId"]] = order
+        return order
+
+    def _order_view(self, order: Dict) -> Dict:
+        return {key: value for key, value in order.items() if key != "seq"}
+
+    def _fill(self, order: Dict, qty: float, price: float, maker: bool, exec_type: str = "Trade"):
+        symbol = order["symbol"]
+        quote = self._quote(symbol)
+        fee = qty * price * (MAKER_FEE if maker else TAKER_FEE)
+        self._wallet -= fee
+        self._apply_fill(symbol, order["side"], qty, price, order)
+
+        cum_qty = _float(order["cumExecQty"]) + qty
+        cum_value = _float(order["cumExecValue"]) + qty * price
+        order["cumExecQty"] = _fmt(cum_qty, quote["qty_step"])
+        order["cumExecValue"] = str(round(cum_value, 8))
+        order["cumExecFee"] = str(round(_float(order["cumExecFee"]) + fee, 8))
+        order["avgPrice"] = _fmt(cum_value / cum_qty, quote["tick"] / 10)
+        leaves = max(_round_step(_float(order["qty"]) - cum_qty, quote["qty_step"], ROUND_UP), 0.0)
+        order["leavesQty"] = _fmt(leaves, quote["qty_step"])
+        order["orderStatus"] = "PartiallyFilled" if leaves > 0 else "Filled"
+        order["updatedTime"] = str(self.now_ms)
+
+        self._exec_seq += 1
+        self._emit("execution", {
+            "category": "linear",
+            "symbol": symbol,
+            "execId": f"sim-exec-{self._exec_seq:08d}",
+            "orderId": order["orderId"],
+            "orderLinkId": order["orderLinkId"],
+            "side": order["side"],
+            "orderType": order["orderType"],
+            "stopOrderType": order["stopOrderType"],
+            "execType": exec_type,
+            "execPrice": _fmt(price, quote["tick"]),
+            "execQty": _fmt(qty, quote["qty_step"]),
+            "execValue": str(round(qty * price, 8)),
+            "execFee": str(round(fee, 8)),
+            "feeRate": str(MAKER_FEE if maker else TAKER_FEE),
+            "isMaker": maker,
+            "leavesQty": order["leavesQty"],
+            "execTime": str(self.now_ms),
+        })
+        self._emit("order", self._order_view(order))
+        self._emit("wallet", self._wallet_view())
+
+    def _apply_fill(self, symbol: str, side: str, qty: float, price: float, order: Dict):
+        position = self._positions.get(symbol)
+        if position is None or position["side"] == side:
+            if position is None:
+                position = {"side": side, "size": 0.0, "avg_price": 0.0, "leverage": self.leverage,
+                            "stopLoss": "", "takeProfit": "", "realised": 0.0, "createdTime": str(self.now_ms)}
+                self._positions[symbol] = position
+            size = position["size"] + qty
+            position["avg_price"] = (position["avg_price"] * position["size"] + price * qty) / size
+            position["size"] = size
+            if order["stopLoss"]:
+                position["stopLoss"] = order["stopLoss"]
+            if order["takeProfit"]:
+                position["takeProfit"] = order["takeProfit"]
+        else:
+            closed = min(qty, position["size"])
+            direction = 1 if position["side"] == "Buy" else -1
+            pnl = (price - position["avg_price"]) * closed * direction
+            self._wallet += pnl
+            position["realised"] += pnl
+            position["size"] = _round_step(position["size"] - closed, self._quote(symbol)["qty_step"], ROUND_UP)
+            remainder = qty - closed
+            if position["size"] <= 0:
+                del self._positions[symbol]
+                self._emit("position", self._position_view(symbol, closed_from=position))
+                if remainder > 0 and not order["reduceOnly"]:
+                    self._apply_fill(symbol, side, remainder, price, order)
+                return
+        position["updatedTime"] = str(self.now_ms)
+        self._emit("position", self._position_view(symbol))
+
+    def _position_view(self, symbol: str, closed_from: Dict = None) -> Dict:
+        """Позиция в формате get_positions / топика position (без позиции - size 0)"""
+        position = self._positions.get(symbol)
+        quote = self._quote(symbol)
+        mark = quote["price"] if quote else 0.0
+        if position is None:
+            return {
+                "category": "linear", "symbol": symbol, "side": "", "size": "0", "avgPrice": "0",
+                "positionValue": "0", "markPrice": _fmt(mark, quote["tick"]) if quote else "0",
+                "unrealisedPnl": "0", "cumRealisedPnl": str(round(closed_from["realised"], 8)) if closed_from else "0",
+                "leverage": str(self.leverage), "liqPrice": "", "stopLoss": "", "takeProfit": "",
+                "tpslMode": "Full", "positionIdx": 0, "positionStatus": "Normal",
+                "createdTime": closed_from["createdTime"] if closed_from else "", "updatedTime": str(self.now_ms),
+            }
+        direction = 1 if position["side"] == "Buy" else -1
+        return {
+            "category": "linear",
+            "symbol": symbol,
+            "side": position["side"],
+            "size": _fmt(position["size"], quote["qty_step"]),
+            "avgPrice": _fmt(position["avg_price"], quote["tick"] / 10),
+            "positionValue": str(round(position["size"] * position["avg_price"], 8)),
+            "markPrice": _fmt(mark, quote["tick"]),
+            "unrealisedPnl": str(round((mark - position["avg_price"]) * position["size"] * direction, 8)),
+            "cumRealisedPnl": str(round(position["realised"], 8)),
+            "leverage": str(position["leverage"]),
+            "liqPrice": _fmt(self._liq_price(position), quote["tick"]),
+            "stopLoss": position["stopLoss"],
+            "takeProfit": position["takeProfit"],
+            "tpslMode": "Full",
+            "positionIdx": 0,
+            "positionStatus": "Normal",
+            "createdTime": position["createdTime"],
+            "updatedTime": position.get("updatedTime", position["createdTime"]),
+        }
+
+    def _wallet_view(self) -> Dict:
+        unrealised = 0.0
+        margin = 0.0
+        for symbol, position in self._positions.items():
+            mark = self._quote(symbol)["price"]
+            direction = 1 if position["side"] == "Buy" else -1
+            unrealised += (mark - position["avg_price"]) * position["size"] * direction
+            margin += position["avg_price"] * position["size"] / position["leverage"]
+        equity = self._wallet + unrealised
+        return {
+            "accountType": "UNIFIED",
+            "totalWalletBalance": f"{self._wallet:.8f}",
+            "totalEquity": f"{equity:.8f}",
+            "totalMarginBalance": f"{equity:.8f}",
+            "totalAvailableBalance": f"{equity - margin:.8f}",
+            "totalPerpUPL": f"{unrealised:.8f}",
+            "coin": [{"coin": "USDT", "walletBalance": f"{self._wallet:.8f}", "equity": f"{equity:.8f}",
+                      "unrealisedPnl": f"{unrealised:.8f}", "totalPositionIM": f"{margin:.8f}"}],
+        }
+
+    def _check_tp_sl(self, side: str, base_price: float, stop_loss: str, take_profit: str,
+                     base_name: str = "LastPrice") -> Optional[str]:
+        """Ошибка уровней в формате Bybit (None - уровни допустимы)"""
+        below, above = ("lower", "higher") if side == "Buy" else ("higher", "lower")
+        if stop_loss and _float(stop_loss) > 0:
+            wrong = _float(stop_loss) >= base_price if side == "Buy" else _float(stop_loss) <= base_price
+            if wrong:
+                return f"StopLoss:{stop_loss} set for {side} position should {below} than base_price:{base_price}??{base_name}"
+        if take_profit and _float(take_profit) > 0:
+            wrong = _float(take_profit) <= base_price if side == "Buy" else _float(take_profit) >= base_price
+            if wrong:
+                return f"TakeProfit:{take_profit} set for {side} position should {above} than base_price:{base_price}??{base_name}"
+        return None
+
+    def _place_order(self, symbol: str, side: str, orderType: str, qty, price=None, timeInForce: str = None,
+                     reduceOnly: bool = False, stopLoss: str = None, takeProfit: str = None,
+                     orderLinkId: str = "", **_) -> Tuple[Optional[Dict], Optional[Tuple[int, str]]]:
+        """Разместить ордер: (ордер, None) или (None, (retCode, retMsg))"""
+        quote = self._quote(symbol)
+        if quote is None:
+            return None, (10001, "params error: symbol invalid")
+        if side not in ("Buy", "Sell") or orderType not in ("Market", "Limit"):
+            return None, (10001, "params error: side or orderType invalid")
+        qty = _float(qty)
+        if qty < quote["qty_step"] or _round_step(qty, quote["qty_step"]) != round(qty, 12):
+            return None, (10001, "Qty invalid")
+        position = self._positions.get(symbol)
+        reduce_only = bool(reduceOnly) and str(reduceOnly).lower() != "false"
+        if reduce_only:
+            if position is None or position["side"] == side:
+                return None, (110017, "current position is zero, cannot fix reduce-only order qty")
+            qty = min(qty, position["size"])
+        opening = not reduce_only and (position is None or position["side"] == side)
+
+        crossing_price = quote["ask"] if side == "Buy" else quote["bid"]
+        if orderType == "Limit":
+            if not price:
+                return None, (10001, "params error: price is required for limit order")
+            limit_price = _round_step(_float(price), quote["tick"])
+            crosses = limit_price >= quote["ask"] if side == "Buy" else limit_price <= quote["bid"]
+        else:
+            limit_price, crosses = crossing_price, True
+
+        stop_loss = str(stopLoss) if stopLoss and opening else ""
+        take_profit = str(takeProfit) if takeProfit and opening else ""
+        if stop_loss or take_profit:
+            error = self._check_tp_sl(side, crossing_price if crosses else limit_price, stop_loss, take_profit)
+            if error:
+                return None, (10001, error)
+        if opening:
+            wallet = self._wallet_view()
+            if qty * limit_price / self.leverage > _float(wallet["totalAvailableBalance"]):
+                return None, (110007, "ab not enough for new order")
+
+        time_in_force = timeInForce or ("IOC" if orderType == "Market" else "GTC")
+        order = self._new_order(symbol, side, qty, orderType, limit_price, time_in_force, reduce_only,
+                                stop_loss, take_profit, orderLinkId)
+        if crosses and time_in_force == "PostOnly":
+            # PostOnly, пересекающий стакан, принимается и сразу отменяется биржей
+            order["orderStatus"] = "Cancelled"
+            order["cancelType"] = "CancelByPostOnly"
+            self._emit("order", self._order_view(order))
+        elif crosses:
+            self._fill(order, qty, crossing_price, maker=False)
+        else:
+            self._emit("order", self._order_view(order))
+        return order, None
+
+    # ---------- события ----------
+
+    def websocket(self, **_) -> SimulatedWebSocket:
+        """Фабрика приватного потока (AccountStream(websocket_factory=simulator.websocket))"""
+        socket = SimulatedWebSocket(self)
+        with self._lock:
+            self._sockets.append(socket)
+        return socket
+
+    def detach_websocket(self, socket: SimulatedWebSocket):
+        with self._lock:
+            if socket in self._sockets:
+                self._sockets.remove(socket)
+
+    def _emit(self, topic: str, data: Dict):
+        if self._sockets:
+            self._outbox.append((topic, data))
+
+    def _dispatch(self, messages: List[Tuple[str, Dict]]):
+        """Разослать события вне блокировки (обработчики могут обращаться к симулятору)"""
+        if not messages:
+            return
+        sockets = list(self._sockets)
+        for topic, data in messages:
+            message = {"topic": topic, "creationTime": self.now_ms, "data": [dict(data)]}
+            for socket in sockets:
+                socket.deliver(topic, message)
+
+    # ---------- задержки и ошибки ----------
+
+    def inject_error(self, method: str, ret_code: int = 10016, ret_msg: str = "Internal server error",
+                     count: int = 1, exception: Exception = None):
+        """
+        Следующие count вызовов method ответят ошибкой (или выбросят exception - таймаут сети)
+        """
+        with self._lock:
+            self._failures.setdefault(method, []).extend(
+                [{"ret_code": ret_code, "ret_msg": ret_msg, "exception": exception}] * count
+            )
+
+    def _before_request(self, name: str) -> Optional[Dict]:
+        with self._lock:
+            self.calls[name] += 1
+            queued = self._failures.get(name)
+            failure = queued.pop(0) if queued else None
+            random_failure = self.error_rate > 0 and self._fault_rng.random() < self.error_rate
+            delay = self.latency.get(name, 0.0) if isinstance(self.latency, dict) else self.latency
+            if self.jitter:
+                delay += float(self._fault_rng.random()) * self.jitter
+        if delay > 0:
+            time.sleep(delay)
+        if failure is not None:
+            if failure["exception"] is not None:
+                raise failure["exception"]
+            return _error(failure["ret_code"], failure["ret_msg"], self.now_ms)
+        if random_failure:
+            return _error(10006, "Too many visits!", self.now_ms)
+        return None
+
+    # ---------- REST: рынок ----------
+
+    @_endpoint
+    def get_tickers(self, category: str = "linear", symbol: str = None, **_):
+        items = []
+        for name in ([symbol] if symbol else self._symbols()):
+            quote = self._quote(name)
+            if quote is None:
+                continue
+            tape = self._tape(name)
+            index = tape.index_at(self.now_ms)
+            day_ago = max(index - (1440 * MINUTE_MS) // tape.bar_ms, 0)
+            tick = quote["tick"]
+            items.append({
+                "symbol": name,
+                "lastPrice": _fmt(quote["price"], tick),
+                "markPrice": _fmt(quote["price"], tick),
+                "indexPrice": _fmt(quote["price"], tick),
+                "bid1Price": _fmt(quote["bid"], tick),
+                "bid1Size": "1",
+                "ask1Price": _fmt(quote["ask"], tick),
+                "ask1Size": "1",
+                "prevPrice24h": _fmt(float(tape.close[day_ago]), tick),
+                "price24hPcnt": f"{quote['price'] / float(tape.close[day_ago]) - 1:.6f}",
+                "highPrice24h": _fmt(float(tape.high[day_ago:index + 1].max()), tick),
+                "lowPrice24h": _fmt(float(tape.low[day_ago:index + 1].min()), tick),
+                "volume24h": f"{float(tape.volume[day_ago:index + 1].sum()):.4f}",
+                "turnover24h": f"{float((tape.volume[day_ago:index + 1] * tape.close[day_ago:index + 1]).sum()):.4f}",
+                "fundingRate": "0.0001",
+                "openInterest": f"{(_crc(name) % 1000 + 100) * 1000 / quote['price']:.4f}",
+            })
+        if symbol and not items:
+            return _error(10001, "params error: symbol invalid", self.now_ms)
+        return _ok({"category": category, "list": items}, now_ms=self.now_ms)
+
+    @_endpoint
+    def get_kline(self, category: str = "linear", symbol: str = None, interval: str = "60", limit: int = 200,
+                  start: int = None, end: int = None, **_):
+        tape = self._tape(symbol) if symbol else None
+        if tape is None:
+            return _error(10001, "params error: symbol invalid", self.now_ms)
+        interval_ms = max(INTERVAL_MINUTES.get(str(interval), 60) * MINUTE_MS, tape.bar_ms)
+        limit = min(max(int(limit or 200), 1), 1000)
+        last = tape.index_at(min(int(end), self.now_ms) if end else self.now_ms)
+        if tape.ts[last] > self.now_ms:
+            return _ok({"category": category, "symbol": symbol, "list": []}, now_ms=self.now_ms)
+        first_bucket = (int(tape.ts[last]) // interval_ms - limit + 1) * interval_ms
+        if start:
+            first_bucket = max(first_bucket, int(start) // interval_ms * interval_ms)
+        first = int(np.searchsorted(tape.ts, first_bucket, side="left"))
+        ts = tape.ts[first:last + 1]
+        if len(ts) == 0:
+            return _ok({"category": category, "symbol": symbol, "list": []}, now_ms=self.now_ms)
+        buckets = ts // interval_ms
+        starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+        ends = np.concatenate((starts[1:], [len(ts)])) - 1
+        opens = tape.open[first:last + 1][starts]
+        closes = tape.close[first:last + 1][ends]
+        highs = np.maximum.reduceat(tape.high[first:last + 1], starts)
+        lows = np.minimum.reduceat(tape.low[first:last + 1], starts)
+        volumes = np.add.reduceat(tape.volume[first:last + 1], starts)
+        turnovers = np.add.reduceat(tape.volume[first:last + 1] * tape.close[first:last + 1], starts)
+        tick = self._quote(symbol)["tick"]
+        rows = [
+            [str(int(buckets[s]) * interval_ms), _fmt(o, tick), _fmt(h, tick), _fmt(lo, tick), _fmt(c, tick),
+             f"{v:.4f}", f"{t:.4f}"]
+            for s, o, h, lo, c, v, t in zip(starts, opens, highs, lows, closes, volumes, turnovers)
+        ]
+        # Bybit отдает свечи от новой к старой
+        return _ok({"category": category, "symbol": symbol, "list": rows[::-1]}, now_ms=self.now_ms)
+
+    @_endpoint
+    def get_orderbook(self, category: str = "linear", symbol: str = None, limit: int = 25, **_):
+        quote = self._quote(symbol) if symbol else None
+        if quote is None:
+            return _error(10001, "params error: symbol invalid", self.now_ms)
+        depth = min(max(int(limit or 25), 1), 200)
+        rng = np.random.default_rng([self.seed, _crc(symbol), self.now_ms // MINUTE_MS, 2])
+        step = max(quote["tick"], _round_step(quote["price"] * 0.0002, quote["tick"]))
+        sizes = rng.lognormal(0.0, 1.0, (2, depth)) * 20000 / quote["price"]
+        qty_step = quote["qty_step"]
+        bids = [[_fmt(quote["bid"] - i * step, quote["tick"]), _fmt(max(_round_step(size, qty_step), qty_step), qty_step)]
+                for i, size in enumerate(sizes[0])]
+        asks = [[_fmt(quote["ask"] + i * step, quote["tick"]), _fmt(max(_round_step(size, qty_step), qty_step), qty_step)]
+                for i, size in enumerate(sizes[1])]
+        return _ok({"s": symbol, "b": bids, "a": asks, "ts": self.now_ms, "u": self.now_ms // 100}, now_ms=self.now_ms)
+
+    @_endpoint
+    def get_public_trade(self, category: str = "linear", symbol: str = None, limit: int = 500, **_):
+        quote = self._quote(symbol) if symbol else None
+        if quote is None:
+            return _error(10001, "params error: symbol invalid", self.now_ms)
+        count = min(max(int(limit or 500), 1), 1000)
+        rng = np.random.default_rng([self.seed, _crc(symbol), self.now_ms // MINUTE_MS, 3])
+        sides = rng.random(count) < 0.5
+        sizes = rng.lognormal(0.0, 1.5, count) * 2000 / quote["price"]
+        trades = []
+        for i in range(count):
+            buy = bool(sides[i])
+            trades.append({
+                "execId": f"sim-trade-{self.now_ms}-{i}",
+                "symbol": symbol,
+                "price": _fmt(quote["ask"] if buy else quote["bid"], quote["tick"]),
+                "size": _fmt(max(_round_step(float(sizes[i]), quote["qty_step"]), quote["qty_step"]), quote["qty_step"]),
+                "side": "Buy" if buy else "Sell",
+                "time": str(self.now_ms - i * 250),
+                "isBlockTrade": False,
+            })
+        return _ok({"category": category, "list": trades}, now_ms=self.now_ms)
+
+    @_endpoint
+    def get_instruments_info(self, category: str = "linear", symbol: str = None, limit: int = 500,
+                             cursor: str = None, **_):
+        items = []
+        for name in ([symbol] if symbol else self._symbols()):
+            quote = self._quote(name)
+            if quote is None:
+                continue
+            tick, qty_step = quote["tick"], quote["qty_step"]
+            items.append({
+                "symbol": name,
+                "contractType": "LinearPerpetual",
+                "status": "Trading",
+                "baseCoin": name[:-4],
+                "quoteCoin": "USDT",
+                "settleCoin": "USDT",
+                "priceScale": str(_decimals(tick)),
+                "leverageFilter": {"minLeverage": "1", "maxLeverage": "50.00", "leverageStep": "0.01"},
+                "priceFilter": {"minPrice": _fmt(tick, tick), "maxPrice": "1999999", "tickSize": _fmt(tick, tick)},
+                "lotSizeFilter": {"minOrderQty": _fmt(qty_step, qty_step), "qtyStep": _fmt(qty_step, qty_step),
+                                  "maxOrderQty": _fmt(qty_step * 1000000, qty_step),
+                                  "maxMktOrderQty": _fmt(qty_step * 100000, qty_step),
+                                  "minNotionalValue": "5"},
+            })
+        page, next_cursor = _page(items, limit, cursor)
+        return _ok({"category": category, "list": page, "nextPageCursor": next_cursor}, now_ms=self.now_ms)
+
+    @_endpoint
+    def get_funding_rate_history(self, category: str = "linear", symbol: str = None, limit: int = 200, **_):
+        if self._quote(symbol) is None:
+            return _error(10001, "params error: symbol invalid", self.now_ms)
+        funding_ms = self.now_ms // (8 * 60 * MINUTE_MS) * (8 * 60 * MINUTE_MS)
+        items = [{"symbol": symbol, "fundingRate": "0.0001", "fundingRateTimestamp": str(funding_ms)}]
+        return _ok({"category": category, "list": items}, now_ms=self.now_ms)
+
+    @_endpoint
+    def get_open_interest(self, category: str = "linear", symbol: str = None, intervalTime: str = "5min",
+                          limit: int = 50, **_):
+        quote = self._quote(symbol) if symbol else None
+        if quote is None:
+            return _error(10001, "params error: symbol invalid", self.now_ms)
+        items = [{"openInterest": f"{(_crc(symbol) % 1000 + 100) * 1000 / quote['price']:.4f}",
+                  "timestamp": str(self.now_ms // 300000 * 300000)}]
+        return _ok({"category": category, "symbol": symbol, "list": items}, now_ms=self.now_ms)
+
+    # ---------- REST: счет ----------
+
+    @_endpoint
+    def get_wallet_balance(self, accountType: str = "UNIFIED", **_):
+        return _ok({"list": [self._wallet_view()]}, now_ms=self.now_ms)
+
+    @_endpoint
+    def get_positions(self, category: str = "linear", symbol: str = None, settleCoin: str = None,
+                      limit: int = 20, cursor: str = None, **_):
+        if symbol:
+            if self._quote(symbol) is None:
+                return _error(10001, "params error: symbol invalid", self.now_ms)
+            items = [self._position_view(symbol)]
+        elif settleCoin:
+            items = [self._position_view(name) for name in sorted(self._positions)]
+        else:
+            return _error(10001, "params error: symbol or settleCoin is required", self.now_ms)
+        page, next_cursor = _page(items, limit, cursor)
+        return _ok({"category": category, "list": page, "nextPageCursor": next_cursor}, now_ms=self.now_ms)
+
+    @_endpoint
+    def get_open_orders(self, category: str = "linear", symbol: str = None, orderId: str = None,
+                        limit: int = 20, cursor: str = None, **_):
+        if orderId:
+            order = self._orders.get(orderId)
+            items = [self._order_view(order)] if order and (not symbol or order["symbol"] == symbol) else []
+        else:
+            items = [self._order_view(order) for order in sorted(self._orders.values(), key=lambda item: -item["seq"])
+                     if order["orderStatus"] in OPEN_ORDER_STATUSES and (not symbol or order["symbol"] == symbol)]
+        page, next_cursor = _page(items, limit, cursor)
+        return _ok({"category": category, "list": page, "nextPageCursor": next_cursor}, now_ms=self.now_ms)
+
+    # ---------- REST: торговля ----------
+
+    @_endpoint
+    def place_order(self, category: str = "linear", **params):
+        order, error = self._place_order(**params)
+        if error:
+            return _error(*error, now_ms=self.now_ms)
+        return _ok({"orderId": order["orderId"], "orderLinkId": order["orderLinkId"]}, now_ms=self.now_ms)
+
+    @_endpoint
+    def place_batch_order(self, category: str = "linear", request: List[Dict] = None, **_):
+        results, statuses = [], []
+        for params in request or []:
+            order, error = self._place_order(**params)
+            results.append({"category": category, "symbol": params.get("symbol"),
+                            "orderId": order["orderId"] if order else "",
+                            "orderLinkId": order["orderLinkId"] if order else "",
+                            "createAt": str(self.now_ms)})
+            statuses.append({"code": error[0], "msg": error[1]} if error else {"code": 0, "msg": "OK"})
+        return _ok({"list": results}, ret_ext_info={"list": statuses}, now_ms=self.now_ms)
+
+    @_endpoint
+    def amend_order(self, category: str = "linear", symbol: str = None, orderId: str = None,
+                    price: str = None, qty: str = None, **_):
+        order = self._orders.get(orderId)
+        if order is None or order["orderStatus"] not in OPEN_ORDER_STATUSES:
+            return _error(110001, "order not exists or too late to replace", self.now_ms)
+        quote = self._quote(order["symbol"])
+        if qty is not None:
+            new_qty = _float(qty)
+            if new_qty <= _float(order["cumExecQty"]):
+                return _error(10001, "Qty invalid", self.now_ms)
+            order["qty"] = _fmt(new_qty, quote["qty_step"])
+            order["leavesQty"] = _fmt(new_qty - _float(order["cumExecQty"]), quote["qty_step"])
+        if price is not None:
+            new_price = _round_step(_float(price), quote["tick"])
+            if _fmt(new_price, quote["tick"]) == order["price"] and qty is None:
+                return _error(10001, "The order remains unchanged as the parameters entered match the existing ones.",
+                              self.now_ms)
+            order["price"] = _fmt(new_price, quote["tick"])
+            crosses = new_price >= quote["ask"] if order["side"] == "Buy" else new_price <= quote["bid"]
+            if crosses and order["timeInForce"] == "PostOnly":
+                order["orderStatus"] = "Cancelled"
+                order["cancelType"] = "CancelByPostOnly"
+            elif crosses:
+                self._fill(order, _float(order["leavesQty"]), quote["ask"] if order["side"] == "Buy" else quote["bid"],
+                           maker=False)
+        order["updatedTime"] = str(self.now_ms)
+        self._emit("order", self._order_view(order))
+        return _ok({"orderId": orderId, "orderLinkId": order["orderLinkId"]}, now_ms=self.now_ms)
+
+    @_endpoint
+    def cancel_order(self, category: str = "linear", symbol: str = None, orderId: str = None, **_):
+        order = self._orders.get(orderId)
+        if order is None or order["orderStatus"] not in OPEN_ORDER_STATUSES:
+            return _error(110001, "order not exists or too late to cancel", self.now_ms)
+        order["orderStatus"] = "PartiallyFilledCanceled" if _float(order["cumExecQty"]) > 0 else "Cancelled"
+        order["cancelType"] = "CancelByUser"
+        order["updatedTime"] = str(self.now_ms)
+        self._emit("order", self._order_view(order))
+        return _ok({"orderId": orderId, "orderLinkId": order["orderLinkId"]}, now_ms=self.now_ms)
+
+    @_endpoint
+    def cancel_all_orders(self, category: str = "linear", symbol: str = None, orderFilter: str = None, **_):
+        cancelled = []
+        if orderFilter not in ("tpslOrder", "StopOrder"):
+            # Условных ордеров симулятор не хранит: TP/SL - уровни позиции
+            for order in self._orders.values():
+                if order["orderStatus"] in OPEN_ORDER_STATUSES and (not symbol or order["symbol"] == symbol):
+                    order["orderStatus"] = "Cancelled"
+                    order["cancelType"] = "CancelByUser"
+                    self._emit("order", self._order_view(order))
+                    cancelled.append({"orderId": order["orderId"], "orderLinkId": order["orderLinkId"]})
+        return _ok({"list": cancelled}, now_ms=self.now_ms)
+
+    @_endpoint
+    def set_trading_stop(self, category: str = "linear", symbol: str = None, stopLoss: str = None,
+                         takeProfit: str = None, positionIdx: int = 0, **_):
+        position = self._positions.get(symbol)
+        if position is None:
+            return _error(10001, "can not set tp/sl/ts for zero position", self.now_ms)
+        error = self._check_tp_sl(position["side"], self._quote(symbol)["price"], stopLoss, takeProfit, "MarkPrice")
+        if error:
+            return _error(10001, error, self.now_ms)
+        changed = False
+        for key, value in (("stopLoss", stopLoss), ("takeProfit", takeProfit)):
+            if value is None:
+                continue
+            value = "" if _float(value) == 0 else str(value)
+            if _float(position[key]) != _float(value):
+                position[key] = value
+                changed = True
+        if not changed:
+            return _error(34040, "not modified", self.now_ms)
+        position["updatedTime"] = str(self.now_ms)
+        self._emit("position", self._position_view(symbol))
+        return _ok({}, now_ms=self.now_ms)
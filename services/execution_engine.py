@@ -0,0 +1,340 @@
+"""
+Исполнение ордеров на вход: мейкер с догоном цены, рыночный добор по дедлайну, телеметрия
+
+Стратегия "maker": лимитный PostOnly по лучшей цене своей стороны стакана (bid для покупки,
+ask для продажи). Каждые chase_interval секунд ордер переставляется за ценой, если она ушла;
+отмененный биржей PostOnly (пересек стакан) выставляется заново. По истечении
+maker_deadline остаток отменяется и добирается рыночным ордером. Если вызывающему задан общий
+срок (deadline, например бюджет цикла автозакупки), мейкер-фаза заканчивается раньше, чтобы
+рыночный добор успел до него.
+Стратегия "market": сразу рыночный ордер.
+
+По каждому исполнению записываются моменты решения, отправки, подтверждения биржей
+и исполнения, ожидаемая и средняя цена исполнения, мейкер/тейкер объем, оценка комиссии
+и экономии относительно рыночного входа - в таблицу order_executions.
+
+Методы блокирующие (ожидание - time.sleep), вызываются из потока (OrderManager).
+"""
+import logging
+import time
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from services.trading_rules import MAKER_FEE, TAKER_FEE
+import config
+
+logger = logging.getLogger(__name__)
+
+EXECUTION_INSERT_QUERY = """
+            INSERT INTO order_executions (
+                bot_name, symbol, side, strategy, execution_type, status, qty, filled_qty, maker_qty, taker_qty,
+                expected_price, avg_price, slippage_bps, fee_estimate, fee_saved, reprices,
+                decision_time, send_time, ack_time, fill_time, decision_to_fill_ms, order_ids, error_message
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """
+FINAL_ORDER_STATUSES = ("Filled", "Cancelled", "Rejected", "Deactivated", "PartiallyFilledCanceled")
+MARKET_FILL_POLLS = 5
+MARKET_FILL_POLL_SECONDS = 0.2
+MARKET_RESERVE_SECONDS = 2.0  # Запас до общего срока на рыночный добор и проверку его исполнения
+
+
+def _float(value, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _subtract_qty(qty: float, filled: float) -> float:
+    """Остаток без ошибок двоичного округления (шаг объема сохраняется)"""
+    return float(Decimal(str(qty)) - Decimal(str(filled)))
+
+
+class ExecutionEngine:
+    def __init__(self, bybit_service, db_service=None, maker_deadline: float = None,
+                 chase_interval: float = None, bot_name: str = None):
+        """
+        Args:
+            bybit_service: BybitService
+            db_service: DatabaseService для записи исполнений (None - только в лог)
+            maker_deadline: Сколько секунд ждать мейкер-исполнения (по умолчанию config.EXECUTION_MAKER_DEADLINE_SECONDS)
+            chase_interval: Период проверки и перестановки лимитного ордера (по умолчанию config.EXECUTION_CHASE_INTERVAL_SECONDS)
+            bot_name: Имя бота в записях (по умолчанию config.BOT_NAME)
+        """
+        self.bybit_service = bybit_service
+        self.db_service = db_service
+        self.maker_deadline = maker_deadline if maker_deadline is not None else config.EXECUTION_MAKER_DEADLINE_SECONDS
+        self.chase_interval = chase_interval if chase_interval is not None else config.EXECUTION_CHASE_INTERVAL_SECONDS
+        self.bot_name = bot_name or getattr(config, "BOT_NAME", "main")
+
+    # ---------- исполнение ----------
+
+    def execute(self, symbol: str, side: str, qty: float, expected_price: float = None,
+                stop_loss: float = None, take_profit: float = None, prefer_maker: bool = None,
+                decision_time: datetime = None, deadline: float = None) -> Dict:
+        """
+        Исполнить ордер на вход
+
+        Args:
+            symbol: Символ
+            side: "Buy" или "Sell"
+            qty: Количество (уже приведенное к шагу лота)
+            expected_price: Цена, по которой принималось решение (для проскальзывания)
+            stop_loss: Стоп-лосс позиции
+            take_profit: Тейк-профит позиции
+            prefer_maker: Входить лимитным PostOnly (по умолчанию config.EXECUTION_PREFER_MAKER)
+            decision_time: Момент решения (UTC), по умолчанию - сейчас
+            deadline: Момент time.monotonic(), к которому вход должен завершиться (None - без ограничения)
+
+        Returns:
+            Результат в формате BybitService.place_order (orderId, tp_sl_attached или error)
+            плюс ключ "execution" с записью телеметрии
+        """
+        decision_time = decision_time or datetime.utcnow()
+        if prefer_maker is None:
+            prefer_maker = config.EXECUTION_PREFER_MAKER
+        if expected_price is None:
+            ticker = self.bybit_service.get_ticker(symbol)
+            expected_price = (_float(ticker.get("last_price")) or None) if ticker else None
+        record = {
+            "symbol": symbol,
+            "side": side,
+            "strategy": "maker" if prefer_maker else "market",
+            "qty": qty,
+            "expected_price": expected_price,
+            "decision_time": decision_time,
+            "send_time": None,
+            "ack_time": None,
+            "fill_time": None,
+            "fills": [],  # (qty, price, maker)
+            "order_ids": [],
+            "reprices": 0,
+            "error": None,
+        }
+        try:
+            if prefer_maker:
+                result = self._execute_maker(record, stop_loss, take_profit, deadline)
+            else:
+                result = self._send_market(record, qty, stop_loss, take_profit)
+        except Exception as e:
+            logger.error(f"Ошибка исполнения ордера {symbol}: {e}", exc_info=True)
+            record["error"] = str(e)
+            result = {"error": str(e)}
+
+        execution = self._finalize(record)
+        self._save(execution)
+        result["execution"] = execution
+        return result
+
+    def _stamp_ack(self, record: Dict, order_result: Dict):
+        if record["ack_time"] is None:
+            record["ack_time"] = datetime.utcnow()
+        order_id = order_result.get("orderId")
+        if order_id:
+            record["order_ids"].append(order_id)
+
+    def _send_market(self, record: Dict, qty: float, stop_loss: float = None, take_profit: float = None) -> Dict:
+        """Рыночный ордер на qty; исполнение - по состоянию ордера на бирже"""
+        if record["send_time"] is None:
+            record["send_time"] = datetime.utcnow()
+        result = self.bybit_service.place_order(
+            symbol=record["symbol"], side=record["side"], qty=qty,
+            stop_loss=stop_loss, take_profit=take_profit
+        )
+        if not result or result.get("error"):
+            record["error"] = (result or {}).get("error", "Bybit вернул ошибку")
+            return result or {"error": record["error"]}
+        self._stamp_ack(record, result)
+
+        order = self._wait_market_fill(record["symbol"], result.get("orderId")) if result.get("orderId") else None
+        filled = _float(order.get("cumExecQty")) if order else qty
+        price = _float(order.get("avgPrice")) if order else 0.0
+        if filled > 0:
+            record["fills"].append((filled, price or record["expected_price"] or 0.0, False))
+            record["fill_time"] = datetime.utcnow()
+        return result
+
+    def _wait_market_fill(self, symbol: str, order_id: str) -> Optional[Dict]:
+        """Состояние рыночного ордера после исполнения (ответ place_order приходит раньше)"""
+        order = None
+        for _ in range(MARKET_FILL_POLLS):
+            order = self.bybit_service.get_order(symbol, order_id)
+            if order and order.get("orderStatus") in FINAL_ORDER_STATUSES:
+                break
+            time.sleep(MARKET_FILL_POLL_SECONDS)
+        return order
+
+    def _passive_price(self, symbol: str, side: str) -> Optional[float]:
+        """Лучшая цена своей стороны стакана: bid для покупки, ask для продажи"""
+        ticker = self.bybit_service.get_ticker(symbol)
+        if not ticker:
+            return None
+        price = _float(ticker.get("bid_price" if side == "Buy" else "ask_price"))
+        return price or None
+
+    def _execute_maker(self, record: Dict, stop_loss: float = None, take_profit: float = None,
+                       deadline: float = None) -> Dict:
+        symbol, side = record["symbol"], record["side"]
+        maker_deadline = time.monotonic() + self.maker_deadline
+        if deadline is not None:
+            maker_deadline = min(maker_deadline, deadline - MARKET_RESERVE_SECONDS)
+        remaining = record["qty"]
+        tp_sl_attached = False
+        first_result: Optional[Dict] = None
+        order_id, order_price = None, None
+
+        while remaining > 0 and time.monotonic() < maker_deadline:
+            if order_id is None:
+                price = self._passive_price(symbol, side)
+                if not price:
+                    break
+                if record["send_time"] is None:
+                    record["send_time"] = datetime.utcnow()
+                result = self.bybit_service.place_order(
+                    symbol=symbol, side=side, qty=remaining, order_type="Limit", price=price,
+                    prefer_maker=True, stop_loss=stop_loss, take_profit=take_profit
+                )
+                if not result or result.get("error"):
+                    logger.warning(f"Лимитный ордер {symbol} не размещен: {(result or {}).get('error')}")
+                    break
+                self._stamp_ack(record, result)
+                first_result = first_result or result
+                tp_sl_attached = tp_sl_attached or bool(result.get("tp_sl_attached"))
+                order_id, order_price = result.get("orderId"), price
+
+            time.sleep(min(self.chase_interval, max(maker_deadline - time.monotonic(), 0)))
+            order = self.bybit_service.get_order(symbol, order_id)
+            if not order:
+                continue
+            status = order.get("orderStatus")
+            if status in FINAL_ORDER_STATUSES:
+                remaining = self._collect_fill(record, order, remaining)
+                # PostOnly, пересекший стакан, биржа отменяет - выставим заново по новой цене
+                order_id = None
+                if status != "Filled":
+                    record["reprices"] += 1
+                continue
+
+            price = self._passive_price(symbol, side)
+            if price and price != order_price and self.bybit_service.amend_order(symbol, order_id, price=price):
+                order_price = price
+                record["reprices"] += 1
+
+        if order_id is not None:
+            # Дедлайн: снимаем лимитный ордер и учитываем то, что успело исполниться
+            self.bybit_service.cancel_order(symbol, order_id)
+            order = self.bybit_service.get_order(symbol, order_id)
+            if order:
+                remaining = self._collect_fill(record, order, remaining)
+
+        if remaining > 0:
+            logger.info(f"Мейкер-исполнение {symbol} не завершено к дедлайну, добор рынком: {remaining}")
+            result = self._send_market(record, remaining, stop_loss, take_profit)
+            if result.get("error") and not first_result:
+                return result
+            first_result = first_result or result
+            tp_sl_attached = tp_sl_attached or bool(result.get("tp_sl_attached"))
+
+        result = dict(first_result or {})
+        if stop_loss or take_profit:
+            result["tp_sl_attached"] = tp_sl_attached
+        return result
+
+    def _collect_fill(self, record: Dict, order: Dict, remaining: float) -> float:
+        """Учесть исполнение закрытого лимитного ордера, вернуть остаток"""
+        filled = _float(order.get("cumExecQty"))
+        if filled > 0:
+            record["fills"].append((filled, _float(order.get("avgPrice")) or _float(order.get("price")), True))
+            record["fill_time"] = datetime.utcnow()
+        return max(_subtract_qty(remaining, filled), 0.0)
+
+    # ---------- телеметрия ----------
+
+    def _finalize(self, record: Dict) -> Dict:
+        """Итоги исполнения: средняя цена, проскальзывание, комиссия и экономия"""
+        fills: List[tuple] = record["fills"]
+        maker_qty = sum(qty for qty, _, maker in fills if maker)
+        taker_qty = sum(qty for qty, _, maker in fills if not maker)
+        filled_qty = maker_qty + taker_qty
+        notional = sum(qty * price for qty, price, _ in fills)
+        avg_price = notional / filled_qty if filled_qty else None
+
+        slippage_bps = None
+        expected = record["expected_price"]
+        if avg_price and expected:
+            # Положительное - хуже ожидаемого (дороже покупка, дешевле продажа)
+            direction = 1 if record["side"] == "Buy" else -1
+            slippage_bps = (avg_price - expected) / expected * 10000 * direction
+
+        maker_notional = sum(qty * price for qty, price, maker in fills if maker)
+        fee_estimate = maker_notional * MAKER_FEE + (notional - maker_notional) * TAKER_FEE
+        fee_saved = maker_notional * (TAKER_FEE - MAKER_FEE)
+
+        if maker_qty and taker_qty:
+            execution_type = "mixed"
+        elif maker_qty:
+            execution_type = "maker"
+        elif taker_qty:
+            execution_type = "taker"
+        else:
+            execution_type = "none"
+
+        if filled_qty <= 0:
+            status = "Failed"
+        elif _subtract_qty(record["qty"], filled_qty) > 0:
+            status = "PartiallyFilled"
+        else:
+            status = "Filled"
+
+        decision_to_fill_ms = None
+        if record["fill_time"]:
+            decision_to_fill_ms = int((record["fill_time"] - record["decision_time"]).total_seconds() * 1000)
+
+        execution = {
+            "symbol": record["symbol"],
+            "side": record["side"],
+            "strategy": record["strategy"],
+            "execution_type": execution_type,
+            "status": status,
+            "qty": record["qty"],
+            "filled_qty": filled_qty,
+            "maker_qty": maker_qty,
+            "taker_qty": taker_qty,
+            "expected_price": expected,
+            "avg_price": avg_price,
+            "slippage_bps": slippage_bps,
+            "fee_estimate": fee_estimate,
+            "fee_saved": fee_saved,
+            "reprices": record["reprices"],
+            "decision_time": record["decision_time"],
+            "send_time": record["send_time"],
+            "ack_time": record["ack_time"],
+            "fill_time": record["fill_time"],
+            "decision_to_fill_ms": decision_to_fill_ms,
+            "order_ids": ",".join(record["order_ids"])[:255],
+            "error": record["error"],
+        }
+        slippage_text = f"{slippage_bps:.2f} bps" if slippage_bps is not None else "N/A"
+        logger.info(
+            f"Исполнение {record['symbol']} {record['side']}: {status}, {execution_type}, "
+            f"{filled_qty}/{record['qty']} по {avg_price}, проскальзывание {slippage_text}, "
+            f"решение→исполнение {decision_to_fill_ms} мс, перестановок {record['reprices']}"
+        )
+        return execution
+
+    def _save(self, execution: Dict):
+        if not self.db_service:
+            return
+        try:
+            params = (
+                self.bot_name, execution["symbol"], execution["side"], execution["strategy"],
+                execution["execution_type"], execution["status"], execution["qty"], execution["filled_qty"],
+                execution["maker_qty"], execution["taker_qty"], execution["expected_price"], execution["avg_price"],
+                execution["slippage_bps"], execution["fee_estimate"], execution["fee_saved"], execution["reprices"],
+                execution["decision_time"], execution["send_time"], execution["ack_time"], execution["fill_time"],
+                execution["decision_to_fill_ms"], execution["order_ids"], execution["error"]
+            )
+            self.db_service.execute_query(EXECUTION_INSERT_QUERY, params)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить исполнение {execution['symbol']}: {e}")
@@ -0,0 +1,165 @@
+"""
+Справочник инструментов Bybit (linear): шаг цены, шаг и пределы объема, пределы плеча
+
+Весь список загружается одним постраничным get_instruments_info и сохраняется
+в StateStore со временем загрузки. При старте бота справочник восстанавливается
+из хранилища без запросов к бирже; устаревший (старше ttl) обновляется в фоне.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+STATE_NAMESPACE = "instruments"
+DEFAULT_QTY_STEP = 0.0001  # Если инструмента нет в справочнике
+
+
+def _to_float(value, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_instrument(item: Dict) -> Dict:
+    """Инструмент из ответа get_instruments_info в плоский словарь"""
+    lot_filter = item.get("lotSizeFilter") or {}
+    price_filter = item.get("priceFilter") or {}
+    leverage_filter = item.get("leverageFilter") or {}
+    max_qty = _to_float(lot_filter.get("maxOrderQty"))
+    return {
+        "symbol": item.get("symbol"),
+        "status": item.get("status"),
+        "tick_size": _to_float(price_filter.get("tickSize")),
+        "min_price": _to_float(price_filter.get("minPrice")),
+        "max_price": _to_float(price_filter.get("maxPrice")),
+        "qty_step": _to_float(lot_filter.get("qtyStep")),
+        "min_qty": _to_float(lot_filter.get("minOrderQty")),
+        "max_qty": max_qty,
+        "max_market_qty": _to_float(lot_filter.get("maxMktOrderQty"), max_qty),
+        "min_notional": _to_float(lot_filter.get("minNotionalValue")),
+        "min_leverage": _to_float(leverage_filter.get("minLeverage"), 1.0),
+        "max_leverage": _to_float(leverage_filter.get("maxLeverage"), 1.0),
+        "leverage_step": _to_float(leverage_filter.get("leverageStep"), 0.01),
+    }
+
+
+class InstrumentCatalog:
+    def __init__(self, bybit_service, state_store=None, category: str = "linear",
+                 ttl: timedelta = timedelta(hours=24)):
+        """
+        Args:
+            bybit_service: BybitService для загрузки
+            state_store: StateStore для сохранения между перезапусками (None - только в памяти)
+            category: Категория инструментов
+            ttl: Через сколько справочник считается устаревшим
+        """
+        self.bybit_service = bybit_service
+        self.state_store = state_store
+        self.category = category
+        self.ttl = ttl
+        self.instruments: Dict[str, Dict] = {}
+        self.loaded_at: Optional[datetime] = None
+        self._refresh_lock = threading.Lock()
+        self._last_attempt: Optional[datetime] = None
+        self._restore()
+
+    def _restore(self):
+        if not self.state_store:
+            return
+        saved = self.state_store.get(STATE_NAMESPACE, self.category)
+        if saved:
+            self.instruments = saved.get("items", {})
+            self.loaded_at = saved.get("loaded_at")
+            logger.info(f"Справочник инструментов восстановлен: {len(self.instruments)} шт., загружен {self.loaded_at}")
+
+    # ---------- загрузка ----------
+
+    def is_stale(self) -> bool:
+        return not self.loaded_at or datetime.utcnow() - self.loaded_at >= self.ttl
+
+    def refresh(self) -> bool:
+        """Загрузить весь справочник с биржи и сохранить (параллельные вызовы ждут первый)"""
+        with self._refresh_lock:
+            self._last_attempt = datetime.utcnow()
+            items = self.bybit_service.get_instruments(self.category)
+            if not items:
+                logger.warning("Справочник инструментов не обновлен: биржа вернула пустой список")
+                return False
+            instruments = {}
+            for item in items:
+                instrument = parse_instrument(item)
+                if instrument["symbol"]:
+                    instruments[instrument["symbol"]] = instrument
+            # Ссылка подменяется целиком - читатели видят либо старый, либо новый справочник
+            self.instruments = instruments
+            self.loaded_at = datetime.utcnow()
+            if self.state_store:
+                self.state_store.set(STATE_NAMESPACE, self.category,
+                                     {"loaded_at": self.loaded_at, "items": instruments})
+            logger.info(f"Справочник инструментов обновлен: {len(instruments)} шт.")
+            return True
+
+    def refresh_if_stale(self) -> bool:
+        if not self.is_stale():
+            return False
+        return self.refresh()
+
+    def refresh_in_background(self):
+        """Обновить устаревший справочник в фоновом потоке (старт бота его не ждет)"""
+        if self.is_stale():
+            threading.Thread(target=self.refresh_if_stale, name="instrument-catalog", daemon=True).start()
+
+    # ---------- чтение ----------
+
+    def get(self, symbol: str) -> Optional[Dict]:
+        """Параметры инструмента; если справочник еще не загружен - загрузить синхронно"""
+        symbol = symbol.upper()
+        # Синхронная загрузка не чаще раза в минуту, чтобы при недоступной бирже не дергать ее на каждом ордере
+        if not self.instruments and (not self._last_attempt
+                                     or datetime.utcnow() - self._last_attempt > timedelta(minutes=1)):
+            self.refresh()
+        return self.instruments.get(symbol)
+
+    def normalize_qty(self, symbol: str, qty: float, market: bool = True) -> float:
+        """
+        Привести количество к шагу лота и пределам объема
+
+        Args:
+            symbol: Символ
+            qty: Желаемое количество
+            market: Рыночный ордер (у него свой максимум объема)
+        """
+        instrument = self.get(symbol)
+        if not instrument:
+            logger.warning(f"{symbol} нет в справочнике инструментов, шаг объема {DEFAULT_QTY_STEP}")
+            instrument = {"qty_step": DEFAULT_QTY_STEP, "min_qty": DEFAULT_QTY_STEP}
+        step = Decimal(str(instrument.get("qty_step") or DEFAULT_QTY_STEP))
+        normalized = (Decimal(str(qty)) / step).to_integral_value(rounding=ROUND_DOWN) * step
+        min_qty = Decimal(str(instrument.get("min_qty") or step))
+        if normalized < min_qty:
+            normalized = min_qty
+        max_qty = instrument.get("max_market_qty" if market else "max_qty") or 0
+        if max_qty and normalized > Decimal(str(max_qty)):
+            normalized = (Decimal(str(max_qty)) / step).to_integral_value(rounding=ROUND_DOWN) * step
+        return float(normalized)
+
+    def round_price(self, symbol: str, price: Optional[float]) -> Optional[float]:
+        """Округлить цену до шага цены инструмента"""
+        if not price:
+            return price
+        instrument = self.get(symbol)
+        tick = Decimal(str(instrument.get("tick_size") or 0)) if instrument else Decimal(0)
+        if tick <= 0:
+            return price
+        return float((Decimal(str(price)) / tick).to_integral_value(rounding=ROUND_HALF_UP) * tick)
+
+    def clamp_leverage(self, symbol: str, leverage: float) -> float:
+        """Ограничить плечо пределами инструмента"""
+        instrument = self.get(symbol)
+        if not instrument:
+            return leverage
+        return max(instrument.get("min_leverage") or 1.0, min(leverage, instrument.get("max_leverage") or leverage))
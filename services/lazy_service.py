@@ -0,0 +1,97 @@
+"""
+Отложенное создание сервисов и профиль запуска
+
+LazyService - заместитель сервиса: объект создается фабрикой при первом обращении
+к атрибуту (или при проверке `if service:`), а не при импорте модуля. Код, который
+держит ссылку на заместитель, работает с ним как с самим сервисом.
+
+Время создания каждого сервиса и этапов запуска записывается в STARTUP_TIMINGS,
+format_startup_profile() собирает из них отчет.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+STARTUP_TIMINGS: Dict[str, float] = {}  # Этап/сервис -> секунды
+_PROCESS_STARTED = time.perf_counter()
+
+
+@contextmanager
+def timed(name: str):
+    """Замерить этап запуска"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_TIMINGS[name] = STARTUP_TIMINGS.get(name, 0.0) + time.perf_counter() - started
+
+
+def format_startup_profile() -> str:
+    """Отчет о времени запуска: этапы по убыванию длительности"""
+    total = time.perf_counter() - _PROCESS_STARTED
+    lines = [f"Профиль запуска: {total * 1000:.0f} мс с импорта services.lazy_service"]
+    for name, seconds in sorted(STARTUP_TIMINGS.items(), key=lambda item: item[1], reverse=True):
+        lines.append(f"   {name}: {seconds * 1000:.1f} мс")
+    return "\n".join(lines)
+
+
+class LazyService:
+    """Заместитель сервиса, создаваемого при первом обращении"""
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        """
+        Args:
+            name: Имя для логов и профиля запуска
+            factory: Функция без аргументов, возвращающая сервис (или None, если он недоступен)
+        """
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_initialized", False)
+        object.__setattr__(self, "_lock", threading.RLock())
+
+    def _resolve(self) -> Any:
+        """
+        Сервис (создается при первом вызове, потокобезопасно)
+
+        Имя закрытое: публичные get/initialized перекрыли бы одноименные методы сервиса
+        (CorrelationEngine.get, InstrumentCatalog.get, StateStore.get)
+        """
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    with timed(f"init {self._name}"):
+                        try:
+                            instance = self._factory()
+                        except Exception as e:
+                            logger.warning(f"Не удалось инициализировать {self._name}: {e}")
+                            instance = None
+                    object.__setattr__(self, "_instance", instance)
+                    object.__setattr__(self, "_initialized", True)
+                    logger.info(f"{self._name} инициализирован за {STARTUP_TIMINGS[f'init {self._name}'] * 1000:.0f} мс"
+                                if instance is not None else f"{self._name} недоступен")
+        return self._instance
+
+    @property
+    def _is_initialized(self) -> bool:
+        return self._initialized
+
+    def __getattr__(self, item):
+        instance = self._resolve()
+        if instance is None:
+            raise AttributeError(f"{self._name} недоступен (атрибут {item})")
+        return getattr(instance, item)
+
+    def __setattr__(self, key, value):
+        setattr(self._resolve(), key, value)
+
+    def __bool__(self) -> bool:
+        return self._resolve() is not None
+
+    def __repr__(self) -> str:
+        state = repr(self._instance) if self._initialized else "не создан"
+        return f"<LazyService {self._name}: {state}>"
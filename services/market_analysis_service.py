@@ -14,11 +14,13 @@ logger = logging.getLogger(__name__)
 
 
 class MarketAnalysisService:
-    def __init__(self, news_service=None, db_service=None):
-        self.bybit_service = BybitService(db_service=db_service)  # Передаем db_service для сохранения ошибок
-        self.risk_service = RiskManagementService()
+    def __init__(self, news_service=None, db_service=None, bybit_service=None, risk_service=None, candle_store=None):
+        # Передаем db_service для сохранения ошибок; клиента можно передать готовым (бэктест, общий клиент)
+        self.bybit_service = bybit_service or BybitService(db_service=db_service)
+        self.risk_service = risk_service or RiskManagementService(bybit_service=self.bybit_service)
         self.news_service = news_service  # Опционально, для интеграции новостей
         self.db_service = db_service  # Опционально, для сохранения истории
+        self.candle_store = candle_store  # Опционально, CandleStore - копит часовые свечи из анализа
         
         # Популярные монеты для анализа (топ по объему и ликвидности)
         # Только символы, доступные на Bybit для фьючерсов (linear)
@@ -52,14 +54,34 @@ class MarketAnalysisService:
         # Максимальный риск в день/на сделку: читаем из config.AUTO_RISK_PER_TRADE (по умолчанию 2%)
         self.max_daily_risk = getattr(config, "AUTO_RISK_PER_TRADE", 0.02)
         self.min_risk_reward = 2.0  # Минимальный risk-reward для безопасной торговли: 1:2
+        
+        # Пороги стратегии (вынесены в атрибуты, чтобы их можно было подбирать оптимизатором)
+        # Плечо по волатильности: [(порог волатильности %, плечо)], иначе base_leverage
+        self.leverage_volatility_tiers = [(10, 2), (5, 3), (3, 5)]
+        self.base_leverage = 7
+        # Перекупленность/перепроданность
+        self.rsi_overbought = 70
+        self.rsi_oversold = 30
+        self.overbought_change_percent = 6
+        self.overbought_funding_rate = 0.01
+        self.oversold_funding_rate = -0.005
+        self.ema_divergence_change_percent = 3
+        # Оценка возможности: [(порог волатильности %, баллы)]
+        self.score_volatility_tiers = [(2, 20), (3, 15), (5, 10), (7, 5)]
+        self.score_overbought_penalty = 15
+        self.score_oversold_bonus = 10
+        self.score_ema_weight = 8
     
-    def get_historical_data(self, symbol: str, days: int = 7) -> Optional[Dict]:
+    def get_historical_data(self, symbol: str, days: int = 7, save_snapshot: bool = True) -> Optional[Dict]:
         """
         Получить исторические данные за период
         
         Args:
             symbol: Символ для анализа
             days: Количество дней истории
+            save_snapshot: Сохранить снимок в БД; False - снимок возвращается в ключе "db_snapshot"
+                (его сохраняет вызывающий, например асинхронно через AsyncDatabaseService),
+                а полученный стакан - в ключе "order_book", чтобы не запрашивать его повторно
         
         Returns:
             Словарь с историческими данными
@@ -78,6 +100,11 @@ class MarketAnalysisService:
             funding = self.bybit_service.get_funding_rate(symbol)
             oi = self.bybit_service.get_open_interest(symbol)
             candles = self.bybit_service.get_kline(symbol=symbol, interval="60", limit=240)
+            if self.candle_store and candles:
+                try:
+                    self.candle_store.append(symbol, "60", candles)
+                except Exception as e:
+                    logger.warning(f"Не удалось сохранить свечи {symbol} в хранилище: {e}")
             candle_stats = self._analyze_candles(candles)
             whale_activity = self._get_whale_activity(symbol)
             order_book = self.bybit_service.get_order_book(symbol, limit=50)
@@ -132,7 +159,7 @@ class MarketAnalysisService:
             }
             
             # Сохраняем снимок в БД для анализа времени суток
-            if self.db_service:
+            if self.db_service or not save_snapshot:
                 try:
                     market_snapshot = {
                         "current_price": float(ticker["last_price"]),
@@ -140,11 +167,17 @@ class MarketAnalysisService:
                         "volatility": self._calculate_volatility(ticker),
                         "funding_rate": float(funding.get("funding_rate", 0)) if funding else 0,
                         "open_interest": oi.get("open_interest", 0) if oi and oi.get("open_interest") != "N/A" else 0,
-                        "liquidity_score": self._calculate_liquidity_score(ticker, oi)
+                        "liquidity_score": self._calculate_liquidity_score(ticker, oi),
+                        "spread": self._calculate_spread(ticker)
                     }
-                    self.db_service.save_market_snapshot(symbol, market_snapshot, candle_stats)
+                    if save_snapshot:
+                        self.db_service.save_market_snapshot(symbol, market_snapshot, candle_stats)
+                    else:
+                        result_data["db_snapshot"] = market_snapshot
                 except Exception as db_error:
                     logger.warning(f"Не удалось сохранить снимок рынка в БД для {symbol}: {db_error}")
+            if not save_snapshot:
+                result_data["order_book"] = order_book
             
             return result_data
             
@@ -153,6 +186,17 @@ class MarketAnalysisService:
             logger.error(f"Ошибка при получении исторических данных для {symbol}: {e}")
             return None
     
+    def _calculate_spread(self, ticker: Dict) -> Optional[float]:
+        """Относительный спред лучшего bid/ask (доля от средней цены), None если котировок нет"""
+        try:
+            bid = float(ticker.get("bid_price") or 0)
+            ask = float(ticker.get("ask_price") or 0)
+            if bid <= 0 or ask <= 0:
+                return None
+            return (ask - bid) / ((ask + bid) / 2)
+        except (TypeError, ValueError):
+            return None
+    
     def _calculate_volatility(self, ticker: Dict) -> float:
         """Рассчитать волатильность на основе high/low 24h"""
         try:
@@ -254,9 +298,9 @@ class MarketAnalysisService:
         # Determine RSI signal
         rsi_signal = "NEUTRAL"
         if rsi:
-            if rsi > 70:
+            if rsi > self.rsi_overbought:
                 rsi_signal = "OVERBOUGHT"
-            elif rsi < 30:
+            elif rsi < self.rsi_oversold:
                 rsi_signal = "OVERSOLD"
         
         # Calculate MACD
@@ -303,14 +347,12 @@ class MarketAnalysisService:
         """
         try:
             # Чем выше волатильность, тем ниже leverage (безопасность)
-            if volatility > 10:  # Очень высокая волатильность
-                max_leverage = 2
-            elif volatility > 5:  # Высокая волатильность
-                max_leverage = 3
-            elif volatility > 3:  # Средняя волатильность
-                max_leverage = 5
-            else:  # Низкая волатильность
-                max_leverage = 7
+            # По умолчанию: >10% → 2x, >5% → 3x, >3% → 5x, иначе 7x
+            max_leverage = self.base_leverage
+            for threshold, tier_leverage in self.leverage_volatility_tiers:
+                if volatility > threshold:
+                    max_leverage = tier_leverage
+                    break
             
             # Ограничиваем максимум 10x для безопасности
             max_leverage = min(max_leverage, 10)
@@ -531,14 +573,10 @@ EMA (50/200): {ema_signal}
             
             # Волатильность (ниже = лучше для безопасности)
             volatility = data["volatility"]
-            if volatility < 2:
-                score += 20
-            elif volatility < 3:
-                score += 15
-            elif volatility < 5:
-                score += 10
-            elif volatility < 7:
-                score += 5
+            for threshold, points in self.score_volatility_tiers:
+                if volatility < threshold:
+                    score += points
+                    break
             
             # Funding rate (ближе к 0 = лучше)
             funding = abs(data["funding_rate"])
@@ -572,15 +610,15 @@ EMA (50/200): {ema_signal}
             # Перекупленность/перепроданность
             status = data.get("overbought_status")
             if status == "OVERBOUGHT":
-                score -= 15
+                score -= self.score_overbought_penalty
             elif status == "OVERSOLD":
-                score += 10
+                score += self.score_oversold_bonus
 
             ema_signal = data.get("ema_signal")
             if ema_signal == "BULLISH":
-                score += 8
+                score += self.score_ema_weight
             elif ema_signal == "BEARISH":
-                score -= 8
+                score -= self.score_ema_weight
 
             smart_flow = data.get("smart_money_flow", 0)
             if smart_flow > 100000:
@@ -601,7 +639,7 @@ EMA (50/200): {ema_signal}
         """
         try:
             # Приоритет 1: RSI - самый надежный индикатор перекупленности/перепроданности
-            if rsi_signal == "OVERBOUGHT" or (rsi and rsi > 70):
+            if rsi_signal == "OVERBOUGHT" or (rsi and rsi > self.rsi_overbought):
                 # Если RSI показывает перекупленность, но EMA бычий - может быть сильный тренд
                 # В таком случае не блокируем Long полностью, но предпочитаем Short
                 if ema_signal == "BEARISH":
@@ -611,7 +649,7 @@ EMA (50/200): {ema_signal}
                 else:
                     return "OVERBOUGHT"  # RSI высокий без четкого тренда
             
-            if rsi_signal == "OVERSOLD" or (rsi and rsi < 30):
+            if rsi_signal == "OVERSOLD" or (rsi and rsi < self.rsi_oversold):
                 # Если RSI показывает перепроданность, но EMA медвежий - может быть сильный падающий тренд
                 if ema_signal == "BULLISH":
                     return "OVERSOLD"  # Явная перепроданность + бычий тренд
@@ -621,15 +659,15 @@ EMA (50/200): {ema_signal}
                     return "OVERSOLD"  # RSI низкий без четкого тренда
             
             # Приоритет 2: Комбинация изменения цены и funding rate
-            if change_percent > 6 and funding_rate > 0.01:
+            if change_percent > self.overbought_change_percent and funding_rate > self.overbought_funding_rate:
                 return "OVERBOUGHT"
-            if change_percent < -6 and funding_rate < -0.005:
+            if change_percent < -self.overbought_change_percent and funding_rate < self.oversold_funding_rate:
                 return "OVERSOLD"
             
             # Приоритет 3: EMA сигнал
-            if ema_signal == "BEARISH" and change_percent > 3:
+            if ema_signal == "BEARISH" and change_percent > self.ema_divergence_change_percent:
                 return "OVERBOUGHT"  # Медвежий тренд + рост цены = перекупленность
-            if ema_signal == "BULLISH" and change_percent < -3:
+            if ema_signal == "BULLISH" and change_percent < -self.ema_divergence_change_percent:
                 return "OVERSOLD"  # Бычий тренд + падение цены = перепроданность
             
             # Нейтральные случаи
@@ -0,0 +1,384 @@
+"""
+Метрики бота в формате Prometheus: счетчики, гистограммы, HTTP /metrics
+
+Реестр в памяти процесса, без внешних зависимостей. Что замеряется:
+- запросы к Bybit по эндпоинтам и классам символов (InstrumentedClient в BybitService)
+- запросы к AI и расход токенов (AIService)
+- запросы к БД (DatabaseService, AsyncDatabaseService)
+- длительность и превышения бюджета job'ов (track_job) и этапы цикла автозакупки (StageTimer)
+- задержка цикла событий asyncio (watch_event_loop_lag)
+
+Отдача: start_http_server(host, port) - GET /metrics в текстовом формате Prometheus 0.0.4.
+"""
+import asyncio
+import bisect
+import functools
+import logging
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+AI_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 20.0, 30.0, 45.0, 60.0, 120.0)
+JOB_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 20.0, 25.0, 30.0, 60.0, 120.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+MAJOR_SYMBOLS = {"BTCUSDT", "ETHUSDT"}
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...], extra: Dict[str, str] = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонный счетчик"""
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{self._labels(key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """Текущее значение"""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{self._labels(key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам (секунды)"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [счетчики корзин без накопления (+Inf последней), сумма, количество]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self, **labels) -> Dict:
+        """Количество и сумма наблюдений"""
+        state = self._values.get(self._key(labels))
+        if state is None:
+            return {"count": 0, "sum": 0.0}
+        return {"count": state[2], "sum": state[1]}
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{self._labels(key, {'le': _format_value(bound)})} {cumulative}"
+            yield f"{self.name}_sum{self._labels(key)} {_format_value(total)}"
+            yield f"{self.name}_count{self._labels(key)} {count}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+BYBIT_REQUEST_SECONDS = REGISTRY.histogram(
+    "bybit_request_seconds", "Время запроса к Bybit REST", ["endpoint", "symbol_class", "outcome"]
+)
+BYBIT_ERRORS = REGISTRY.counter(
+    "bybit_errors_total", "Ответы Bybit с ошибкой (retCode != 0) и исключения клиента", ["endpoint", "code"]
+)
+AI_REQUEST_SECONDS = REGISTRY.histogram(
+    "ai_request_seconds", "Время запроса к AI", ["operation", "model", "outcome"], buckets=AI_BUCKETS
+)
+AI_TOKENS = REGISTRY.counter("ai_tokens_total", "Токены AI по ответам API", ["operation", "model", "kind"])
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "db_query_seconds", "Время запроса к MySQL", ["backend", "operation", "table", "outcome"], buckets=DB_BUCKETS
+)
+JOB_DURATION_SECONDS = REGISTRY.histogram(
+    "job_duration_seconds", "Длительность запуска job'а", ["job", "outcome"], buckets=JOB_BUCKETS
+)
+JOB_OVERRUNS = REGISTRY.counter("job_overruns_total", "Запуски job'а дольше его бюджета", ["job"])
+STAGE_SECONDS = REGISTRY.histogram(
+    "pipeline_stage_seconds", "Длительность этапа конвейера", ["pipeline", "stage"], buckets=JOB_BUCKETS
+)
+EVENT_LOOP_LAG_SECONDS = REGISTRY.histogram(
+    "event_loop_lag_seconds", "Опоздание пробуждения в цикле событий asyncio", buckets=LAG_BUCKETS
+)
+EVENT_LOOP_LAG_LAST = REGISTRY.gauge("event_loop_lag_last_seconds", "Последний замер задержки цикла событий")
+
+
+def symbol_class(symbol: Optional[str]) -> str:
+    """Класс символа для меток: major (BTC/ETH), alt, none - запрос без символа"""
+    if not symbol:
+        return "none"
+    return "major" if str(symbol).upper() in MAJOR_SYMBOLS else "alt"
+
+
+# ---------- Bybit ----------
+
+class InstrumentedClient:
+    """Обертка клиента pybit HTTP (или симулятора): каждый вызов метода попадает в bybit_request_seconds"""
+
+    def __init__(self, client):
+        object.__setattr__(self, "_client", client)
+
+    @property
+    def wrapped(self):
+        return self._client
+
+    def __getattr__(self, item):
+        attr = getattr(self._client, item)
+        if item.startswith("_") or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            labels = {"endpoint": item, "symbol_class": "batch" if "request" in kwargs else symbol_class(kwargs.get("symbol"))}
+            started = time.perf_counter()
+            try:
+                response = attr(*args, **kwargs)
+            except Exception as e:
+                BYBIT_REQUEST_SECONDS.observe(time.perf_counter() - started, outcome="exception", **labels)
+                BYBIT_ERRORS.inc(endpoint=item, code=getattr(e, "status_code", None) or type(e).__name__)
+                raise
+            outcome = "ok"
+            if isinstance(response, dict) and response.get("retCode") not in (None, 0):
+                outcome = "error"
+                BYBIT_ERRORS.inc(endpoint=item, code=response.get("retCode"))
+            BYBIT_REQUEST_SECONDS.observe(time.perf_counter() - started, outcome=outcome, **labels)
+            return response
+        return call
+
+    def __setattr__(self, key, value):
+        setattr(self._client, key, value)
+
+
+def instrument_client(client):
+    """Обернуть клиент биржи, если он еще не обернут"""
+    return client if isinstance(client, InstrumentedClient) else InstrumentedClient(client)
+
+
+# ---------- AI ----------
+
+def observe_ai_request(operation: str, model: str, seconds: float, outcome: str = "ok", completion=None):
+    """Записать запрос к AI и токены из completion.usage (если API их вернул)"""
+    model = model or "unknown"
+    AI_REQUEST_SECONDS.observe(seconds, operation=operation, model=model, outcome=outcome)
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, kind, None)
+        if tokens:
+            AI_TOKENS.inc(tokens, operation=operation, model=model, kind=kind.replace("_tokens", ""))
+
+
+# ---------- БД ----------
+
+_TABLE_PATTERN = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE(?:\s+IF\s+(?:NOT\s+)?EXISTS)?)\s+`?(\w+)", re.IGNORECASE)
+
+
+def query_labels(query: str) -> Dict[str, str]:
+    """Операция (первое слово SQL) и основная таблица запроса"""
+    text = str(query).lstrip()
+    operation = text.split(None, 1)[0].upper() if text else "UNKNOWN"
+    match = _TABLE_PATTERN.search(text)
+    return {"operation": operation, "table": match.group(1).lower() if match else "none"}
+
+
+def observe_db_query(backend: str, query: str, seconds: float, outcome: str = "ok"):
+    DB_QUERY_SECONDS.observe(seconds, backend=backend, outcome=outcome, **query_labels(query))
+
+
+# ---------- job'ы и этапы ----------
+
+def track_job(name: str, budget: float = None):
+    """
+    Декоратор async job'а: длительность в job_duration_seconds, превышение budget секунд -
+    в job_overruns_total и предупреждение в лог
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            outcome = "ok"
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                duration = time.perf_counter() - started
+                JOB_DURATION_SECONDS.observe(duration, job=name, outcome=outcome)
+                if budget and duration > budget:
+                    JOB_OVERRUNS.inc(job=name)
+                    logger.warning(f"⏱ {name} выполнялся {duration:.1f} сек при бюджете {budget:g} сек")
+        return wrapper
+    return decorator
+
+
+class StageTimer:
+    """
+    Замер этапов конвейера без вложенных блоков: lap(stage) записывает время с предыдущей отметки
+
+    Пример: stages = StageTimer("auto_trade"); ...; stages.lap("scan"); ...; stages.lap("overview")
+    """
+
+    def __init__(self, pipeline: str):
+        self.pipeline = pipeline
+        self._last = time.perf_counter()
+
+    def lap(self, stage: str) -> float:
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+        STAGE_SECONDS.observe(elapsed, pipeline=self.pipeline, stage=stage)
+        return elapsed
+
+
+async def watch_event_loop_lag(interval: float = 1.0):
+    """Бесконечно замерять, насколько позже запланированного просыпается корутина (блокировки цикла событий)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        EVENT_LOOP_LAG_SECONDS.observe(lag)
+        EVENT_LOOP_LAG_LAST.set(lag)
+
+
+# ---------- HTTP ----------
+
+def start_http_server(host: str = "127.0.0.1", port: int = 9108, registry: MetricsRegistry = REGISTRY) -> Optional[ThreadingHTTPServer]:
+    """
+    Отдавать GET /metrics в фоновом потоке
+
+    Returns:
+        Сервер (server.shutdown() - остановить) или None, если порт занят
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logger.error(f"Не удалось запустить /metrics на {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"📈 Метрики: http://{host}:{port}/metrics")
+    return server
@@ -3,9 +3,12 @@
 """
 import logging
 import os
+import re
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 
+from services.sentiment_scorer import SentimentScorer
+
 logger = logging.getLogger(__name__)
 
 try:
@@ -38,6 +41,41 @@ class NewsService:
             "crypto.news",
             "ru.investing.com"
         ]
+        
+        # Полные названия монет для привязки новостей к символам
+        self.symbol_names = {
+            "BTC": ["bitcoin"],
+            "ETH": ["ethereum", "ether"],
+            "SOL": ["solana"],
+            "BNB": ["binance coin", "bnb chain"],
+            "XRP": ["ripple"],
+            "ADA": ["cardano"],
+            "DOGE": ["dogecoin"],
+            "AVAX": ["avalanche"],
+            "DOT": ["polkadot"],
+            "LINK": ["chainlink"],
+            "MATIC": ["polygon"],
+            "LTC": ["litecoin"],
+            "TRX": ["tron"],
+            "TON": ["toncoin"],
+            "ATOM": ["cosmos"],
+            "NEAR": ["near protocol"],
+            "APT": ["aptos"],
+            "ARB": ["arbitrum"],
+            "OP": ["optimism"],
+            "SUI": ["sui network"],
+        }
+        
+        # Предкомпилированный скорер настроения с кэшем по URL
+        self.sentiment_scorer = SentimentScorer()
+        
+        # Сколько символов объединять в один поисковый запрос
+        self.batch_query_size = 5
+        
+        # Общий кэш пакетных новостей: {базовый символ: (время, результат)}
+        # Используется и автотрейдингом, и командой /news
+        self.batched_cache_ttl = timedelta(minutes=10)
+        self._batched_cache: Dict[str, tuple] = {}
     
     def get_crypto_news(self, symbol: str = "BTC", max_results: int = 10) -> List[Dict]:
         """
@@ -175,50 +213,133 @@ class NewsService:
                 "summary": f"Ошибка: {str(e)}"
             }
     
-    def _analyze_sentiment(self, news_list: List[Dict]) -> str:
+    def get_batched_symbol_news(self, symbols: List[str], max_results_per_symbol: int = 5) -> Dict[str, Dict]:
         """
-        Анализировать эмоциональный фон на основе новостей
+        Получить новости сразу по нескольким символам за минимальное число запросов
+        
+        Символы объединяются в группы по batch_query_size, на каждую группу
+        делается один поиск, а результаты распределяются по символам
+        по тикеру и полному названию монеты.
+        
+        Args:
+            symbols: Список символов (BTC, ETHUSDT, etc.)
+            max_results_per_symbol: Максимум новостей на один символ
         
         Returns:
-            "BULLISH", "BEARISH", или "NEUTRAL"
+            Словарь {символ: результат в формате get_symbol_specific_news}; символов,
+            чей пакетный запрос не удался, в нем нет (вызывающий код запрашивает их отдельно)
         """
-        if not news_list:
-            return "NEUTRAL"
+        # Нормализуем символы, сохраняя исходные ключи для вызывающего кода
+        base_by_symbol: Dict[str, str] = {}
+        for symbol in symbols or []:
+            if not symbol:
+                continue
+            base_by_symbol[symbol] = symbol.upper().replace("USDT", "")
         
-        # Ключевые слова для определения настроения
-        bullish_keywords = [
-            "surge", "rally", "bullish", "gains", "up", "rise", "growth",
-            "adoption", "institutional", "breakthrough", "positive",
-            "вырос", "рост", "ралли", "бычий", "позитивный"
-        ]
-        
-        bearish_keywords = [
-            "crash", "drop", "bearish", "decline", "down", "fall", "loss",
-            "concern", "warning", "risk", "negative", "correction",
-            "упал", "падение", "медвежий", "негативный", "риск"
-        ]
+        now = datetime.now()
+        cached: Dict[str, Dict] = {}
+        for base in dict.fromkeys(base_by_symbol.values()):
+            entry = self._batched_cache.get(base)
+            if entry and now - entry[0] < self.batched_cache_ttl:
+                cached[base] = entry[1]
         
-        bullish_score = 0
-        bearish_score = 0
+        bases = [base for base in dict.fromkeys(base_by_symbol.values()) if base not in cached]
+        news_by_base: Dict[str, List[Dict]] = {base: [] for base in bases}
+        failed_bases = set()
         
-        for news_item in news_list:
-            text = (news_item.get("title", "") + " " + news_item.get("snippet", "")).lower()
-            
-            for keyword in bullish_keywords:
-                if keyword in text:
-                    bullish_score += 1
+        for i in range(0, len(bases), self.batch_query_size):
+            batch = bases[i:i + self.batch_query_size]
+            try:
+                query = f"{' '.join(batch)} cryptocurrency news today latest updates market analysis"
+                search = self.client.search.create(
+                    query=query,
+                    search_domain_filter=self.crypto_news_sources,
+                    max_results=min(20, max_results_per_symbol * len(batch) * 2),
+                    max_tokens_per_page=1024
+                )
+            except Exception as e:
+                logger.error(f"Ошибка при пакетном получении новостей для {batch}: {e}")
+                failed_bases.update(batch)
+                continue
             
-            for keyword in bearish_keywords:
-                if keyword in text:
-                    bearish_score += 1
-        
-        # Определяем настроение
-        if bullish_score > bearish_score * 1.5:
-            return "BULLISH"
-        elif bearish_score > bullish_score * 1.5:
-            return "BEARISH"
-        else:
-            return "NEUTRAL"
+            for result in search.results:
+                news_item = {
+                    "title": result.title,
+                    "url": result.url,
+                    "snippet": result.snippet[:500] if hasattr(result, 'snippet') else "",
+                    "date": getattr(result, 'date', None),
+                    "source": self._extract_domain(result.url)
+                }
+                for base in self._match_symbols(news_item, batch):
+                    if len(news_by_base[base]) < max_results_per_symbol:
+                        news_by_base[base].append(news_item)
+        
+        timestamp = now.isoformat()
+        results_by_base: Dict[str, Dict] = dict(cached)
+        for base, news in news_by_base.items():
+            if base in failed_bases:
+                continue
+            if not news:
+                results_by_base[base] = {
+                    "symbol": base,
+                    "sentiment": "NEUTRAL",
+                    "news": [],
+                    "summary": "Новости не найдены",
+                    "timestamp": timestamp
+                }
+            else:
+                sentiment = self._analyze_sentiment(news)
+                results_by_base[base] = {
+                    "symbol": base,
+                    "sentiment": sentiment,
+                    "news": news,
+                    "summary": self._generate_summary(news, sentiment),
+                    "timestamp": timestamp
+                }
+            self._batched_cache[base] = (now, results_by_base[base])
+        
+        return {symbol: results_by_base[base] for symbol, base in base_by_symbol.items() if base in results_by_base}
+    
+    def _match_symbols(self, news_item: Dict, candidates: List[str]) -> List[str]:
+        """
+        Определить, к каким символам из группы относится новость
+        
+        Тикер ищется как отдельное слово в исходном регистре (чтобы "OP" не
+        совпадал с "operation"), название монеты - без учета регистра.
+        Если ни один символ не найден и в группе один символ, новость
+        относится к нему.
+        """
+        text = news_item.get("title", "") + " " + news_item.get("snippet", "")
+        text_lower = text.lower()
+        
+        matched = []
+        for base in candidates:
+            if re.search(rf"(?<![A-Za-z0-9]){re.escape(base)}(?![A-Za-z0-9])", text):
+                matched.append(base)
+                continue
+            names = self.symbol_names.get(base, [])
+            if any(name in text_lower for name in names):
+                matched.append(base)
+        
+        if not matched and len(candidates) == 1:
+            matched = list(candidates)
+        return matched
+    
+    def _analyze_sentiment(self, news_list: List[Dict]) -> str:
+        """
+        Анализировать эмоциональный фон на основе новостей
+        
+        Returns:
+            "BULLISH", "BEARISH", или "NEUTRAL"
+        """
+        return self.sentiment_scorer.analyze(news_list)["sentiment"]
+    
+    def analyze_sentiment_details(self, news_list: List[Dict]) -> Dict:
+        """
+        Подробная оценка настроения: метка, сырые счета и счета,
+        взвешенные по свежести и источнику новости
+        """
+        return self.sentiment_scorer.analyze(news_list)
     
     def _generate_summary(self, news_list: List[Dict], sentiment: str) -> str:
         """Сгенерировать краткое резюме новостей"""
@@ -253,19 +374,22 @@ class NewsService:
         except:
             return url
     
-    def get_trading_news_context(self, symbol: str) -> Dict:
+    def get_trading_news_context(self, symbol: str, batched_news: Optional[Dict[str, Dict]] = None) -> Dict:
         """
         Получить новостной контекст для торговых решений
         
         Args:
             symbol: Символ для анализа
+            batched_news: Готовый результат get_batched_symbol_news (если уже получен)
         
         Returns:
             Словарь с новостным контекстом
         """
         try:
-            # Получаем новости по символу
-            symbol_news = self.get_symbol_specific_news(symbol, max_results=5)
+            # Получаем новости по символу (из пакетного результата, если он есть)
+            if batched_news is None:
+                batched_news = self.get_batched_symbol_news([symbol], max_results_per_symbol=5)
+            symbol_news = batched_news.get(symbol) or self.get_symbol_specific_news(symbol, max_results=5)
             
             # Получаем общий фон рынка
             market_sentiment = self.get_market_sentiment([symbol])
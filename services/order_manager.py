@@ -0,0 +1,137 @@
+"""
+Жизненный цикл ордеров на вход: размещение и защитные уровни без блокировки цикла событий
+
+Ордер размещается вместе со стоп-лоссом и тейк-профитом (BybitService.place_order,
+tpslMode=Full). Если биржа приняла ордер без уровней, они ставятся фоновой задачей:
+она ждет исполнения (событие приватного потока, services/account_stream.py) и повторяет
+set_trading_stop с экспоненциальной задержкой. Ожидание и повторы - asyncio.sleep,
+запросы к бирже - в потоках, поэтому другие job'ы и команды бота не ждут.
+
+Сам вход (мейкер с догоном цены или рыночный) и его телеметрию ведет ExecutionEngine
+(services/execution_engine.py), если он передан.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional, Set
+
+from services.account_stream import EXECUTION, POSITION_OPENED, POSITION_UPDATED
+
+logger = logging.getLogger(__name__)
+
+FILL_WAIT_SECONDS = 10  # Сколько ждать события исполнения, дальше - попытки без него
+
+
+class OrderManager:
+    def __init__(self, bybit_service, execution_engine=None, max_attempts: int = 6, base_delay: float = 0.5, max_delay: float = 8.0):
+        """
+        Args:
+            bybit_service: BybitService
+            execution_engine: ExecutionEngine (None - сразу рыночный ордер через place_order)
+            max_attempts: Попыток установки TP/SL
+            base_delay: Первая задержка между попытками (секунды), дальше удваивается
+            max_delay: Максимальная задержка между попытками
+        """
+        self.bybit_service = bybit_service
+        self.execution_engine = execution_engine
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.account_stream = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._fill_events: Dict[str, asyncio.Event] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def bind_stream(self, account_stream, loop: asyncio.AbstractEventLoop):
+        """Ждать исполнения по событиям приватного потока"""
+        self.account_stream = account_stream
+        self._loop = loop
+        account_stream.add_listener(self._on_stream_event)
+
+    def _on_stream_event(self, event: str, symbol: str, data: Dict):
+        # Вызывается в потоке WebSocket
+        if event in (EXECUTION, POSITION_OPENED, POSITION_UPDATED):
+            fill_event = self._fill_events.get(symbol)
+            if fill_event is not None and self._loop is not None:
+                self._loop.call_soon_threadsafe(fill_event.set)
+
+    # ---------- размещение ----------
+
+    async def place_entry(self, symbol: str, side: str, qty: float,
+                          stop_loss: float = None, take_profit: float = None,
+                          expected_price: float = None, decision_time: datetime = None,
+                          deadline: float = None) -> Dict:
+        """
+        Разместить ордер на вход с защитными уровнями
+
+        Args:
+            expected_price: Цена, по которой принято решение (для проскальзывания)
+            decision_time: Момент решения (UTC), по умолчанию - момент вызова
+            deadline: Момент time.monotonic(), к которому вход должен завершиться (для ExecutionEngine)
+
+        Returns:
+            Результат BybitService.place_order (с ExecutionEngine - плюс "execution");
+            если уровни не вошли в ордер, tp_sl_attached=False и их установка уже запущена в фоне
+        """
+        decision_time = decision_time or datetime.utcnow()
+        symbol = symbol.upper()
+        protect = bool(stop_loss or take_profit)
+        if protect:
+            # Регистрируем ожидание до ордера: рыночный ордер исполняется раньше, чем вернется ответ
+            self._fill_events[symbol] = asyncio.Event()
+        if self.execution_engine:
+            result = await asyncio.to_thread(
+                self.execution_engine.execute, symbol=symbol, side=side, qty=qty,
+                expected_price=expected_price, stop_loss=stop_loss, take_profit=take_profit,
+                decision_time=decision_time, deadline=deadline
+            )
+        else:
+            result = await asyncio.to_thread(
+                self.bybit_service.place_order, symbol=symbol, side=side, qty=qty,
+                stop_loss=stop_loss, take_profit=take_profit
+            )
+        if protect and result and not result.get("error") and not result.get("tp_sl_attached"):
+            self.attach_tp_sl(symbol, stop_loss, take_profit)
+        else:
+            self._fill_events.pop(symbol, None)
+        return result
+
+    def attach_tp_sl(self, symbol: str, stop_loss: float = None, take_profit: float = None) -> asyncio.Task:
+        """Поставить TP/SL после исполнения в фоновой задаче"""
+        task = asyncio.create_task(self._attach_tp_sl(symbol.upper(), stop_loss, take_profit))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _wait_for_fill(self, symbol: str):
+        fill_event = self._fill_events.setdefault(symbol, asyncio.Event())
+        try:
+            if self.account_stream is None or not self.account_stream.is_live():
+                return
+            if self.account_stream.get_position(symbol):
+                return
+            await asyncio.wait_for(fill_event.wait(), timeout=FILL_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning(f"Событие исполнения {symbol} не пришло за {FILL_WAIT_SECONDS} сек, ставлю TP/SL")
+        finally:
+            self._fill_events.pop(symbol, None)
+
+    async def _attach_tp_sl(self, symbol: str, stop_loss: float, take_profit: float) -> bool:
+        await self._wait_for_fill(symbol)
+        delay = self.base_delay
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                result = await asyncio.to_thread(
+                    self.bybit_service.set_trading_stop, symbol=symbol,
+                    stop_loss=stop_loss, take_profit=take_profit
+                )
+                if result is not None:
+                    logger.info(f"✅ TP/SL установлены для {symbol} (попытка {attempt}): SL={stop_loss}, TP={take_profit}")
+                    return True
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка при установке TP/SL для {symbol} (попытка {attempt}): {e}")
+            if attempt < self.max_attempts:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_delay)
+        logger.error(f"❌ Не удалось установить TP/SL для {symbol} после {self.max_attempts} попыток")
+        return False
@@ -0,0 +1,368 @@
+"""
+Перебор параметров стратегии и walk-forward валидация на бэктестере
+
+Пороги _calculate_opportunity_score, calculate_adaptive_leverage,
+_detect_overbought_status и лимиты RiskManagementService перебираются сеткой
+или случайным поиском в пуле процессов. Свечи и признаки один раз кладутся
+в разделяемую память (multiprocessing.shared_memory), воркеры читают их
+без копирования и без pickle. Результаты ранжируются и пишутся на диск.
+"""
+import copy
+import csv
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.backtest_engine import BacktestEngine, compute_features
+
+logger = logging.getLogger(__name__)
+
+# Сетка по умолчанию: префикс указывает, куда применяется параметр
+#   market.* - атрибут MarketAnalysisService
+#   risk.*   - атрибут RiskManagementService
+#   engine.* - аргумент BacktestEngine
+DEFAULT_PARAM_GRID = {
+    "market.rsi_overbought": [65, 70, 75],
+    "market.rsi_oversold": [25, 30, 35],
+    "market.score_overbought_penalty": [10, 15, 25],
+    "market.leverage_volatility_tiers": [
+        [[10, 2], [5, 3], [3, 5]],
+        [[8, 2], [4, 3], [2, 5]],
+    ],
+    "risk.atr_stop_multiplier": [1.5, 2.0, 3.0],
+    "engine.take_profit_percent": [0.5, 1.0, 1.5],
+}
+
+# Атрибуты-ссылки на другие сервисы, которые не сбрасываются между прогонами
+_SERVICE_ATTRS = ("bybit_service", "risk_service", "news_service", "db_service")
+
+# Состояние воркера: разделяемая память, представления массивов и сервисы
+_WORKER = {}
+
+
+def build_param_sets(grid: Dict[str, List], samples: Optional[int] = None, seed: int = 42) -> List[Dict]:
+    """
+    Построить наборы параметров: полная сетка или случайная выборка из нее
+
+    Args:
+        grid: {имя параметра: список значений}
+        samples: Сколько наборов выбрать случайно (None - вся сетка)
+        seed: Зерно генератора для воспроизводимости
+    """
+    names = list(grid.keys())
+    combos = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    if samples and samples < len(combos):
+        combos = random.Random(seed).sample(combos, samples)
+    return combos
+
+
+def build_folds(timeline: np.ndarray, train_days: int, test_days: int) -> List[Dict]:
+    """
+    Разбить шкалу времени на скользящие окна walk-forward: обучение + следующий за ним тест
+
+    Returns:
+        Список окон с границами в миллисекундах
+    """
+    if len(timeline) == 0:
+        return []
+    day_ms = 24 * 3600 * 1000
+    start = int(timeline[0])
+    end = int(timeline[-1])
+    folds = []
+    train_start = start
+    while train_start + (train_days + test_days) * day_ms <= end + day_ms:
+        train_end = train_start + train_days * day_ms
+        test_end = min(train_end + test_days * day_ms, end + 1)
+        folds.append({
+            "fold": len(folds),
+            "train": (train_start, train_end),
+            "test": (train_end, test_end),
+        })
+        train_start += test_days * day_ms
+    return folds
+
+
+def objective(metrics: Dict, min_trades: int = 10) -> Optional[float]:
+    """Целевая функция: доходность на единицу просадки (None - слишком мало сделок)"""
+    if metrics["trades_count"] < min_trades:
+        return None
+    return metrics["total_return_percent"] / max(metrics["max_drawdown_percent"], 1.0)
+
+
+def _pack_shared(arrays_by_symbol: Dict[str, Dict[str, Dict[str, np.ndarray]]]) -> Tuple[shared_memory.SharedMemory, List]:
+    """Сложить все массивы в один блок разделяемой памяти; вернуть блок и раскладку"""
+    layout = []
+    offset = 0
+    for symbol, groups in arrays_by_symbol.items():
+        for group, fields in groups.items():
+            for field, array in fields.items():
+                array = np.ascontiguousarray(array)
+                layout.append((symbol, group, field, array.dtype.str, array.shape, offset))
+                offset += array.nbytes
+                offset = (offset + 7) // 8 * 8  # Выравнивание по 8 байт
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 8))
+    for (symbol, group, field, dtype, shape, start), array in zip(
+        layout,
+        (array for groups in arrays_by_symbol.values() for fields in groups.values() for array in fields.values())
+    ):
+        view = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start)
+        view[...] = array
+    return shm, layout
+
+
+def _attach_shared(name: str, layout: List) -> Tuple[shared_memory.SharedMemory, Dict]:
+    """Подключиться к блоку разделяемой памяти и построить представления массивов без копирования"""
+    shm = shared_memory.SharedMemory(name=name)
+    arrays: Dict[str, Dict[str, Dict[str, np.ndarray]]] = {}
+    for symbol, group, field, dtype, shape, start in layout:
+        view = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start)
+        view.flags.writeable = False
+        arrays.setdefault(symbol, {}).setdefault(group, {})[field] = view
+    return shm, arrays
+
+
+def _build_services():
+    """Сервисы для оценки (сетевые запросы бэктесту не нужны, клиент только создается)"""
+    from services.bybit_service import BybitService
+    from services.market_analysis_service import MarketAnalysisService
+    from services.risk_management_service import RiskManagementService
+
+    bybit_service = BybitService()
+    risk_service = RiskManagementService(bybit_service=bybit_service)
+    market_service = MarketAnalysisService(bybit_service=bybit_service, risk_service=risk_service)
+    return market_service, risk_service
+
+
+def _init_worker(shm_name: str, layout: List, engine_defaults: Dict):
+    """Инициализация процесса пула: подключение к разделяемой памяти и создание сервисов"""
+    logging.getLogger().setLevel(logging.WARNING)
+    # Блоком владеет родительский процесс: он же удаляет его после перебора
+    shm, arrays = _attach_shared(shm_name, layout)
+
+    market_service, risk_service = _build_services()
+    _WORKER.update({
+        "shm": shm,
+        "arrays": arrays,
+        "market_service": market_service,
+        "risk_service": risk_service,
+        "market_defaults": copy.deepcopy({k: v for k, v in vars(market_service).items() if k not in _SERVICE_ATTRS}),
+        "risk_defaults": copy.deepcopy({k: v for k, v in vars(risk_service).items() if k not in _SERVICE_ATTRS}),
+        "engine_defaults": engine_defaults,
+    })
+
+
+def _apply_params(params: Dict):
+    """Сбросить сервисы к значениям по умолчанию и применить набор параметров"""
+    market_service = _WORKER["market_service"]
+    risk_service = _WORKER["risk_service"]
+    for name, value in _WORKER["market_defaults"].items():
+        setattr(market_service, name, copy.deepcopy(value))
+    for name, value in _WORKER["risk_defaults"].items():
+        setattr(risk_service, name, copy.deepcopy(value))
+
+    engine_kwargs = dict(_WORKER["engine_defaults"])
+    for key, value in params.items():
+        target, name = key.split(".", 1)
+        if target == "market":
+            setattr(market_service, name, value)
+        elif target == "risk":
+            setattr(risk_service, name, value)
+        elif target == "engine":
+            engine_kwargs[name] = value
+        else:
+            raise ValueError(f"Неизвестная цель параметра: {key}")
+    return engine_kwargs
+
+
+def _evaluate_task(task: Dict) -> Dict:
+    """Прогнать один набор параметров на одном отрезке времени (выполняется в воркере)"""
+    engine_kwargs = _apply_params(task["params"])
+    engine = BacktestEngine(_WORKER["market_service"], _WORKER["risk_service"], **engine_kwargs)
+
+    start_ts, end_ts = task["range"]
+    candles_by_symbol = {}
+    features_by_symbol = {}
+    for symbol, groups in _WORKER["arrays"].items():
+        timestamps = groups["candles"]["timestamp"]
+        lo = int(np.searchsorted(timestamps, start_ts, side="left"))
+        hi = int(np.searchsorted(timestamps, end_ts, side="left"))
+        if hi - lo < 2:
+            continue
+        # Срезы - представления разделяемой памяти, без копирования
+        candles_by_symbol[symbol] = {field: array[lo:hi] for field, array in groups["candles"].items()}
+        features_by_symbol[symbol] = {field: array[lo:hi] for field, array in groups["features"].items()}
+
+    report = engine.run(candles_by_symbol, features_by_symbol)
+    metrics = {key: report[key] for key in (
+        "final_equity", "total_pnl_usdt", "total_return_percent", "max_drawdown_percent",
+        "trades_count", "win_rate", "profit_factor"
+    )}
+    return {
+        "param_id": task["param_id"],
+        "fold": task["fold"],
+        "segment": task["segment"],
+        "metrics": metrics,
+    }
+
+
+class ParameterOptimizer:
+    """Перебор параметров с walk-forward валидацией в пуле процессов"""
+
+    def __init__(self, candles_by_symbol: Dict[str, Dict[str, np.ndarray]], window: int = 240,
+                 engine_defaults: Optional[Dict] = None, max_workers: Optional[int] = None,
+                 min_trades: int = 10):
+        """
+        Args:
+            candles_by_symbol: {символ: колонки свечей}
+            window: Окно свечей для индикаторов
+            engine_defaults: Аргументы BacktestEngine по умолчанию (max_positions, slippage_bps...)
+            max_workers: Размер пула (по умолчанию - все ядра)
+            min_trades: Минимум сделок, чтобы результат участвовал в ранжировании
+        """
+        self.candles_by_symbol = {s: c for s, c in candles_by_symbol.items() if c is not None and len(c["close"]) > window}
+        self.window = window
+        self.engine_defaults = engine_defaults or {}
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.min_trades = min_trades
+
+    def run(self, param_sets: List[Dict], train_days: int = 90, test_days: int = 30,
+            output_dir: Optional[Path] = None) -> Dict:
+        """
+        Запустить перебор
+
+        Args:
+            param_sets: Наборы параметров (build_param_sets)
+            train_days: Длина окна обучения
+            test_days: Длина тестового окна (и шаг сдвига)
+            output_dir: Куда записать ranked.csv и walk_forward.json
+
+        Returns:
+            Сводка: ранжированные наборы и результаты walk-forward
+        """
+        started = time.perf_counter()
+        timeline = np.unique(np.concatenate([c["timestamp"] for c in self.candles_by_symbol.values()]))
+        # Первые window свечей уходят на прогрев индикаторов
+        folds = build_folds(timeline[self.window:], train_days, test_days)
+        if not folds:
+            raise ValueError("Недостаточно истории для walk-forward: уменьшите train_days/test_days")
+
+        arrays = {
+            symbol: {"candles": candles, "features": compute_features(candles, self.window)}
+            for symbol, candles in self.candles_by_symbol.items()
+        }
+        shm, layout = _pack_shared(arrays)
+        logger.info(
+            f"Оптимизатор: {len(param_sets)} наборов × {len(folds)} окон, "
+            f"{shm.size / 1024 / 1024:.1f} МБ в разделяемой памяти, {self.max_workers} процессов"
+        )
+
+        tasks = [
+            {"param_id": pid, "params": params, "fold": fold["fold"], "segment": segment, "range": fold[segment]}
+            for pid, params in enumerate(param_sets)
+            for fold in folds
+            for segment in ("train", "test")
+        ]
+
+        try:
+            with ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(shm.name, layout, self.engine_defaults)
+            ) as executor:
+                chunksize = max(1, len(tasks) // (self.max_workers * 4))
+                results = list(executor.map(_evaluate_task, tasks, chunksize=chunksize))
+        finally:
+            shm.close()
+            shm.unlink()
+
+        summary = self._summarize(param_sets, folds, results)
+        summary["elapsed_seconds"] = round(time.perf_counter() - started, 2)
+        if output_dir:
+            self.write_results(summary, Path(output_dir))
+        return summary
+
+    def _summarize(self, param_sets: List[Dict], folds: List[Dict], results: List[Dict]) -> Dict:
+        by_key = {(r["param_id"], r["fold"], r["segment"]): r["metrics"] for r in results}
+
+        # Ранжирование наборов по среднему значению цели на обучающих окнах
+        ranked = []
+        for pid, params in enumerate(param_sets):
+            train_scores = [objective(by_key[(pid, f["fold"], "train")], self.min_trades) for f in folds]
+            test_scores = [objective(by_key[(pid, f["fold"], "test")], self.min_trades) for f in folds]
+            train_valid = [s for s in train_scores if s is not None]
+            test_valid = [s for s in test_scores if s is not None]
+            test_returns = [by_key[(pid, f["fold"], "test")]["total_return_percent"] for f in folds]
+            ranked.append({
+                "param_id": pid,
+                "params": params,
+                "train_objective": round(float(np.mean(train_valid)), 4) if train_valid else None,
+                "test_objective": round(float(np.mean(test_valid)), 4) if test_valid else None,
+                "test_return_percent": round(float(np.sum(test_returns)), 4),
+                "test_trades": sum(by_key[(pid, f["fold"], "test")]["trades_count"] for f in folds),
+            })
+        ranked.sort(key=lambda r: (r["train_objective"] is not None, r["train_objective"] or 0), reverse=True)
+
+        # Walk-forward: на каждом окне выбираем лучший набор по обучению и смотрим его тест
+        walk_forward = []
+        for fold in folds:
+            candidates = [
+                (objective(by_key[(pid, fold["fold"], "train")], self.min_trades), pid)
+                for pid in range(len(param_sets))
+            ]
+            candidates = [c for c in candidates if c[0] is not None]
+            if not candidates:
+                walk_forward.append({"fold": fold["fold"], "selected": None})
+                continue
+            best_score, best_pid = max(candidates)
+            walk_forward.append({
+                "fold": fold["fold"],
+                "train_range": [datetime.utcfromtimestamp(t / 1000).isoformat() for t in fold["train"]],
+                "test_range": [datetime.utcfromtimestamp(t / 1000).isoformat() for t in fold["test"]],
+                "selected": best_pid,
+                "params": param_sets[best_pid],
+                "train_objective": round(best_score, 4),
+                "train_metrics": by_key[(best_pid, fold["fold"], "train")],
+                "test_metrics": by_key[(best_pid, fold["fold"], "test")],
+            })
+
+        oos = [wf["test_metrics"] for wf in walk_forward if wf.get("selected") is not None]
+        return {
+            "param_sets": len(param_sets),
+            "folds": len(folds),
+            "ranked": ranked,
+            "walk_forward": walk_forward,
+            "out_of_sample": {
+                "total_return_percent": round(sum(m["total_return_percent"] for m in oos), 4),
+                "max_drawdown_percent": round(max((m["max_drawdown_percent"] for m in oos), default=0.0), 4),
+                "trades_count": sum(m["trades_count"] for m in oos),
+            },
+        }
+
+    @staticmethod
+    def write_results(summary: Dict, output_dir: Path):
+        """Записать ранжированные результаты (CSV) и полную сводку walk-forward (JSON)"""
+        output_dir.mkdir(parents=True, exist_ok=True)
+        param_names = sorted({name for row in summary["ranked"] for name in row["params"]})
+        with (output_dir / "ranked.csv").open("w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["rank", "param_id", "train_objective", "test_objective",
+                             "test_return_percent", "test_trades"] + param_names)
+            for rank, row in enumerate(summary["ranked"], 1):
+                writer.writerow(
+                    [rank, row["param_id"], row["train_objective"], row["test_objective"],
+                     row["test_return_percent"], row["test_trades"]]
+                    + [json.dumps(row["params"].get(name)) for name in param_names]
+                )
+        with (output_dir / "walk_forward.json").open("w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2, default=str)
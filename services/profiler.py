@@ -0,0 +1,271 @@
+"""
+Сэмплирующий профилировщик для работающего бота
+
+Фоновый поток раз в interval снимает стеки всех потоков процесса (sys._current_frames)
+и считает одинаковые стеки. Накладные расходы - один обход стеков за интервал, код бота
+не трассируется, поэтому профилировщик можно включать в бою. Сессия длится заданное число
+циклов job'а (cycle_finished вызывается в конце каждого цикла) или до stop().
+
+Результат:
+- файл collapsed stacks (формат flamegraph.pl / speedscope / inferno): "поток;f1;f2;f3 N"
+- сводка: доля времени Bybit / AI / БД / Telegram / CPU и топ функций
+Простаивающие потоки (ожидание в threading, selectors, queue) в файл и проценты не входят.
+"""
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_DIR = Path(__file__).resolve().parent.parent / "data" / "profiles"
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Источник времени по ближайшему к вершине стека кадру из этих модулей
+CATEGORY_MARKERS = [
+    ("bybit", ("pybit", "services/bybit_service.py", "services/exchange_simulator.py")),
+    ("ai", ("openai", "services/ai_service.py")),
+    ("db", ("mysql", "aiomysql", "pymysql", "services/db_service.py", "services/async_db_service.py")),
+    ("news", ("perplexity", "services/news_service.py")),
+    ("telegram", ("telegram",)),
+]
+# Вершина стека в этих файлах - поток ждет (блокировки, select цикла событий, очередь пула потоков)
+IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "futures/thread.py")
+CATEGORY_LABELS = {
+    "bybit": "Bybit",
+    "ai": "AI",
+    "db": "БД",
+    "news": "Новости",
+    "telegram": "Telegram",
+    "cpu": "CPU (код бота)",
+}
+
+
+def _short_path(filename: str) -> Tuple[str, bool]:
+    """Путь для подписи кадра и признак кода бота"""
+    path = filename.replace(os.sep, "/")
+    root = str(PROJECT_ROOT).replace(os.sep, "/") + "/"
+    if path.startswith(root):
+        return path[len(root):], True
+    for marker in ("site-packages/", "dist-packages/"):
+        if marker in path:
+            return path.split(marker, 1)[1], False
+    return "/".join(path.rsplit("/", 2)[-2:]), False
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.01, output_dir: Optional[str] = None):
+        """
+        Args:
+            interval: Интервал снятия стеков (секунды)
+            output_dir: Каталог файлов профиля (по умолчанию data/profiles)
+        """
+        self.interval = interval
+        self.output_dir = Path(output_dir) if output_dir else DEFAULT_PROFILE_DIR
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._stacks: Counter = Counter()
+        self._idle_samples = 0
+        self._cycles_left: Optional[int] = None
+        self._cycles_done = 0
+        self._started_at: Optional[float] = None
+        self._stopped_at: Optional[float] = None
+        # Подписи кадров кэшируются по объекту кода: форматирование - самая дорогая часть сэмпла
+        self._labels: Dict[object, Tuple[str, str]] = {}
+        self._project_labels = set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def cycles_left(self) -> Optional[int]:
+        return self._cycles_left
+
+    # ---------- управление ----------
+
+    def start(self, cycles: Optional[int] = None) -> bool:
+        """
+        Начать новую сессию (накопленные сэмплы сбрасываются)
+
+        Args:
+            cycles: Через сколько циклов job'а остановиться (None - до stop())
+
+        Returns:
+            False, если сессия уже идет
+        """
+        with self._lock:
+            if self.running:
+                return False
+            self._stacks = Counter()
+            self._idle_samples = 0
+            self._cycles_left = cycles
+            self._cycles_done = 0
+            self._started_at = time.monotonic()
+            self._stopped_at = None
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"🔬 Профилировщик запущен: интервал {self.interval * 1000:.0f} мс, циклов {cycles or '∞'}")
+        return True
+
+    def stop(self) -> bool:
+        """Остановить сессию; False - если она не шла"""
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return False
+            self._stop_event.set()
+            self._thread = None
+        thread.join(timeout=max(1.0, self.interval * 10))
+        self._stopped_at = time.monotonic()
+        logger.info(f"🔬 Профилировщик остановлен: {self.sample_count()} сэмплов")
+        return True
+
+    def cycle_finished(self) -> bool:
+        """
+        Отметить конец цикла job'а
+
+        Returns:
+            True, если этим циклом сессия завершилась (пора отдавать отчет)
+        """
+        if not self.running:
+            return False
+        self._cycles_done += 1
+        if self._cycles_left is None:
+            return False
+        self._cycles_left -= 1
+        if self._cycles_left > 0:
+            return False
+        return self.stop()
+
+    # ---------- сэмплирование ----------
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self._sample(names.get(thread_id, str(thread_id)), frame)
+
+    def _frame_label(self, code) -> Tuple[str, str]:
+        label = self._labels.get(code)
+        if label is None:
+            path, in_project = _short_path(code.co_filename)
+            label = self._labels[code] = (f"{code.co_name} ({path}:{code.co_firstlineno})", path)
+            if in_project:
+                self._project_labels.add(label[0])
+        return label
+
+    def _sample(self, thread_name: str, frame):
+        labels = []
+        while frame is not None:
+            labels.append(self._frame_label(frame.f_code))
+            frame = frame.f_back
+        if not labels:
+            return
+        if labels[0][1].endswith(IDLE_FILES):
+            self._idle_samples += 1
+            return
+        stack = (thread_name,) + tuple(label for label, _ in reversed(labels))
+        self._stacks[stack] += 1
+
+    # ---------- результаты ----------
+
+    def sample_count(self) -> int:
+        return sum(self._stacks.values())
+
+    def duration(self) -> float:
+        if self._started_at is None:
+            return 0.0
+        return (self._stopped_at or time.monotonic()) - self._started_at
+
+    def _category(self, stack: Tuple[str, ...]) -> str:
+        # Решает ближайший к вершине кадр известного модуля или кода бота:
+        # запрос к MySQL из ai_service - это БД, код бота в job'е PTB - это CPU, а не Telegram
+        for label in reversed(stack[1:]):
+            path = label.rsplit("(", 1)[-1]
+            for category, markers in CATEGORY_MARKERS:
+                if any(marker in path for marker in markers):
+                    return category
+            if label in self._project_labels:
+                return "cpu"
+        return "cpu"
+
+    def categories(self) -> Dict[str, int]:
+        """Сэмплы по источникам времени (bybit, ai, db, news, telegram, cpu)"""
+        totals: Counter = Counter()
+        for stack, count in list(self._stacks.items()):
+            totals[self._category(stack)] += count
+        return dict(totals)
+
+    def top_functions(self, top_n: int = 15) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+        """
+        Топ функций
+
+        Returns:
+            (по собственному времени - кадр на вершине стека,
+             по включительному - функция бота где угодно в стеке: рамки asyncio и PTB есть во всех стеках)
+        """
+        own: Counter = Counter()
+        inclusive: Counter = Counter()
+        for stack, count in list(self._stacks.items()):
+            frames = stack[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for label in set(frames):
+                if label in self._project_labels:
+                    inclusive[label] += count
+        return own.most_common(top_n), inclusive.most_common(top_n)
+
+    def write_collapsed(self, path: Optional[str] = None) -> Path:
+        """
+        Записать collapsed stacks (flamegraph.pl profile.collapsed > profile.svg)
+
+        Returns:
+            Путь к файлу
+        """
+        if path:
+            target = Path(path)
+        else:
+            target = self.output_dir / f"profile_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.collapsed"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with target.open("w", encoding="utf-8") as f:
+            for stack, count in sorted(self._stacks.items(), key=lambda item: -item[1]):
+                # ";" разделяет кадры, поэтому в подписях его быть не должно
+                f.write(";".join(part.replace(";", ",") for part in stack) + f" {count}\n")
+        return target
+
+    def summary(self, top_n: int = 15) -> str:
+        """Текстовая сводка для Telegram"""
+        total = self.sample_count()
+        lines = [
+            f"🔬 Профиль: {self.duration():.1f} сек, циклов {self._cycles_done}, "
+            f"{total} сэмплов (интервал {self.interval * 1000:.0f} мс, простой: {self._idle_samples})"
+        ]
+        if not total:
+            lines.append("Сэмплов нет - бот простаивал.")
+            return "\n".join(lines)
+
+        lines.append("")
+        lines.append("⏱ Время по источникам:")
+        for category, count in sorted(self.categories().items(), key=lambda item: -item[1]):
+            lines.append(f"  {CATEGORY_LABELS.get(category, category)}: {count / total * 100:.1f}%")
+
+        own, inclusive = self.top_functions(top_n)
+        lines.append("")
+        lines.append(f"🔝 Топ-{top_n} по собственному времени:")
+        lines.extend(f"  {count / total * 100:5.1f}%  {label}" for label, count in own)
+        lines.append("")
+        lines.append(f"📚 Топ-{top_n} функций бота по включительному времени:")
+        lines.extend(f"  {count / total * 100:5.1f}%  {label}" for label, count in inclusive)
+        return "\n".join(lines)
@@ -0,0 +1,283 @@
+"""
+Сервис хранения и ротации данных в MySQL
+
+- market_history, api_errors, ai_responses разбиты на дневные RANGE-партиции:
+  старые дни удаляются через DROP PARTITION (операция над метаданными, без построчного DELETE)
+- остальные таблицы чистятся порциями (DatabaseService.delete_in_batches)
+- перед удалением строки можно выгрузить в архив: JSONL, сжатый gzip, по файлу на таблицу и день
+"""
+import gzip
+import json
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from services.rollup_service import RESOLUTIONS
+import config
+
+logger = logging.getLogger(__name__)
+
+# Политики хранения: колонка времени, срок хранения, дневные партиции, доп. условие удаления.
+# Сырые снимки market_history живут недолго - история остается в агрегатах (services/rollup_service.py)
+DEFAULT_POLICIES = {
+    "market_history": {"column": "timestamp", "keep_days": config.RAW_HISTORY_KEEP_DAYS, "partitioned": True},
+    "api_errors": {"column": "timestamp", "keep_days": 30, "partitioned": True},
+    "ai_responses": {"column": "timestamp", "keep_days": 30, "partitioned": True},
+    "trades_history": {"column": "entry_time", "keep_days": 90, "partitioned": False,
+                       "where": "status = 'closed'"},
+}
+DEFAULT_POLICIES.update({
+    resolution["table"]: {"column": "bucket_start", "keep_days": resolution["keep_days"], "partitioned": False}
+    for resolution in RESOLUTIONS if resolution["keep_days"]
+})
+
+OLD_PARTITION = "p_old"  # Все, что старше первой дневной партиции
+MAX_PARTITION = "p_max"  # Все, что новее последней дневной партиции
+
+
+def _partition_name(day) -> str:
+    return f"p{day.strftime('%Y%m%d')}"
+
+
+def _partition_day(name: str):
+    try:
+        return datetime.strptime(name[1:], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+
+class RetentionService:
+    def __init__(self, db_service, archive_dir: Optional[str] = None, policies: Optional[Dict] = None,
+                 days_ahead: int = 3, batch_size: int = 5000):
+        """
+        Args:
+            db_service: DatabaseService (лучше отдельное подключение - ротация идет в фоновом потоке)
+            archive_dir: Каталог архива (None - удалять без архивации)
+            policies: Политики хранения (по умолчанию DEFAULT_POLICIES)
+            days_ahead: На сколько дней вперед заранее создавать партиции
+            batch_size: Размер порции при удалении и выгрузке
+        """
+        self.db_service = db_service
+        self.archive_dir = Path(archive_dir) if archive_dir else None
+        self.policies = policies or DEFAULT_POLICIES
+        self.days_ahead = days_ahead
+        self.batch_size = batch_size
+
+    # ---------- партиции ----------
+
+    def get_partitions(self, table_name: str) -> List[Dict]:
+        """Партиции таблицы в порядке следования (пусто, если таблица не партиционирована)"""
+        rows = self.db_service.execute_query(
+            """
+            SELECT PARTITION_NAME AS name
+            FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+            """,
+            (table_name,)
+        )
+        return rows or []
+
+    def partition_table(self, table_name: str, history_days: int = None) -> bool:
+        """
+        Перевести таблицу на дневные RANGE-партиции по колонке времени (разовая миграция)
+
+        Перестраивает таблицу целиком, поэтому запускается вручную (rotate_data.py --partition),
+        а не из бота. Первичный ключ расширяется до (id, колонка времени) - этого требует MySQL.
+
+        Args:
+            table_name: Имя таблицы из политик с partitioned=True
+            history_days: Сколько прошлых дней разбить по партициям (по умолчанию срок хранения)
+        """
+        policy = self.policies.get(table_name)
+        if not policy or not policy.get("partitioned"):
+            logger.warning(f"Таблица {table_name} не настроена на партиционирование")
+            return False
+        if self.get_partitions(table_name):
+            logger.info(f"Таблица {table_name} уже партиционирована")
+            return True
+
+        column = policy["column"]
+        today = datetime.utcnow().date()
+        first_day = today - timedelta(days=history_days if history_days is not None else policy["keep_days"])
+        days = [first_day + timedelta(days=i) for i in range((today - first_day).days + self.days_ahead + 1)]
+
+        definitions = [f"PARTITION {OLD_PARTITION} VALUES LESS THAN (TO_DAYS('{first_day.isoformat()}'))"]
+        definitions += [
+            f"PARTITION {_partition_name(day)} VALUES LESS THAN (TO_DAYS('{(day + timedelta(days=1)).isoformat()}'))"
+            for day in days
+        ]
+        definitions.append(f"PARTITION {MAX_PARTITION} VALUES LESS THAN MAXVALUE")
+
+        logger.info(f"Партиционирование {table_name}: {len(definitions)} партиций, это может занять время...")
+        if self.db_service.execute_query(
+            f"ALTER TABLE {table_name} DROP PRIMARY KEY, ADD PRIMARY KEY (id, {column})"
+        ) is None:
+            return False
+        result = self.db_service.execute_query(
+            f"ALTER TABLE {table_name} PARTITION BY RANGE (TO_DAYS({column})) ({', '.join(definitions)})"
+        )
+        return result is not None
+
+    def ensure_future_partitions(self, table_name: str) -> int:
+        """
+        Создать дневные партиции на days_ahead дней вперед (делением пустой p_max)
+
+        Returns:
+            Количество созданных партиций
+        """
+        partitions = self.get_partitions(table_name)
+        days = [d for d in (_partition_day(p["name"]) for p in partitions) if d]
+        if not days or not any(p["name"] == MAX_PARTITION for p in partitions):
+            return 0
+
+        last_day = max(days)
+        target_day = datetime.utcnow().date() + timedelta(days=self.days_ahead)
+        new_days = [last_day + timedelta(days=i) for i in range(1, (target_day - last_day).days + 1)]
+        if not new_days:
+            return 0
+
+        definitions = [
+            f"PARTITION {_partition_name(day)} VALUES LESS THAN (TO_DAYS('{(day + timedelta(days=1)).isoformat()}'))"
+            for day in new_days
+        ]
+        definitions.append(f"PARTITION {MAX_PARTITION} VALUES LESS THAN MAXVALUE")
+        result = self.db_service.execute_query(
+            f"ALTER TABLE {table_name} REORGANIZE PARTITION {MAX_PARTITION} INTO ({', '.join(definitions)})"
+        )
+        return len(new_days) if result is not None else 0
+
+    def drop_expired_partitions(self, table_name: str, keep_days: int) -> int:
+        """
+        Удалить партиции, целиком лежащие старше срока хранения (с архивацией, если она включена)
+
+        Returns:
+            Количество удаленных партиций
+        """
+        cutoff_day = datetime.utcnow().date() - timedelta(days=keep_days)
+        partitions = self.get_partitions(table_name)
+        days = {p["name"]: _partition_day(p["name"]) for p in partitions}
+        first_day = min((d for d in days.values() if d), default=None)
+
+        expired = []
+        for partition in partitions:
+            name = partition["name"]
+            if name == MAX_PARTITION:
+                continue
+            # p_old содержит дни раньше первой дневной партиции
+            day = days[name] if name != OLD_PARTITION else (first_day - timedelta(days=1) if first_day else None)
+            if day is not None and day < cutoff_day:
+                expired.append((name, day))
+
+        dropped = 0
+        for name, day in expired:
+            if name == OLD_PARTITION and not self.db_service.execute_query(
+                    f"SELECT 1 FROM {table_name} PARTITION ({name}) LIMIT 1"):
+                continue
+            if self.archive_dir and not self._archive_partition(table_name, name, day):
+                logger.warning(f"Архивация {table_name}.{name} не удалась - партиция не удалена")
+                continue
+            if name == OLD_PARTITION:
+                # p_old нужна как нижняя граница - очищаем, а не удаляем
+                result = self.db_service.execute_query(f"ALTER TABLE {table_name} TRUNCATE PARTITION {name}")
+            else:
+                result = self.db_service.execute_query(f"ALTER TABLE {table_name} DROP PARTITION {name}")
+            if result is not None:
+                dropped += 1
+        return dropped
+
+    # ---------- архив ----------
+
+    def _archive_file(self, table_name: str, label: str) -> Path:
+        table_dir = self.archive_dir / table_name
+        table_dir.mkdir(parents=True, exist_ok=True)
+        return table_dir / f"{table_name}_{label}.jsonl.gz"
+
+    def _archive_partition(self, table_name: str, partition: str, day) -> bool:
+        """Выгрузить партицию в gzip JSONL порциями по первичному ключу"""
+        try:
+            archive_file = self._archive_file(table_name, day.strftime("%Y%m%d") if partition != OLD_PARTITION
+                                              else f"before_{day.strftime('%Y%m%d')}")
+            last_id = 0
+            with gzip.open(archive_file, "at", encoding="utf-8") as f:
+                while True:
+                    rows = self.db_service.execute_query(
+                        f"SELECT * FROM {table_name} PARTITION ({partition}) WHERE id > %s ORDER BY id LIMIT %s",
+                        (last_id, self.batch_size)
+                    )
+                    if rows is None:
+                        return False
+                    for row in rows:
+                        f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+                    if len(rows) < self.batch_size:
+                        break
+                    last_id = rows[-1]["id"]
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при архивации {table_name}.{partition}: {e}")
+            return False
+
+    def _archive_and_delete(self, table_name: str, where_clause: str, params: tuple, column: str) -> int:
+        """Порционно выгрузить в архив и удалить строки по первичному ключу"""
+        deleted = 0
+        archive_file = self._archive_file(table_name, datetime.utcnow().strftime("%Y%m%d"))
+        with gzip.open(archive_file, "at", encoding="utf-8") as f:
+            while True:
+                rows = self.db_service.execute_query(
+                    f"SELECT * FROM {table_name} WHERE {where_clause} ORDER BY {column} LIMIT %s",
+                    tuple(params) + (self.batch_size,)
+                )
+                if not rows:
+                    break
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+                ids = [row["id"] for row in rows]
+                placeholders = ",".join(["%s"] * len(ids))
+                result = self.db_service.execute_query(
+                    f"DELETE FROM {table_name} WHERE id IN ({placeholders})", tuple(ids)
+                )
+                if not result:
+                    break
+                deleted += result
+                if len(rows) < self.batch_size:
+                    break
+        return deleted
+
+    # ---------- ротация ----------
+
+    def rotate_table(self, table_name: str) -> Dict:
+        """Применить политику хранения к одной таблице"""
+        policy = self.policies[table_name]
+        column = policy["column"]
+        result = {"table": table_name, "partitions_dropped": 0, "partitions_created": 0, "rows_deleted": 0}
+
+        if policy.get("partitioned") and self.get_partitions(table_name):
+            result["partitions_created"] = self.ensure_future_partitions(table_name)
+            result["partitions_dropped"] = self.drop_expired_partitions(table_name, policy["keep_days"])
+            return result
+
+        # Непартиционированные таблицы (или партиционирование еще не выполнено) - порционное удаление
+        cutoff_time = datetime.utcnow() - timedelta(days=policy["keep_days"])
+        where_clause = f"{column} < %s"
+        if policy.get("where"):
+            where_clause += f" AND {policy['where']}"
+        if self.archive_dir:
+            result["rows_deleted"] = self._archive_and_delete(table_name, where_clause, (cutoff_time,), column)
+        else:
+            result["rows_deleted"] = self.db_service.delete_in_batches(
+                table_name, where_clause, (cutoff_time,), order_column=column, batch_size=self.batch_size
+            )
+        return result
+
+    def run(self) -> List[Dict]:
+        """Ротация всех таблиц из политик; ошибка одной таблицы не останавливает остальные"""
+        results = []
+        for table_name in self.policies:
+            try:
+                results.append(self.rotate_table(table_name))
+            except Exception as e:
+                logger.error(f"Ошибка при ротации {table_name}: {e}")
+                results.append({"table": table_name, "error": str(e)})
+        return results
@@ -12,9 +12,12 @@ logger = logging.getLogger(__name__)
 
 
 class RiskManagementService:
-    def __init__(self, db_service=None):
-        self.bybit_service = BybitService()
+    def __init__(self, db_service=None, bybit_service=None, correlation_engine=None):
+        # bybit_service можно передать снаружи (общий клиент или офлайн-заглушка для бэктеста)
+        self.bybit_service = bybit_service or BybitService()
         self.db_service = db_service  # Для динамического расчета корреляции
+        self.correlation_engine = correlation_engine  # CorrelationEngine: корреляции по свечам за O(1)
+        self.correlation_method = getattr(config, "CORRELATION_METHOD", "rolling")  # "rolling" или "ewma"
         
         # Параметры управления рисками
         # Значение max_risk_per_trade можно переопределить через переменную окружения AUTO_RISK_PER_TRADE
@@ -25,6 +28,11 @@ class RiskManagementService:
         self.max_correlation = 0.9  # Максимальная корреляция между позициями (повышено для BTC/ETH и других основных активов)
         self.max_drawdown = 0.20  # Максимальная просадка: 20%
         
+        # Стоп-лосс по ATR: ATR * множитель, ограниченный диапазоном 0.5%-5%
+        self.atr_stop_multiplier = 2.0
+        self.min_stop_distance = 0.005
+        self.max_stop_distance = 0.05
+        
         # Параметры для trailing stop
         self.trailing_stop_enabled = True
         self.trailing_stop_percent = 0.02  # 2% trailing stop
@@ -37,7 +45,7 @@ class RiskManagementService:
         self.max_daily_loss_percent = 0.05  # Максимальный дневной убыток: 5% от капитала
         self.daily_loss_tracking = {}  # Отслеживание дневных убытков по датам
         
-        # Корреляционная матрица для популярных пар (fallback, если нет данных в БД)
+        # Корреляционная матрица для популярных пар (fallback, если у движка корреляций нет данных по паре)
         self.correlation_matrix = {
             "BTCUSDT": {"ETHUSDT": 0.85, "SOLUSDT": 0.75, "BNBUSDT": 0.70},
             "ETHUSDT": {"BTCUSDT": 0.85, "SOLUSDT": 0.80, "BNBUSDT": 0.75},
@@ -308,12 +316,11 @@ class RiskManagementService:
         try:
             # Если доступен ATR, используем его (более точный расчет)
             if atr and atr > 0:
-                # Используем ATR * 2 для стоп-лосса (стандартная практика)
-                atr_multiplier = 2.0
-                stop_distance = (atr * atr_multiplier) / entry_price
+                # Используем ATR * atr_stop_multiplier (по умолчанию 2) для стоп-лосса (стандартная практика)
+                stop_distance = (atr * self.atr_stop_multiplier) / entry_price
                 
                 # Ограничиваем минимальное расстояние 0.5% и максимальное 5%
-                stop_distance = max(0.005, min(stop_distance, 0.05))
+                stop_distance = max(self.min_stop_distance, min(stop_distance, self.max_stop_distance))
                 
                 if side.lower() == "long":
                     return entry_price * (1 - stop_distance)
@@ -445,6 +452,26 @@ class RiskManagementService:
         
         return validation_result
     
+    def get_correlation(self, symbol1: str, symbol2: str) -> float:
+        """
+        Корреляция пары: из движка корреляций, при отсутствии данных - из статической матрицы
+        
+        Returns:
+            Коэффициент корреляции (0.0, если пара неизвестна)
+        """
+        symbol1 = symbol1.upper()
+        symbol2 = symbol2.upper()
+        if self.correlation_engine:
+            correlation = self.correlation_engine.get(symbol1, symbol2, self.correlation_method)
+            if correlation is not None:
+                return correlation
+        
+        correlation = self.correlation_matrix.get(symbol1, {}).get(symbol2, 0.0)
+        if correlation == 0:
+            correlation = self.correlation_matrix.get(symbol2, {}).get(symbol1, 0.0)
+        logger.debug(f"Использование статической корреляции {symbol1}-{symbol2}: {correlation:.2f}")
+        return correlation
+    
     def check_correlation(self, new_symbol: str, existing_positions: List[Dict], new_side: str = None) -> Dict:
         """
         Проверить корреляцию новой позиции с существующими
@@ -474,15 +501,7 @@ class RiskManagementService:
                 if not existing_symbol:
                     continue
                     
-                correlation = 0.0
-                
-                # ВРЕМЕННО: Не используем БД для расчета корреляции, пока база наполняется
-                # Используем только статическую матрицу корреляций
-                correlation = self.correlation_matrix.get(new_symbol_upper, {}).get(existing_symbol, 0.0)
-                if correlation == 0:
-                    correlation = self.correlation_matrix.get(existing_symbol, {}).get(new_symbol_upper, 0.0)
-                
-                logger.debug(f"Использование статической корреляции {new_symbol_upper}-{existing_symbol}: {correlation:.2f} (БД временно отключена)")
+                correlation = self.get_correlation(new_symbol_upper, existing_symbol)
                 
                 if correlation > max_correlation:
                     max_correlation = correlation
@@ -551,6 +570,7 @@ class RiskManagementService:
         """
         try:
             today = datetime.utcnow().date().isoformat()
+            capital = float(capital or 0)  # BybitService.get_balance возвращает строку из ответа API
             
             # Получаем текущий дневной убыток
             if today not in self.daily_loss_tracking:
@@ -0,0 +1,265 @@
+"""
+Многоуровневые агрегаты market_history: 1m (сырые снимки) → 5m → 1h → 1d
+
+Каждый уровень - таблица с OHLC цены и средними индикаторов за интервал, строится из
+предыдущего уровня. Пересчитываются только интервалы начиная с последнего сохраненного
+(он мог быть неполным), поэтому прогон после каждого сбора данных дешевый.
+Запросы истории направляются в самую грубую таблицу, которая покрывает период
+с нужной детализацией; сырые снимки хранятся недолго.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Уровни агрегации от мелкого к крупному: таблица, длина интервала, срок хранения (None - бессрочно)
+RAW_TABLE = "market_history"
+RESOLUTIONS = [
+    {"name": "5m", "table": "market_history_5m", "seconds": 300, "keep_days": 30},
+    {"name": "1h", "table": "market_history_1h", "seconds": 3600, "keep_days": 730},
+    {"name": "1d", "table": "market_history_1d", "seconds": 86400, "keep_days": None},
+]
+
+# Средние, которые переносятся между уровнями
+MEAN_COLUMNS = ["volume_24h", "volatility", "funding_rate", "open_interest", "rsi", "atr", "macd", "liquidity_score"]
+
+
+def _bucket_expression(resolution: Dict, column: str) -> str:
+    """SQL-выражение начала интервала для колонки времени"""
+    if resolution["seconds"] == 300:
+        return f"({column} - INTERVAL MOD(MINUTE({column}), 5) * 60 + SECOND({column}) SECOND)"
+    if resolution["seconds"] == 3600:
+        return f"({column} - INTERVAL MINUTE({column}) * 60 + SECOND({column}) SECOND)"
+    return f"CAST(DATE({column}) AS DATETIME)"
+
+
+class RollupService:
+    def __init__(self, db_service, raw_keep_days: int = 3):
+        """
+        Args:
+            db_service: DatabaseService
+            raw_keep_days: Сколько дней хранятся сырые снимки market_history
+        """
+        self.db_service = db_service
+        self.raw_keep_days = raw_keep_days
+
+    def init_tables(self):
+        """Создать таблицы агрегатов"""
+        mean_columns = ",\n".join(f"                avg_{column} DOUBLE" for column in MEAN_COLUMNS)
+        for resolution in RESOLUTIONS:
+            self.db_service.execute_query(f"""
+            CREATE TABLE IF NOT EXISTS {resolution['table']} (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                symbol VARCHAR(20) NOT NULL,
+                bucket_start DATETIME NOT NULL,
+                open DECIMAL(20, 8) NOT NULL,
+                high DECIMAL(20, 8) NOT NULL,
+                low DECIMAL(20, 8) NOT NULL,
+                close DECIMAL(20, 8) NOT NULL,
+{mean_columns},
+                sample_count INT NOT NULL,
+                UNIQUE KEY unique_symbol_bucket (symbol, bucket_start),
+                INDEX idx_bucket_start (bucket_start)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """)
+
+    # ---------- построение ----------
+
+    def _source_select(self, index: int, symbol: Optional[str]) -> str:
+        """SELECT для уровня index из предыдущего уровня (для первого - из сырых снимков)"""
+        resolution = RESOLUTIONS[index]
+        symbol_filter = "AND symbol = %s" if symbol else ""
+
+        if index == 0:
+            bucket = _bucket_expression(resolution, "timestamp")
+            means = ",\n".join(f"                AVG({column}) AS m_{column}" for column in MEAN_COLUMNS)
+            select = f"""
+            SELECT
+                symbol,
+                {bucket} AS bucket,
+                SUBSTRING_INDEX(GROUP_CONCAT(price ORDER BY timestamp ASC), ',', 1) AS o,
+                MAX(price) AS h,
+                MIN(price) AS l,
+                SUBSTRING_INDEX(GROUP_CONCAT(price ORDER BY timestamp DESC), ',', 1) AS c,
+{means},
+                COUNT(*) AS n
+            FROM {RAW_TABLE}
+            WHERE timestamp >= %s {symbol_filter}
+            GROUP BY symbol, bucket
+            """
+            return select
+
+        bucket = _bucket_expression(resolution, "bucket_start")
+        # Средние взвешиваются числом исходных снимков; NULL-значения в вес не входят
+        means = ",\n".join(
+            f"                SUM(avg_{column} * sample_count) / "
+            f"NULLIF(SUM(CASE WHEN avg_{column} IS NOT NULL THEN sample_count END), 0) AS m_{column}"
+            for column in MEAN_COLUMNS
+        )
+        select = f"""
+            SELECT
+                symbol,
+                {bucket} AS bucket,
+                SUBSTRING_INDEX(GROUP_CONCAT(open ORDER BY bucket_start ASC), ',', 1) AS o,
+                MAX(high) AS h,
+                MIN(low) AS l,
+                SUBSTRING_INDEX(GROUP_CONCAT(close ORDER BY bucket_start DESC), ',', 1) AS c,
+{means},
+                SUM(sample_count) AS n
+            FROM {RESOLUTIONS[index - 1]['table']}
+            WHERE bucket_start >= %s {symbol_filter}
+            GROUP BY symbol, bucket
+            """
+        return select
+
+    def rollup(self, index: int, since: Optional[datetime] = None, symbol: Optional[str] = None) -> int:
+        """
+        Пересчитать уровень index начиная с since (по умолчанию - с последнего сохраненного интервала)
+
+        Returns:
+            Количество затронутых строк
+        """
+        resolution = RESOLUTIONS[index]
+        if since is None:
+            watermark = self.db_service.execute_query(
+                f"SELECT MAX(bucket_start) AS last_bucket FROM {resolution['table']}"
+            )
+            since = watermark[0]["last_bucket"] if watermark and watermark[0]["last_bucket"] else datetime(1970, 1, 1)
+
+        # Источник оборачивается в подзапрос: у уровней одинаковые имена колонок, а в
+        # INSERT ... SELECT ... ON DUPLICATE KEY UPDATE с GROUP BY они были бы неоднозначны
+        select = self._source_select(index, symbol)
+        mean_columns = ", ".join(f"avg_{column}" for column in MEAN_COLUMNS)
+        updates = ",\n".join(
+            f"                {column} = VALUES({column})"
+            for column in ["open", "high", "low", "close"] + [f"avg_{c}" for c in MEAN_COLUMNS] + ["sample_count"]
+        )
+        query = f"""
+            INSERT INTO {resolution['table']} (
+                symbol, bucket_start, open, high, low, close, {mean_columns}, sample_count
+            )
+            SELECT * FROM ({select}) AS src
+            ON DUPLICATE KEY UPDATE
+{updates}
+            """
+        params = (since, symbol) if symbol else (since,)
+        result = self.db_service.execute_query(query, params)
+        return result or 0
+
+    def run(self) -> Dict[str, int]:
+        """Довести все уровни до актуального состояния (вызывается после каждого сбора данных)"""
+        # Первая строка OHLC берется из GROUP_CONCAT - поднимаем лимит длины на время сессии
+        self.db_service.execute_query("SET SESSION group_concat_max_len = 1048576")
+        results = {}
+        for index, resolution in enumerate(RESOLUTIONS):
+            try:
+                results[resolution["name"]] = self.rollup(index)
+            except Exception as e:
+                logger.error(f"Ошибка при агрегации {resolution['table']}: {e}")
+                results[resolution["name"]] = 0
+        return results
+
+    def rebuild(self, symbol: Optional[str] = None, since: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Пересобрать все уровни за период (после загрузки истории задним числом)
+
+        Args:
+            symbol: Символ (None - все)
+            since: Начало периода (None - вся доступная история)
+        """
+        self.db_service.execute_query("SET SESSION group_concat_max_len = 1048576")
+        since = since or datetime(1970, 1, 1)
+        results = {}
+        for index, resolution in enumerate(RESOLUTIONS):
+            # Начало периода выравниваем на интервал уровня, чтобы первый интервал пересчитался целиком
+            if resolution["seconds"] >= 86400:
+                level_since = datetime(since.year, since.month, since.day)
+            else:
+                level_since = since - timedelta(seconds=(since.minute * 60 + since.second) % resolution["seconds"],
+                                                microseconds=since.microsecond)
+            results[resolution["name"]] = self.rollup(index, since=level_since, symbol=symbol)
+        return results
+
+    # ---------- маршрутизация запросов ----------
+
+    @staticmethod
+    def table_for_seconds(seconds: int) -> Optional[str]:
+        """Таблица агрегатов с ровно таким интервалом (None, если такого уровня нет)"""
+        for resolution in RESOLUTIONS:
+            if resolution["seconds"] == seconds:
+                return resolution["table"]
+        return None
+
+    def covered_since(self, table: str, now: Optional[datetime] = None) -> Optional[datetime]:
+        """С какого момента таблица гарантированно содержит данные (по сроку хранения)"""
+        now = now or datetime.utcnow()
+        if table == RAW_TABLE:
+            return now - timedelta(days=self.raw_keep_days)
+        for resolution in RESOLUTIONS:
+            if resolution["table"] == table:
+                return now - timedelta(days=resolution["keep_days"]) if resolution["keep_days"] else None
+        return None
+
+    def choose_table(self, start_time: datetime, end_time: Optional[datetime] = None,
+                     max_points: int = 1000, min_step_seconds: int = 0) -> Dict:
+        """
+        Выбрать самую грубую таблицу, которая покрывает период и дает не меньше max_points точек
+
+        Args:
+            start_time: Начало периода (UTC)
+            end_time: Конец периода (UTC, по умолчанию сейчас)
+            max_points: Сколько точек нужно на период
+            min_step_seconds: Минимальный допустимый шаг (например, 3600 для часовых доходностей)
+
+        Returns:
+            {"table", "seconds", "time_column", "raw"}
+        """
+        end_time = end_time or datetime.utcnow()
+        step = max((end_time - start_time).total_seconds() / max(max_points, 1), min_step_seconds)
+        candidates = [{"table": RAW_TABLE, "seconds": 60, "time_column": "timestamp", "raw": True}] + [
+            {"table": r["table"], "seconds": r["seconds"], "time_column": "bucket_start", "raw": False}
+            for r in RESOLUTIONS
+        ]
+
+        def covers(candidate):
+            since = self.covered_since(candidate["table"], end_time)
+            return since is None or since <= start_time
+
+        # Сначала - самая грубая таблица, не грубее запрошенного шага и покрывающая период
+        for candidate in reversed(candidates):
+            if candidate["seconds"] <= step and covers(candidate):
+                return candidate
+        # Шаг мельче доступного для такого старого периода - самая мелкая из покрывающих
+        for candidate in candidates:
+            if covers(candidate):
+                return candidate
+        return candidates[-1]
+
+    def get_history(self, symbol: str, start_time: datetime, end_time: Optional[datetime] = None,
+                    max_points: int = 1000, min_step_seconds: int = 0) -> List[Dict]:
+        """
+        История символа из подходящей таблицы в едином формате (от старых к новым)
+
+        Returns:
+            [{"timestamp", "open", "high", "low", "close", "volume_24h", "volatility", ...}, ...]
+        """
+        end_time = end_time or datetime.utcnow()
+        target = self.choose_table(start_time, end_time, max_points, min_step_seconds)
+        if target["raw"]:
+            query = f"""
+            SELECT timestamp, price AS open, price AS high, price AS low, price AS close,
+                   {', '.join(MEAN_COLUMNS)}
+            FROM {RAW_TABLE}
+            WHERE symbol = %s AND timestamp >= %s AND timestamp <= %s
+            ORDER BY timestamp ASC
+            """
+        else:
+            query = f"""
+            SELECT bucket_start AS timestamp, open, high, low, close,
+                   {', '.join(f'avg_{c} AS {c}' for c in MEAN_COLUMNS)}
+            FROM {target['table']}
+            WHERE symbol = %s AND bucket_start >= %s AND bucket_start <= %s
+            ORDER BY bucket_start ASC
+            """
+        return self.db_service.execute_query(query, (symbol, start_time, end_time)) or []
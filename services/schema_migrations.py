@@ -0,0 +1,375 @@
+"""
+Версионные миграции схемы БД
+
+Таблица schema_version хранит номера примененных миграций. При запуске бота
+(DatabaseService.init_tables) читается одна версия; если она равна последней
+в MIGRATIONS, больше запросов не выполняется. Иначе недостающие миграции
+применяются по порядку, каждая записывается в schema_version сразу после успеха.
+
+Миграции идемпотентны (CREATE TABLE IF NOT EXISTS, проверка колонок и индексов
+перед ALTER), поэтому база, которую раньше вели init_tables и ручные скрипты,
+доводится до актуальной схемы без ошибок. Параллельный запуск (бот и скрипт загрузки)
+сериализуется блокировкой MySQL GET_LOCK.
+
+Новая миграция - функция migration(db_service), добавленная в конец MIGRATIONS
+со следующим номером. Уже примененные миграции не меняются.
+"""
+import logging
+import time
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_LOCK_NAME = "trade_bot_schema_migrations"
+SCHEMA_LOCK_TIMEOUT = 60  # Секунды ожидания миграций, запущенных другим процессом
+
+SCHEMA_VERSION_TABLE = """
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                description VARCHAR(255) NOT NULL,
+                applied_at DATETIME NOT NULL,
+                duration_ms INT
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """
+
+# Таблица для хранения исторических данных по монетам
+MARKET_HISTORY_TABLE = """
+            CREATE TABLE IF NOT EXISTS market_history (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                symbol VARCHAR(20) NOT NULL,
+                timestamp DATETIME NOT NULL,
+                hour_utc INT NOT NULL,
+                price DECIMAL(20, 8) NOT NULL,
+                volume_24h DECIMAL(20, 2),
+                volatility DECIMAL(10, 4),
+                funding_rate DECIMAL(10, 8),
+                open_interest DECIMAL(20, 2),
+                rsi DECIMAL(6, 2),
+                atr DECIMAL(20, 8),
+                macd DECIMAL(20, 8),
+                macd_signal DECIMAL(20, 8),
+                bb_upper DECIMAL(20, 8),
+                bb_middle DECIMAL(20, 8),
+                bb_lower DECIMAL(20, 8),
+                ema_50 DECIMAL(20, 8),
+                ema_200 DECIMAL(20, 8),
+                vwap DECIMAL(20, 8),
+                liquidity_score DECIMAL(6, 2),
+                INDEX idx_symbol_timestamp (symbol, timestamp),
+                INDEX idx_hour_utc (hour_utc),
+                INDEX idx_timestamp (timestamp)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """
+
+# Таблица для статистики по времени суток
+TIME_OF_DAY_STATS_TABLE = """
+            CREATE TABLE IF NOT EXISTS time_of_day_stats (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                symbol VARCHAR(20) NOT NULL,
+                hour_utc INT NOT NULL,
+                avg_volatility DECIMAL(10, 4),
+                avg_volume DECIMAL(20, 2),
+                avg_spread DECIMAL(10, 8),
+                trade_count INT DEFAULT 0,
+                win_rate DECIMAL(5, 2),
+                avg_pnl DECIMAL(10, 4),
+                last_updated DATETIME NOT NULL,
+                UNIQUE KEY unique_symbol_hour (symbol, hour_utc),
+                INDEX idx_hour_utc (hour_utc)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """
+
+# Инкрементальные суммы по (символ, день, час UTC) - обновляются при каждой записи снимка/сделки.
+# time_of_day_stats пересобирается из них за последние N дней без сканирования market_history
+TIME_OF_DAY_BUCKETS_TABLE = """
+            CREATE TABLE IF NOT EXISTS time_of_day_buckets (
+                symbol VARCHAR(20) NOT NULL,
+                day DATE NOT NULL,
+                hour_utc INT NOT NULL,
+                snapshot_count INT NOT NULL DEFAULT 0,
+                sum_volatility DOUBLE NOT NULL DEFAULT 0,
+                sum_volume DOUBLE NOT NULL DEFAULT 0,
+                sum_funding_rate DOUBLE NOT NULL DEFAULT 0,
+                spread_count INT NOT NULL DEFAULT 0,
+                sum_spread DOUBLE NOT NULL DEFAULT 0,
+                trade_count INT NOT NULL DEFAULT 0,
+                win_count INT NOT NULL DEFAULT 0,
+                sum_pnl_percent DOUBLE NOT NULL DEFAULT 0,
+                PRIMARY KEY (symbol, day, hour_utc),
+                INDEX idx_day (day)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """
+
+# Таблица для хранения результатов сделок
+TRADES_HISTORY_TABLE = """
+            CREATE TABLE IF NOT EXISTS trades_history (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                bot_name VARCHAR(50) DEFAULT 'main',
+                symbol VARCHAR(20) NOT NULL,
+                side VARCHAR(10) NOT NULL,
+                entry_time DATETIME NOT NULL,
+                exit_time DATETIME,
+                entry_price DECIMAL(20, 8) NOT NULL,
+                exit_price DECIMAL(20, 8),
+                quantity DECIMAL(20, 8) NOT NULL,
+                pnl DECIMAL(20, 8),
+                pnl_percent DECIMAL(10, 4),
+                hour_utc INT NOT NULL,
+                leverage INT,
+                status VARCHAR(20) DEFAULT 'open',
+                stop_loss DECIMAL(20, 8),
+                take_profit DECIMAL(20, 8),
+                INDEX idx_symbol (symbol),
+                INDEX idx_entry_time (entry_time),
+                INDEX idx_hour_utc (hour_utc),
+                INDEX idx_status (status),
+                INDEX idx_bot_name (bot_name)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """
+
+# Таблица для хранения AI ответов и рекомендаций
+AI_RESPONSES_TABLE = """
+            CREATE TABLE IF NOT EXISTS ai_responses (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                timestamp DATETIME NOT NULL,
+                request_type VARCHAR(50) NOT NULL,
+                symbols TEXT,
+                prompt LONGTEXT,
+                recommended_symbol VARCHAR(20),
+                recommended_side VARCHAR(10),
+                entry_price DECIMAL(20, 8),
+                stop_loss DECIMAL(20, 8),
+                take_profit DECIMAL(20, 8),
+                confidence DECIMAL(5, 2),
+                reasoning TEXT,
+                full_response TEXT,
+                tokens_used INT,
+                response_time_ms INT,
+                INDEX idx_timestamp (timestamp),
+                INDEX idx_recommended_symbol (recommended_symbol),
+                INDEX idx_request_type (request_type)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """
+
+# Таблица для хранения ошибок API
+API_ERRORS_TABLE = """
+            CREATE TABLE IF NOT EXISTS api_errors (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                timestamp DATETIME NOT NULL,
+                api_method VARCHAR(50) NOT NULL,
+                symbol VARCHAR(20),
+                error_code VARCHAR(20),
+                error_message TEXT,
+                response_data TEXT,
+                occurrences INT NOT NULL DEFAULT 1,
+                INDEX idx_timestamp (timestamp),
+                INDEX idx_api_method (api_method),
+                INDEX idx_symbol (symbol)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """
+
+# Таблица для кэширования данных по монетам (быстрый доступ)
+MARKET_CACHE_TABLE = """
+            CREATE TABLE IF NOT EXISTS market_cache (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                symbol VARCHAR(20) NOT NULL,
+                timestamp DATETIME NOT NULL,
+                data_type VARCHAR(50) NOT NULL,
+                data_json TEXT NOT NULL,
+                expires_at DATETIME NOT NULL,
+                UNIQUE KEY unique_symbol_type (symbol, data_type),
+                INDEX idx_expires_at (expires_at),
+                INDEX idx_symbol_timestamp (symbol, timestamp)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """
+
+# Исполнение ордеров: моменты решения/отправки/подтверждения/исполнения, ожидаемая и фактическая цена
+# (services/execution_engine.py)
+ORDER_EXECUTIONS_TABLE = """
+            CREATE TABLE IF NOT EXISTS order_executions (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                bot_name VARCHAR(50) NOT NULL DEFAULT 'main',
+                symbol VARCHAR(20) NOT NULL,
+                side VARCHAR(10) NOT NULL,
+                strategy VARCHAR(20) NOT NULL,
+                execution_type VARCHAR(10) NOT NULL,
+                status VARCHAR(20) NOT NULL,
+                qty DECIMAL(20, 8) NOT NULL,
+                filled_qty DECIMAL(20, 8) NOT NULL,
+                maker_qty DECIMAL(20, 8) NOT NULL,
+                taker_qty DECIMAL(20, 8) NOT NULL,
+                expected_price DECIMAL(20, 8),
+                avg_price DECIMAL(20, 8),
+                slippage_bps DECIMAL(10, 3),
+                fee_estimate DECIMAL(20, 8),
+                fee_saved DECIMAL(20, 8),
+                reprices INT NOT NULL DEFAULT 0,
+                decision_time DATETIME(3) NOT NULL,
+                send_time DATETIME(3),
+                ack_time DATETIME(3),
+                fill_time DATETIME(3),
+                decision_to_fill_ms INT,
+                order_ids VARCHAR(255),
+                error_message TEXT,
+                INDEX idx_symbol_decision (symbol, decision_time),
+                INDEX idx_decision_time (decision_time)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+            """
+
+
+class MigrationError(Exception):
+    """Запрос миграции не выполнен"""
+
+
+def _execute(db_service, query: str, params=None):
+    """Выполнить запрос миграции; ошибка прерывает миграцию"""
+    result = db_service.execute_query(query, params)
+    if result is None:
+        raise MigrationError(f"запрос не выполнен: {query.strip().splitlines()[0]}")
+    return result
+
+
+def _has_column(db_service, table: str, column: str) -> bool:
+    return bool(_execute(db_service, f"SHOW COLUMNS FROM {table} LIKE %s", (column,)))
+
+
+def _has_index(db_service, table: str, index: str) -> bool:
+    return bool(_execute(db_service, f"SHOW INDEX FROM {table} WHERE Key_name = %s", (index,)))
+
+
+def _add_column(db_service, table: str, column: str, definition: str):
+    if not _has_column(db_service, table, column):
+        _execute(db_service, f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        logger.info(f"✅ Добавлено поле {column} в {table}")
+
+
+# ---------- миграции ----------
+
+def _create_base_tables(db_service):
+    for query in (MARKET_HISTORY_TABLE, TIME_OF_DAY_STATS_TABLE, TIME_OF_DAY_BUCKETS_TABLE,
+                  TRADES_HISTORY_TABLE, AI_RESPONSES_TABLE, API_ERRORS_TABLE, MARKET_CACHE_TABLE):
+        _execute(db_service, query)
+    db_service.rollup_service.init_tables()
+
+
+def _add_late_columns(db_service):
+    # Колонки, которые раньше добавлялись проверками в init_tables и migrate_trades_table.sql
+    _add_column(db_service, "trades_history", "bot_name", "VARCHAR(50) DEFAULT 'main' AFTER id")
+    if not _has_index(db_service, "trades_history", "idx_bot_name"):
+        _execute(db_service, "ALTER TABLE trades_history ADD INDEX idx_bot_name (bot_name)")
+    _add_column(db_service, "trades_history", "stop_loss", "DECIMAL(20, 8) AFTER status")
+    _add_column(db_service, "trades_history", "take_profit", "DECIMAL(20, 8) AFTER stop_loss")
+    # time_of_day_stats хранит готовые средние для выборки одним запросом
+    _add_column(db_service, "time_of_day_stats", "avg_funding_rate", "DECIMAL(10, 8) AFTER avg_spread")
+    _add_column(db_service, "time_of_day_stats", "data_points", "INT DEFAULT 0 AFTER avg_funding_rate")
+    _add_column(db_service, "ai_responses", "prompt", "LONGTEXT AFTER symbols")
+    # Повторы одной ошибки схлопываются в строку с количеством (services/error_sink.py)
+    _add_column(db_service, "api_errors", "occurrences", "INT NOT NULL DEFAULT 1 AFTER response_data")
+
+
+def _trades_unique_entry(db_service):
+    # Одна сделка бота по символу на момент входа. Перед созданием ключа удаляются
+    # дубликаты (остается запись с максимальным id, как в remove_duplicates_trades.py)
+    if _has_index(db_service, "trades_history", "unique_bot_symbol_entry"):
+        return
+    _execute(db_service, "UPDATE trades_history SET bot_name = 'main' WHERE bot_name IS NULL")
+    removed = _execute(db_service, """
+            DELETE older FROM trades_history older
+            JOIN trades_history newer
+              ON newer.bot_name = older.bot_name
+             AND newer.symbol = older.symbol
+             AND newer.entry_time = older.entry_time
+             AND newer.id > older.id
+            """)
+    if removed:
+        logger.info(f"Удалено дубликатов сделок: {removed}")
+    _execute(db_service, """
+            ALTER TABLE trades_history
+            ADD UNIQUE KEY unique_bot_symbol_entry (bot_name, symbol, entry_time)
+            """)
+
+
+def _ai_responses_type_time_index(db_service):
+    # Выборки ответов AI идут по типу запроса за период; одиночный индекс по типу
+    # становится префиксом нового и удаляется
+    if not _has_index(db_service, "ai_responses", "idx_request_type_timestamp"):
+        _execute(db_service, "ALTER TABLE ai_responses ADD INDEX idx_request_type_timestamp (request_type, timestamp)")
+    if _has_index(db_service, "ai_responses", "idx_request_type"):
+        _execute(db_service, "ALTER TABLE ai_responses DROP INDEX idx_request_type")
+
+
+def _fill_time_of_day_buckets(db_service):
+    # Первое включение агрегатов: заполняем корзины из уже накопленной истории
+    if not _execute(db_service, "SELECT 1 FROM time_of_day_buckets LIMIT 1"):
+        db_service.rebuild_time_of_day_buckets()
+
+
+def _create_order_executions(db_service):
+    _execute(db_service, ORDER_EXECUTIONS_TABLE)
+
+
+# Номер, описание, функция. Порядок и номера не меняются, новые миграции - только в конец
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, "Базовые таблицы и агрегаты market_history", _create_base_tables),
+    (2, "Колонки, добавленные после первой версии схемы", _add_late_columns),
+    (3, "Уникальный ключ trades_history (bot_name, symbol, entry_time)", _trades_unique_entry),
+    (4, "Индекс ai_responses (request_type, timestamp)", _ai_responses_type_time_index),
+    (5, "Заполнение time_of_day_buckets из истории", _fill_time_of_day_buckets),
+    (6, "Таблица order_executions (задержки и проскальзывание ордеров)", _create_order_executions),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# ---------- запуск ----------
+
+def pending_migrations(current_version: int) -> List[Tuple[int, str, Callable]]:
+    """Миграции новее current_version"""
+    return [migration for migration in MIGRATIONS if migration[0] > current_version]
+
+
+def run_migrations(db_service, target_version: Optional[int] = None) -> bool:
+    """
+    Применить недостающие миграции
+
+    Args:
+        db_service: DatabaseService
+        target_version: До какой версии применять (по умолчанию - до последней)
+
+    Returns:
+        True, если схема доведена до целевой версии
+    """
+    target_version = target_version or LATEST_VERSION
+    current = db_service.get_schema_version()
+    if current is None:
+        return False
+    if current >= target_version:
+        return True
+
+    locked = db_service.execute_query("SELECT GET_LOCK(%s, %s) AS locked",
+                                      (SCHEMA_LOCK_NAME, SCHEMA_LOCK_TIMEOUT))
+    if not locked or not locked[0]["locked"]:
+        logger.error("Не удалось дождаться блокировки миграций схемы БД")
+        return False
+    try:
+        db_service.execute_query(SCHEMA_VERSION_TABLE)
+        # Пока ждали блокировку, миграции мог применить другой процесс
+        current = db_service.get_schema_version() or 0
+        for version, description, migration in pending_migrations(current):
+            if version > target_version:
+                break
+            started = time.perf_counter()
+            try:
+                migration(db_service)
+            except Exception as e:
+                logger.error(f"❌ Миграция {version} ({description}) не применена: {e}")
+                return False
+            duration_ms = int((time.perf_counter() - started) * 1000)
+            db_service.execute_query(
+                "INSERT INTO schema_version (version, description, applied_at, duration_ms) VALUES (%s, %s, %s, %s)",
+                (version, description, datetime.utcnow(), duration_ms)
+            )
+            logger.info(f"✅ Миграция {version} применена за {duration_ms} мс: {description}")
+        return True
+    finally:
+        db_service.execute_query("SELECT RELEASE_LOCK(%s) AS released", (SCHEMA_LOCK_NAME,))
@@ -0,0 +1,202 @@
+"""
+Быстрый лексиконный скорер эмоционального фона новостей
+
+Один предкомпилированный regex по всему словарю, кэш оценок статей по хэшу URL,
+веса по свежести новости и по источнику. Метка (BULLISH/BEARISH/NEUTRAL)
+считается по тем же правилам, что и раньше в NewsService._analyze_sentiment.
+"""
+import hashlib
+import logging
+import re
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BULLISH_KEYWORDS = [
+    "surge", "rally", "bullish", "gains", "up", "rise", "growth",
+    "adoption", "institutional", "breakthrough", "positive",
+    "вырос", "рост", "ралли", "бычий", "позитивный"
+]
+
+BEARISH_KEYWORDS = [
+    "crash", "drop", "bearish", "decline", "down", "fall", "loss",
+    "concern", "warning", "risk", "negative", "correction",
+    "упал", "падение", "медвежий", "негативный", "риск"
+]
+
+# Вес источника (доверенные издания весят больше)
+DEFAULT_SOURCE_WEIGHTS = {
+    "coindesk.com": 1.2,
+    "theblock.co": 1.2,
+    "cointelegraph.com": 1.1,
+    "bitcoinmagazine.com": 1.0,
+    "decrypt.co": 1.0,
+    "cryptonews.com": 0.9,
+    "crypto.news": 0.9,
+    "ru.investing.com": 0.9,
+}
+
+
+class SentimentScorer:
+    """
+    Скорер новостей по словарю бычьих/медвежьих ключевых слов
+
+    Семантика совпадений та же, что у поиска подстрок: ключевое слово
+    засчитывается один раз на статью, если встречается в тексте
+    (заголовок + сниппет) в любом месте.
+    """
+
+    def __init__(
+        self,
+        bullish_keywords: Optional[List[str]] = None,
+        bearish_keywords: Optional[List[str]] = None,
+        source_weights: Optional[Dict[str, float]] = None,
+        recency_half_life_hours: float = 24.0,
+        cache_size: int = 10000
+    ):
+        self.bullish_keywords = list(dict.fromkeys(bullish_keywords or BULLISH_KEYWORDS))
+        self.bearish_keywords = list(dict.fromkeys(bearish_keywords or BEARISH_KEYWORDS))
+        self.source_weights = source_weights if source_weights is not None else dict(DEFAULT_SOURCE_WEIGHTS)
+        self.recency_half_life_hours = recency_half_life_hours
+        self.cache_size = cache_size
+
+        self._bullish_set = set(self.bullish_keywords)
+        self._bearish_set = set(self.bearish_keywords)
+        vocabulary = list(dict.fromkeys(self.bullish_keywords + self.bearish_keywords))
+
+        # Lookahead находит совпадение на каждой позиции, а не только
+        # непересекающиеся. Длинные слова идут первыми.
+        alternatives = "|".join(re.escape(word) for word in sorted(vocabulary, key=len, reverse=True))
+        self._pattern = re.compile(f"(?=({alternatives}))")
+
+        # Если на позиции нашлось длинное слово, то все словарные слова,
+        # входящие в него подстрокой, тоже присутствуют в тексте
+        self._implied = {
+            word: frozenset(other for other in vocabulary if other in word)
+            for word in vocabulary
+        }
+
+        self._cache: "OrderedDict[str, Tuple[int, int]]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def score_text(self, text: str) -> Tuple[int, int]:
+        """
+        Оценить один текст
+
+        Returns:
+            (количество бычьих слов, количество медвежьих слов)
+        """
+        found = set()
+        for word in set(self._pattern.findall(text.lower())):
+            found |= self._implied[word]
+        return len(found & self._bullish_set), len(found & self._bearish_set)
+
+    def score_texts(self, texts: Iterable[str]) -> List[Tuple[int, int]]:
+        """Пакетная оценка текстов (без кэша) - для бэктестов по архиву новостей"""
+        return [self.score_text(text) for text in texts]
+
+    def score_article(self, news_item: Dict) -> Tuple[int, int]:
+        """Оценить статью с кэшированием по хэшу URL"""
+        text = news_item.get("title", "") + " " + news_item.get("snippet", "")
+        key = self._cache_key(news_item.get("url") or text)
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return cached
+
+        self.cache_misses += 1
+        score = self.score_text(text)
+        self._cache[key] = score
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return score
+
+    def analyze(self, news_list: List[Dict], now: Optional[datetime] = None) -> Dict:
+        """
+        Оценить список новостей
+
+        Returns:
+            Словарь с меткой, сырыми и взвешенными счетами
+        """
+        if not news_list:
+            return {
+                "sentiment": "NEUTRAL",
+                "bullish_score": 0,
+                "bearish_score": 0,
+                "weighted_bullish": 0.0,
+                "weighted_bearish": 0.0,
+                "weighted_balance": 0.0
+            }
+
+        now = now or datetime.now(timezone.utc)
+        bullish_score = 0
+        bearish_score = 0
+        weighted_bullish = 0.0
+        weighted_bearish = 0.0
+
+        for news_item in news_list:
+            bullish, bearish = self.score_article(news_item)
+            bullish_score += bullish
+            bearish_score += bearish
+
+            weight = self._source_weight(news_item) * self._recency_weight(news_item, now)
+            weighted_bullish += bullish * weight
+            weighted_bearish += bearish * weight
+
+        total = weighted_bullish + weighted_bearish
+        return {
+            "sentiment": self.label(bullish_score, bearish_score),
+            "bullish_score": bullish_score,
+            "bearish_score": bearish_score,
+            "weighted_bullish": round(weighted_bullish, 4),
+            "weighted_bearish": round(weighted_bearish, 4),
+            "weighted_balance": round((weighted_bullish - weighted_bearish) / total, 4) if total else 0.0
+        }
+
+    @staticmethod
+    def label(bullish_score: float, bearish_score: float) -> str:
+        """Метка настроения по тем же порогам, что и раньше"""
+        if bullish_score > bearish_score * 1.5:
+            return "BULLISH"
+        elif bearish_score > bullish_score * 1.5:
+            return "BEARISH"
+        else:
+            return "NEUTRAL"
+
+    @staticmethod
+    def _cache_key(value: str) -> str:
+        return hashlib.sha1(value.encode("utf-8", errors="ignore")).hexdigest()
+
+    def _source_weight(self, news_item: Dict) -> float:
+        source = (news_item.get("source") or "").lower()
+        if source.startswith("www."):
+            source = source[4:]
+        return self.source_weights.get(source, 1.0)
+
+    def _recency_weight(self, news_item: Dict, now: datetime) -> float:
+        """Экспоненциальное затухание веса с периодом полураспада recency_half_life_hours"""
+        published = self._parse_date(news_item.get("date") or news_item.get("published_at"))
+        if not published or self.recency_half_life_hours <= 0:
+            return 1.0
+        age_hours = max(0.0, (now - published).total_seconds() / 3600)
+        return 0.5 ** (age_hours / self.recency_half_life_hours)
+
+    @staticmethod
+    def _parse_date(value) -> Optional[datetime]:
+        if not value:
+            return None
+        if isinstance(value, datetime):
+            parsed = value
+        else:
+            try:
+                parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+            except ValueError:
+                return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed
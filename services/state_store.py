@@ -0,0 +1,220 @@
+"""
+Хранилище состояния бота между перезапусками (SQLite в режиме WAL)
+
+Одна таблица ключ-значение, разбитая на пространства имен (позиции, карантин,
+автозакупка, фильтры объема). Значения сериализуются pickle - datetime и вложенные
+словари сохраняются как есть. Каждая запись - один UPSERT в своей транзакции;
+в WAL с synchronous=NORMAL это дешево и безопасно для горячего пути.
+
+Код бота работает с StateMap - словарем в памяти, который пишет изменения
+в хранилище. При старте все пространства имен читаются одним запросом.
+"""
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_FILE = Path(__file__).resolve().parent.parent / "data" / "bot_state.sqlite3"
+
+
+class StateStore:
+    def __init__(self, path: Optional[Union[str, Path]] = None):
+        """
+        Args:
+            path: Файл базы (по умолчанию data/bot_state.sqlite3)
+        """
+        self.path = Path(path) if path else DEFAULT_STATE_FILE
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Одно подключение на процесс; обращения из потоков сериализуются блокировкой
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS state (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            ) WITHOUT ROWID
+        """)
+        self._maps: Dict[str, "StateMap"] = {}
+        self._loaded = self._load_all()
+
+    def _load_all(self) -> Dict[str, Dict[str, Any]]:
+        started = time.perf_counter()
+        loaded: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            rows = self._conn.execute("SELECT namespace, key, value FROM state").fetchall()
+        for namespace, key, value in rows:
+            try:
+                loaded.setdefault(namespace, {})[key] = pickle.loads(value)
+            except Exception as e:
+                logger.warning(f"Состояние {namespace}/{key} не прочитано: {e}")
+        logger.info(f"Состояние бота загружено из {self.path}: {len(rows)} записей "
+                    f"за {(time.perf_counter() - started) * 1000:.1f} мс")
+        return loaded
+
+    # ---------- ключ-значение ----------
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        return pickle.loads(row[0]) if row else default
+
+    def set(self, namespace: str, key: str, value: Any):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+                """,
+                (namespace, key, payload, time.time())
+            )
+
+    def set_many(self, namespace: str, values: Dict[str, Any]):
+        """Записать несколько ключей одной транзакцией"""
+        now = time.time()
+        rows = [(namespace, key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), now)
+                for key, value in values.items()]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    """
+                    INSERT INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+                    """,
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def update(self, namespace: str, key: str, func: Callable[[Any], Any], default: Any = None) -> Any:
+        """
+        Атомарно изменить значение: func(старое) -> новое, в одной транзакции
+
+        Returns:
+            Новое значение
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+                ).fetchone()
+                value = func(pickle.loads(row[0]) if row else default)
+                self._conn.execute(
+                    """
+                    INSERT INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+                    """,
+                    (namespace, key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), time.time())
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if namespace in self._maps:
+            dict.__setitem__(self._maps[namespace], key, value)
+        return value
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def clear(self, namespace: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE namespace = ?", (namespace,))
+
+    def updated_at(self, namespace: str, key: str) -> Optional[float]:
+        """Время последней записи ключа (unix time) или None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT updated_at FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+        return row[0] if row else None
+
+    # ---------- словари ----------
+
+    def namespace(self, namespace: str, defaults: Optional[Dict[str, Any]] = None) -> "StateMap":
+        """
+        Словарь пространства имен, восстановленный из хранилища
+
+        Args:
+            namespace: Имя пространства
+            defaults: Значения для ключей, которых еще нет в хранилище (не записываются, пока не изменены)
+        """
+        if namespace not in self._maps:
+            initial = dict(defaults or {})
+            initial.update(self._loaded.pop(namespace, {}))
+            self._maps[namespace] = StateMap(self, namespace, initial)
+        return self._maps[namespace]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class StateMap(dict):
+    """
+    dict, изменения которого сразу пишутся в StateStore
+
+    Вложенные изменяемые значения (state[key]["field"] = ...) словарь не видит -
+    после таких изменений нужно вызвать save(key).
+    """
+
+    def __init__(self, store: StateStore, namespace: str, initial: Dict[str, Any]):
+        super().__init__(initial)
+        self._store = store
+        self._namespace = namespace
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._store.set(self._namespace, key, value)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._store.delete(self._namespace, key)
+
+    def pop(self, key, *args):
+        existed = key in self
+        value = super().pop(key, *args)
+        if existed:
+            self._store.delete(self._namespace, key)
+        return value
+
+    def update(self, *args, **kwargs):
+        values = dict(*args, **kwargs)
+        super().update(values)
+        if values:
+            self._store.set_many(self._namespace, values)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return super().__getitem__(key)
+
+    def clear(self):
+        super().clear()
+        self._store.clear(self._namespace)
+
+    def save(self, key):
+        """Записать текущее значение ключа (после изменения вложенного объекта)"""
+        if key in self:
+            self._store.set(self._namespace, key, super().__getitem__(key))
+
+    def atomic_update(self, key, func: Callable[[Any], Any], default: Any = None) -> Any:
+        """Атомарное изменение значения в хранилище (см. StateStore.update)"""
+        return self._store.update(self._namespace, key, func, default)
@@ -11,9 +11,10 @@ logger = logging.getLogger(__name__)
 
 
 class TradingDecisionService:
-    def __init__(self):
-        self.bybit_service = BybitService()
-        self.ai_service = AIService()
+    def __init__(self, bybit_service=None, ai_service=None):
+        # Клиентов можно передать готовыми, чтобы не создавать лишние подключения
+        self.bybit_service = bybit_service or BybitService()
+        self.ai_service = ai_service or AIService()
         self.fee_hurdle = 0.0015  # 0.15% комиссия
     
     def get_current_positions(self):
@@ -0,0 +1,79 @@
+"""
+Общие торговые правила бота: комиссии, выбор направления сделки, карантин.
+Используются и в bot.py, и в бэктестере, чтобы офлайн-прогон считал так же, как живой бот.
+"""
+from typing import Dict, Optional
+
+# Комиссии Bybit (фьючерсы)
+MAKER_FEE = 0.0002  # 0.02% для мейкер-ордеров (лимитные)
+TAKER_FEE = 0.00055  # 0.055% для тейкер-ордеров (рыночные)
+ADDITIONAL_FEE = 0.0005  # 0.05% дополнительная комиссия (если применима)
+
+# Пауза по символу после закрытия сделки
+TRADE_COOLDOWN_HOURS = 4
+
+
+def calculate_net_profit(pnl_percent: float, use_maker: bool = True, include_additional_fee: bool = False) -> Dict[str, float]:
+    """
+    Рассчитать чистую прибыль с учетом комиссий.
+
+    Args:
+        pnl_percent: Процент прибыли/убытка (например, 0.5 для 0.5%)
+        use_maker: Использовать мейкер-комиссию (True) или тейкер (False)
+        include_additional_fee: Включать ли дополнительную комиссию 0.05%
+
+    Returns:
+        Dict с ключами: gross_pnl, entry_fee, exit_fee, additional_fee, total_fees, net_pnl, net_pnl_percent
+    """
+    entry_fee = MAKER_FEE if use_maker else TAKER_FEE
+    exit_fee = TAKER_FEE  # Выход всегда рыночный (стоп/тейк)
+    additional_fee = ADDITIONAL_FEE if include_additional_fee else 0.0
+
+    total_fees = entry_fee + exit_fee + additional_fee
+    net_pnl_percent = pnl_percent - (total_fees * 100)  # Конвертируем в проценты
+
+    return {
+        "gross_pnl": pnl_percent,
+        "entry_fee": entry_fee * 100,  # В процентах
+        "exit_fee": exit_fee * 100,
+        "additional_fee": additional_fee * 100,
+        "total_fees": total_fees * 100,
+        "net_pnl": net_pnl_percent,
+        "net_pnl_percent": net_pnl_percent
+    }
+
+
+def determine_trade_side(status: Optional[str], trend: Optional[str]) -> str:
+    """
+    Логика выбора направления сделки с учетом перекупленности/перепроданности:
+      - OVERBOUGHT → Short (но если тренд сильный бычий, может быть Long)
+      - OVERSOLD → Long (но если тренд сильный медвежий, может быть Short)
+      - BALANCED/NEUTRAL → Long по умолчанию (бычий рынок в целом)
+      - Медвежий тренд → Short
+      - Бычий тренд → Long
+    """
+    status = (status or "BALANCED").upper()
+    trend = (trend or "сбалансирован").lower()
+
+    # Явная перепроданность - хорошая возможность для Long
+    if status == "OVERSOLD":
+        # Если тренд очень медвежий, может быть опасно открывать Long
+        if "сильный медвеж" in trend or "критическ" in trend:
+            return "Short"  # Следуем тренду
+        return "Long"  # Перепроданность = возможность для отскока
+
+    # Явная перекупленность - возможность для Short
+    if status == "OVERBOUGHT":
+        # Если тренд очень бычий, может быть опасно открывать Short
+        if "сильный быч" in trend or "критическ" in trend:
+            return "Long"  # Следуем тренду
+        return "Short"  # Перекупленность = возможность для коррекции
+
+    # Если статус BALANCED или NEUTRAL, смотрим на тренд
+    if "медвеж" in trend:
+        return "Short"
+    if "быч" in trend:
+        return "Long"
+
+    # По умолчанию Long (бычий рынок в целом)
+    return "Long"
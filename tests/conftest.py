@@ -0,0 +1,17 @@
+"""
+Общие настройки тестов: корень репозитория в sys.path (сервисы импортируются как services.*)
+и фиктивные ключи в окружении - config.py без них не импортируется.
+
+Запуск: python -m pytest -q (нужны зависимости из requirements.txt; сеть, MySQL и Bybit не нужны)
+"""
+import os
+import sys
+
+# До импорта config: load_dotenv не перезаписывает уже заданные переменные,
+# поэтому настоящие ключи из .env в тесты не попадают
+for name in ("TELEGRAM_BOT_TOKEN", "BYBIT_API_KEY", "BYBIT_API_SECRET", "DEEPSEEK_API_KEY"):
+    os.environ.setdefault(name, "test")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,153 @@
+"""
+AccountStream на приватном потоке ExchangeSimulator: сверка со снимком REST, события
+потока и ответы BybitService из книги
+"""
+import pytest
+
+from services.account_stream import (
+    AccountStream, EXECUTION, LIQUIDATION, POSITION_CLOSED, POSITION_OPENED, POSITION_UPDATED
+)
+from services.bybit_service import BybitService
+from services.exchange_simulator import ExchangeSimulator
+
+
+def position(symbol, size, updated_ms, side="Buy"):
+    return {"symbol": symbol, "side": side, "size": str(size), "avgPrice": "100", "updatedTime": str(updated_ms)}
+
+
+@pytest.fixture
+def simulator():
+    return ExchangeSimulator(seed=3, leverage=100, volatility=0.01)
+
+
+@pytest.fixture
+def stream(simulator):
+    stream = AccountStream(testnet=True, api_key="key", api_secret="secret", websocket_factory=simulator.websocket)
+    stream.events = []
+    stream.add_listener(lambda event, symbol, data: stream.events.append((event, symbol)))
+    assert stream.start()
+    yield stream
+    stream.stop()
+
+
+@pytest.fixture
+def bybit(simulator, stream):
+    service = BybitService(client=simulator)
+    service.attach_account_stream(stream)
+    return service
+
+
+def seed(stream, bybit):
+    stream.reconcile(bybit.get_positions_snapshot(), balance=bybit.get_balance(fresh=True))
+
+
+def market_order(simulator, symbol, side, qty, reduce_only=False):
+    response = simulator.place_order(category="linear", symbol=symbol, side=side, orderType="Market",
+                                     qty=str(qty), reduceOnly=reduce_only)
+    assert response["retCode"] == 0
+
+
+# ---------- reconcile ----------
+
+def test_not_live_until_reconciled(stream):
+    assert not stream.is_live()
+    stream.reconcile([])
+    assert stream.is_live()
+
+
+def test_reconcile_opens_missing_and_closes_absent_positions(stream):
+    stream.reconcile([position("BTCUSDT", 0.5, 1_000), position("ETHUSDT", 2, 1_000)], taken_at=2)
+    assert {pos["symbol"] for pos in stream.positions()} == {"BTCUSDT", "ETHUSDT"}
+    assert stream.events == [(POSITION_OPENED, "BTCUSDT"), (POSITION_OPENED, "ETHUSDT")]
+
+    stream.events.clear()
+    stream.reconcile([position("BTCUSDT", 0.5, 1_000)], taken_at=3)
+
+    assert [pos["symbol"] for pos in stream.positions()] == ["BTCUSDT"]
+    assert [event for event in stream.events if event[0] != POSITION_UPDATED] == [(POSITION_CLOSED, "ETHUSDT")]
+
+
+def test_reconcile_ignores_snapshot_older_than_stream(stream):
+    stream.reconcile([position("BTCUSDT", 0.5, 5_000)], taken_at=6)
+    stream.events.clear()
+
+    # Снимок запрошен до обновления потоком: размер из него не применяется
+    stream.reconcile([position("BTCUSDT", 0.1, 4_000)], taken_at=4.5)
+    assert stream.get_position("BTCUSDT")["size"] == "0.5"
+
+    # Позиция, открытая потоком после запроса снимка, не закрывается этим снимком
+    stream.reconcile([position("BTCUSDT", 0.5, 5_000), position("SOLUSDT", 3, 7_000)], taken_at=8)
+    stream.reconcile([position("BTCUSDT", 0.5, 5_000)], taken_at=6.5)
+    assert {pos["symbol"] for pos in stream.positions()} == {"BTCUSDT", "SOLUSDT"}
+    assert (POSITION_CLOSED, "SOLUSDT") not in stream.events
+
+
+def test_reconcile_keeps_stream_balance(stream):
+    stream.reconcile([], balance="1000")
+    assert stream.balance == "1000"
+    stream.reconcile([], balance="900")
+    assert stream.balance == "1000"
+
+
+# ---------- события потока ----------
+
+def test_stream_reports_open_update_and_close(simulator, stream, bybit):
+    seed(stream, bybit)
+
+    market_order(simulator, "BTCUSDT", "Buy", 0.01)
+    assert stream.get_position("BTCUSDT")["side"] == "Buy"
+    market_order(simulator, "BTCUSDT", "Buy", 0.01)
+    market_order(simulator, "BTCUSDT", "Sell", 0.02, reduce_only=True)
+
+    position_events = [event for event in stream.events if event[0].startswith("position")]
+    assert position_events == [
+        (POSITION_OPENED, "BTCUSDT"), (POSITION_UPDATED, "BTCUSDT"), (POSITION_CLOSED, "BTCUSDT")
+    ]
+    assert stream.positions() == []
+    assert stream.events.count((EXECUTION, "BTCUSDT")) == 3
+
+
+def test_stream_reports_liquidation(simulator, stream, bybit):
+    seed(stream, bybit)
+    market_order(simulator, "ETHUSDT", "Buy", 1)
+
+    # Плечо 100 и высокая волатильность: ликвидация наступает за несколько сдвигов часов
+    for _ in range(50):
+        simulator.advance(600)
+        if (LIQUIDATION, "ETHUSDT") in stream.events:
+            break
+
+    assert (LIQUIDATION, "ETHUSDT") in stream.events
+    assert (POSITION_CLOSED, "ETHUSDT") in stream.events
+    assert stream.get_position("ETHUSDT") is None
+
+
+# ---------- BybitService ----------
+
+def test_bybit_service_serves_from_book_while_live(simulator, stream, bybit):
+    seed(stream, bybit)
+    market_order(simulator, "BTCUSDT", "Buy", 0.01)
+    calls = dict(simulator.calls)
+
+    positions = bybit.get_positions()
+    balance = bybit.get_balance()
+
+    assert [pos["symbol"] for pos in positions] == ["BTCUSDT"]
+    assert float(balance) < 10000
+    assert dict(simulator.calls) == calls
+
+
+def test_bybit_service_falls_back_to_rest_when_not_live(simulator, stream, bybit):
+    # Книга не заполнена снимком - ответы из REST
+    market_order(simulator, "BTCUSDT", "Buy", 0.01)
+    assert [pos["symbol"] for pos in bybit.get_positions()] == ["BTCUSDT"]
+    assert simulator.calls["get_positions"] == 1
+
+    seed(stream, bybit)
+    stream.stop()
+    calls = simulator.calls["get_positions"], simulator.calls["get_wallet_balance"]
+
+    bybit.invalidate_positions()
+    assert [pos["symbol"] for pos in bybit.get_positions()] == ["BTCUSDT"]
+    assert bybit.get_balance() is not None
+    assert (simulator.calls["get_positions"], simulator.calls["get_wallet_balance"]) == (calls[0] + 1, calls[1] + 1)
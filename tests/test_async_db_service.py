@@ -0,0 +1,243 @@
+"""
+AsyncDatabaseService поверх пула-заглушки с интерфейсом aiomysql и без aiomysql (через поток)
+"""
+import asyncio
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import services.async_db_service as async_db_module
+from services.async_db_service import AsyncDatabaseService
+
+TRADE_COLUMNS = ["id", "symbol", "side", "entry_price", "quantity", "leverage", "stop_loss", "take_profit",
+                 "entry_time", "exit_time", "exit_price", "pnl", "pnl_percent", "status", "bot_name"]
+GOOD_MARKET_DATA = {"current_price": 100.0, "volume_24h": 1_000_000.0, "volatility": 2.0, "funding_rate": 0.0001}
+
+
+class FakeCursor:
+    def __init__(self, pool):
+        self.pool = pool
+        self.rowcount = 0
+        self._rows = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query, params=()):
+        pool = self.pool
+        pool.queries.append((" ".join(query.split()), params))
+        pool.in_flight += 1
+        pool.max_in_flight = max(pool.max_in_flight, pool.in_flight)
+        try:
+            # Уступаем цикл событий: параллельные запросы успевают пересечься
+            await asyncio.sleep(0.01)
+            if pool.fail_on and pool.fail_on in query:
+                raise RuntimeError("Lost connection to MySQL server")
+            self._rows = pool.rows_for(query)
+            self.rowcount = 1
+        finally:
+            pool.in_flight -= 1
+
+    async def fetchall(self):
+        return self._rows
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self, cursor_class=None):
+        self.pool.cursor_classes.append(cursor_class)
+        return FakeCursor(self.pool)
+
+
+class FakeAcquire:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def __aenter__(self):
+        return FakeConnection(self.pool)
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakePool:
+    """Пул с интерфейсом aiomysql: acquire() -> connection.cursor(DictCursor) -> execute/fetchall"""
+
+    def __init__(self, open_trade=None):
+        self.queries = []
+        self.cursor_classes = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.fail_on = None
+        self.open_trade = open_trade
+        self.closed = False
+
+    def acquire(self):
+        return FakeAcquire(self)
+
+    def rows_for(self, query):
+        normalized = query.strip().upper()
+        if normalized.startswith("SHOW COLUMNS"):
+            return [{"Field": name} for name in TRADE_COLUMNS]
+        if normalized.startswith("SELECT ID, ENTRY_TIME"):
+            return [self.open_trade] if self.open_trade else []
+        if normalized.startswith("SELECT"):
+            return [{"value": 1}]
+        return []
+
+    def statements(self, prefix):
+        return [query for query, _ in self.queries if query.upper().startswith(prefix.upper())]
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+
+@pytest.fixture
+def dict_cursor(monkeypatch):
+    """aiomysql.DictCursor без установленного aiomysql"""
+    marker = object()
+    monkeypatch.setattr(async_db_module, "aiomysql", SimpleNamespace(DictCursor=marker), raising=False)
+    return marker
+
+
+def make_service(pool):
+    service = AsyncDatabaseService(max_size=4)
+    service._pool = pool
+    return service
+
+
+def test_execute_query_returns_rows_for_select(dict_cursor):
+    pool = FakePool()
+    service = make_service(pool)
+
+    result = asyncio.run(service.execute_query("SELECT 1 AS value"))
+
+    assert result == [{"value": 1}]
+    assert pool.cursor_classes == [dict_cursor]
+
+
+def test_execute_query_returns_rowcount_for_dml(dict_cursor):
+    pool = FakePool()
+    service = make_service(pool)
+
+    result = asyncio.run(service.execute_query("DELETE FROM market_cache WHERE expires_at < %s", ("2024-01-01",)))
+
+    assert result == 1
+    assert pool.queries == [("DELETE FROM market_cache WHERE expires_at < %s", ("2024-01-01",))]
+
+
+def test_execute_query_returns_none_on_error(dict_cursor):
+    pool = FakePool()
+    pool.fail_on = "market_cache"
+    service = make_service(pool)
+
+    assert asyncio.run(service.execute_query("DELETE FROM market_cache")) is None
+
+
+def test_save_market_snapshot_runs_both_inserts_concurrently(dict_cursor):
+    pool = FakePool()
+    service = make_service(pool)
+
+    saved = asyncio.run(service.save_market_snapshot("BTCUSDT", GOOD_MARKET_DATA, {"rsi": 55.0}))
+
+    assert saved is True
+    assert len(pool.statements("INSERT INTO market_history")) == 1
+    assert len(pool.statements("INSERT INTO time_of_day_buckets")) == 1
+    assert pool.max_in_flight == 2
+
+
+def test_save_market_snapshot_records_error_when_snapshot_insert_fails(dict_cursor):
+    pool = FakePool()
+    pool.fail_on = "market_history"
+    service = make_service(pool)
+
+    saved = asyncio.run(service.save_market_snapshot("BTCUSDT", GOOD_MARKET_DATA, {}))
+
+    assert saved is False
+    assert len(pool.statements("INSERT INTO api_errors")) == 1
+
+
+def test_save_market_snapshot_skips_invalid_data(dict_cursor):
+    pool = FakePool()
+    service = make_service(pool)
+
+    assert asyncio.run(service.save_market_snapshot("BTCUSDT", {"current_price": 0}, {})) is False
+    assert pool.queries == []
+
+
+def test_trade_columns_are_queried_once(dict_cursor):
+    pool = FakePool(open_trade={"id": 7, "entry_time": datetime(2024, 1, 1, 10)})
+    service = make_service(pool)
+
+    async def scenario():
+        await service.save_trade("BTCUSDT", "Buy", 100.0, 0.5, 5, stop_loss=95.0, take_profit=110.0)
+        await service.save_trade("ETHUSDT", "Sell", 2000.0, 1.0, 3)
+        await service.update_trade_exit("BTCUSDT", 105.0, 2.5, 5.0)
+
+    asyncio.run(scenario())
+
+    assert len(pool.statements("SHOW COLUMNS")) == 1
+    assert service._trade_columns == TRADE_COLUMNS
+    inserts = [(query, params) for query, params in pool.queries if query.startswith("INSERT INTO trades_history")]
+    assert len(inserts) == 2
+    assert "bot_name" in inserts[0][0]
+    # Колонка bot_name есть - выход ищется по символу и боту
+    select = [params for query, params in pool.queries if query.startswith("SELECT id, entry_time")]
+    assert select == [("BTCUSDT", "main")]
+    updates = [params for query, params in pool.queries if query.startswith("UPDATE trades_history")]
+    assert len(updates) == 1 and updates[0][-1] == 7
+    assert len(pool.statements("INSERT INTO time_of_day_buckets")) == 1
+
+
+def test_update_trade_exit_without_open_trade_does_not_update(dict_cursor):
+    pool = FakePool(open_trade=None)
+    service = make_service(pool)
+
+    assert asyncio.run(service.update_trade_exit("BTCUSDT", 105.0, 2.5, 5.0)) is True
+    assert pool.statements("UPDATE") == []
+
+
+def test_falls_back_to_thread_without_aiomysql(monkeypatch):
+    calls = []
+
+    class FakeSyncDatabase:
+        def __init__(self):
+            self.closed = False
+
+        def execute_query(self, query, params=None):
+            calls.append((query, params, threading.get_ident()))
+            return [{"value": 1}] if query.startswith("SELECT") else 1
+
+        def close(self):
+            self.closed = True
+
+    monkeypatch.setattr(async_db_module, "AIOMYSQL_AVAILABLE", False)
+    monkeypatch.setattr(async_db_module, "DatabaseService", FakeSyncDatabase)
+    service = AsyncDatabaseService()
+
+    async def scenario():
+        rows = await service.execute_query("SELECT 1")
+        count = await service.execute_query("DELETE FROM market_cache")
+        sync_db = service._sync_db
+        await service.close()
+        return rows, count, sync_db
+
+    rows, count, sync_db = asyncio.run(scenario())
+
+    assert rows == [{"value": 1}]
+    assert count == 1
+    assert service._pool is None
+    assert sync_db.closed
+    # Синхронный DatabaseService не блокирует цикл событий - запросы идут в потоке
+    assert all(thread_id != threading.get_ident() for _, _, thread_id in calls)
+    assert len(calls) == 2
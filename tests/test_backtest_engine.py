@@ -0,0 +1,65 @@
+"""
+BacktestEngine на синтетических свечах: капитал не уходит ниже нуля
+"""
+import numpy as np
+import pytest
+
+from services.backtest_engine import BacktestEngine
+from services.bybit_service import BybitService
+from services.exchange_simulator import ExchangeSimulator
+from services.market_analysis_service import MarketAnalysisService
+from services.risk_management_service import RiskManagementService
+
+SYMBOLS = ["AAAUSDT", "BBBUSDT", "CCCUSDT"]
+
+
+def random_walk(rng, count=2000, volatility=0.03):
+    close = 100 * np.exp(np.cumsum(rng.normal(0, volatility, count)))
+    open_ = np.concatenate([[100.0], close[:-1]])
+    return {
+        "timestamp": np.arange(count, dtype=np.int64) * 3_600_000 + 1_600_000_000_000,
+        "open": open_,
+        "high": np.maximum(open_, close) * (1 + np.abs(rng.normal(0, volatility, count))),
+        "low": np.minimum(open_, close) * (1 - np.abs(rng.normal(0, volatility, count))),
+        "close": close,
+        "volume": rng.lognormal(10, 1, count),
+    }
+
+
+def make_engine(risk_per_trade):
+    bybit = BybitService(client=ExchangeSimulator(seed=0))
+    risk_service = RiskManagementService(bybit_service=bybit)
+    market_service = MarketAnalysisService(bybit_service=bybit, risk_service=risk_service)
+    market_service.max_daily_risk = risk_per_trade
+    return BacktestEngine(market_service, cooldown_hours=0)
+
+
+@pytest.fixture
+def candles():
+    rng = np.random.default_rng(1)
+    return {symbol: random_walk(rng) for symbol in SYMBOLS}
+
+
+def test_stops_trading_when_capital_is_exhausted(candles):
+    # Риск 500% капитала на сделку: первая же серия убытков исчерпывает капитал
+    report = make_engine(risk_per_trade=5.0).run(candles)
+
+    assert report["final_equity"] == 0
+    assert report["total_return_percent"] == -100
+    assert report["max_drawdown_percent"] == 100
+    assert report["exit_reasons"]["LIQUIDATION"] >= 1
+    assert all(value >= 0 for _, value in report["equity_curve"])
+    assert report["total_pnl_usdt"] == pytest.approx(-report["start_capital"])
+    last_exit = max(trade["exit_ts"] for trade in report["trades"])
+    assert all(trade["entry_ts"] <= last_exit for trade in report["trades"])
+
+
+def test_drawdown_within_bounds():
+    rng = np.random.default_rng(2)
+    candles = {symbol: random_walk(rng, volatility=0.01) for symbol in SYMBOLS}
+
+    report = make_engine(risk_per_trade=0.02).run(candles)
+
+    assert report["trades_count"] > 0
+    assert 0 <= report["max_drawdown_percent"] <= 100
+    assert report["final_equity"] > 0
@@ -0,0 +1,53 @@
+"""
+BybitService.close_all_positions на ExchangeSimulator
+"""
+import threading
+
+from services.bybit_service import BybitService
+from services.exchange_simulator import ExchangeSimulator
+
+POSITIONS = {"BTCUSDT": "0.01", "ETHUSDT": "0.1", "SOLUSDT": "1", "XRPUSDT": "100", "DOGEUSDT": "1000"}
+
+
+def open_positions(simulator):
+    for symbol, qty in POSITIONS.items():
+        response = simulator.place_order(category="linear", symbol=symbol, side="Buy", orderType="Market", qty=qty)
+        assert response["retCode"] == 0, (symbol, response["retMsg"])
+
+
+def test_close_all_positions_in_one_batch():
+    simulator = ExchangeSimulator(seed=1)
+    open_positions(simulator)
+    bybit = BybitService(client=simulator)
+
+    result = bybit.close_all_positions()
+
+    assert result["total_closed"] == len(POSITIONS)
+    assert all(report["batch"] and report["status"] == "Filled" for report in result["orders"])
+    assert simulator.calls["place_batch_order"] == 1
+    assert bybit.get_positions_snapshot() == []
+
+
+def test_close_all_positions_falls_back_to_parallel_orders():
+    simulator = ExchangeSimulator(seed=1)
+    open_positions(simulator)
+    bybit = BybitService(client=simulator)
+    simulator.inject_error("place_batch_order", ret_code=10016, ret_msg="Internal server error")
+
+    # Каждый ордер ждет остальные на барьере: при последовательной отправке барьер
+    # не соберется и ордера завершатся ошибкой BrokenBarrierError
+    barrier = threading.Barrier(len(POSITIONS), timeout=5)
+    place_order = simulator.place_order
+
+    def place_order_together(**kwargs):
+        barrier.wait()
+        return place_order(**kwargs)
+
+    simulator.place_order = place_order_together
+    result = bybit.close_all_positions()
+
+    assert result["errors"] == []
+    assert result["total_closed"] == len(POSITIONS)
+    assert not any(report["batch"] for report in result["orders"])
+    assert simulator.calls["place_order"] == 2 * len(POSITIONS)
+    assert bybit.get_positions_snapshot() == []
@@ -0,0 +1,168 @@
+"""
+ExecutionEngine на ExchangeSimulator в реальном времени: мейкер-исполнение, догон цены,
+повтор отмененного PostOnly, рыночный добор по дедлайну и телеметрия
+"""
+import time
+
+import pytest
+
+from services.bybit_service import BybitService
+from services.exchange_simulator import ExchangeSimulator
+from services.execution_engine import EXECUTION_INSERT_QUERY, MARKET_RESERVE_SECONDS, ExecutionEngine
+from services.trading_rules import MAKER_FEE, TAKER_FEE
+
+SYMBOL = "BTCUSDT"
+QTY = 0.01
+# Синтетика без волатильности: цена 60000, bid 59994, ask 60006
+EXPECTED_PRICE = 60000.0
+BID, ASK = 59994.0, 60006.0
+
+
+class RecordingDatabase:
+    def __init__(self):
+        self.queries = []
+
+    def execute_query(self, query, params=None):
+        self.queries.append((query, params))
+        return 1
+
+
+class StaleQuoteBybitService(BybitService):
+    """Первые ответы get_ticker - с устаревшими bid/ask (цена ушла между решением и ордером)"""
+
+    def __init__(self, client, stale_quotes):
+        super().__init__(client=client)
+        self.stale_quotes = list(stale_quotes)
+
+    def get_ticker(self, symbol):
+        ticker = super().get_ticker(symbol)
+        if ticker and self.stale_quotes:
+            ticker = dict(ticker, **self.stale_quotes.pop(0))
+        return ticker
+
+
+def make_engine(touch_fill_rate, maker_deadline=2.0, stale_quotes=()):
+    simulator = ExchangeSimulator(seed=1, realtime=True, volatility=0.0, touch_fill_rate=touch_fill_rate)
+    bybit = StaleQuoteBybitService(simulator, stale_quotes)
+    db = RecordingDatabase()
+    engine = ExecutionEngine(bybit, db_service=db, maker_deadline=maker_deadline, chase_interval=0.05,
+                             bot_name="test")
+    return engine, simulator, db
+
+
+def test_post_only_fill_at_bid():
+    engine, simulator, _ = make_engine(touch_fill_rate=1.0)
+
+    result = engine.execute(SYMBOL, "Buy", QTY, expected_price=EXPECTED_PRICE, prefer_maker=True)
+
+    execution = result["execution"]
+    assert result["orderId"]
+    assert execution["status"] == "Filled"
+    assert execution["execution_type"] == "maker"
+    assert execution["avg_price"] == pytest.approx(BID)
+    assert execution["reprices"] == 0
+    assert simulator.calls["place_order"] == 1
+    assert simulator.calls["amend_order"] == 0
+
+
+def test_chases_price_with_amend():
+    # Ордер выставлен по устаревшему bid 59990, на следующей проверке переставляется на 59994
+    engine, simulator, _ = make_engine(touch_fill_rate=1.0, stale_quotes=[{"bid_price": "59990"}])
+
+    execution = engine.execute(SYMBOL, "Buy", QTY, expected_price=EXPECTED_PRICE, prefer_maker=True)["execution"]
+
+    assert execution["reprices"] == 1
+    assert simulator.calls["amend_order"] == 1
+    assert simulator.calls["place_order"] == 1
+    assert execution["execution_type"] == "maker"
+    assert execution["avg_price"] == pytest.approx(BID)
+
+
+def test_replaces_post_only_cancelled_for_crossing():
+    # Устаревший bid выше ask: PostOnly пересекает стакан, биржа его отменяет
+    engine, simulator, _ = make_engine(touch_fill_rate=1.0, stale_quotes=[{"bid_price": "60010"}])
+
+    execution = engine.execute(SYMBOL, "Buy", QTY, expected_price=EXPECTED_PRICE, prefer_maker=True)["execution"]
+
+    assert simulator.calls["place_order"] == 2
+    assert execution["reprices"] == 1
+    assert len(execution["order_ids"].split(",")) == 2
+    assert execution["status"] == "Filled"
+    assert execution["execution_type"] == "maker"
+    assert execution["avg_price"] == pytest.approx(BID)
+
+
+def test_market_fallback_at_deadline():
+    engine, simulator, _ = make_engine(touch_fill_rate=0.0, maker_deadline=0.3)
+
+    execution = engine.execute(SYMBOL, "Buy", QTY, expected_price=EXPECTED_PRICE, prefer_maker=True)["execution"]
+
+    assert simulator.calls["cancel_order"] == 1
+    assert simulator.calls["place_order"] == 2
+    assert execution["strategy"] == "maker"
+    assert execution["execution_type"] == "taker"
+    assert execution["status"] == "Filled"
+    assert execution["maker_qty"] == 0
+    assert execution["taker_qty"] == pytest.approx(QTY)
+    assert execution["avg_price"] == pytest.approx(ASK)
+    assert execution["decision_to_fill_ms"] >= 300
+
+
+def test_caller_deadline_shortens_maker_phase():
+    # Мейкер-дедлайн 20 с, но общий срок вызывающего - через 2.3 с: добор рынком раньше
+    engine, simulator, _ = make_engine(touch_fill_rate=0.0, maker_deadline=20.0)
+
+    deadline = time.monotonic() + MARKET_RESERVE_SECONDS + 0.3
+    execution = engine.execute(SYMBOL, "Buy", QTY, expected_price=EXPECTED_PRICE, prefer_maker=True,
+                               deadline=deadline)["execution"]
+
+    # Вход закончился к общему сроку, а не через 20 секунд мейкер-дедлайна
+    assert execution["decision_to_fill_ms"] < 5000
+    assert simulator.calls["cancel_order"] == 1
+    assert execution["execution_type"] == "taker"
+    assert execution["status"] == "Filled"
+
+
+def test_telemetry_record():
+    engine, _, _ = make_engine(touch_fill_rate=1.0)
+
+    execution = engine.execute(SYMBOL, "Buy", QTY, expected_price=EXPECTED_PRICE, prefer_maker=True)["execution"]
+
+    notional = QTY * BID
+    assert execution["maker_qty"] == pytest.approx(QTY)
+    assert execution["taker_qty"] == 0
+    # Покупка по bid ниже цены решения - проскальзывание отрицательное (лучше ожидаемого)
+    assert execution["slippage_bps"] == pytest.approx((BID - EXPECTED_PRICE) / EXPECTED_PRICE * 10000)
+    assert execution["fee_estimate"] == pytest.approx(notional * MAKER_FEE)
+    assert execution["fee_saved"] == pytest.approx(notional * (TAKER_FEE - MAKER_FEE))
+    assert execution["decision_time"] <= execution["send_time"] <= execution["ack_time"] <= execution["fill_time"]
+    assert execution["decision_to_fill_ms"] >= 0
+
+
+def test_market_strategy_slippage_for_sell():
+    engine, simulator, _ = make_engine(touch_fill_rate=0.0)
+
+    execution = engine.execute(SYMBOL, "Sell", QTY, expected_price=EXPECTED_PRICE, prefer_maker=False)["execution"]
+
+    assert simulator.calls["place_order"] == 1
+    assert execution["strategy"] == "market"
+    assert execution["avg_price"] == pytest.approx(BID)
+    # Продажа дешевле цены решения - проскальзывание положительное
+    assert execution["slippage_bps"] == pytest.approx((EXPECTED_PRICE - BID) / EXPECTED_PRICE * 10000)
+    assert execution["fee_saved"] == 0
+
+
+def test_execution_saved_to_order_executions():
+    engine, _, db = make_engine(touch_fill_rate=1.0)
+
+    execution = engine.execute(SYMBOL, "Buy", QTY, expected_price=EXPECTED_PRICE, prefer_maker=True)["execution"]
+
+    assert len(db.queries) == 1
+    query, params = db.queries[0]
+    assert query == EXECUTION_INSERT_QUERY
+    assert query.count("%s") == len(params)
+    assert params[:6] == ("test", SYMBOL, "Buy", "maker", "maker", "Filled")
+    assert params[12] == execution["slippage_bps"]
+    assert params[14] == execution["fee_saved"]
+    assert params[20] == execution["decision_to_fill_ms"]
+    assert params[21] == execution["order_ids"]